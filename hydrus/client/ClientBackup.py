@@ -0,0 +1,476 @@
+import os
+import queue
+import re
+import sqlite3
+import threading
+
+from hydrus.core import HydrusExceptions
+from hydrus.core import HydrusNumbers
+from hydrus.core import HydrusPaths
+
+# the online backup copies the live db files with the sqlite backup api through a second connection, so the main db thread can keep working
+# the client_files mirror keeps a manifest in the backup dir so a repeat backup does not have to stat millions of source files. the backup side is still checked every time
+
+CLIENT_FILES_MANIFEST_FILENAME = 'client_files_backup_manifest.db'
+DB_BACKUP_TEMP_SUFFIX = '.backup_temp'
+
+# the parts of a file storage path, like 'fba/d/bad...64 hex....jpg'. these are named by their hash, so their content never changes
+CONTENT_ADDRESSED_PREFIX_RE = re.compile( r'f[0-9a-f]{1,2}' )
+CONTENT_ADDRESSED_SUBFOLDER_RE = re.compile( r'[0-9a-f]{1,2}' )
+CONTENT_ADDRESSED_FILENAME_RE = re.compile( r'[0-9a-f]{64}(\.[0-9a-z]+)?' )
+
+def _DeleteSQLiteFileAndSidecars( path ):
+    
+    for suffix in ( '', '-wal', '-shm', '-journal' ):
+        
+        sidecar_path = path + suffix
+        
+        if os.path.exists( sidecar_path ):
+            
+            HydrusPaths.DeletePath( sidecar_path )
+            
+        
+    
+
+def BackupDBFilesOnline( db_dir: str, db_filenames: dict[ str, str ], dest_dir: str, pages_per_step = 4096, text_update_hook = None, is_cancelled_hook = None ):
+    """
+    Copies the given database files to dest_dir with the sqlite online backup api, a few pages at a time, while other connections keep using them.
+    Every file is copied from the same read snapshot, so the result is consistent. This only works nicely in WAL mode--in other journal modes, our read lock will block the writer.
+    Raises CancelledException if the hook says so. The existing files in dest_dir are only replaced once everything has copied successfully.
+    """
+    
+    HydrusPaths.MakeSureDirectoryExists( dest_dir )
+    
+    main_path = os.path.join( db_dir, db_filenames[ 'main' ] )
+    
+    temp_paths_to_dest_paths = {}
+    
+    source_db = sqlite3.connect( main_path, isolation_level = None, detect_types = sqlite3.PARSE_DECLTYPES )
+    
+    try:
+        
+        c = source_db.cursor()
+        
+        for ( name, filename ) in db_filenames.items():
+            
+            if name == 'main':
+                
+                continue
+                
+            
+            c.execute( 'ATTACH ? AS ' + name + ';', ( os.path.join( db_dir, filename ), ) )
+            
+        
+        # this read transaction pins one WAL snapshot for all the files. the main connection can commit all it likes in the meantime without restarting us
+        
+        c.execute( 'BEGIN DEFERRED;' )
+        
+        for name in db_filenames.keys():
+            
+            c.execute( 'SELECT 1 FROM {}.sqlite_master LIMIT 1;'.format( name ) ).fetchall()
+            
+        
+        for ( name, filename ) in db_filenames.items():
+            
+            dest_path = os.path.join( dest_dir, filename )
+            temp_path = dest_path + DB_BACKUP_TEMP_SUFFIX
+            
+            _DeleteSQLiteFileAndSidecars( temp_path )
+            
+            temp_paths_to_dest_paths[ temp_path ] = dest_path
+            
+            def progress( status, remaining, total ):
+                
+                if is_cancelled_hook is not None and is_cancelled_hook():
+                    
+                    raise HydrusExceptions.CancelledException( 'Backup cancelled!' )
+                    
+                
+                if text_update_hook is not None:
+                    
+                    text_update_hook( 'copying {}: {} pages'.format( filename, HydrusNumbers.ValueRangeToPrettyString( total - remaining, total ) ) )
+                    
+                
+            
+            dest_db = sqlite3.connect( temp_path, isolation_level = None )
+            
+            try:
+                
+                source_db.backup( dest_db, pages = pages_per_step, name = name, progress = progress )
+                
+            finally:
+                
+                dest_db.close()
+                
+            
+        
+        c.execute( 'COMMIT;' )
+        
+    except:
+        
+        for temp_path in temp_paths_to_dest_paths.keys():
+            
+            _DeleteSQLiteFileAndSidecars( temp_path )
+            
+        
+        raise
+        
+    finally:
+        
+        source_db.close()
+        
+    
+    for ( temp_path, dest_path ) in temp_paths_to_dest_paths.items():
+        
+        _DeleteSQLiteFileAndSidecars( dest_path )
+        
+        os.replace( temp_path, dest_path )
+        
+    
+
+class ClientFilesBackupManifest( object ):
+    """
+    A little sqlite file in the backup dir that remembers which client_files paths we have already copied, with the size and modified time of the copy we made.
+    If the copy in the backup no longer matches, it has been truncated or touched since, and we copy it again.
+    """
+    
+    def __init__( self, backup_dir: str ):
+        
+        self._path = os.path.join( backup_dir, CLIENT_FILES_MANIFEST_FILENAME )
+        
+        self._db = sqlite3.connect( self._path, isolation_level = None )
+        
+        self._db.execute( 'CREATE TABLE IF NOT EXISTS client_files_manifest ( relative_path TEXT PRIMARY KEY, size INTEGER, mtime INTEGER );' )
+        
+    
+    def AddEntries( self, rows ):
+        
+        self._db.execute( 'BEGIN IMMEDIATE;' )
+        
+        self._db.executemany( 'REPLACE INTO client_files_manifest ( relative_path, size, mtime ) VALUES ( ?, ?, ? );', rows )
+        
+        self._db.execute( 'COMMIT;' )
+        
+    
+    def Close( self ):
+        
+        self._db.close()
+        
+    
+    def DeleteEntries( self, relative_paths ):
+        
+        self._db.execute( 'BEGIN IMMEDIATE;' )
+        
+        self._db.executemany( 'DELETE FROM client_files_manifest WHERE relative_path = ?;', ( ( relative_path, ) for relative_path in relative_paths ) )
+        
+        self._db.execute( 'COMMIT;' )
+        
+    
+    def GetEntries( self ) -> dict[ str, tuple[ int | None, int | None ] ]:
+        
+        return { relative_path : ( size, mtime ) for ( relative_path, size, mtime ) in self._db.execute( 'SELECT relative_path, size, mtime FROM client_files_manifest;' ) }
+        
+    
+
+def _PathIsContentAddressed( relative_path: str ):
+    
+    components = relative_path.split( os.sep )
+    
+    if len( components ) < 2:
+        
+        return False
+        
+    
+    if CONTENT_ADDRESSED_PREFIX_RE.fullmatch( components[0] ) is None or CONTENT_ADDRESSED_FILENAME_RE.fullmatch( components[-1] ) is None:
+        
+        return False
+        
+    
+    return all( ( CONTENT_ADDRESSED_SUBFOLDER_RE.fullmatch( component ) is not None for component in components[1:-1] ) )
+    
+
+def _ScanClientFilesTree( source: str, is_cancelled_hook = None, stat_content_addressed = False ):
+    
+    relative_dirs = []
+    relative_paths_to_info = {}
+    
+    dirs_to_scan = [ '' ]
+    
+    while len( dirs_to_scan ) > 0:
+        
+        if is_cancelled_hook is not None and is_cancelled_hook():
+            
+            raise HydrusExceptions.CancelledException( 'Backup cancelled!' )
+            
+        
+        relative_dir = dirs_to_scan.pop()
+        
+        with os.scandir( os.path.join( source, relative_dir ) ) as scan:
+            
+            for entry in scan:
+                
+                relative_path = os.path.join( relative_dir, entry.name )
+                
+                if entry.is_dir():
+                    
+                    relative_dirs.append( relative_path )
+                    dirs_to_scan.append( relative_path )
+                    
+                elif _PathIsContentAddressed( relative_path ) and not stat_content_addressed:
+                    
+                    relative_paths_to_info[ relative_path ] = ( None, None )
+                    
+                else:
+                    
+                    stat_result = entry.stat()
+                    
+                    relative_paths_to_info[ relative_path ] = ( stat_result.st_size, int( stat_result.st_mtime ) )
+                    
+                
+            
+        
+    
+    return ( relative_dirs, relative_paths_to_info )
+    
+
+def MirrorClientFilesIncrementally( source: str, dest: str, backup_dir: str, num_workers = 4, text_update_hook = None, is_cancelled_hook = None ):
+    """
+    Makes dest look like source, like MirrorTree, but content-addressed source files are only statted if the manifest in backup_dir has not seen them copied.
+    Dest is scanned every time, so anything there that is not in source is deleted, and anything that changed since we copied it is copied again.
+    Copies happen in parallel. If we are cancelled, everything copied so far is remembered, so the next run picks up where we left off.
+    """
+    
+    def report( text ):
+        
+        if text_update_hook is not None:
+            
+            text_update_hook( text )
+            
+        
+    
+    def check_cancelled():
+        
+        if is_cancelled_hook is not None and is_cancelled_hook():
+            
+            raise HydrusExceptions.CancelledException( 'Backup cancelled!' )
+            
+        
+    
+    report( 'scanning client_files' )
+    
+    ( relative_dirs, source_relative_paths_to_info ) = _ScanClientFilesTree( source, is_cancelled_hook = is_cancelled_hook )
+    
+    HydrusPaths.MakeSureDirectoryExists( dest )
+    
+    report( 'scanning existing backup of client_files' )
+    
+    ( gumpf, dest_relative_paths_to_info ) = _ScanClientFilesTree( dest, is_cancelled_hook = is_cancelled_hook, stat_content_addressed = True )
+    
+    manifest = ClientFilesBackupManifest( backup_dir )
+    
+    try:
+        
+        manifest_relative_paths_to_info = manifest.GetEntries()
+        
+        if len( manifest_relative_paths_to_info ) == 0 and len( dest_relative_paths_to_info ) > 0:
+            
+            # a backup from before we had a manifest. one slow full scan of the source to see which of its files we can trust
+            
+            report( 'scanning client_files for an old backup' )
+            
+            ( gumpf, full_source_relative_paths_to_info ) = _ScanClientFilesTree( source, is_cancelled_hook = is_cancelled_hook, stat_content_addressed = True )
+            
+            rows = [ ( relative_path, ) + info for ( relative_path, info ) in dest_relative_paths_to_info.items() if full_source_relative_paths_to_info.get( relative_path ) == info ]
+            
+            manifest.AddEntries( rows )
+            
+            manifest_relative_paths_to_info = { relative_path : ( size, mtime ) for ( relative_path, size, mtime ) in rows }
+            
+        
+        # anything in the backup that is not in the source goes, whether we put it there or not
+        
+        deletee_relative_paths = [ relative_path for relative_path in dest_relative_paths_to_info.keys() if relative_path not in source_relative_paths_to_info ]
+        
+        for ( i, relative_path ) in enumerate( deletee_relative_paths ):
+            
+            if i % 100 == 0:
+                
+                check_cancelled()
+                
+                report( 'deleting old client_files: {}'.format( HydrusNumbers.ValueRangeToPrettyString( i, len( deletee_relative_paths ) ) ) )
+                
+            
+            HydrusPaths.DeletePath( os.path.join( dest, relative_path ) )
+            
+        
+        manifest.DeleteEntries( [ relative_path for relative_path in manifest_relative_paths_to_info.keys() if relative_path not in source_relative_paths_to_info or relative_path not in dest_relative_paths_to_info ] )
+        
+        copy_relative_paths = []
+        
+        for ( relative_path, info ) in source_relative_paths_to_info.items():
+            
+            dest_info = dest_relative_paths_to_info.get( relative_path, None )
+            
+            if dest_info is None or manifest_relative_paths_to_info.get( relative_path, None ) != dest_info:
+                
+                # missing, never recorded, or changed since we copied it
+                
+                copy_relative_paths.append( relative_path )
+                
+            elif not _PathIsContentAddressed( relative_path ) and dest_info != info:
+                
+                copy_relative_paths.append( relative_path )
+                
+            
+        
+        if len( copy_relative_paths ) == 0:
+            
+            return
+            
+        
+        for relative_dir in relative_dirs:
+            
+            HydrusPaths.MakeSureDirectoryExists( os.path.join( dest, relative_dir ) )
+            
+        
+        copy_relative_paths.sort()
+        
+        work_queue = queue.Queue()
+        results_queue = queue.Queue()
+        stop_event = threading.Event()
+        
+        for relative_path in copy_relative_paths:
+            
+            work_queue.put( relative_path )
+            
+        
+        def THREADCopyWorker():
+            
+            while not stop_event.is_set():
+                
+                try:
+                    
+                    relative_path = work_queue.get_nowait()
+                    
+                except queue.Empty:
+                    
+                    return
+                    
+                
+                dest_path = os.path.join( dest, relative_path )
+                
+                try:
+                    
+                    HydrusPaths.MirrorFile( os.path.join( source, relative_path ), dest_path )
+                    
+                    # we remember what we wrote, so we can tell if it changes under us
+                    
+                    stat_result = os.stat( dest_path )
+                    
+                    results_queue.put( ( ( relative_path, stat_result.st_size, int( stat_result.st_mtime ) ), None ) )
+                    
+                except Exception as e:
+                    
+                    results_queue.put( ( ( relative_path, None, None ), e ) )
+                    
+                
+            
+        
+        workers = [ threading.Thread( target = THREADCopyWorker, daemon = True ) for i in range( max( 1, num_workers ) ) ]
+        
+        for worker in workers:
+            
+            worker.start()
+            
+        
+        num_done = 0
+        pending_manifest_rows = []
+        first_error = None
+        
+        try:
+            
+            while num_done < len( copy_relative_paths ):
+                
+                if is_cancelled_hook is not None and is_cancelled_hook():
+                    
+                    stop_event.set()
+                    
+                
+                if stop_event.is_set() and not any( ( worker.is_alive() for worker in workers ) ) and results_queue.empty():
+                    
+                    break
+                    
+                
+                try:
+                    
+                    ( row, e ) = results_queue.get( timeout = 0.5 )
+                    
+                except queue.Empty:
+                    
+                    continue
+                    
+                
+                num_done += 1
+                
+                if e is None:
+                    
+                    pending_manifest_rows.append( row )
+                    
+                elif first_error is None:
+                    
+                    first_error = ( row, e )
+                    
+                    stop_event.set()
+                    
+                
+                if len( pending_manifest_rows ) >= 256:
+                    
+                    manifest.AddEntries( pending_manifest_rows )
+                    
+                    pending_manifest_rows = []
+                    
+                    report( 'copying client_files: {}'.format( HydrusNumbers.ValueRangeToPrettyString( num_done, len( copy_relative_paths ) ) ) )
+                    
+                
+            
+        finally:
+            
+            stop_event.set()
+            
+            for worker in workers:
+                
+                worker.join()
+                
+            
+            # anything that finished while we were winding down still counts
+            
+            while not results_queue.empty():
+                
+                ( row, e ) = results_queue.get_nowait()
+                
+                if e is None:
+                    
+                    pending_manifest_rows.append( row )
+                    
+                
+            
+            if len( pending_manifest_rows ) > 0:
+                
+                manifest.AddEntries( pending_manifest_rows )
+                
+            
+        
+        if first_error is not None:
+            
+            ( row, e ) = first_error
+            
+            raise Exception( 'While trying to back up "{}" into "{}", copying "{}" failed!'.format( source, dest, row[0] ) ) from e
+            
+        
+        check_cancelled()
+        
+    finally:
+        
+        manifest.Close()
+
+
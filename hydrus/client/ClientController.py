@@ -16,6 +16,7 @@ from hydrus.core import HydrusController
 from hydrus.core import HydrusData
 from hydrus.core import HydrusExceptions
 from hydrus.core import HydrusGlobals as HG
+from hydrus.core import HydrusPaths
 from hydrus.core import HydrusPSUtil
 from hydrus.core import HydrusSerialisable
 from hydrus.core import HydrusStaticDir
@@ -25,6 +26,7 @@ from hydrus.core.networking import HydrusNetworking
 from hydrus.core.processes import HydrusProcess
 from hydrus.core.processes import HydrusThreading
 
+from hydrus.client import ClientBackup
 from hydrus.client import ClientConstants as CC
 from hydrus.client import ClientDaemons
 from hydrus.client import ClientDefaults
@@ -51,6 +53,21 @@ callable_R = typing.TypeVar( 'callable_R' )
 
 PubSubEventType = QP.registerEventType()
 
+# argless 'something changed, go look' pubs that can be sent once per pubsub pass
+PUBSUB_TOPICS_TO_DEDUPE = [
+    'notify_new_favourite_tags',
+    'notify_new_options',
+    'notify_new_pages_count',
+    'notify_new_pending',
+    'notify_new_permissions',
+    'notify_new_physical_file_delete_numbers',
+    'notify_new_repo_sync',
+    'notify_new_services_data',
+    'notify_new_services_gui',
+    'notify_new_tag_display_application',
+    'notify_new_undo'
+]
+
 class PubSubEvent( QC.QEvent ):
     
     def __init__( self ):
@@ -187,6 +204,12 @@ class Controller( HydrusController.HydrusController ):
         
         self._name = 'client'
         
+        # these fire in bursts during big imports and repo syncs, and each listener only needs to hear about the latest state once
+        for topic in PUBSUB_TOPICS_TO_DEDUPE:
+            
+            self._pubsub.SetTopicCoalescing( topic )
+            
+        
         CG.client_controller = self
         
         # just to set up some defaults, in case some db update expects something for an odd yaml-loading reason
@@ -403,6 +426,62 @@ class Controller( HydrusController.HydrusController ):
         return QC.QThread.currentThread() == self.main_qt_thread
         
     
+    def BackupDatabaseOnline( self, path ):
+        
+        # call this off the main thread. the db keeps working while we copy it
+        
+        job_status = ClientThreading.JobStatus( cancellable = True )
+        
+        job_status.SetStatusTitle( 'backing up db' )
+        
+        self.pub( 'message', job_status )
+        
+        def is_cancelled_hook():
+            
+            return job_status.IsCancelled() or HG.started_shutdown
+            
+        
+        def text_update_hook( text ):
+            
+            job_status.SetStatusText( text )
+            
+        
+        try:
+            
+            job_status.SetStatusText( 'committing db' )
+            
+            self.ForceDatabaseCommit()
+            
+            ( db_filenames, additional_filenames ) = self.Read( 'backup_filenames' )
+            
+            ClientBackup.BackupDBFilesOnline( self.db_dir, db_filenames, path, text_update_hook = text_update_hook, is_cancelled_hook = is_cancelled_hook )
+            
+            for additional_filename in additional_filenames:
+                
+                HydrusPaths.MirrorFile( os.path.join( self.db_dir, additional_filename ), os.path.join( path, additional_filename ) )
+                
+            
+            client_files_default = os.path.join( self.db_dir, 'client_files' )
+            
+            if os.path.exists( client_files_default ):
+                
+                ClientBackup.MirrorClientFilesIncrementally( client_files_default, os.path.join( path, 'client_files' ), path, text_update_hook = text_update_hook, is_cancelled_hook = is_cancelled_hook )
+                
+            
+            self.new_options.SetNoneableInteger( 'last_backup_time', HydrusTime.GetNow() )
+            
+            job_status.SetStatusText( 'backup complete!' )
+            
+        except HydrusExceptions.CancelledException:
+            
+            job_status.SetStatusText( 'backup cancelled! the media file copy will pick up where it left off next time' )
+            
+        finally:
+            
+            job_status.Finish()
+            
+        
+    
     def BlockingSafeShowCriticalMessage( self, title: str, message: str ):
         
         ClientGUIDialogsMessage.ShowCritical( self.gui, title, message )
@@ -1686,6 +1765,13 @@ class Controller( HydrusController.HydrusController ):
             return
             
         
+        self.WriteSynchronous( 'maintain_related_tags_cache', maintenance_mode = maintenance_mode, stop_time = stop_time )
+        
+        if self.ShouldStopThisWork( maintenance_mode, stop_time = stop_time ):
+            
+            return
+            
+        
     
     def MaintainHashedSerialisables( self ):
         
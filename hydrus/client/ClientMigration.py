@@ -1,8 +1,11 @@
 import os
+import queue
+import threading
 
 from hydrus.core import HydrusConstants as HC
 from hydrus.core import HydrusData
 from hydrus.core import HydrusLists
+from hydrus.core import HydrusNumbers
 from hydrus.core import HydrusTagArchive
 from hydrus.core import HydrusTime
 
@@ -54,7 +57,9 @@ class MigrationDestination( object ):
         pass
         
     
-    def DoSomeWork( self, source ):
+    def DoSomeWork( self, data ) -> int:
+        
+        # returns the number of rows processed
         
         raise NotImplementedError()
         
@@ -95,22 +100,11 @@ class MigrationDestinationHTA( MigrationDestination ):
         self._hta = None
         
     
-    def DoSomeWork( self, source ):
-        
-        time_started_precise = HydrusTime.GetNowPrecise()
+    def DoSomeWork( self, data ):
         
-        num_done = 0
+        self._hta.AddMappingsBulk( data )
         
-        data = source.GetSomeData()
-        
-        for ( hash, tags ) in data:
-            
-            self._hta.AddMappings( hash, tags )
-            
-            num_done += len( tags )
-            
-        
-        return GetBasicSpeedStatement( num_done, time_started_precise )
+        return sum( ( len( tags ) for ( hash, tags ) in data ) )
         
     
     def Prepare( self ):
@@ -123,7 +117,7 @@ class MigrationDestinationHTA( MigrationDestination ):
         
         self._hta.SetHashType( hta_hash_type )
         
-        self._hta.BeginBigJob()
+        self._hta.BeginBigJob( defer_index_creation = True )
         
     
 class MigrationDestinationHTPA( MigrationDestination ):
@@ -156,17 +150,11 @@ class MigrationDestinationHTPA( MigrationDestination ):
         self._htpa = None
         
     
-    def DoSomeWork( self, source ):
-        
-        time_started_precise = HydrusTime.GetNowPrecise()
-        
-        data = source.GetSomeData()
+    def DoSomeWork( self, data ):
         
         self._htpa.AddPairs( data )
         
-        num_done = len( data )
-        
-        return GetBasicSpeedStatement( num_done, time_started_precise )
+        return len( data )
         
     
     def Prepare( self ):
@@ -195,7 +183,7 @@ class MigrationDestinationList( MigrationDestination ):
         self._time_started = 0
         
     
-    def DoSomeWork( self, source ):
+    def DoSomeWork( self, data ):
         
         raise NotImplementedError()
         
@@ -207,14 +195,10 @@ class MigrationDestinationList( MigrationDestination ):
     
 class MigrationDestinationListMappings( MigrationDestinationList ):
     
-    def DoSomeWork( self, source ):
-        
-        time_started_precise = HydrusTime.GetNowPrecise()
+    def DoSomeWork( self, data ):
         
         num_done = 0
         
-        data = source.GetSomeData()
-        
         for ( hash, tags ) in data:
             
             self._data_received.append( ( hash, tags ) )
@@ -222,22 +206,16 @@ class MigrationDestinationListMappings( MigrationDestinationList ):
             num_done += len( tags )
             
         
-        return GetBasicSpeedStatement( num_done, time_started_precise )
+        return num_done
         
     
 class MigrationDestinationListPairs( MigrationDestinationList ):
     
-    def DoSomeWork( self, source ):
-        
-        time_started_precise = HydrusTime.GetNowPrecise()
-        
-        data = source.GetSomeData()
+    def DoSomeWork( self, data ):
         
         self._data_received.extend( data )
         
-        num_done = len( data )
-        
-        return GetBasicSpeedStatement( num_done, time_started_precise )
+        return len( data )
         
     
 class MigrationDestinationTagService( MigrationDestination ):
@@ -256,7 +234,7 @@ class MigrationDestinationTagService( MigrationDestination ):
         self._content_action = content_action
         
     
-    def DoSomeWork( self, source ):
+    def DoSomeWork( self, data ):
         
         raise NotImplementedError()
         
@@ -270,11 +248,7 @@ class MigrationDestinationTagServiceMappings( MigrationDestinationTagService ):
         self._reason = 'Mass Migration Job'
         
     
-    def DoSomeWork( self, source ):
-        
-        time_started_precise = HydrusTime.GetNowPrecise()
-        
-        data = source.GetSomeData()
+    def DoSomeWork( self, data ):
         
         content_updates = []
         
@@ -307,7 +281,7 @@ class MigrationDestinationTagServiceMappings( MigrationDestinationTagService ):
         
         self._controller.WriteSynchronous( 'content_updates', content_update_package )
         
-        return GetBasicSpeedStatement( num_done, time_started_precise )
+        return num_done
         
     
     def SetReason( self, reason: str ):
@@ -325,11 +299,7 @@ class MigrationDestinationTagServicePairs( MigrationDestinationTagService ):
         self._content_type = content_type
         
     
-    def DoSomeWork( self, source ):
-        
-        time_started_precise = HydrusTime.GetNowPrecise()
-        
-        data = source.GetSomeData()
+    def DoSomeWork( self, data ):
         
         content_updates = []
         
@@ -348,13 +318,16 @@ class MigrationDestinationTagServicePairs( MigrationDestinationTagService ):
         
         self._controller.WriteSynchronous( 'content_updates', content_update_package )
         
-        num_done = len( data )
-        
-        return GetBasicSpeedStatement( num_done, time_started_precise )
+        return len( data )
         
     
 class MigrationJob( object ):
     
+    # the source reads on its own thread and feeds the destination through a small queue, so reading the next chunk overlaps with writing the last
+    # the source does its Prepare, GetSomeData, and CleanUp all on that thread, since some sources hold a sqlite connection
+    
+    MAX_CHUNKS_IN_FLIGHT = 8
+    
     def __init__( self, controller: "CG.ClientController.Controller", title, source, destination ):
         
         self._controller = controller
@@ -362,6 +335,66 @@ class MigrationJob( object ):
         self._source = source
         self._destination = destination
         
+        self._data_queue = queue.Queue( maxsize = self.MAX_CHUNKS_IN_FLIGHT )
+        self._stop_reading = threading.Event()
+        
+        self.SENTINEL = None
+        
+    
+    def _PutOnQueue( self, item ):
+        
+        while not self._stop_reading.is_set():
+            
+            try:
+                
+                self._data_queue.put( item, timeout = 0.5 )
+                
+                return True
+                
+            except queue.Full:
+                
+                continue
+                
+            
+        
+        return False
+        
+    
+    def _THREADReadSource( self ):
+        
+        try:
+            
+            self._source.Prepare()
+            
+            try:
+                
+                while self._source.StillWorkToDo() and not self._stop_reading.is_set():
+                    
+                    data = self._source.GetSomeData()
+                    
+                    if len( data ) > 0:
+                        
+                        if not self._PutOnQueue( data ):
+                            
+                            break
+                            
+                        
+                    
+                
+            finally:
+                
+                self._source.CleanUp()
+                
+            
+        except Exception as e:
+            
+            self._PutOnQueue( e )
+            
+        finally:
+            
+            self._PutOnQueue( self.SENTINEL )
+            
+        
     
     def Run( self ):
         
@@ -371,23 +404,52 @@ class MigrationJob( object ):
         
         self._controller.pub( 'message', job_status )
         
+        job_status.SetStatusText( 'preparing destination' )
+        
+        self._destination.Prepare()
+        
         job_status.SetStatusText( 'preparing source' )
         
-        self._source.Prepare()
+        reader_thread = threading.Thread( target = self._THREADReadSource, name = 'migration source reader' )
         
-        job_status.SetStatusText( 'preparing destination' )
+        reader_thread.daemon = True
         
-        self._destination.Prepare()
+        reader_thread.start()
         
-        job_status.SetStatusText( 'beginning work' )
+        time_started_precise = HydrusTime.GetNowPrecise()
+        num_done = 0
         
         try:
             
-            while self._source.StillWorkToDo():
+            while True:
+                
+                try:
+                    
+                    data = self._data_queue.get( timeout = 0.5 )
+                    
+                except queue.Empty:
+                    
+                    if job_status.IsCancelled():
+                        
+                        break
+                        
+                    
+                    continue
+                    
                 
-                progress_statement = self._destination.DoSomeWork( self._source )
+                if data is self.SENTINEL:
+                    
+                    break
+                    
+                
+                if isinstance( data, Exception ):
+                    
+                    raise data
+                    
                 
-                job_status.SetStatusText( progress_statement )
+                num_done += self._destination.DoSomeWork( data )
+                
+                job_status.SetStatusText( '{} rows done, {}'.format( HydrusNumbers.ToHumanInt( num_done ), GetBasicSpeedStatement( num_done, time_started_precise ) ) )
                 
                 job_status.WaitIfNeeded()
                 
@@ -401,7 +463,9 @@ class MigrationJob( object ):
             
             job_status.SetStatusText( 'done, cleaning up source' )
             
-            self._source.CleanUp()
+            self._stop_reading.set()
+            
+            reader_thread.join()
             
             job_status.SetStatusText( 'done, cleaning up destination' )
             
@@ -469,25 +533,11 @@ class MigrationSourceHTA( MigrationSource ):
     
     def _ConvertHashes( self, source_hash_type, desired_hash_type, data ):
         
-        if source_hash_type != desired_hash_type:
-            
-            fixed_data = []
+        if source_hash_type != desired_hash_type and len( data ) > 0:
             
-            for ( hash, tags ) in data:
-                
-                source_to_desired = self._controller.Read( 'file_hashes', ( hash, ), source_hash_type, desired_hash_type )
-                
-                if len( source_to_desired ) == 0:
-                    
-                    continue
-                    
-                
-                desired_hash = list( source_to_desired.values() )[0]
-                
-                fixed_data.append( ( desired_hash, tags ) )
-                
+            source_to_desired = self._controller.Read( 'file_hashes', [ hash for ( hash, tags ) in data ], source_hash_type, desired_hash_type )
             
-            data = fixed_data
+            data = [ ( source_to_desired[ hash ], tags ) for ( hash, tags ) in data if hash in source_to_desired ]
             
         
         return data
@@ -22,7 +22,7 @@ from qtpy import QtCore as QC
 from hydrus.core import HydrusExceptions
 from hydrus.core.files import HydrusPDFHandling
 
-from hydrus.client import ClientGlobals as CG
+from hydrus.client import ClientRasterisation
 from hydrus.client.gui import ClientGUIFunctions
 
 def QtLoadPDF( path: str ):
@@ -109,7 +109,7 @@ def GenerateThumbnailNumPyFromPDFPath( path: str, target_resolution: tuple[int,
             
         
     
-    return CG.client_controller.CallBlockingToQtTLW( qt_code )
+    return ClientRasterisation.rasterisation_pool.Render( qt_code )
     
 
 HydrusPDFHandling.GenerateThumbnailNumPyFromPDFPath = GenerateThumbnailNumPyFromPDFPath
@@ -151,7 +151,7 @@ def GetHumanReadableEmbeddedMetadata( path ) -> str:
         return '\n'.join( result_components )
         
     
-    return CG.client_controller.CallBlockingToQtTLW( qt_code )
+    return ClientRasterisation.rasterisation_pool.Render( qt_code )
     
 
 def HasHumanReadableEmbeddedMetadata( path ) -> bool:
@@ -215,7 +215,7 @@ def GetPDFInfo( path: str ):
         return ( num_words, ( width, height ) )
         
     
-    return CG.client_controller.CallBlockingToQtTLW( qt_code )
+    return ClientRasterisation.rasterisation_pool.Render( qt_code )
     
 
 def GetPDFModifiedTimestampMS( path ):
@@ -242,7 +242,7 @@ def GetPDFModifiedTimestampMS( path ):
         return modified_timestamp_ms
         
     
-    return CG.client_controller.CallBlockingToQtTLW( qt_code )
+    return ClientRasterisation.rasterisation_pool.Render( qt_code )
     
 
 def GetPDFResolutionFromDocument( document ):
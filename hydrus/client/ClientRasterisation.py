@@ -0,0 +1,89 @@
+import threading
+import typing
+
+from hydrus.core import HydrusData
+from hydrus.core.processes import HydrusThreading
+
+from hydrus.client import ClientGlobals as CG
+
+# PDF and SVG rasterisation goes through the Qt main thread. QPdfDocument and QSvgRenderer have crashed on us elsewhere, so that stays
+# what we can do is stop a big import from queueing up dozens of renders there at once and starving the ui. one renders while the next waits its turn
+RASTERISATION_MAX_SIMULTANEOUS_JOBS = 2
+
+callable_P = typing.ParamSpec( 'callable_P' )
+callable_R = typing.TypeVar( 'callable_R' )
+
+class RasterisationPool( object ):
+    
+    def __init__( self, max_simultaneous_jobs: int ):
+        
+        self._max_simultaneous_jobs = max_simultaneous_jobs
+        
+        self._slots = threading.BoundedSemaphore( max_simultaneous_jobs )
+        
+        self._lock = threading.Lock()
+        
+        self._num_jobs_running = 0
+        self._num_jobs_done = 0
+        
+    
+    def _AcquireSlot( self ):
+        
+        while not self._slots.acquire( timeout = 0.5 ):
+            
+            HydrusData.CheckProgramIsNotShuttingDown()
+            HydrusThreading.CheckIfThreadShuttingDown()
+            
+        
+    
+    def GetMaxSimultaneousJobs( self ) -> int:
+        
+        return self._max_simultaneous_jobs
+        
+    
+    def GetStatus( self ) -> tuple[ int, int ]:
+        
+        with self._lock:
+            
+            return ( self._num_jobs_running, self._num_jobs_done )
+            
+        
+    
+    def Render( self, func: typing.Callable[ callable_P, callable_R ], *args: callable_P.args, **kwargs: callable_P.kwargs ) -> callable_R:
+        
+        HydrusData.CheckProgramIsNotShuttingDown()
+        
+        controller = CG.client_controller
+        
+        if controller.AmInTheMainQtThread():
+            
+            # we don't want the ui waiting on a slot, so just do it
+            
+            return func( *args, **kwargs )
+            
+        
+        self._AcquireSlot()
+        
+        with self._lock:
+            
+            self._num_jobs_running += 1
+            
+        
+        try:
+            
+            return controller.CallBlockingToQtTLW( func, *args, **kwargs )
+            
+        finally:
+            
+            with self._lock:
+                
+                self._num_jobs_running -= 1
+                self._num_jobs_done += 1
+                
+            
+            self._slots.release()
+            
+        
+    
+
+rasterisation_pool = RasterisationPool( RASTERISATION_MAX_SIMULTANEOUS_JOBS )
@@ -1,3 +1,4 @@
+import math
 import numpy
 import threading
 import time
@@ -46,6 +47,21 @@ def FrameIndexOutOfRange( index, range_start, range_end ):
     return False
     
 
+def EstimateImageRendererMemoryFootprint( media ) -> int:
+    
+    ( width, height ) = media.GetResolution()
+    
+    if width is None or height is None:
+        
+        ( width, height ) = ( 100, 100 )
+        
+    
+    # we render transparent images to rgba
+    depth = 4 if media.GetFileInfoManager().has_transparency else 3
+    
+    return width * height * depth
+    
+
 def GenerateHydrusBitmap( path, mime, compressed = True ):
     
     numpy_image = HydrusImageHandling.GenerateNumPyImage( path, mime )
@@ -82,6 +98,12 @@ def GenerateHydrusBitmapFromPILImage( pil_image, compressed = True ):
         
     
 
+# when a tile is zoomed out to half size or less, we cut it from a cached power-of-two downscale of the image rather than resizing from full res every time
+MIPMAP_MAX_ZOOM = 0.5
+
+# we don't make mipmap levels smaller than this
+MIPMAP_MIN_SIZE = 16
+
 class ImageRenderer( ClientCachesBase.CacheableObject ):
     
     def __init__( self, media, this_is_for_metadata_alone = False ):
@@ -92,6 +114,10 @@ class ImageRenderer( ClientCachesBase.CacheableObject ):
         self._render_failed = False
         self._is_ready = False
         
+        # level 1 is half size, level 2 quarter, and so on. built lazily as we zoom out
+        self._mipmap_levels: list[ numpy.ndarray ] = []
+        self._mipmap_lock = threading.Lock()
+        
         self._hash = media.GetHash()
         self._mime = media.GetMime()
         
@@ -110,14 +136,141 @@ class ImageRenderer( ClientCachesBase.CacheableObject ):
         
         self._this_is_for_metadata_alone = this_is_for_metadata_alone
         
+        self._estimated_memory_footprint = EstimateImageRendererMemoryFootprint( media )
+        
         CG.client_controller.CallToThread( self._Initialise )
         
-
+    
     def GetNumPyImage(self):
-
+        
         return self._numpy_image
         
     
+    def _CanUseMipmap( self, clip_rect: QC.QRect, target_resolution: QC.QSize ) -> bool:
+        
+        if not self._is_ready or self._render_failed or clip_rect.width() <= 0 or clip_rect.height() <= 0:
+            
+            return False
+            
+        
+        ( my_width, my_height ) = self._resolution
+        
+        if self._numpy_image.shape[:2] != ( my_height, my_width ) or not QC.QRect( 0, 0, my_width, my_height ).contains( clip_rect ):
+            
+            return False
+            
+        
+        zoom = max( target_resolution.width() / clip_rect.width(), target_resolution.height() / clip_rect.height() )
+        
+        return self._GetMipmapLevelNumberForZoom( zoom ) is not None
+        
+    
+    def _GetMipmapLevelNumberForZoom( self, zoom: float ) -> int | None:
+        
+        ( my_width, my_height ) = self._resolution
+        
+        if zoom > MIPMAP_MAX_ZOOM or min( my_width, my_height ) // 2 < MIPMAP_MIN_SIZE:
+            
+            return None
+            
+        
+        # the smallest level that is still at least as big as the target, so the final resize is always a gentle downscale
+        
+        level = 1
+        
+        while zoom * ( 2 ** ( level + 1 ) ) <= 1 and min( my_width, my_height ) >> ( level + 1 ) >= MIPMAP_MIN_SIZE:
+            
+            level += 1
+            
+        
+        return level
+        
+    
+    def _GetMipmapLevel( self, level: int ) -> numpy.ndarray:
+        
+        with self._mipmap_lock:
+            
+            built_a_level = len( self._mipmap_levels ) < level
+            
+            while len( self._mipmap_levels ) < level:
+                
+                if len( self._mipmap_levels ) == 0:
+                    
+                    previous_level = self._numpy_image
+                    
+                else:
+                    
+                    previous_level = self._mipmap_levels[-1]
+                    
+                
+                self._mipmap_levels.append( ClientImageHandling.GenerateNumPyImageMipmapLevel( previous_level ) )
+                
+            
+            level_image = self._mipmap_levels[ level - 1 ]
+            
+        
+        if built_a_level:
+            
+            # we are bigger now, so the image cache needs to know
+            CG.client_controller.pub( 'notify_image_renderer_memory_footprint_changed', self._hash )
+            
+        
+        return level_image
+        
+    
+    def _GetNumPyImageFromMipmap( self, clip_rect: QC.QRect, target_resolution: QC.QSize ):
+        
+        ( my_width, my_height ) = self._resolution
+        
+        target_width = target_resolution.width()
+        target_height = target_resolution.height()
+        
+        zoom = max( target_width / clip_rect.width(), target_height / clip_rect.height() )
+        
+        level = self._GetMipmapLevelNumberForZoom( zoom )
+        
+        level_image = self._GetMipmapLevel( level )
+        
+        ( level_height, level_width ) = level_image.shape[:2]
+        
+        x_scale = level_width / my_width
+        y_scale = level_height / my_height
+        
+        # the clip in level coordinates will not usually land on whole pixels, so we take the whole pixels around it, resize at the exact zoom, and crop the margin
+        
+        x0 = clip_rect.x() * x_scale
+        y0 = clip_rect.y() * y_scale
+        x1 = ( clip_rect.x() + clip_rect.width() ) * x_scale
+        y1 = ( clip_rect.y() + clip_rect.height() ) * y_scale
+        
+        level_x0 = math.floor( x0 )
+        level_y0 = math.floor( y0 )
+        level_x1 = max( level_x0 + 1, min( level_width, math.ceil( x1 ) ) )
+        level_y1 = max( level_y0 + 1, min( level_height, math.ceil( y1 ) ) )
+        
+        source = level_image[ level_y0 : level_y1, level_x0 : level_x1 ]
+        
+        level_zoom_x = target_width / ( x1 - x0 )
+        level_zoom_y = target_height / ( y1 - y0 )
+        
+        resize_width = max( target_width, round( ( level_x1 - level_x0 ) * level_zoom_x ) )
+        resize_height = max( target_height, round( ( level_y1 - level_y0 ) * level_zoom_y ) )
+        
+        result = ClientImageHandling.ResizeNumPyImageForMediaViewer( self._mime, source, ( resize_width, resize_height ) )
+        
+        x = min( round( ( x0 - level_x0 ) * level_zoom_x ), resize_width - target_width )
+        y = min( round( ( y0 - level_y0 ) * level_zoom_y ), resize_height - target_height )
+        
+        result = result[ y : y + target_height, x : x + target_width ]
+        
+        if not result.data.c_contiguous:
+            
+            result = result.copy()
+            
+        
+        return result
+        
+    
     def _GetNumPyImage( self, clip_rect: QC.QRect, target_resolution: QC.QSize ):
         
         if self._numpy_image is None:
@@ -125,6 +278,11 @@ class ImageRenderer( ClientCachesBase.CacheableObject ):
             return numpy.zeros( ( target_resolution.height(), target_resolution.width() ), dtype = 'uint8' )
             
         
+        if self._CanUseMipmap( clip_rect, target_resolution ):
+            
+            return self._GetNumPyImageFromMipmap( clip_rect, target_resolution )
+            
+        
         clip_size = clip_rect.size()
         clip_width = clip_size.width()
         clip_height = clip_size.height()
@@ -368,13 +526,11 @@ class ImageRenderer( ClientCachesBase.CacheableObject ):
         
         if self._numpy_image is None:
             
-            ( width, height ) = self._resolution
-            
-            return width * height * 3
+            return self._estimated_memory_footprint
             
         else:
             
-            return self._numpy_image.nbytes
+            return self._numpy_image.nbytes + sum( ( mipmap_level.nbytes for mipmap_level in self._mipmap_levels ) )
             
         
     
@@ -497,6 +653,37 @@ class ImageRenderer( ClientCachesBase.CacheableObject ):
         return self._is_ready
         
     
+    def MipmapIsWarmForZoom( self, zoom: float ) -> bool:
+        
+        level = self._GetMipmapLevelNumberForZoom( zoom )
+        
+        return level is None or len( self._mipmap_levels ) >= level
+        
+    
+    def PrewarmMipmapForZoom( self, zoom: float ):
+        
+        # the media viewer is about to ask for tiles at this zoom, so we build the level they will be cut from ahead of time
+        
+        if not self._is_ready or self._render_failed:
+            
+            return
+            
+        
+        ( my_width, my_height ) = self._resolution
+        
+        if self._numpy_image.shape[:2] != ( my_height, my_width ):
+            
+            return
+            
+        
+        level = self._GetMipmapLevelNumberForZoom( zoom )
+        
+        if level is not None:
+            
+            self._GetMipmapLevel( level )
+            
+        
+    
     def RenderFailed( self ):
         
         return self._render_failed
@@ -585,6 +772,7 @@ class RasterContainerVideo( RasterContainer ):
         self._renderer = None
         
         self._frames = {}
+        self._frame_ring_buffer: VideoFrameRingBuffer | None = None
         self._frame_durations_ms = []
         
         self._buffer_start_index = -1
@@ -684,6 +872,13 @@ class RasterContainerVideo( RasterContainer ):
         
         for i in deletees:
             
+            frame = self._frames[ i ]
+            
+            if isinstance( frame, VideoFrameRingBufferFrame ):
+                
+                self._frame_ring_buffer.ReleaseSlot( frame.GetSlot() )
+                
+            
             del self._frames[ i ]
             
         
@@ -724,6 +919,12 @@ class RasterContainerVideo( RasterContainer ):
             
             frame = self._frames[ index ]
             
+            if isinstance( frame, VideoFrameRingBufferFrame ):
+                
+                # the canvas draws straight from this memory, so it can't be recycled until the next frame is asked for
+                self._frame_ring_buffer.PinSlot( frame.GetSlot() )
+                
+            
         
         num_frames_in_video = self.GetNumFrames()
         
@@ -920,6 +1121,36 @@ class RasterContainerVideo( RasterContainer ):
         self._stop = True
         
     
+    def THREADLoadKeyframeIndex( self, renderer: HydrusVideoHandling.VideoRendererFFMPEG ):
+        
+        hash = self._media.GetHash()
+        
+        keyframe_index = CG.client_controller.Read( 'video_keyframe_index', hash )
+        
+        if keyframe_index is None:
+            
+            try:
+                
+                keyframe_index = HydrusVideoHandling.GetFFMPEGKeyframeIndex( self._path )
+                
+            except Exception as e:
+                
+                HydrusData.Print( 'Could not generate a keyframe index for {}:'.format( hash.hex() ) )
+                
+                HydrusData.PrintException( e, do_wait = False )
+                
+                return
+                
+            
+            CG.client_controller.Write( 'video_keyframe_index', hash, keyframe_index )
+            
+        
+        if not self._stop:
+            
+            renderer.SetKeyframeIndex( keyframe_index )
+            
+        
+    
     def THREADRender( self ):
         
         mime = self._media.GetMime()
@@ -975,6 +1206,17 @@ class RasterContainerVideo( RasterContainer ):
             
             self._renderer = HydrusVideoHandling.VideoRendererFFMPEG( self._path, mime, duration_ms, num_frames_in_video, self._target_resolution )
             
+            # the whole buffer window, plus one being rendered into and one the canvas may still be drawing
+            num_slots = min( self._num_frames_backwards + 1 + self._num_frames_forwards, num_frames_in_video ) + 2
+            
+            self._frame_ring_buffer = VideoFrameRingBuffer( num_slots, self._target_resolution, self._renderer.depth )
+            
+            if mime in HC.VIDEO:
+                
+                # we start rendering right away and the renderer picks up the keyframes whenever they turn up
+                CG.client_controller.CallToThread( self.THREADLoadKeyframeIndex, self._renderer )
+                
+            
         
         # give ui a chance to draw a blank frame rather than hard-charge right into CPUland
         time.sleep( 0.00001 )
@@ -1045,13 +1287,57 @@ class RasterContainerVideo( RasterContainer ):
                     
                     renderer = self._renderer
                     
+                    frame_ring_buffer = self._frame_ring_buffer
+                    
+                    if frame_ring_buffer is None:
+                        
+                        slot = None
+                        
+                    else:
+                        
+                        # clear out anything the buffer window has moved off, so we have somewhere to put this
+                        self._MaintainBuffer()
+                        
+                        slot = frame_ring_buffer.ClaimSlot()
+                        
+                    
                 
                 try:
                     
-                    numpy_image = renderer.read_frame()
+                    if slot is None:
+                        
+                        numpy_image = renderer.read_frame()
+                        
+                    else:
+                        
+                        numpy_image = frame_ring_buffer.GetSlotArray( slot )
+                        
+                        got_a_frame = renderer.read_frame_into( numpy_image )
+                        
+                        if not got_a_frame:
+                            
+                            # the video ran out early, so we repeat the last frame, same as the old read_frame would
+                            
+                            with self._lock:
+                                
+                                previous_frame = self._frames.get( frame_index - 1, None )
+                                
+                            
+                            if not isinstance( previous_frame, VideoFrameRingBufferFrame ):
+                                
+                                numpy_image[:] = 0
+                                
+                            else:
+                                
+                                numpy_image[:] = previous_frame.GetNumPyImage()
+                                
+                            
+                        
                     
                 except Exception as e:
                     
+                    # we do not hand the slot back. if the decode failed partway, nothing else should get a buffer the reader might have had
+                    
                     HydrusData.ShowException( e )
                     
                     return
@@ -1082,7 +1368,14 @@ class RasterContainerVideo( RasterContainer ):
                 
                 if should_save_frame:
                     
-                    frame = GenerateHydrusBitmapFromNumPyImage( numpy_image, compressed = False )
+                    if slot is None:
+                        
+                        frame = GenerateHydrusBitmapFromNumPyImage( numpy_image, compressed = False )
+                        
+                    else:
+                        
+                        frame = VideoFrameRingBufferFrame( frame_ring_buffer, slot )
+                        
                     
                     with self._lock:
                         
@@ -1091,6 +1384,13 @@ class RasterContainerVideo( RasterContainer ):
                         self._MaintainBuffer()
                         
                     
+                elif slot is not None:
+                    
+                    with self._lock:
+                        
+                        frame_ring_buffer.ReleaseSlot( slot )
+                        
+                    
                 
                 with self._lock:
                     
@@ -1204,3 +1504,139 @@ class HydrusBitmap( ClientCachesBase.CacheableObject ):
         return True
         
     
+
+class VideoFrameRingBuffer( object ):
+    
+    # one contiguous block for a video's whole frame buffer, rather than a fresh allocation per frame
+    # the renderer decodes straight into free slots and the canvas draws straight out of them
+    # not threadsafe by itself--the video container's lock covers it
+    
+    def __init__( self, num_slots: int, resolution: tuple[ int, int ], depth: int ):
+        
+        ( width, height ) = resolution
+        
+        self._resolution = resolution
+        self._depth = depth
+        
+        self._block = numpy.empty( ( num_slots, height, width, depth ), dtype = numpy.uint8 )
+        
+        self._free_slots = list( range( num_slots - 1, -1, -1 ) )
+        
+        self._pinned_slot = None
+        self._pinned_slot_is_released = False
+        
+    
+    def ClaimSlot( self ) -> int | None:
+        
+        if len( self._free_slots ) == 0:
+            
+            return None
+            
+        
+        return self._free_slots.pop()
+        
+    
+    def GetDepth( self ) -> int:
+        
+        return self._depth
+        
+    
+    def GetNumSlots( self ) -> int:
+        
+        return len( self._block )
+        
+    
+    def GetResolution( self ) -> tuple[ int, int ]:
+        
+        return self._resolution
+        
+    
+    def GetSlotArray( self, slot: int ) -> numpy.ndarray:
+        
+        return self._block[ slot ]
+        
+    
+    def PinSlot( self, slot: int ):
+        
+        if slot == self._pinned_slot:
+            
+            return
+            
+        
+        if self._pinned_slot is not None and self._pinned_slot_is_released:
+            
+            self._free_slots.append( self._pinned_slot )
+            
+        
+        self._pinned_slot = slot
+        self._pinned_slot_is_released = False
+        
+    
+    def ReleaseSlot( self, slot: int ):
+        
+        if slot == self._pinned_slot:
+            
+            # we'll free it when something else gets pinned
+            self._pinned_slot_is_released = True
+            
+        else:
+            
+            self._free_slots.append( slot )
+            
+        
+    
+
+class VideoFrameRingBufferFrame( object ):
+    
+    # quacks like an uncompressed HydrusBitmap, but it is just a view on a ring buffer slot
+    
+    def __init__( self, frame_ring_buffer: VideoFrameRingBuffer, slot: int ):
+        
+        self._frame_ring_buffer = frame_ring_buffer
+        self._slot = slot
+        
+    
+    def GetDepth( self ) -> int:
+        
+        return self._frame_ring_buffer.GetDepth()
+        
+    
+    def GetEstimatedMemoryFootprint( self ):
+        
+        return self.GetNumPyImage().nbytes
+        
+    
+    def GetNumPyImage( self ) -> numpy.ndarray:
+        
+        return self._frame_ring_buffer.GetSlotArray( self._slot )
+        
+    
+    def GetQtImage( self ) -> QG.QImage:
+        
+        ( width, height ) = self._frame_ring_buffer.GetResolution()
+        
+        return CG.client_controller.bitmap_manager.GetQtImageFromBuffer( width, height, self.GetDepth() * 8, self.GetNumPyImage().data )
+        
+    
+    def GetQtPixmap( self ) -> QG.QPixmap:
+        
+        ( width, height ) = self._frame_ring_buffer.GetResolution()
+        
+        return CG.client_controller.bitmap_manager.GetQtPixmapFromBuffer( width, height, self.GetDepth() * 8, self.GetNumPyImage().data )
+        
+    
+    def GetSize( self ):
+        
+        return self._frame_ring_buffer.GetResolution()
+        
+    
+    def GetSlot( self ) -> int:
+        
+        return self._slot
+        
+    
+    def IsFinishedLoading( self ):
+        
+        return True
+        
+    
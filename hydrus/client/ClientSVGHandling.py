@@ -5,7 +5,7 @@ from qtpy import QtCore as QC
 from hydrus.core import HydrusExceptions
 from hydrus.core.files import HydrusSVGHandling
 
-from hydrus.client import ClientGlobals as CG
+from hydrus.client import ClientRasterisation
 from hydrus.client.gui import ClientGUIFunctions
 
 def QtLoadSVGRenderer( path: str ):
@@ -66,7 +66,7 @@ def GenerateThumbnailNumPyFromSVGPath( path: str, target_resolution: tuple[int,
             
         
     
-    return CG.client_controller.CallBlockingToQtTLW( qt_code )
+    return ClientRasterisation.rasterisation_pool.Render( qt_code )
     
 
 HydrusSVGHandling.GenerateThumbnailNumPyFromSVGPath = GenerateThumbnailNumPyFromSVGPath
@@ -91,7 +91,7 @@ def GetSVGResolution( path: str ):
             
         
     
-    return CG.client_controller.CallBlockingToQtTLW( qt_code )
+    return ClientRasterisation.rasterisation_pool.Render( qt_code )
     
 
 HydrusSVGHandling.GetSVGResolution = GetSVGResolution
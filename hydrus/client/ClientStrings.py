@@ -748,6 +748,59 @@ class StringMatch( StringProcessingStep ):
         self._example_string = example_string
         
     
+    def _GetRegexAndFailReason( self ):
+        
+        r = ''
+        fail_reason = ' (unknown error, this object is probably from a newer client)'
+        
+        if self._match_type == STRING_MATCH_FLEXIBLE:
+            
+            if self._match_value == FLEXIBLE_MATCH_ALPHA:
+                
+                r = r'^[a-zA-Z]+$'
+                fail_reason = ' had non-alpha characters'
+                
+            elif self._match_value == FLEXIBLE_MATCH_ALPHANUMERIC:
+                
+                r = r'^[a-zA-Z\d]+$'
+                fail_reason = ' had non-alphanumeric characters'
+                
+            elif self._match_value == FLEXIBLE_MATCH_NUMERIC:
+                
+                r = r'^\d+$'
+                fail_reason = ' had non-numeric characters'
+                
+            elif self._match_value == FLEXIBLE_MATCH_HEX:
+                
+                r = r'^[\da-fA-F]+$'
+                fail_reason = ' had non-hex characters'
+                
+            elif self._match_value == FLEXIBLE_MATCH_BASE64:
+                
+                r = r'^[a-zA-Z\d+/]+={0,2}$'
+                fail_reason = ' had non-base64 characters'
+                
+            elif self._match_value == FLEXIBLE_MATCH_BASE64_URL_ENCODED:
+                
+                r = r'^([a-zA-Z\d]|%2B|%2F)+(%3D){0,2}$'
+                fail_reason = ' had non-base64 (url-encoded) characters'
+                
+            elif self._match_value == FLEXIBLE_MATCH_BASE64URL:
+                
+                r = r'^[a-zA-Z\d\-_]+={0,2}$'
+                fail_reason = ' had non-base64url characters'
+                
+            
+        elif self._match_type == STRING_MATCH_REGEX:
+            
+            r = self._match_value
+            
+            fail_reason = ' did not match "' + r + '"'
+            
+        
+        return ( r, fail_reason )
+        
+    
     def _GetSerialisableInfo( self ):
         
         return ( self._match_type, self._match_value, self._min_chars, self._max_chars, self._example_string )
@@ -758,6 +811,63 @@ class StringMatch( StringProcessingStep ):
         ( self._match_type, self._match_value, self._min_chars, self._max_chars, self._example_string ) = serialisable_info
         
     
+    def GenerateMatchCallable( self ) -> collections.abc.Callable[ [ str ], bool ]:
+        
+        # an exception-free equivalent of Matches, with any regex compiled ahead of time, for hot loops like url class matching
+        
+        min_chars = self._min_chars
+        max_chars = self._max_chars
+        
+        if self._match_type == STRING_MATCH_FIXED:
+            
+            match_value = self._match_value
+            
+            value_test = lambda text: text == match_value
+            
+        elif self._match_type in ( STRING_MATCH_FLEXIBLE, STRING_MATCH_REGEX ):
+            
+            ( r, fail_reason ) = self._GetRegexAndFailReason()
+            
+            try:
+                
+                compiled_r = re.compile( r )
+                
+            except Exception as e:
+                
+                # Test would raise on this, so nothing matches
+                return lambda text: False
+                
+            
+            value_test = lambda text: compiled_r.search( ''.join( text.splitlines() ).strip() ) is not None
+            
+        else:
+            
+            value_test = None
+            
+        
+        def match_callable( text: str ) -> bool:
+            
+            if isinstance( text, bytes ):
+                
+                return False
+                
+            
+            if min_chars is not None and len( text ) < min_chars:
+                
+                return False
+                
+            
+            if max_chars is not None and len( text ) > max_chars:
+                
+                return False
+                
+            
+            return value_test is None or value_test( text )
+            
+        
+        return match_callable
+        
+    
     def GetExampleString( self ):
         
         return self._example_string
@@ -832,53 +942,7 @@ class StringMatch( StringProcessingStep ):
             
         elif self._match_type in ( STRING_MATCH_FLEXIBLE, STRING_MATCH_REGEX ):
             
-            r = ''
-            fail_reason = ' (unknown error, this object is probably from a newer client)'
-            
-            if self._match_type == STRING_MATCH_FLEXIBLE:
-                
-                if self._match_value == FLEXIBLE_MATCH_ALPHA:
-                    
-                    r = r'^[a-zA-Z]+$'
-                    fail_reason = ' had non-alpha characters'
-                    
-                elif self._match_value == FLEXIBLE_MATCH_ALPHANUMERIC:
-                    
-                    r = r'^[a-zA-Z\d]+$'
-                    fail_reason = ' had non-alphanumeric characters'
-                    
-                elif self._match_value == FLEXIBLE_MATCH_NUMERIC:
-                    
-                    r = r'^\d+$'
-                    fail_reason = ' had non-numeric characters'
-                    
-                elif self._match_value == FLEXIBLE_MATCH_HEX:
-                    
-                    r = r'^[\da-fA-F]+$'
-                    fail_reason = ' had non-hex characters'
-                    
-                elif self._match_value == FLEXIBLE_MATCH_BASE64:
-                    
-                    r = r'^[a-zA-Z\d+/]+={0,2}$'
-                    fail_reason = ' had non-base64 characters'
-                    
-                elif self._match_value == FLEXIBLE_MATCH_BASE64_URL_ENCODED:
-                    
-                    r = r'^([a-zA-Z\d]|%2B|%2F)+(%3D){0,2}$'
-                    fail_reason = ' had non-base64 (url-encoded) characters'
-                    
-                elif self._match_value == FLEXIBLE_MATCH_BASE64URL:
-                    
-                    r = r'^[a-zA-Z\d\-_]+={0,2}$'
-                    fail_reason = ' had non-base64url characters'
-                    
-                
-            elif self._match_type == STRING_MATCH_REGEX:
-                
-                r = self._match_value
-                
-                fail_reason = ' did not match "' + r + '"'
-                
+            ( r, fail_reason ) = self._GetRegexAndFailReason()
             
             try:
                 
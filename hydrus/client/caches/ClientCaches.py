@@ -130,6 +130,9 @@ class ParsingCache( object ):
         
     
 
+# how many images we let the media viewer prefetch render at once. the current image is one of them
+PREFETCH_MAX_IN_FLIGHT = max( 2, HydrusThreading.CPU_HEAVY_MAX_SIMULTANEOUS_JOBS )
+
 class ImageRendererCache( object ):
     
     def __init__( self, controller: "CG.ClientController.Controller" ):
@@ -145,9 +148,13 @@ class ImageRendererCache( object ):
         
         self._data_cache = ClientCachesBase.DataCache( self._controller, 'image cache', cache_size, timeout = cache_timeout )
         
+        # the renderers we started as prefetch and are still rendering. only touched from the gui thread
+        self._prefetch_hashes_in_flight = set()
+        
         self._controller.sub( self, 'NotifyNewOptions', 'notify_new_options' )
         self._controller.sub( self, 'Clear', 'clear_image_cache' )
         self._controller.sub( self, 'ClearSpecificFiles', 'notify_files_need_cache_clear' )
+        self._controller.sub( self, 'NotifyImageRendererMemoryFootprintChanged', 'notify_image_renderer_memory_footprint_changed' )
         
     
     def Clear( self ):
@@ -200,6 +207,11 @@ class ImageRendererCache( object ):
         return self._data_cache.HasData( key )
         
     
+    def NotifyImageRendererMemoryFootprintChanged( self, hash ):
+        
+        self._data_cache.UpdateEstimatedMemoryFootprint( hash )
+        
+    
     def NotifyNewOptions( self ):
         
         cache_size = self._controller.new_options.GetInteger( 'image_cache_size' )
@@ -208,7 +220,16 @@ class ImageRendererCache( object ):
         self._data_cache.SetCacheSizeAndTimeout( cache_size, cache_timeout )
         
     
-    def PrefetchImageRenderers( self, media_results: list[ ClientMediaResult.MediaResult ] ):
+    def PrefetchImageRenderers( self, media_results: list[ ClientMediaResult.MediaResult ], hashes_to_zooms: dict[ bytes, float ] | None = None ):
+        """
+        Takes media results in preference order and keeps up to PREFETCH_MAX_IN_FLIGHT of them rendering at once.
+        Prefetches that are no longer wanted, because the user jumped elsewhere, are dropped. Anything ready is prewarmed for the zoom it will be shown at.
+        """
+        
+        if hashes_to_zooms is None:
+            
+            hashes_to_zooms = {}
+            
         
         image_cache_storage_limit_percentage = self._controller.new_options.GetInteger( 'image_cache_storage_limit_percentage' )
         image_cache_prefetch_limit_percentage = self._controller.new_options.GetInteger( 'image_cache_prefetch_limit_percentage' )
@@ -219,6 +240,27 @@ class ImageRendererCache( object ):
         total_size_we_are_ok_with = cache_size * ( image_cache_prefetch_limit_percentage / 100 )
         total_size_we_have_prefetched_here = 0
         
+        wanted_hashes = { media_result.GetHash() for media_result in media_results }
+        
+        for hash in list( self._prefetch_hashes_in_flight ):
+            
+            if hash not in wanted_hashes:
+                
+                # the render thread will finish, but we drop our reference so it isn't taking up space we want for the new neighbours
+                
+                result = self._data_cache.GetIfHasData( hash )
+                
+                if result is not None and not typing.cast( ClientRendering.ImageRenderer, result ).IsReady():
+                    
+                    self._data_cache.DeleteData( hash )
+                    
+                
+                self._prefetch_hashes_in_flight.discard( hash )
+                
+            
+        
+        num_in_flight = 0
+        
         for media_result in media_results:
             
             hash = media_result.GetHash()
@@ -231,48 +273,65 @@ class ImageRendererCache( object ):
                 
                 image_renderer = typing.cast( ClientRendering.ImageRenderer, result )
                 
+                total_size_we_have_prefetched_here += image_renderer.GetEstimatedMemoryFootprint()
+                
                 if image_renderer.IsReady():
                     
-                    total_size_we_have_prefetched_here += image_renderer.GetEstimatedMemoryFootprint()
+                    self._prefetch_hashes_in_flight.discard( hash )
+                    
+                    if hash in hashes_to_zooms and not image_renderer.MipmapIsWarmForZoom( hashes_to_zooms[ hash ] ):
+                        
+                        self._controller.CallToThread( image_renderer.PrewarmMipmapForZoom, hashes_to_zooms[ hash ] )
+                        
                     
                 else:
                     
-                    return # we are still rendering a guy, no desire to add more work right now
+                    num_in_flight += 1
                     
                 
-            else:
+                continue
+                
+            
+            # ok, here's a guy to do
+            
+            if num_in_flight >= PREFETCH_MAX_IN_FLIGHT:
                 
-                # ok, here's a guy to do
+                return # we are busy enough. we'll be called again when one finishes
                 
-                ( width, height ) = media_result.GetResolution()
+            
+            ( width, height ) = media_result.GetResolution()
+            
+            if width is None or height is None:
                 
-                if width is None or height is None:
-                    
-                    return
-                    
+                return
                 
-                expected_size = width * height * 3
+            
+            expected_size = ClientRendering.EstimateImageRendererMemoryFootprint( media_result )
+            
+            if total_size_we_have_prefetched_here + expected_size > total_size_we_are_ok_with:
                 
-                if total_size_we_have_prefetched_here + expected_size > total_size_we_are_ok_with:
-                    
-                    return # ok, this prefetch is pretty bulky
-                    
+                return # ok, this prefetch is pretty bulky
                 
-                if expected_size > single_file_size_we_are_ok_with:
-                    
-                    return # ok this guy is too bulky to save
-                    
+            
+            if expected_size > single_file_size_we_are_ok_with:
                 
-                successful = self._data_cache.TryToFlushEasySpaceForPrefetch( expected_size )
+                return # ok this guy is too bulky to save
                 
-                if successful:
-                    
-                    self.GetImageRenderer( media_result )
-                    
+            
+            successful = self._data_cache.TryToFlushEasySpaceForPrefetch( expected_size )
+            
+            if not successful:
                 
                 return
                 
             
+            self.GetImageRenderer( media_result )
+            
+            self._prefetch_hashes_in_flight.add( hash )
+            
+            num_in_flight += 1
+            total_size_we_have_prefetched_here += expected_size
+            
         
     
 
@@ -285,7 +344,8 @@ class ImageTileCache( object ):
         cache_size = self._controller.new_options.GetInteger( 'image_tile_cache_size' )
         cache_timeout = self._controller.new_options.GetInteger( 'image_tile_cache_timeout' )
         
-        self._data_cache = ClientCachesBase.DataCache( self._controller, 'image tile cache', cache_size, timeout = cache_timeout )
+        # tile keys start with the hash, so we can clear a file's tiles without scanning the whole cache
+        self._data_cache = ClientCachesBase.DataCache( self._controller, 'image tile cache', cache_size, timeout = cache_timeout, key_to_group_callable = lambda key: key[0] )
         
         self._controller.sub( self, 'NotifyNewOptions', 'notify_new_options' )
         self._controller.sub( self, 'Clear', 'clear_image_tile_cache' )
@@ -301,17 +361,7 @@ class ImageTileCache( object ):
         
         for hash in hashes:
             
-            keys = self._data_cache.GetAllKeys()
-            
-            for key in keys:
-                
-                key = typing.cast( tuple, key )
-                
-                if key[0] == hash:
-                    
-                    self._data_cache.DeleteData( key )
-                    
-                
+            self._data_cache.DeleteGroup( hash )
             
         
     
@@ -24,7 +24,7 @@ class CacheableObject( object ):
 
 class DataCache( object ):
     
-    def __init__( self, controller: "CG.ClientController.Controller", name, cache_size, timeout = 1200 ):
+    def __init__( self, controller: "CG.ClientController.Controller", name, cache_size, timeout = 1200, key_to_group_callable: collections.abc.Callable[ [ typing.Any ], typing.Any ] | None = None ):
         
         self._controller = controller
         self._name = name
@@ -34,6 +34,10 @@ class DataCache( object ):
         self._keys_to_data: dict[ typing.Any, tuple[ CacheableObject, int ] ] = {}
         self._keys_fifo = collections.OrderedDict()
         
+        # if the keys fall into natural groups, like many tiles for one file, we index them so a whole group can go at once
+        self._key_to_group_callable = key_to_group_callable
+        self._groups_to_keys = collections.defaultdict( set )
+        
         self._total_estimated_memory_footprint = 0
         
         self._lock = threading.Lock()
@@ -57,6 +61,18 @@ class DataCache( object ):
         
         del self._keys_to_data[ key ]
         
+        if self._key_to_group_callable is not None:
+            
+            group = self._key_to_group_callable( key )
+            
+            self._groups_to_keys[ group ].discard( key )
+            
+            if len( self._groups_to_keys[ group ] ) == 0:
+                
+                del self._groups_to_keys[ group ]
+                
+            
+        
         self._total_estimated_memory_footprint -= size_estimate
         
         if HG.cache_report_mode:
@@ -112,6 +128,7 @@ class DataCache( object ):
             
             self._keys_to_data = {}
             self._keys_fifo = collections.OrderedDict()
+            self._groups_to_keys = collections.defaultdict( set )
             
             self._total_estimated_memory_footprint = 0
             
@@ -132,6 +149,11 @@ class DataCache( object ):
                 
                 self._keys_to_data[ key ] = ( data, size_estimate )
                 
+                if self._key_to_group_callable is not None:
+                    
+                    self._groups_to_keys[ self._key_to_group_callable( key ) ].add( key )
+                    
+                
                 self._total_estimated_memory_footprint += size_estimate
                 
                 self._TouchKey( key )
@@ -159,6 +181,22 @@ class DataCache( object ):
             
         
     
+    def DeleteGroup( self, group ):
+        
+        with self._lock:
+            
+            if group not in self._groups_to_keys:
+                
+                return
+                
+            
+            for key in list( self._groups_to_keys[ group ] ):
+                
+                self._Delete( key )
+                
+            
+        
+    
     def GetAllKeys( self ) -> list[ object ]:
         
         with self._lock:
@@ -257,6 +295,33 @@ class DataCache( object ):
             
         
     
+    def UpdateEstimatedMemoryFootprint( self, key ) -> None:
+        """
+        For data that grows after it is added. We account for the new size and make room if we are now over.
+        """
+        
+        with self._lock:
+            
+            if key not in self._keys_to_data:
+                
+                return
+                
+            
+            ( data, size_estimate ) = self._keys_to_data[ key ]
+            
+            new_estimate = data.GetEstimatedMemoryFootprint()
+            
+            self._total_estimated_memory_footprint += new_estimate - size_estimate
+            
+            self._keys_to_data[ key ] = ( data, new_estimate )
+            
+            while self._total_estimated_memory_footprint > self._cache_size and len( self._keys_fifo ) > 0:
+                
+                self._DeleteItem()
+                
+            
+        
+    
     def _DeleteLoadedItemsUntilFreeSpace( self, free_space_desired: int ) -> bool:
         
         current_free_space = self._cache_size - self._total_estimated_memory_footprint
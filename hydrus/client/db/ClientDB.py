@@ -27,6 +27,7 @@ from hydrus.core import HydrusTime
 from hydrus.core.networking import HydrusNetwork
 
 from hydrus.client import ClientAPI
+from hydrus.client import ClientBackup
 from hydrus.client import ClientConstants as CC
 from hydrus.client import ClientDefaults
 from hydrus.client import ClientGlobals as CG
@@ -387,14 +388,25 @@ class DB( HydrusDB.HydrusDB ):
             
             if os.path.exists( client_files_default ):
                 
-                HydrusPaths.MirrorTree( client_files_default, os.path.join( path, 'client_files' ), text_update_hook = text_update_hook, is_cancelled_hook = is_cancelled_hook )
+                ClientBackup.MirrorClientFilesIncrementally( client_files_default, os.path.join( path, 'client_files' ), path, text_update_hook = text_update_hook, is_cancelled_hook = is_cancelled_hook )
                 
             
+        except HydrusExceptions.CancelledException:
+            
+            pass
+            
         finally:
             
             self._InitDBConnection()
             
-            job_status.SetStatusText( 'backup complete!' )
+            if job_status.IsCancelled():
+                
+                job_status.SetStatusText( 'backup cancelled! the media file copy will pick up where it left off next time' )
+                
+            else:
+                
+                job_status.SetStatusText( 'backup complete!' )
+                
             
             job_status.Finish()
             
@@ -1378,6 +1390,8 @@ class DB( HydrusDB.HydrusDB ):
         
         self._DeleteServiceDropMappingsTables( service_id, service_type )
         
+        self.modules_related_tags_cache.Drop( service_id )
+        
         self.modules_services.DeleteService( service_id )
         
         service_update = ClientServices.ServiceUpdate( HC.SERVICE_UPDATE_RESET )
@@ -2918,6 +2932,13 @@ class DB( HydrusDB.HydrusDB ):
         return None
         
     
+    def _GetBackupFilenames( self ):
+        
+        additional_filenames = [ filename for filename in self._GetPossibleAdditionalDBFilenames() if os.path.exists( os.path.join( self._db_dir, filename ) ) ]
+        
+        return ( dict( self._db_filenames ), additional_filenames )
+        
+    
     def _GetPossibleAdditionalDBFilenames( self ):
         
         paths = HydrusDB.HydrusDB._GetPossibleAdditionalDBFilenames( self )
@@ -3008,7 +3029,7 @@ class DB( HydrusDB.HydrusDB ):
             # counter can just take a list of gubbins like this
             results_dict.update( loop_of_results )
             
-            if cancelled_hook():
+            if cancelled_hook is not None and cancelled_hook():
                 
                 we_stopped_early = True
                 
@@ -3146,12 +3167,34 @@ class DB( HydrusDB.HydrusDB ):
         max_num_files_to_search *= magical_later_multiplication_smoothing_coefficient
         
         search_tag_ids_to_tag_ids_to_matching_counts = {}
+        search_tag_ids_to_num_files_searched = {}
         
         for search_tag in search_tags_sorted_ascending:
             
             search_tag_id = self.modules_tags_local_cache.GetTagId( search_tag )
             
-            ( tag_ids_to_matching_counts, it_stopped_early ) = self._GetRelatedTagCountsForOneTag( tag_display_type, file_service_id, tag_service_id, search_tag_id, max_num_files_to_search, stop_time_for_finding_results = stop_time_for_finding_results )
+            sketch = None
+            
+            if search_tag_ids_to_total_counts[ search_tag_id ] >= ClientDBTagSuggestions.RELATED_TAGS_SKETCH_MIN_COUNT:
+                
+                # big tags are sampled properly in the background. if we don't have one yet, this queues it up
+                sketch = self.modules_related_tags_cache.GetSketch( file_service_id, tag_service_id, search_tag_id, search_tag_ids_to_total_counts[ search_tag_id ] )
+                
+            
+            if sketch is None:
+                
+                ( tag_ids_to_matching_counts, it_stopped_early ) = self._GetRelatedTagCountsForOneTag( tag_display_type, file_service_id, tag_service_id, search_tag_id, max_num_files_to_search, stop_time_for_finding_results = stop_time_for_finding_results )
+                
+                search_tag_ids_to_num_files_searched[ search_tag_id ] = max_num_files_to_search
+                
+            else:
+                
+                ( tag_ids_to_matching_counts, num_files_searched ) = sketch
+                
+                it_stopped_early = False
+                
+                search_tag_ids_to_num_files_searched[ search_tag_id ] = num_files_searched
+                
             
             if search_tag_id in tag_ids_to_matching_counts:
                 
@@ -3250,12 +3293,14 @@ class DB( HydrusDB.HydrusDB ):
             
             search_tag_count = tag_ids_to_total_counts[ search_tag_id ]
             
+            num_files_searched = search_tag_ids_to_num_files_searched[ search_tag_id ]
+            
             matching_count_multiplier = 1.0
             
-            if search_tag_count > max_num_files_to_search:
+            if search_tag_count > num_files_searched:
                 
                 # had we searched everything, how much bigger would the results probably be?
-                matching_count_multiplier = search_tag_count / max_num_files_to_search
+                matching_count_multiplier = search_tag_count / num_files_searched
                 
             
             weight = get_weight_from_dict( search_tag_ids_to_search_tags[ search_tag_id ], search_tag_slices_weight_dict )
@@ -3627,6 +3672,20 @@ class DB( HydrusDB.HydrusDB ):
         return self.modules_hashes_local_cache.GetHashes( hash_ids )
         
     
+    def _GetVideoFrameCount( self, hash: bytes ) -> int | None:
+        
+        hash_id = self.modules_hashes_local_cache.GetHashId( hash )
+        
+        return self.modules_files_metadata_basic.GetVideoFrameCount( hash_id )
+        
+    
+    def _GetVideoKeyframeIndex( self, hash: bytes ) -> list[ tuple[ int, int ] ] | None:
+        
+        hash_id = self.modules_hashes_local_cache.GetHashId( hash )
+        
+        return self.modules_files_metadata_basic.GetVideoKeyframeIndex( hash_id )
+        
+    
     def _ImportFile( self, file_import_job: ClientImportFiles.FileImportJob ):
         
         if HG.file_import_report_mode:
@@ -3666,6 +3725,13 @@ class DB( HydrusDB.HydrusDB ):
             
             self.modules_files_metadata_basic.AddFilesInfo( [ ( hash_id, size, mime, width, height, duration_ms, num_frames, has_audio, num_words ) ], overwrite = True )
             
+            num_frames_counted_manually = file_import_job.GetNumFramesCountedManually()
+            
+            if num_frames_counted_manually is not None:
+                
+                self.modules_files_metadata_basic.SetVideoFrameCount( hash_id, num_frames_counted_manually )
+                
+            
             #
             
             pixel_hash = file_import_job.GetPixelHash()
@@ -3834,6 +3900,7 @@ class DB( HydrusDB.HydrusDB ):
         
         self._read_commands_to_methods.update(
             {
+                'backup_filenames' : self._GetBackupFilenames,
                 'boned_stats' : self._GetBonedStats,
                 'file_history' : self._GetFileHistory,
                 'file_system_predicates' : self._GetFileSystemPredicates,
@@ -3852,6 +3919,8 @@ class DB( HydrusDB.HydrusDB ):
                 'tables_and_columns_using_definitions' : self._GetTablesAndColumnsUsingDefinitions,
                 'tag_display_maintenance_status' : self._CacheTagDisplayGetApplicationStatusNumbers,
                 'trash_hashes' : self._GetTrashHashes,
+                'video_frame_count' : self._GetVideoFrameCount,
+                'video_keyframe_index' : self._GetVideoKeyframeIndex
             }
         )
         
@@ -3968,7 +4037,9 @@ class DB( HydrusDB.HydrusDB ):
                 'sync_tag_display_maintenance' : self._CacheTagDisplaySync,
                 'update_server_services' : self._UpdateServerServices,
                 'update_services' : self._UpdateServices,
-                'vacuum' : self._Vacuum
+                'vacuum' : self._Vacuum,
+                'video_frame_count' : self._SetVideoFrameCount,
+                'video_keyframe_index' : self._SetVideoKeyframeIndex
             }
         )
         
@@ -4011,6 +4082,7 @@ class DB( HydrusDB.HydrusDB ):
                 'file_maintenance_clear_jobs' : self.modules_files_maintenance.ClearJobs,
                 'ideal_client_files_locations' : self.modules_files_physical_storage.SetIdealClientFilesLocations,
                 'maintain_hashed_serialisables' : self.modules_serialisable.MaintainHashedStorage,
+                'maintain_related_tags_cache' : self._MaintainRelatedTagsCache,
                 'maintain_similar_files_tree' : self.modules_similar_files.MaintainTree,
                 'missing_archive_timestamps_import_fillin' : self.modules_files_inbox.FillInMissingImportArchiveTimestamps,
                 'missing_archive_timestamps_legacy_fillin' : self.modules_files_inbox.FillInMissingLegacyArchiveTimestamps,
@@ -4029,6 +4101,7 @@ class DB( HydrusDB.HydrusDB ):
                 'reprocess_repository' : self.modules_repositories.ReprocessRepository,
                 'serialisable' : self.modules_serialisable.SetJSONDump,
                 'serialisable_atomic' : self.modules_serialisable.SetJSONComplex,
+                'serialisable_named_journal' : self.modules_serialisable.AppendJSONDumpNamedJournal,
                 'serialisable_simple' : self.modules_serialisable.SetJSONSimple,
                 'serialisables_overwrite' : self.modules_serialisable.OverwriteJSONDumps,
                 'set_repository_update_hashes' : self.modules_repositories.SetRepositoryUpdateHashes,
@@ -4181,6 +4254,10 @@ class DB( HydrusDB.HydrusDB ):
         
         self._modules.append( self.modules_recent_tags )
         
+        self.modules_related_tags_cache = ClientDBTagSuggestions.ClientDBRelatedTagsCache( self._c )
+        
+        self._modules.append( self.modules_related_tags_cache )
+        
         #
         
         self.modules_ratings = ClientDBRatings.ClientDBRatings( self._c, self.modules_services )
@@ -4430,6 +4507,51 @@ class DB( HydrusDB.HydrusDB ):
         self._modules.append( self.modules_files_duplicates_auto_resolution_search )
         
     
+    def _MaintainRelatedTagsCache( self, maintenance_mode = HC.MAINTENANCE_IDLE, stop_time = None ):
+        
+        tag_display_type = ClientTags.TAG_DISPLAY_DISPLAY_ACTUAL
+        
+        num_files_to_search = ClientDBTagSuggestions.RELATED_TAGS_SKETCH_NUM_FILES_TO_SEARCH
+        
+        while True:
+            
+            rows = self.modules_related_tags_cache.GetQueue()
+            
+            if len( rows ) == 0:
+                
+                return
+                
+            
+            for ( file_service_id, tag_service_id, search_tag_id ) in rows:
+                
+                if self._controller.ShouldStopThisWork( maintenance_mode, stop_time = stop_time ):
+                    
+                    return
+                    
+                
+                # take it off first, so a row that errors doesn't get tried forever
+                self.modules_related_tags_cache.RemoveFromQueue( file_service_id, tag_service_id, search_tag_id )
+                
+                search_tag_count = sum( ( abs( current_count ) + abs( pending_count ) for ( tag_id, current_count, pending_count ) in self.modules_mappings_counts.GetCountsForTag( tag_display_type, file_service_id, tag_service_id, search_tag_id ) ) )
+                
+                if search_tag_count < ClientDBTagSuggestions.RELATED_TAGS_SKETCH_MIN_COUNT:
+                    
+                    continue
+                    
+                
+                # no time limit here, we want the whole sample
+                ( tag_ids_to_matching_counts, it_stopped_early ) = self._GetRelatedTagCountsForOneTag( tag_display_type, file_service_id, tag_service_id, search_tag_id, num_files_to_search )
+                
+                if search_tag_id in tag_ids_to_matching_counts:
+                    
+                    del tag_ids_to_matching_counts[ search_tag_id ]
+                    
+                
+                self.modules_related_tags_cache.SetSketch( file_service_id, tag_service_id, search_tag_id, search_tag_count, num_files_to_search, tag_ids_to_matching_counts )
+                
+            
+        
+    
     def _ManageDBError( self, job, e ):
         
         if isinstance( e, MemoryError ):
@@ -4444,6 +4566,10 @@ class DB( HydrusDB.HydrusDB ):
             HydrusData.ShowText( 'A database exception looked like it could be a very serious \'database image is malformed\' error! Unless you know otherwise, please shut down the client immediately and check the \'help my db is broke.txt\' under install_dir/db.' )
             
         
+        # this job's writes are about to be rolled back, so anything we cached in memory during it may be wrong
+        self.modules_mappings_counts.ClearCountsCache()
+        self.modules_tag_search.ClearAutocompleteSearchCache()
+        
         if job.IsSynchronous():
             
             db_traceback = 'Database ' + tb
@@ -6962,6 +7088,20 @@ class DB( HydrusDB.HydrusDB ):
         self._SaveOptions( self._controller.options )
         
     
+    def _SetVideoFrameCount( self, hash: bytes, num_frames: int ):
+        
+        hash_id = self.modules_hashes_local_cache.GetHashId( hash )
+        
+        self.modules_files_metadata_basic.SetVideoFrameCount( hash_id, num_frames )
+        
+    
+    def _SetVideoKeyframeIndex( self, hash: bytes, keyframe_index: list[ tuple[ int, int ] ] ):
+        
+        hash_id = self.modules_hashes_local_cache.GetHashId( hash )
+        
+        self.modules_files_metadata_basic.SetVideoKeyframeIndex( hash_id, keyframe_index )
+        
+    
     def _UpdateDB( self, version ):
         
         self._controller.frame_splash_status.SetText( 'updating db to v' + str( version + 1 ) )
@@ -8798,6 +8938,45 @@ class DB( HydrusDB.HydrusDB ):
                 
             
         
+        if version == 659:
+            
+            self._Execute( 'CREATE TABLE IF NOT EXISTS main.video_keyframe_indices ( hash_id INTEGER PRIMARY KEY, keyframe_index TEXT );' )
+            self._Execute( 'CREATE TABLE IF NOT EXISTS main.video_frame_counts ( hash_id INTEGER PRIMARY KEY, num_frames INTEGER );' )
+            
+            self._Execute( 'CREATE TABLE IF NOT EXISTS main.json_dumps_named_journal ( journal_id INTEGER PRIMARY KEY, dump_type INTEGER, dump_name TEXT, dump BLOB_BYTES );' )
+            self._CreateIndex( 'main.json_dumps_named_journal', [ 'dump_type', 'dump_name' ] )
+            
+            self._Execute( 'CREATE TABLE IF NOT EXISTS external_caches.related_tags_sketch_definitions ( file_service_id INTEGER, tag_service_id INTEGER, search_tag_id INTEGER, search_tag_count INTEGER, num_files_searched INTEGER, timestamp_ms INTEGER, PRIMARY KEY ( file_service_id, tag_service_id, search_tag_id ) );' )
+            self._Execute( 'CREATE TABLE IF NOT EXISTS external_caches.related_tags_sketches ( file_service_id INTEGER, tag_service_id INTEGER, search_tag_id INTEGER, tag_id INTEGER, matching_count INTEGER, PRIMARY KEY ( file_service_id, tag_service_id, search_tag_id, tag_id ) ) WITHOUT ROWID;' )
+            self._Execute( 'CREATE TABLE IF NOT EXISTS external_caches.related_tags_sketch_queue ( file_service_id INTEGER, tag_service_id INTEGER, search_tag_id INTEGER, PRIMARY KEY ( file_service_id, tag_service_id, search_tag_id ) );' )
+            
+            try:
+                
+                self._controller.frame_splash_status.SetSubtext( 'generating url search caches' )
+                
+                self._Execute( 'CREATE TABLE IF NOT EXISTS external_caches.url_class_cache_definitions ( url_class_cache_id INTEGER PRIMARY KEY, fingerprint BLOB_BYTES UNIQUE, max_url_id INTEGER, last_used_timestamp_ms INTEGER );' )
+                self._Execute( 'CREATE TABLE IF NOT EXISTS external_caches.url_class_cache_url_map ( url_class_cache_id INTEGER, url_id INTEGER, PRIMARY KEY ( url_class_cache_id, url_id ) ) WITHOUT ROWID;' )
+                self._Execute( 'CREATE TABLE IF NOT EXISTS external_caches.url_domain_mapping_counts ( domain_id INTEGER PRIMARY KEY, mapping_count INTEGER );' )
+                
+                self.modules_url_map.RegenerateDomainMappingCounts()
+                
+                if ClientDBMaster.URL_TRIGRAM_INDEX_OK:
+                    
+                    self._Execute( 'CREATE VIRTUAL TABLE IF NOT EXISTS external_caches.url_trigrams USING fts5( url, content = \'\', tokenize = \'trigram\' );' )
+                    
+                    self.modules_urls.RegenerateURLTrigramIndex()
+                    
+                
+            except Exception as e:
+                
+                HydrusData.PrintException( e )
+                
+                message = 'Trying to generate the new url search caches failed! Please let hydrus dev know!'
+                
+                self.pub_initial_message( message )
+                
+            
+        
         self._controller.frame_splash_status.SetTitleText( 'updated db to v{}'.format( HydrusNumbers.ToHumanInt( version + 1 ) ) )
         
         self._Execute( 'UPDATE version SET version = ?;', ( version + 1, ) )
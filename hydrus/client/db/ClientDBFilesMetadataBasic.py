@@ -1,4 +1,5 @@
 import collections.abc
+import json
 import sqlite3
 
 from hydrus.core import HydrusConstants as HC
@@ -42,6 +43,8 @@ class ClientDBFilesMetadataBasic( ClientDBModule.ClientDBModule ):
             'main.has_exif' : ( 'CREATE TABLE IF NOT EXISTS {} ( hash_id INTEGER PRIMARY KEY );', 505 ),
             'main.has_human_readable_embedded_metadata' : ( 'CREATE TABLE IF NOT EXISTS {} ( hash_id INTEGER PRIMARY KEY );', 505 ),
             'main.has_transparency' : ( 'CREATE TABLE IF NOT EXISTS {} ( hash_id INTEGER PRIMARY KEY );', 552 ),
+            'main.video_frame_counts' : ( 'CREATE TABLE IF NOT EXISTS {} ( hash_id INTEGER PRIMARY KEY, num_frames INTEGER );', 660 ),
+            'main.video_keyframe_indices' : ( 'CREATE TABLE IF NOT EXISTS {} ( hash_id INTEGER PRIMARY KEY, keyframe_index TEXT );', 660 ),
             'external_master.blurhashes' : ( 'CREATE TABLE IF NOT EXISTS {} ( hash_id INTEGER PRIMARY KEY, blurhash TEXT );', 545 )
         }
         
@@ -60,6 +63,12 @@ class ClientDBFilesMetadataBasic( ClientDBModule.ClientDBModule ):
         # hash_id, size, mime, width, height, duration, num_frames, has_audio, num_words
         self._ExecuteMany( insert_phrase + ' files_info ( hash_id, size, mime, width, height, duration, num_frames, has_audio, num_words ) VALUES ( ?, ?, ?, ?, ?, ?, ?, ?, ? );', rows )
         
+        if overwrite:
+            
+            # the file may have been re-parsed into something else, so any keyframe index is suspect. we'll regen it next time it is watched
+            self._ExecuteMany( 'DELETE FROM video_keyframe_indices WHERE hash_id = ?;', ( ( row[0], ) for row in rows ) )
+            
+        
     
     def GetBlurhash( self, hash_id: int ) -> str:
         
@@ -197,7 +206,9 @@ class ClientDBFilesMetadataBasic( ClientDBModule.ClientDBModule ):
                 ( 'has_human_readable_embedded_metadata', 'hash_id' ),
                 ( 'has_icc_profile', 'hash_id' ),
                 ( 'has_transparency', 'hash_id' ),
-                ( 'blurhashes', 'hash_id' )
+                ( 'blurhashes', 'hash_id' ),
+                ( 'video_frame_counts', 'hash_id' ),
+                ( 'video_keyframe_indices', 'hash_id' )
             ]
             
         
@@ -225,6 +236,34 @@ class ClientDBFilesMetadataBasic( ClientDBModule.ClientDBModule ):
         return total_size
         
     
+    def GetVideoFrameCount( self, hash_id: int ) -> int | None:
+        
+        result = self._Execute( 'SELECT num_frames FROM video_frame_counts WHERE hash_id = ?;', ( hash_id, ) ).fetchone()
+        
+        if result is None:
+            
+            return None
+            
+        
+        ( num_frames, ) = result
+        
+        return num_frames
+        
+    
+    def GetVideoKeyframeIndex( self, hash_id: int ) -> list[ tuple[ int, int ] ] | None:
+        
+        result = self._Execute( 'SELECT keyframe_index FROM video_keyframe_indices WHERE hash_id = ?;', ( hash_id, ) ).fetchone()
+        
+        if result is None:
+            
+            return None
+            
+        
+        ( keyframe_index_json, ) = result
+        
+        return [ tuple( row ) for row in json.loads( keyframe_index_json ) ]
+        
+    
     def SetForcedFiletype( self, hash_id: int, forced_mime: int | None ):
         
         self._Execute( 'DELETE FROM files_info_forced_filetypes WHERE hash_id = ?;', ( hash_id, ) )
@@ -300,3 +339,14 @@ class ClientDBFilesMetadataBasic( ClientDBModule.ClientDBModule ):
         self._Execute('INSERT OR REPLACE INTO blurhashes ( hash_id, blurhash ) VALUES ( ?, ?);', ( hash_id, blurhash ) )
         
     
+    def SetVideoFrameCount( self, hash_id: int, num_frames: int ):
+        
+        # this is a manual count of the file's actual bytes, so unlike the keyframe index it stays good through a metadata regen
+        self._Execute( 'REPLACE INTO video_frame_counts ( hash_id, num_frames ) VALUES ( ?, ? );', ( hash_id, num_frames ) )
+        
+    
+    def SetVideoKeyframeIndex( self, hash_id: int, keyframe_index: list[ tuple[ int, int ] ] ):
+        
+        self._Execute( 'REPLACE INTO video_keyframe_indices ( hash_id, keyframe_index ) VALUES ( ?, ? );', ( hash_id, json.dumps( keyframe_index ) ) )
+        
+    
@@ -1,4 +1,5 @@
 import collections.abc
+import heapq
 import random
 import sqlite3
 import typing
@@ -35,6 +36,7 @@ from hydrus.client.media import ClientMedia
 from hydrus.client.metadata import ClientTags
 from hydrus.client.search import ClientNumberTest
 from hydrus.client.search import ClientSearchFileSearchContext
+from hydrus.client.search import ClientSearchHashIdSet
 from hydrus.client.search import ClientSearchPredicate
 from hydrus.client.search import ClientSearchTagContext
 
@@ -42,15 +44,37 @@ SHOWN_UNINITIALISED_SEARCH_ERROR = False
 
 def intersection_update_qhi( query_hash_ids: set[ int ] | None, some_hash_ids: collections.abc.Collection[ int ], force_create_new_set = False ) -> set[ int ]:
     
+    # big query_hash_ids are held in a compact HashIdSet, which quacks like a set but does its algebra in numpy
+    
     if query_hash_ids is None:
         
-        if not isinstance( some_hash_ids, set ) or force_create_new_set:
+        if isinstance( some_hash_ids, ClientSearchHashIdSet.HashIdSet ):
+            
+            if force_create_new_set:
+                
+                some_hash_ids = some_hash_ids.copy()
+                
+            
+        else:
+            
+            if not isinstance( some_hash_ids, set ) or force_create_new_set:
+                
+                some_hash_ids = set( some_hash_ids )
+                
             
-            some_hash_ids = set( some_hash_ids )
+            if len( some_hash_ids ) >= ClientSearchHashIdSet.HASH_ID_SET_THRESHOLD:
+                
+                some_hash_ids = ClientSearchHashIdSet.HashIdSet( some_hash_ids )
+                
             
         
         return some_hash_ids
         
+    elif isinstance( some_hash_ids, ClientSearchHashIdSet.HashIdSet ) and not isinstance( query_hash_ids, ClientSearchHashIdSet.HashIdSet ):
+        
+        # don't iterate the whole big guy in python
+        return ClientSearchHashIdSet.IntersectHashIds( query_hash_ids, some_hash_ids )
+        
     else:
         
         query_hash_ids.intersection_update( some_hash_ids )
@@ -78,6 +102,9 @@ class SearchState( object ):
         self.there_are_simple_files_info_preds_to_search_for = there_are_simple_files_info_preds_to_search_for
         self.done_tricky_incdec_ratings = done_tricky_incdec_ratings
         
+        self.deferred_inbox = False
+        self.tags_to_count_estimates = None
+        
     
     def DoOrPredsInFirstRound( self ):
         
@@ -291,6 +318,45 @@ class ClientDBFilesSearchTags( ClientDBModule.ClientDBModule ):
         super().__init__( 'client file search using tags', cursor )
         
     
+    def GetAutocompleteCountEstimateFromTag( self, tag_display_type: int, location_context: ClientLocation.LocationContext, tag_context: ClientSearchTagContext.TagContext, tag ) -> int:
+        
+        # a cheap look at the a/c count cache, in the same shape as GetHashIdsFromTag, so the query planner can do the rarest tags first
+        
+        if not self.modules_tags.TagExists( tag ):
+            
+            return 0
+            
+        
+        ( file_service_keys, file_location_is_cross_referenced ) = location_context.GetCoveringCurrentFileServiceKeys()
+        
+        if tag_context.service_key == CC.COMBINED_TAG_SERVICE_KEY:
+            
+            search_tag_service_ids = self.modules_services.GetServiceIds( HC.REAL_TAG_SERVICES )
+            
+        else:
+            
+            search_tag_service_ids = ( self.modules_services.GetServiceId( tag_context.service_key ), )
+            
+        
+        tag_id = self.modules_tags.GetTagId( tag )
+        
+        count = 0
+        
+        for search_tag_service_id in search_tag_service_ids:
+            
+            ideal_tag_id = self.modules_tag_siblings.GetIdealTagId( tag_display_type, search_tag_service_id, tag_id )
+            
+            for file_service_key in file_service_keys:
+                
+                file_service_id = self.modules_services.GetServiceId( file_service_key )
+                
+                count += self.modules_mappings_counts.GetAutocompleteCountEstimate( tag_display_type, search_tag_service_id, file_service_id, ( ideal_tag_id, ), tag_context.include_current_tags, tag_context.include_pending_tags )
+                
+            
+        
+        return count
+        
+    
     def GetHashIdsAndNonZeroTagCounts( self, tag_display_type: int, location_context: ClientLocation.LocationContext, tag_context: ClientSearchTagContext.TagContext, hash_ids, namespace_wildcard = '*', job_status = None ):
         
         if namespace_wildcard == '*':
@@ -1254,7 +1320,15 @@ class ClientDBFilesQuery( ClientDBModule.ClientDBModule ):
         
         if is_inbox:
             
-            query_hash_ids = intersection_update_qhi( query_hash_ids, self.modules_files_inbox.inbox_hash_ids, force_create_new_set = True )
+            if query_hash_ids is None and self._GetRarestTagCountEstimate( file_search_context, search_state ) < len( self.modules_files_inbox.inbox_hash_ids ):
+                
+                # a tag is more selective than the inbox, so let it go first and filter its small result by the inbox afterwards
+                search_state.deferred_inbox = True
+                
+            else:
+                
+                query_hash_ids = intersection_update_qhi( query_hash_ids, self.modules_files_inbox.inbox_hash_ids, force_create_new_set = True )
+                
             
         
         #
@@ -1325,9 +1399,17 @@ class ClientDBFilesQuery( ClientDBModule.ClientDBModule ):
                 return ( 1 if HydrusTags.IsUnnamespaced( s ) else 0, -len( s ) )
                 
             
+            tags_to_count_estimates = self._GetTagsToCountEstimates( file_search_context, search_state )
+            
+            def cost_key( s ):
+                
+                # rarest first, so its results filter the rest as a small temp table
+                return ( tags_to_count_estimates.get( s, 0 ), sort_longest_tag_first_key( s ) )
+                
+            
             tags_to_include = list( tags_to_include )
             
-            tags_to_include.sort( key = sort_longest_tag_first_key )
+            tags_to_include.sort( key = cost_key )
             
             for tag in tags_to_include:
                 
@@ -1351,6 +1433,13 @@ class ClientDBFilesQuery( ClientDBModule.ClientDBModule ):
                 
                 search_state.have_cross_referenced_file_locations = True
                 
+                if search_state.deferred_inbox:
+                    
+                    query_hash_ids = intersection_update_qhi( query_hash_ids, self.modules_files_inbox.inbox_hash_ids )
+                    
+                    search_state.deferred_inbox = False
+                    
+                
                 if len( query_hash_ids ) == 0:
                     
                     return set()
@@ -2770,6 +2859,73 @@ class ClientDBFilesQuery( ClientDBModule.ClientDBModule ):
         return query_hash_ids
         
     
+    def _GetRarestTagCountEstimate( self, file_search_context: ClientSearchFileSearchContext.FileSearchContext, search_state: SearchState ) -> int | float:
+        
+        tags_to_count_estimates = self._GetTagsToCountEstimates( file_search_context, search_state )
+        
+        if len( tags_to_count_estimates ) == 0:
+            
+            return float( 'inf' )
+            
+        
+        return min( tags_to_count_estimates.values() )
+        
+    
+    def _GetTagsToCountEstimates( self, file_search_context: ClientSearchFileSearchContext.FileSearchContext, search_state: SearchState ) -> dict[ str, int ]:
+        
+        if search_state.tags_to_count_estimates is None:
+            
+            location_context = file_search_context.GetLocationContext()
+            tag_context = file_search_context.GetTagContext()
+            
+            tags_to_include = file_search_context.GetTagsToInclude()
+            
+            search_state.tags_to_count_estimates = { tag : self.modules_files_search_tags.GetAutocompleteCountEstimateFromTag( ClientTags.TAG_DISPLAY_DISPLAY_ACTUAL, location_context, tag_context, tag ) for tag in tags_to_include }
+            
+        
+        return search_state.tags_to_count_estimates
+        
+    
+    def _GetTopKSortedHashIds( self, hash_ids, query: str, key, reverse: bool, sql_order_by: str | None, rows_per_hash_id: int, limit: int ) -> list[ int ]:
+        
+        with self._MakeTemporaryIntegerTable( hash_ids, 'hash_id' ) as temp_hash_ids_table_name:
+            
+            formatted_query = query.format( temp_table = temp_hash_ids_table_name )
+            
+            if sql_order_by is not None:
+                
+                # sqlite does a bounded top-k sort here, and we only fetch 'limit' rows rather than millions
+                
+                direction = 'DESC' if reverse else 'ASC'
+                
+                formatted_query = '{} ORDER BY {} LIMIT {};'.format( formatted_query.rstrip( ';' ), sql_order_by.format( direction = direction ), limit )
+                
+                rows = list( self._Execute( formatted_query ) )
+                
+            else:
+                
+                # a heap over the cursor, so we never hold or sort the whole result
+                
+                num_rows_needed = limit * rows_per_hash_id
+                
+                cursor = self._Execute( formatted_query )
+                
+                if reverse:
+                    
+                    rows = heapq.nlargest( num_rows_needed, cursor, key = key )
+                    
+                else:
+                    
+                    rows = heapq.nsmallest( num_rows_needed, cursor, key = key )
+                    
+                
+            
+        
+        top_hash_ids = HydrusLists.DedupeList( [ row[0] for row in rows ] )
+        
+        return top_hash_ids[:limit]
+        
+    
     def GetHashIdsFromQuery(
         self,
         file_search_context: ClientSearchFileSearchContext.FileSearchContext,
@@ -2993,7 +3149,9 @@ class ClientDBFilesQuery( ClientDBModule.ClientDBModule ):
         
         if sort_by is not None and sort_by.CanSortAtDBLevel( location_context ):
             
-            ( did_sort, query_hash_ids ) = self.TryToSortHashIds( location_context, query_hash_ids, sort_by )
+            limit = system_limit if we_are_applying_limit else None
+            
+            ( did_sort, query_hash_ids ) = self.TryToSortHashIds( location_context, query_hash_ids, sort_by, limit = limit )
             
         
         #
@@ -3031,7 +3189,9 @@ class ClientDBFilesQuery( ClientDBModule.ClientDBModule ):
         return query_hash_ids
         
     
-    def TryToSortHashIds( self, location_context: ClientLocation.LocationContext, hash_ids, sort_by: ClientMedia.MediaSort ):
+    def TryToSortHashIds( self, location_context: ClientLocation.LocationContext, hash_ids, sort_by: ClientMedia.MediaSort, limit: int | None = None ):
+        
+        # if limit is set, we only promise the first 'limit' results are sorted correctly, and we may return only those
         
         did_sort = False
         
@@ -3040,6 +3200,11 @@ class ClientDBFilesQuery( ClientDBModule.ClientDBModule ):
             return ( did_sort, hash_ids )
             
         
+        if limit is not None and limit >= len( hash_ids ):
+            
+            limit = None
+            
+        
         ( sort_metadata, sort_data ) = sort_by.sort_type
         sort_order = sort_by.sort_order
         
@@ -3047,6 +3212,12 @@ class ClientDBFilesQuery( ClientDBModule.ClientDBModule ):
         key = lambda x: 1
         reverse = False
         
+        # if we can say the sort in sql, a limited search can have the db do a top-k sort and only give us those rows
+        sql_order_by = None
+        
+        # some of the simple queries can give more than one row per file
+        rows_per_hash_id = 1
+        
         if sort_metadata == 'system':
             
             simple_sorts = [
@@ -3086,44 +3257,64 @@ class ClientDBFilesQuery( ClientDBModule.ClientDBModule ):
                     
                     query = 'SELECT hash_id, timestamp_ms FROM {temp_table} CROSS JOIN {current_files_table} USING ( hash_id );'.format( temp_table = '{temp_table}', current_files_table = current_files_table_name )
                     
+                    sql_order_by = 'COALESCE( timestamp_ms, -1 ) {direction}, hash_id {direction}'
+                    
                 elif sort_data == CC.SORT_FILES_BY_FILESIZE:
                     
                     query = 'SELECT hash_id, size FROM {temp_table} CROSS JOIN files_info USING ( hash_id );'
                     
+                    sql_order_by = 'COALESCE( size, -1 ) {direction}'
+                    
                 elif sort_data == CC.SORT_FILES_BY_DURATION:
                     
                     query = 'SELECT hash_id, duration FROM {temp_table} CROSS JOIN files_info USING ( hash_id );'
                     
+                    sql_order_by = 'COALESCE( duration, -1 ) {direction}'
+                    
                 elif sort_data == CC.SORT_FILES_BY_FRAMERATE:
                     
                     query = 'SELECT hash_id, num_frames, duration FROM {temp_table} CROSS JOIN files_info USING ( hash_id );'
                     
+                    sql_order_by = 'CASE WHEN num_frames IS NULL OR duration IS NULL OR num_frames <= 0 OR duration <= 0 THEN -1 ELSE CAST( num_frames AS REAL ) / duration END {direction}'
+                    
                 elif sort_data == CC.SORT_FILES_BY_NUM_FRAMES:
                     
                     query = 'SELECT hash_id, num_frames FROM {temp_table} CROSS JOIN files_info USING ( hash_id );'
                     
+                    sql_order_by = 'COALESCE( num_frames, -1 ) {direction}'
+                    
                 elif sort_data == CC.SORT_FILES_BY_WIDTH:
                     
                     query = 'SELECT hash_id, width FROM {temp_table} CROSS JOIN files_info USING ( hash_id );'
                     
+                    sql_order_by = 'COALESCE( width, -1 ) {direction}'
+                    
                 elif sort_data == CC.SORT_FILES_BY_HEIGHT:
                     
                     query = 'SELECT hash_id, height FROM {temp_table} CROSS JOIN files_info USING ( hash_id );'
                     
+                    sql_order_by = 'COALESCE( height, -1 ) {direction}'
+                    
                 elif sort_data == CC.SORT_FILES_BY_RATIO:
                     
                     query = 'SELECT hash_id, width, height FROM {temp_table} CROSS JOIN files_info USING ( hash_id );'
-                        
+                    
+                    sql_order_by = 'CASE WHEN width IS NULL OR height IS NULL OR width = 0 OR height = 0 THEN -1 ELSE CAST( width AS REAL ) / height END {direction}'
+                    
                 elif sort_data == CC.SORT_FILES_BY_NUM_PIXELS:
                     
                     query = 'SELECT hash_id, width, height FROM {temp_table} CROSS JOIN files_info USING ( hash_id );'
                     
+                    sql_order_by = 'CASE WHEN width IS NULL OR height IS NULL OR width = 0 OR height = 0 THEN -1 ELSE width * height END {direction}'
+                    
                 elif sort_data in ( CC.SORT_FILES_BY_MEDIA_VIEWS, CC.SORT_FILES_BY_MEDIA_VIEWTIME ):
                     
                     desired_canvas_types = CG.client_controller.new_options.GetIntegerList( 'file_viewing_stats_interesting_canvas_types' )
                     
                     desired_canvas_types_splayed = HydrusLists.SplayListForDB( desired_canvas_types )
                     
+                    rows_per_hash_id = max( 1, len( desired_canvas_types ) )
+                    
                     if sort_data == CC.SORT_FILES_BY_MEDIA_VIEWS:
                         
                         query = 'SELECT hash_id, views FROM {temp_table} CROSS JOIN file_viewing_stats USING ( hash_id ) WHERE canvas_type IN {desired_canvas_types_splayed};'.format( temp_table = '{temp_table}', desired_canvas_types_splayed = desired_canvas_types_splayed )
@@ -3148,10 +3339,14 @@ class ClientDBFilesQuery( ClientDBModule.ClientDBModule ):
                     
                     query = 'SELECT hash_id, last_viewed_timestamp_ms FROM {temp_table} CROSS JOIN file_viewing_stats USING ( hash_id ) WHERE canvas_type = {canvas_type};'.format( temp_table = '{temp_table}', canvas_type = CC.CANVAS_MEDIA_VIEWER )
                     
+                    sql_order_by = 'COALESCE( last_viewed_timestamp_ms, -1 ) {direction}'
+                    
                 elif sort_data == CC.SORT_FILES_BY_ARCHIVED_TIMESTAMP:
                     
                     query = 'SELECT hash_id, archived_timestamp_ms FROM {temp_table} CROSS JOIN archive_timestamps USING ( hash_id );'
                     
+                    sql_order_by = 'COALESCE( archived_timestamp_ms, -1 ) {direction}'
+                    
                 
                 if sort_data == CC.SORT_FILES_BY_IMPORT_TIME:
                     
@@ -3296,9 +3491,16 @@ class ClientDBFilesQuery( ClientDBModule.ClientDBModule ):
                 
             elif sort_data == CC.SORT_FILES_BY_RANDOM:
                 
-                hash_ids = list( hash_ids )
-                
-                random.shuffle( hash_ids )
+                if limit is None:
+                    
+                    hash_ids = list( hash_ids )
+                    
+                    random.shuffle( hash_ids )
+                    
+                else:
+                    
+                    hash_ids = random.sample( list( hash_ids ), limit )
+                    
                 
                 did_sort = True
                 
@@ -3308,7 +3510,20 @@ class ClientDBFilesQuery( ClientDBModule.ClientDBModule ):
                 
                 reverse = sort_order == CC.SORT_DESC
                 
-                hash_ids = sorted( hash_ids, key = lambda hash_id: hash_ids_to_hashes[ hash_id ], reverse = reverse )
+                hash_key = lambda hash_id: hash_ids_to_hashes[ hash_id ]
+                
+                if limit is None:
+                    
+                    hash_ids = sorted( hash_ids, key = hash_key, reverse = reverse )
+                    
+                elif reverse:
+                    
+                    hash_ids = heapq.nlargest( limit, hash_ids, key = hash_key )
+                    
+                else:
+                    
+                    hash_ids = heapq.nsmallest( limit, hash_ids, key = hash_key )
+                    
                 
                 did_sort = True
                 
@@ -3373,6 +3588,17 @@ class ClientDBFilesQuery( ClientDBModule.ClientDBModule ):
                 
             
         
+        if query is not None and limit is not None:
+            
+            top_hash_ids = self._GetTopKSortedHashIds( hash_ids, query, key, reverse, sql_order_by, rows_per_hash_id, limit )
+            
+            # if there were not enough rows, we need the 'missing' files too, so fall back to the full sort
+            if len( top_hash_ids ) == limit:
+                
+                return ( True, top_hash_ids )
+                
+            
+        
         if query is not None:
             
             with self._MakeTemporaryIntegerTable( hash_ids, 'hash_id' ) as temp_hash_ids_table_name:
@@ -16,6 +16,11 @@ FILES_COMBINED_DISPLAY_AC_CACHE_PREFIX = 'combined_files_display_ac_cache_'
 FILES_SPECIFIC_AC_CACHE_PREFIX = 'specific_ac_cache_'
 FILES_SPECIFIC_DISPLAY_AC_CACHE_PREFIX = 'specific_display_ac_cache_'
 
+# autocomplete asks for the same popular tags again and again from many places, so we hold recent rows in memory, per counts table
+# the counts tables are only written to through this module, so we forget rows exactly as they change
+# a table's cache holds no more than this. a call asking for more, like a '*' search on a big service, skips the cache entirely
+COUNTS_CACHE_MAX_SIZE_PER_TABLE = 250000
+
 def GenerateCombinedFilesMappingsCountsCacheTableName( tag_display_type, tag_service_id ):
     
     if tag_display_type == ClientTags.TAG_DISPLAY_STORAGE:
@@ -74,6 +79,139 @@ class ClientDBMappingsCounts( ClientDBModule.ClientDBModule ):
         self._missing_storage_tag_service_pairs = set()
         self._missing_display_tag_service_pairs = set()
         
+        # counts_cache_table_name -> tag_id -> ( current_count, pending_count ), or None if the tag has no row
+        self._counts_cache_table_names_to_tag_ids_to_counts = {}
+        
+    
+    def _ClearCountsCache( self, counts_cache_table_name, tag_ids = None ):
+        
+        if counts_cache_table_name not in self._counts_cache_table_names_to_tag_ids_to_counts:
+            
+            return
+            
+        
+        if tag_ids is None:
+            
+            del self._counts_cache_table_names_to_tag_ids_to_counts[ counts_cache_table_name ]
+            
+        else:
+            
+            tag_ids_to_counts = self._counts_cache_table_names_to_tag_ids_to_counts[ counts_cache_table_name ]
+            
+            for tag_id in tag_ids:
+                
+                tag_ids_to_counts.pop( tag_id, None )
+                
+            
+        
+    
+    def _GetCountsRowsCached( self, tag_display_type, file_service_id, tag_service_id, tag_ids, tag_ids_table_name = None ):
+        
+        counts_cache_table_name = self.GetCountsCacheTableName( tag_display_type, file_service_id, tag_service_id )
+        
+        if counts_cache_table_name not in self._counts_cache_table_names_to_tag_ids_to_counts:
+            
+            self._counts_cache_table_names_to_tag_ids_to_counts[ counts_cache_table_name ] = {}
+            
+        
+        tag_ids_to_counts = self._counts_cache_table_names_to_tag_ids_to_counts[ counts_cache_table_name ]
+        
+        if len( tag_ids ) > COUNTS_CACHE_MAX_SIZE_PER_TABLE:
+            
+            # this would push out everything useful, and then not even fit
+            
+            if tag_ids_table_name is not None:
+                
+                return self.GetCountsForTags( tag_display_type, file_service_id, tag_service_id, tag_ids_table_name )
+                
+            
+            with self._MakeTemporaryIntegerTable( tag_ids, 'tag_id' ) as temp_tag_id_table_name:
+                
+                return self.GetCountsForTags( tag_display_type, file_service_id, tag_service_id, temp_tag_id_table_name )
+                
+            
+        
+        uncached_tag_ids = [ tag_id for tag_id in tag_ids if tag_id not in tag_ids_to_counts ]
+        
+        num_to_evict = len( tag_ids_to_counts ) + len( uncached_tag_ids ) - COUNTS_CACHE_MAX_SIZE_PER_TABLE
+        
+        if num_to_evict > 0:
+            
+            # oldest first, but not anything this call is about to read
+            
+            wanted_tag_ids = set( tag_ids )
+            
+            evictee_tag_ids = []
+            
+            for tag_id in tag_ids_to_counts.keys():
+                
+                if tag_id not in wanted_tag_ids:
+                    
+                    evictee_tag_ids.append( tag_id )
+                    
+                    if len( evictee_tag_ids ) == num_to_evict:
+                        
+                        break
+                        
+                    
+                
+            
+            for tag_id in evictee_tag_ids:
+                
+                del tag_ids_to_counts[ tag_id ]
+                
+            
+        
+        if len( uncached_tag_ids ) > 0:
+            
+            if len( uncached_tag_ids ) == 1:
+                
+                ( tag_id, ) = uncached_tag_ids
+                
+                fetched_rows = self.GetCountsForTag( tag_display_type, file_service_id, tag_service_id, tag_id )
+                
+            elif tag_ids_table_name is not None and len( uncached_tag_ids ) == len( tag_ids ):
+                
+                fetched_rows = self.GetCountsForTags( tag_display_type, file_service_id, tag_service_id, tag_ids_table_name )
+                
+            else:
+                
+                with self._MakeTemporaryIntegerTable( uncached_tag_ids, 'tag_id' ) as temp_tag_id_table_name:
+                    
+                    fetched_rows = self.GetCountsForTags( tag_display_type, file_service_id, tag_service_id, temp_tag_id_table_name )
+                    
+                
+            
+            for tag_id in uncached_tag_ids:
+                
+                tag_ids_to_counts[ tag_id ] = None
+                
+            
+            for ( tag_id, current_count, pending_count ) in fetched_rows:
+                
+                tag_ids_to_counts[ tag_id ] = ( current_count, pending_count )
+                
+            
+            if len( uncached_tag_ids ) == len( tag_ids ):
+                
+                return fetched_rows
+                
+            
+        
+        rows = []
+        
+        for tag_id in tag_ids:
+            
+            counts = tag_ids_to_counts.get( tag_id, None )
+            
+            if counts is not None:
+                
+                rows.append( ( tag_id, *counts ) )
+                
+            
+        
+        return rows
+        
     
     def _GetServiceTableGenerationDictSingle( self, tag_display_type, file_service_id, tag_service_id ):
         
@@ -180,6 +318,8 @@ class ClientDBMappingsCounts( ClientDBModule.ClientDBModule ):
                 
             
         
+        self._ClearCountsCache( counts_cache_table_name, tag_ids = [ tag_id for ( tag_id, current_delta, pending_delta ) in ac_cache_changes ] )
+        
         if len( new_tag_ids ) < len( ac_cache_changes ):
             
             self._ExecuteMany( 'UPDATE {} SET current_count = current_count + ?, pending_count = pending_count + ? WHERE tag_id = ?;'.format( counts_cache_table_name ), ( ( num_current, num_pending, tag_id ) for ( tag_id, num_current, num_pending ) in ac_cache_changes if tag_id not in new_tag_ids ) )
@@ -192,6 +332,8 @@ class ClientDBMappingsCounts( ClientDBModule.ClientDBModule ):
         
         table_name = self.GetCountsCacheTableName( tag_display_type, file_service_id, tag_service_id )
         
+        self._ClearCountsCache( table_name, tag_ids = tag_ids )
+        
         if tag_ids is None:
             
             if keep_current:
@@ -232,12 +374,19 @@ class ClientDBMappingsCounts( ClientDBModule.ClientDBModule ):
             
         
     
+    def ClearCountsCache( self ):
+        
+        self._counts_cache_table_names_to_tag_ids_to_counts = {}
+        
+    
     def CreateTables( self, tag_display_type, file_service_id, tag_service_id, populate_from_storage = False ):
         
         table_generation_dict = self._GetServiceTableGenerationDictSingle( tag_display_type, file_service_id, tag_service_id )
         
         for ( table_name, ( create_query_without_name, version_added ) ) in table_generation_dict.items():
             
+            self._ClearCountsCache( table_name )
+            
             self._CreateTable( create_query_without_name, table_name )
             
         
@@ -256,6 +405,8 @@ class ClientDBMappingsCounts( ClientDBModule.ClientDBModule ):
         
         table_name = self.GetCountsCacheTableName( tag_display_type, file_service_id, tag_service_id )
         
+        self._ClearCountsCache( table_name )
+        
         self.modules_db_maintenance.DeferredDropTable( table_name )
         
     
@@ -334,44 +485,14 @@ class ClientDBMappingsCounts( ClientDBModule.ClientDBModule ):
         
         cache_results = []
         
-        if len( tag_ids ) > 1:
+        for search_tag_service_id in search_tag_service_ids:
             
-            if tag_ids_table_name is None:
+            if job_status is not None and job_status.IsCancelled():
                 
-                with self._MakeTemporaryIntegerTable( tag_ids, 'tag_id' ) as temp_tag_id_table_name:
-                    
-                    for search_tag_service_id in search_tag_service_ids:
-                        
-                        if job_status is not None and job_status.IsCancelled():
-                            
-                            return {}
-                            
-                        
-                        cache_results.extend( self.GetCountsForTags( tag_display_type, file_service_id, search_tag_service_id, temp_tag_id_table_name ) )
-                        
-                    
-                
-            else:
-                
-                for search_tag_service_id in search_tag_service_ids:
-                    
-                    if job_status is not None and job_status.IsCancelled():
-                        
-                        return {}
-                        
-                    
-                    cache_results.extend( self.GetCountsForTags( tag_display_type, file_service_id, search_tag_service_id, tag_ids_table_name ) )
-                    
+                return {}
                 
             
-        else:
-            
-            ( tag_id, ) = tag_ids
-            
-            for search_tag_service_id in search_tag_service_ids:
-                
-                cache_results.extend( self.GetCountsForTag( tag_display_type, file_service_id, search_tag_service_id, tag_id ) )
-                
+            cache_results.extend( self._GetCountsRowsCached( tag_display_type, file_service_id, search_tag_service_id, tag_ids, tag_ids_table_name = tag_ids_table_name ) )
             
         
         #
@@ -609,6 +730,8 @@ class ClientDBMappingsCounts( ClientDBModule.ClientDBModule ):
                 
             
         
+        self._ClearCountsCache( counts_cache_table_name, tag_ids = [ tag_id for ( tag_id, current_delta, pending_delta ) in ac_cache_changes ] )
+        
         if len( deleted_tag_ids ) < len( ac_cache_changes ):
             
             self._ExecuteMany( 'UPDATE {} SET current_count = current_count - ?, pending_count = pending_count - ? WHERE tag_id = ?;'.format( counts_cache_table_name ), ( ( current_delta, pending_delta, tag_id ) for ( tag_id, current_delta, pending_delta ) in ac_cache_changes if tag_id not in deleted_tag_ids ) )
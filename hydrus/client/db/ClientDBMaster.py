@@ -12,6 +12,35 @@ from hydrus.client.db import ClientDBModule
 from hydrus.client.networking import ClientNetworkingFunctions
 from hydrus.client.networking import ClientNetworkingURLClass
 
+def SQLiteHasTrigramTokenizer():
+    
+    try:
+        
+        db = sqlite3.connect( ':memory:' )
+        
+        try:
+            
+            db.execute( 'CREATE VIRTUAL TABLE trigram_test USING fts5( text, content = \'\', tokenize = \'trigram\' );' )
+            
+        finally:
+            
+            db.close()
+            
+        
+        return True
+        
+    except sqlite3.Error:
+        
+        return False
+        
+    
+
+# fts5 trigram tokenizer is sqlite 3.34+. it lets url substring and regex searches look at candidate urls rather than all of them
+URL_TRIGRAM_INDEX_OK = SQLiteHasTrigramTokenizer()
+
+# trigram MATCH can't do anything with substrings shorter than this
+URL_TRIGRAM_MIN_SUBSTRING_LENGTH = 3
+
 class ClientDBMasterHashes( ClientDBModule.ClientDBModule ):
     
     def __init__( self, cursor: sqlite3.Cursor ):
@@ -817,11 +846,27 @@ class ClientDBMasterURLs( ClientDBModule.ClientDBModule ):
     
     def _GetInitialTableGenerationDict( self ) -> dict:
         
-        return {
+        table_generation_dict = {
             'external_master.url_domains' : ( 'CREATE TABLE IF NOT EXISTS {} ( domain_id INTEGER PRIMARY KEY, domain TEXT UNIQUE );', 400 ),
             'external_master.urls' : ( 'CREATE TABLE IF NOT EXISTS {} ( url_id INTEGER PRIMARY KEY, domain_id INTEGER, url TEXT UNIQUE );', 400 )
         }
         
+        if URL_TRIGRAM_INDEX_OK:
+            
+            # contentless, so we only get url_ids back, but it is about a third of the size
+            table_generation_dict[ 'external_caches.url_trigrams' ] = ( 'CREATE VIRTUAL TABLE IF NOT EXISTS {} USING fts5( url, content = \'\', tokenize = \'trigram\' );', 660 )
+            
+        
+        return table_generation_dict
+        
+    
+    def _RepairRepopulateTables( self, repopulate_table_names, cursor_transaction_wrapper: HydrusDBBase.DBCursorTransactionWrapper ):
+        
+        if 'external_caches.url_trigrams' in repopulate_table_names:
+            
+            self.RegenerateURLTrigramIndex()
+            
+        
     
     def GetTablesAndColumnsThatUseDefinitions( self, content_type: int ) -> list[ tuple[ str, str ] ]:
         
@@ -830,6 +875,17 @@ class ClientDBMasterURLs( ClientDBModule.ClientDBModule ):
         return []
         
     
+    def GetURLIdsFromSubstrings( self, substrings: collections.abc.Collection[ str ] ) -> set[ int ]:
+        """
+        Returns the url_ids of all urls that contain every one of these substrings, case-insensitively. Substrings must be at least three characters.
+        """
+        
+        # each substring is a phrase, and a trigram phrase matches anywhere in the text
+        match_string = ' AND '.join( ( '"{}"'.format( substring.replace( '"', '""' ) ) for substring in substrings ) )
+        
+        return self._STS( self._Execute( 'SELECT rowid FROM url_trigrams WHERE url_trigrams MATCH ?;', ( match_string, ) ) )
+        
+    
     def GetURLDomainId( self, domain ):
         
         result = self._Execute( 'SELECT domain_id FROM url_domains WHERE domain = ?;', ( domain, ) ).fetchone()
@@ -888,6 +944,11 @@ class ClientDBMasterURLs( ClientDBModule.ClientDBModule ):
             
             url_id = self._GetLastRowId()
             
+            if URL_TRIGRAM_INDEX_OK:
+                
+                self._Execute( 'INSERT INTO url_trigrams ( rowid, url ) VALUES ( ?, ? );', ( url_id, url ) )
+                
+            
         else:
             
             ( url_id, ) = result
@@ -896,3 +957,16 @@ class ClientDBMasterURLs( ClientDBModule.ClientDBModule ):
         return url_id
         
     
+    def RegenerateURLTrigramIndex( self ):
+        
+        if not URL_TRIGRAM_INDEX_OK:
+            
+            return
+            
+        
+        # contentless fts5 can't do a normal DELETE
+        self._Execute( 'INSERT INTO url_trigrams ( url_trigrams ) VALUES ( ? );', ( 'delete-all', ) )
+        
+        self._Execute( 'INSERT INTO url_trigrams ( rowid, url ) SELECT url_id, url FROM urls;' )
+        
+    
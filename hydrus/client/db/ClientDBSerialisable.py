@@ -25,6 +25,12 @@ YAML_DUMP_ID_EXPORT_FOLDER = 6
 YAML_DUMP_ID_SUBSCRIPTION = 7
 YAML_DUMP_ID_LOCAL_BOORU = 8
 
+# big named objects that get lots of small changes can append those changes to a journal instead of resaving the whole thing
+# the journal is replayed on load, and once it gets big relative to the object, we fold it back in with a full save
+JOURNALLED_NAMED_DUMP_TYPES = { HydrusSerialisable.SERIALISABLE_TYPE_SUBSCRIPTION_QUERY_LOG_CONTAINER }
+JOURNAL_COMPACTION_MAX_NUM_DELTAS = 50
+JOURNAL_COMPACTION_MAX_SIZE_RATIO = 0.5
+
 def ExportBrokenHashedJSONDump( db_dir, dump, dump_descriptor ):
     
     timestamp_string = time.strftime( '%Y-%m-%d %H-%M-%S' )
@@ -155,6 +161,41 @@ class ClientDBSerialisable( ClientDBModule.ClientDBModule ):
         self.modules_services = modules_services
         
     
+    def _ApplyJSONDumpNamedJournal( self, obj ):
+        
+        ( dump_type, dump_name ) = ( obj.SERIALISABLE_TYPE, obj.GetName() )
+        
+        results = self._Execute( 'SELECT journal_id, dump FROM json_dumps_named_journal WHERE dump_type = ? AND dump_name = ? ORDER BY journal_id ASC;', ( dump_type, dump_name ) ).fetchall()
+        
+        for ( journal_id, dump ) in results:
+            
+            try:
+                
+                if isinstance( dump, bytes ):
+                    
+                    dump = str( dump, 'utf-8' )
+                    
+                
+                delta = HydrusSerialisable.CreateFromSerialisableTuple( json.loads( dump ) )
+                
+            except Exception as e:
+                
+                self._Execute( 'DELETE FROM json_dumps_named_journal WHERE journal_id = ?;', ( journal_id, ) )
+                
+                self._cursor_transaction_wrapper.CommitAndBegin()
+                
+                DealWithBrokenJSONDump( self._db_dir, dump, ( dump_type, dump_name, journal_id ), 'journal for dump_type {} dump_name {} journal_id {}'.format( dump_type, dump_name[:10], journal_id ) )
+                
+                continue
+                
+            
+            if dump_type == HydrusSerialisable.SERIALISABLE_TYPE_SUBSCRIPTION_QUERY_LOG_CONTAINER:
+                
+                obj.GetFileSeedCache().ApplyDeltaFileSeeds( delta )
+                
+            
+        
+    
     def _GetCriticalTableNames( self ) -> collections.abc.Collection[ str ]:
         
         return {
@@ -163,16 +204,59 @@ class ClientDBSerialisable( ClientDBModule.ClientDBModule ):
         }
         
     
+    def _GetInitialIndexGenerationDict( self ) -> dict:
+        
+        index_generation_dict = {}
+        
+        index_generation_dict[ 'main.json_dumps_named_journal' ] = [
+            ( [ 'dump_type', 'dump_name' ], False, 660 )
+        ]
+        
+        return index_generation_dict
+        
+    
     def _GetInitialTableGenerationDict( self ) -> dict:
         
         return {
             'main.json_dict' : ( 'CREATE TABLE IF NOT EXISTS {} ( name TEXT PRIMARY KEY, dump BLOB_BYTES );', 400 ),
             'main.json_dumps' : ( 'CREATE TABLE IF NOT EXISTS {} ( dump_type INTEGER PRIMARY KEY, version INTEGER, dump BLOB_BYTES );', 400 ),
             'main.json_dumps_named' : ( 'CREATE TABLE IF NOT EXISTS {} ( dump_type INTEGER, dump_name TEXT, version INTEGER, timestamp_ms INTEGER, dump BLOB_BYTES, PRIMARY KEY ( dump_type, dump_name, timestamp_ms ) );', 400 ),
-            'main.json_dumps_hashed' : ( 'CREATE TABLE IF NOT EXISTS {} ( hash BLOB_BYTES PRIMARY KEY, dump_type INTEGER, version INTEGER, dump BLOB_BYTES );', 442 )
+            'main.json_dumps_hashed' : ( 'CREATE TABLE IF NOT EXISTS {} ( hash BLOB_BYTES PRIMARY KEY, dump_type INTEGER, version INTEGER, dump BLOB_BYTES );', 442 ),
+            'main.json_dumps_named_journal' : ( 'CREATE TABLE IF NOT EXISTS {} ( journal_id INTEGER PRIMARY KEY, dump_type INTEGER, dump_name TEXT, dump BLOB_BYTES );', 660 )
         }
         
     
+    def AppendJSONDumpNamedJournal( self, dump_type, dump_name, delta: HydrusSerialisable.SerialisableBase ):
+        
+        result = self._Execute( 'SELECT LENGTH( dump ) FROM json_dumps_named WHERE dump_type = ? AND dump_name = ? ORDER BY timestamp_ms DESC;', ( dump_type, dump_name ) ).fetchone()
+        
+        if result is None:
+            
+            # the object was deleted in the meantime, so there is nothing to append to
+            
+            return
+            
+        
+        ( object_num_bytes, ) = result
+        
+        dump = json.dumps( delta.GetSerialisableTuple() )
+        
+        dump_buffer = GenerateBigSQLiteDumpBuffer( dump )
+        
+        self._Execute( 'INSERT INTO json_dumps_named_journal ( dump_type, dump_name, dump ) VALUES ( ?, ?, ? );', ( dump_type, dump_name, dump_buffer ) )
+        
+        ( num_deltas, journal_num_bytes ) = self._Execute( 'SELECT COUNT( * ), SUM( LENGTH( dump ) ) FROM json_dumps_named_journal WHERE dump_type = ? AND dump_name = ?;', ( dump_type, dump_name ) ).fetchone()
+        
+        if num_deltas > JOURNAL_COMPACTION_MAX_NUM_DELTAS or journal_num_bytes > object_num_bytes * JOURNAL_COMPACTION_MAX_SIZE_RATIO:
+            
+            # a full save clears the journal
+            
+            obj = self.GetJSONDumpNamed( dump_type, dump_name = dump_name )
+            
+            self.SetJSONDump( obj )
+            
+        
+    
     def DeleteJSONDump( self, dump_type ):
         
         self._Execute( 'DELETE FROM json_dumps WHERE dump_type = ?;', ( dump_type, ) )
@@ -183,10 +267,12 @@ class ClientDBSerialisable( ClientDBModule.ClientDBModule ):
         if dump_name is None:
             
             self._Execute( 'DELETE FROM json_dumps_named WHERE dump_type = ?;', ( dump_type, ) )
+            self._Execute( 'DELETE FROM json_dumps_named_journal WHERE dump_type = ?;', ( dump_type, ) )
             
         elif timestamp_ms is None:
             
             self._Execute( 'DELETE FROM json_dumps_named WHERE dump_type = ? AND dump_name = ?;', ( dump_type, dump_name ) )
+            self._Execute( 'DELETE FROM json_dumps_named_journal WHERE dump_type = ? AND dump_name = ?;', ( dump_type, dump_name ) )
             
         else:
             
@@ -375,7 +461,14 @@ class ClientDBSerialisable( ClientDBModule.ClientDBModule ):
                     
                     serialisable_info = json.loads( dump )
                     
-                    objs.append( HydrusSerialisable.CreateFromSerialisableTuple( ( dump_type, dump_name, version, serialisable_info ) ) )
+                    obj = HydrusSerialisable.CreateFromSerialisableTuple( ( dump_type, dump_name, version, serialisable_info ) )
+                    
+                    if dump_type in JOURNALLED_NAMED_DUMP_TYPES:
+                        
+                        self._ApplyJSONDumpNamedJournal( obj )
+                        
+                    
+                    objs.append( obj )
                     
                 except Exception as e:
                     
@@ -425,7 +518,14 @@ class ClientDBSerialisable( ClientDBModule.ClientDBModule ):
                 DealWithBrokenJSONDump( self._db_dir, dump, ( dump_type, dump_name, version, object_timestamp_ms ), 'dump_type {} dump_name {} version {} timestamp_ms {}'.format( dump_type, dump_name[:10], version, object_timestamp_ms ) )
                 
             
-            return HydrusSerialisable.CreateFromSerialisableTuple( ( dump_type, dump_name, version, serialisable_info ) )
+            obj = HydrusSerialisable.CreateFromSerialisableTuple( ( dump_type, dump_name, version, serialisable_info ) )
+            
+            if dump_type in JOURNALLED_NAMED_DUMP_TYPES and timestamp_ms is None:
+                
+                self._ApplyJSONDumpNamedJournal( obj )
+                
+            
+            return obj
             
         
     
@@ -666,6 +766,13 @@ class ClientDBSerialisable( ClientDBModule.ClientDBModule ):
                     self._Execute( 'DELETE FROM json_dumps_named WHERE dump_type = ? AND dump_name = ?;', ( dump_type, dump_name ) )
                     
                 
+                if dump_type in JOURNALLED_NAMED_DUMP_TYPES:
+                    
+                    # we are saving everything, so any journal is now folded in
+                    
+                    self._Execute( 'DELETE FROM json_dumps_named_journal WHERE dump_type = ? AND dump_name = ?;', ( dump_type, dump_name ) )
+                    
+                
             else:
                 
                 object_timestamp_ms = force_timestamp_ms
@@ -44,6 +44,11 @@ def ConvertWildcardToSQLiteLikeParameter( wildcard ):
     return like_param
     
 
+# autocomplete tends to search the same popular text over and over from different dropdowns, dialogs and the api
+# the wildcard->tag_ids part is the expensive bit, and the tag search tables only change through this module, so we remember results per tags table and forget them when it changes
+AUTOCOMPLETE_SEARCH_CACHE_MAX_SIZE_PER_TABLE = 256
+AUTOCOMPLETE_SEARCH_CACHE_MAX_NUM_TAG_IDS = 100000
+
 COMBINED_INTEGER_SUBTAGS_PREFIX = 'combined_files_integer_subtags_cache_'
 COMBINED_SUBTAGS_FTS4_PREFIX = 'combined_files_subtags_fts4_cache_'
 COMBINED_SUBTAGS_SEARCHABLE_MAP_PREFIX = 'combined_files_subtags_searchable_map_cache_'
@@ -163,6 +168,80 @@ class ClientDBTagSearch( ClientDBModule.ClientDBModule ):
         
         self._missing_tag_search_service_pairs = set()
         
+        # tags_table_name -> search_text -> tag_ids, before sibling expansion. oldest first
+        self._tags_table_names_to_search_texts_to_tag_ids = {}
+        
+    
+    def _ClearAutocompleteSearchCache( self, file_service_id, tag_service_id ):
+        
+        tags_table_name = self.GetTagsTableName( file_service_id, tag_service_id )
+        
+        if tags_table_name in self._tags_table_names_to_search_texts_to_tag_ids:
+            
+            del self._tags_table_names_to_search_texts_to_tag_ids[ tags_table_name ]
+            
+        
+    
+    def _GetAutocompleteTagIdsWithoutSiblings( self, leaf: ClientDBServices.FileSearchContextLeaf, namespace: str, half_complete_searchable_subtag: str, job_status = None ) -> set[ int ]:
+        
+        if '*' in namespace:
+            
+            namespace_ids = self.GetNamespaceIdsFromWildcard( namespace )
+            
+        else:
+            
+            if not self.modules_tags.NamespaceExists( namespace ):
+                
+                return set()
+                
+            
+            namespace_ids = ( self.modules_tags.GetNamespaceId( namespace ), )
+            
+        
+        if half_complete_searchable_subtag == '*':
+            
+            if namespace == '':
+                
+                # hellmode 'get all tags' search
+                
+                tag_ids = self.GetAllTagIds( leaf, job_status = job_status )
+                
+            else:
+                
+                tag_ids = self.GetTagIdsFromNamespaceIds( leaf, namespace_ids, job_status = job_status )
+                
+            
+        else:
+            
+            tag_ids = set()
+            
+            with self._MakeTemporaryIntegerTable( [], 'subtag_id' ) as temp_subtag_ids_table_name:
+                
+                self.GetSubtagIdsFromWildcardIntoTable( leaf.file_service_id, leaf.tag_service_id, half_complete_searchable_subtag, temp_subtag_ids_table_name, job_status = job_status )
+                
+                if namespace == '':
+                    
+                    loop_of_tag_ids = self.GetTagIdsFromSubtagIdsTable( leaf.file_service_id, leaf.tag_service_id, temp_subtag_ids_table_name, job_status = job_status )
+                    
+                else:
+                    
+                    with self._MakeTemporaryIntegerTable( namespace_ids, 'namespace_id' ) as temp_namespace_ids_table_name:
+                        
+                        loop_of_tag_ids = self.GetTagIdsFromNamespaceIdsSubtagIdsTables( leaf.file_service_id, leaf.tag_service_id, temp_namespace_ids_table_name, temp_subtag_ids_table_name, job_status = job_status )
+                        
+                    
+                
+                tag_ids.update( loop_of_tag_ids )
+                
+            
+        
+        if not isinstance( tag_ids, set ):
+            
+            tag_ids = set( tag_ids )
+            
+        
+        return tag_ids
+        
     
     def _GetServiceIndexGenerationDictSingle( self, file_service_id, tag_service_id ) -> dict:
         
@@ -292,6 +371,8 @@ class ClientDBTagSearch( ClientDBModule.ClientDBModule ):
             return
             
         
+        self._ClearAutocompleteSearchCache( file_service_id, tag_service_id )
+        
         tags_table_name = self.GetTagsTableName( file_service_id, tag_service_id )
         
         actually_new_tag_ids = set()
@@ -358,6 +439,11 @@ class ClientDBTagSearch( ClientDBModule.ClientDBModule ):
             
         
     
+    def ClearAutocompleteSearchCache( self ):
+        
+        self._tags_table_names_to_search_texts_to_tag_ids = {}
+        
+    
     def DeleteTags( self, file_service_id, tag_service_id, tag_ids ):
         
         if len( tag_ids ) == 0:
@@ -384,6 +470,8 @@ class ClientDBTagSearch( ClientDBModule.ClientDBModule ):
         
         #
         
+        self._ClearAutocompleteSearchCache( file_service_id, tag_service_id )
+        
         tags_table_name = self.GetTagsTableName( file_service_id, tag_service_id )
         subtags_fts4_table_name = self.GetSubtagsFTS4TableName( file_service_id, tag_service_id )
         subtags_searchable_map_table_name = self.GetSubtagsSearchableMapTableName( file_service_id, tag_service_id )
@@ -427,6 +515,8 @@ class ClientDBTagSearch( ClientDBModule.ClientDBModule ):
     
     def Drop( self, file_service_id, tag_service_id ):
         
+        self._ClearAutocompleteSearchCache( file_service_id, tag_service_id )
+        
         tags_table_name = self.GetTagsTableName( file_service_id, tag_service_id )
         
         self.modules_db_maintenance.DeferredDropTable( tags_table_name )
@@ -453,6 +543,8 @@ class ClientDBTagSearch( ClientDBModule.ClientDBModule ):
     
     def Generate( self, file_service_id, tag_service_id ):
         
+        self._ClearAutocompleteSearchCache( file_service_id, tag_service_id )
+        
         table_generation_dict = self._GetServiceTableGenerationDictSingle( file_service_id, tag_service_id )
         
         for ( table_name, ( create_query_without_name, version_added ) ) in table_generation_dict.items():
@@ -606,64 +698,43 @@ class ClientDBTagSearch( ClientDBModule.ClientDBModule ):
                 
             
         
-        if '*' in namespace:
+        tags_table_name = self.GetTagsTableName( leaf.file_service_id, leaf.tag_service_id )
+        
+        if tags_table_name not in self._tags_table_names_to_search_texts_to_tag_ids:
             
-            namespace_ids = self.GetNamespaceIdsFromWildcard( namespace )
+            self._tags_table_names_to_search_texts_to_tag_ids[ tags_table_name ] = {}
             
-        else:
+        
+        search_texts_to_tag_ids = self._tags_table_names_to_search_texts_to_tag_ids[ tags_table_name ]
+        
+        if search_text in search_texts_to_tag_ids:
             
-            if not self.modules_tags.NamespaceExists( namespace ):
-                
-                return set()
-                
+            # move it to the end, so it is the last to be culled
+            cached_tag_ids = search_texts_to_tag_ids.pop( search_text )
             
-            namespace_ids = ( self.modules_tags.GetNamespaceId( namespace ), )
+            search_texts_to_tag_ids[ search_text ] = cached_tag_ids
             
-        
-        if half_complete_searchable_subtag == '*':
-            
-            if namespace == '':
-                
-                # hellmode 'get all tags' search
-                
-                tag_ids = self.GetAllTagIds( leaf, job_status = job_status )
-                
-            else:
-                
-                tag_ids = self.GetTagIdsFromNamespaceIds( leaf, namespace_ids, job_status = job_status )
-                
+            tag_ids = set( cached_tag_ids )
             
         else:
             
-            tag_ids = set()
+            tag_ids = self._GetAutocompleteTagIdsWithoutSiblings( leaf, namespace, half_complete_searchable_subtag, job_status = job_status )
             
-            with self._MakeTemporaryIntegerTable( [], 'subtag_id' ) as temp_subtag_ids_table_name:
+            search_was_cancelled = job_status is not None and job_status.IsCancelled()
+            
+            if not search_was_cancelled and len( tag_ids ) <= AUTOCOMPLETE_SEARCH_CACHE_MAX_NUM_TAG_IDS:
                 
-                self.GetSubtagIdsFromWildcardIntoTable( leaf.file_service_id, leaf.tag_service_id, half_complete_searchable_subtag, temp_subtag_ids_table_name, job_status = job_status )
+                search_texts_to_tag_ids[ search_text ] = frozenset( tag_ids )
                 
-                if namespace == '':
-                    
-                    loop_of_tag_ids = self.GetTagIdsFromSubtagIdsTable( leaf.file_service_id, leaf.tag_service_id, temp_subtag_ids_table_name, job_status = job_status )
+                while len( search_texts_to_tag_ids ) > AUTOCOMPLETE_SEARCH_CACHE_MAX_SIZE_PER_TABLE:
                     
-                else:
-                    
-                    with self._MakeTemporaryIntegerTable( namespace_ids, 'namespace_id' ) as temp_namespace_ids_table_name:
-                        
-                        loop_of_tag_ids = self.GetTagIdsFromNamespaceIdsSubtagIdsTables( leaf.file_service_id, leaf.tag_service_id, temp_namespace_ids_table_name, temp_subtag_ids_table_name, job_status = job_status )
-                        
+                    del search_texts_to_tag_ids[ next( iter( search_texts_to_tag_ids ) ) ]
                     
                 
-                tag_ids.update( loop_of_tag_ids )
-                
             
         
         # now fetch siblings, add to set
         
-        if not isinstance( tag_ids, set ):
-            
-            tag_ids = set( tag_ids )
-            
-        
         # for now, this thing can fetch an absolute ton of stuff. you type in '1 female', you are getting a lot of tags, often with no count
         # not a very nice simple way to clear the chaff since in smaller cases those related siblings are useful, including those with no count, so no worries
         
@@ -1508,6 +1579,8 @@ class ClientDBTagSearch( ClientDBModule.ClientDBModule ):
     
     def RegenerateSearchableSubtagMap( self, file_service_id, tag_service_id, status_hook = None ):
         
+        self._ClearAutocompleteSearchCache( file_service_id, tag_service_id )
+        
         subtags_fts4_table_name = self.GetSubtagsFTS4TableName( file_service_id, tag_service_id )
         subtags_searchable_map_table_name = self.GetSubtagsSearchableMapTableName( file_service_id, tag_service_id )
         
@@ -1553,6 +1626,8 @@ class ClientDBTagSearch( ClientDBModule.ClientDBModule ):
     
     def RepopulateMissingSubtags( self, file_service_id, tag_service_id ):
         
+        self._ClearAutocompleteSearchCache( file_service_id, tag_service_id )
+        
         tags_table_name = self.GetTagsTableName( file_service_id, tag_service_id )
         subtags_fts4_table_name = self.GetSubtagsFTS4TableName( file_service_id, tag_service_id )
         subtags_searchable_map_table_name = self.GetSubtagsSearchableMapTableName( file_service_id, tag_service_id )
@@ -1,3 +1,4 @@
+import collections
 import sqlite3
 
 from hydrus.core import HydrusConstants as HC
@@ -9,6 +10,19 @@ from hydrus.client.db import ClientDBMaster
 from hydrus.client.db import ClientDBModule
 from hydrus.client.db import ClientDBServices
 
+# sampling a tag with fewer files than this is quick and exact, so we don't sketch them
+RELATED_TAGS_SKETCH_MIN_COUNT = 1000
+
+# a sketch samples this many files, which is a lot more than a live search can afford, so it is a lot less noisy
+RELATED_TAGS_SKETCH_NUM_FILES_TO_SEARCH = 4000
+
+# and keeps this many of the top co-occurring tags
+RELATED_TAGS_SKETCH_SIZE = 500
+
+# a sketch is queued for rebuild when its tag's count has moved this much since it was made, or it gets this old
+RELATED_TAGS_SKETCH_MAX_COUNT_DRIFT = 0.1
+RELATED_TAGS_SKETCH_MAX_AGE_MS = 30 * 86400 * 1000
+
 class ClientDBRecentTags( ClientDBModule.ClientDBModule ):
     
     def __init__( self, cursor: sqlite3.Cursor, modules_tags: ClientDBMaster.ClientDBMasterTags, modules_services: ClientDBServices.ClientDBMasterServices, modules_tags_local_cache: ClientDBDefinitionsCache.ClientDBCacheLocalTags ):
@@ -100,3 +114,110 @@ class ClientDBRecentTags( ClientDBModule.ClientDBModule ):
             
         
     
+
+class ClientDBRelatedTagsCache( ClientDBModule.ClientDBModule ):
+    
+    def __init__( self, cursor: sqlite3.Cursor ):
+        
+        super().__init__( 'client related tags cache', cursor )
+        
+    
+    def _GetInitialTableGenerationDict( self ) -> dict:
+        
+        return {
+            'external_caches.related_tags_sketch_definitions' : ( 'CREATE TABLE IF NOT EXISTS {} ( file_service_id INTEGER, tag_service_id INTEGER, search_tag_id INTEGER, search_tag_count INTEGER, num_files_searched INTEGER, timestamp_ms INTEGER, PRIMARY KEY ( file_service_id, tag_service_id, search_tag_id ) );', 660 ),
+            'external_caches.related_tags_sketches' : ( 'CREATE TABLE IF NOT EXISTS {} ( file_service_id INTEGER, tag_service_id INTEGER, search_tag_id INTEGER, tag_id INTEGER, matching_count INTEGER, PRIMARY KEY ( file_service_id, tag_service_id, search_tag_id, tag_id ) ) WITHOUT ROWID;', 660 ),
+            'external_caches.related_tags_sketch_queue' : ( 'CREATE TABLE IF NOT EXISTS {} ( file_service_id INTEGER, tag_service_id INTEGER, search_tag_id INTEGER, PRIMARY KEY ( file_service_id, tag_service_id, search_tag_id ) );', 660 )
+        }
+        
+    
+    def _RepairRepopulateTables( self, repopulate_table_names, cursor_transaction_wrapper ):
+        
+        # sketches are queued back up as they are asked for, so a broken table just needs clearing
+        
+        self.Clear()
+        
+    
+    def Clear( self ):
+        
+        self._Execute( 'DELETE FROM related_tags_sketches;' )
+        self._Execute( 'DELETE FROM related_tags_sketch_definitions;' )
+        self._Execute( 'DELETE FROM related_tags_sketch_queue;' )
+        
+    
+    def Drop( self, service_id ):
+        
+        for table_name in ( 'related_tags_sketches', 'related_tags_sketch_definitions', 'related_tags_sketch_queue' ):
+            
+            self._Execute( f'DELETE FROM {table_name} WHERE file_service_id = ? OR tag_service_id = ?;', ( service_id, service_id ) )
+            
+        
+    
+    def GetQueue( self, limit = 100 ) -> list[ tuple[ int, int, int ] ]:
+        
+        return self._Execute( 'SELECT file_service_id, tag_service_id, search_tag_id FROM related_tags_sketch_queue LIMIT ?;', ( limit, ) ).fetchall()
+        
+    
+    def GetSketch( self, file_service_id: int, tag_service_id: int, search_tag_id: int, search_tag_count: int ):
+        """
+        Returns ( tag_ids_to_matching_counts, num_files_searched ), or None if we have nothing. Missing or stale sketches are queued for maintenance, but a stale one is still returned.
+        """
+        
+        result = self._Execute( 'SELECT search_tag_count, num_files_searched, timestamp_ms FROM related_tags_sketch_definitions WHERE file_service_id = ? AND tag_service_id = ? AND search_tag_id = ?;', ( file_service_id, tag_service_id, search_tag_id ) ).fetchone()
+        
+        if result is None:
+            
+            self._Execute( 'INSERT OR IGNORE INTO related_tags_sketch_queue ( file_service_id, tag_service_id, search_tag_id ) VALUES ( ?, ?, ? );', ( file_service_id, tag_service_id, search_tag_id ) )
+            
+            return None
+            
+        
+        ( sketch_search_tag_count, num_files_searched, timestamp_ms ) = result
+        
+        # mapping changes all go through the counts cache, so count drift is our cheap way of noticing this tag has had a lot of mapping work
+        
+        count_drift = abs( search_tag_count - sketch_search_tag_count ) / max( 1, sketch_search_tag_count )
+        
+        if count_drift > RELATED_TAGS_SKETCH_MAX_COUNT_DRIFT or HydrusTime.TimeHasPassedMS( timestamp_ms + RELATED_TAGS_SKETCH_MAX_AGE_MS ):
+            
+            self._Execute( 'INSERT OR IGNORE INTO related_tags_sketch_queue ( file_service_id, tag_service_id, search_tag_id ) VALUES ( ?, ?, ? );', ( file_service_id, tag_service_id, search_tag_id ) )
+            
+        
+        tag_ids_to_matching_counts = collections.Counter( dict( self._Execute( 'SELECT tag_id, matching_count FROM related_tags_sketches WHERE file_service_id = ? AND tag_service_id = ? AND search_tag_id = ?;', ( file_service_id, tag_service_id, search_tag_id ) ) ) )
+        
+        return ( tag_ids_to_matching_counts, num_files_searched )
+        
+    
+    def GetTablesAndColumnsThatUseDefinitions( self, content_type: int ) -> list[ tuple[ str, str ] ]:
+        
+        tables_and_columns = []
+        
+        if content_type == HC.CONTENT_TYPE_TAG:
+            
+            tables_and_columns.append( ( 'related_tags_sketch_definitions', 'search_tag_id' ) )
+            tables_and_columns.append( ( 'related_tags_sketches', 'search_tag_id' ) )
+            tables_and_columns.append( ( 'related_tags_sketches', 'tag_id' ) )
+            tables_and_columns.append( ( 'related_tags_sketch_queue', 'search_tag_id' ) )
+            
+        
+        return tables_and_columns
+        
+    
+    def RemoveFromQueue( self, file_service_id: int, tag_service_id: int, search_tag_id: int ):
+        
+        self._Execute( 'DELETE FROM related_tags_sketch_queue WHERE file_service_id = ? AND tag_service_id = ? AND search_tag_id = ?;', ( file_service_id, tag_service_id, search_tag_id ) )
+        
+    
+    def SetSketch( self, file_service_id: int, tag_service_id: int, search_tag_id: int, search_tag_count: int, num_files_searched: int, tag_ids_to_matching_counts: collections.Counter ):
+        
+        self._Execute( 'DELETE FROM related_tags_sketches WHERE file_service_id = ? AND tag_service_id = ? AND search_tag_id = ?;', ( file_service_id, tag_service_id, search_tag_id ) )
+        
+        top_rows = tag_ids_to_matching_counts.most_common( RELATED_TAGS_SKETCH_SIZE )
+        
+        self._ExecuteMany( 'INSERT INTO related_tags_sketches ( file_service_id, tag_service_id, search_tag_id, tag_id, matching_count ) VALUES ( ?, ?, ?, ?, ? );', ( ( file_service_id, tag_service_id, search_tag_id, tag_id, matching_count ) for ( tag_id, matching_count ) in top_rows ) )
+        
+        self._Execute( 'REPLACE INTO related_tags_sketch_definitions ( file_service_id, tag_service_id, search_tag_id, search_tag_count, num_files_searched, timestamp_ms ) VALUES ( ?, ?, ?, ?, ?, ? );', ( file_service_id, tag_service_id, search_tag_id, search_tag_count, num_files_searched, HydrusTime.GetNowMS() ) )
+        
+        self.RemoveFromQueue( file_service_id, tag_service_id, search_tag_id )
+        
+    
@@ -1,16 +1,234 @@
 import collections.abc
+import hashlib
 import re
 import sqlite3
 import typing
 
 from hydrus.core import HydrusConstants as HC
 from hydrus.core import HydrusData
+from hydrus.core import HydrusDBBase
+from hydrus.core import HydrusTime
 
 from hydrus.client.db import ClientDBMaster
 from hydrus.client.db import ClientDBModule
 from hydrus.client.networking import ClientNetworkingURLClass
 from hydrus.client.search import ClientNumberTest
 
+# url classes from system:known url predicates are cached by fingerprint. past this many, the least recently searched are dropped
+URL_CLASS_CACHE_MAX_SIZE = 64
+
+def GetRegexEscapeEnd( regex: str, i: int, escaped_c: str ) -> int:
+    """
+    Given the index just after an escaped letter or digit, returns the index just after the whole escape, so '\\x41' is four characters, not two.
+    """
+    
+    octal_digits = '01234567'
+    
+    if escaped_c == 'x':
+        
+        return i + 2
+        
+    elif escaped_c == 'u':
+        
+        return i + 4
+        
+    elif escaped_c == 'U':
+        
+        return i + 8
+        
+    elif escaped_c == 'N' and regex[ i : i + 1 ] == '{':
+        
+        close_index = regex.find( '}', i )
+        
+        return len( regex ) if close_index == -1 else close_index + 1
+        
+    elif escaped_c == '0':
+        
+        # octal, up to three digits in all
+        
+        end = i
+        
+        while end < i + 2 and regex[ end : end + 1 ] != '' and regex[ end ] in octal_digits:
+            
+            end += 1
+            
+        
+        return end
+        
+    elif escaped_c.isdigit():
+        
+        # same rules as sre_parse: three octal digits is an octal escape, otherwise it is a one or two digit backreference
+        
+        next_two = regex[ i : i + 2 ]
+        
+        if escaped_c in octal_digits and len( next_two ) == 2 and next_two[0] in octal_digits and next_two[1] in octal_digits:
+            
+            return i + 2
+            
+        
+        if regex[ i : i + 1 ].isdigit():
+            
+            return i + 1
+            
+        
+        return i
+        
+    
+    return i
+    
+
+def GetRegexRequiredSubstrings( regex: str ) -> list[ str ]:
+    """
+    Returns runs of plain characters that anything this regex matches must contain. Conservative--if the regex is clever, this may return nothing.
+    """
+    
+    try:
+        
+        compiled_regex = re.compile( regex )
+        
+    except re.error:
+        
+        return []
+        
+    
+    if compiled_regex.flags & ( re.IGNORECASE | re.VERBOSE ):
+        
+        # the index folds case its own way, and verbose changes what whitespace means, so don't try to be clever
+        return []
+        
+    
+    substrings = []
+    current_run = []
+    
+    def end_run():
+        
+        if len( current_run ) > 0:
+            
+            substrings.append( ''.join( current_run ) )
+            
+            current_run.clear()
+            
+        
+    
+    depth = 0
+    i = 0
+    
+    while i < len( regex ):
+        
+        c = regex[ i ]
+        
+        if c == '\\':
+            
+            escaped_c = regex[ i + 1 : i + 2 ]
+            
+            i += 2
+            
+            if depth == 0 and escaped_c != '' and not escaped_c.isalnum():
+                
+                current_run.append( escaped_c )
+                
+            else:
+                
+                # \d, \b, \1, \x41 and friends. we don't work out what they match, but we must step over all of them, or their digits become 'required' text
+                
+                i = GetRegexEscapeEnd( regex, i, escaped_c )
+                
+                end_run()
+                
+            
+            continue
+            
+        
+        if c == '[':
+            
+            # skip the character class. a ']' straight after the '[' or '[^' is a literal
+            
+            i += 1
+            
+            if regex[ i : i + 1 ] == '^':
+                
+                i += 1
+                
+            
+            if regex[ i : i + 1 ] == ']':
+                
+                i += 1
+                
+            
+            while i < len( regex ) and regex[ i ] != ']':
+                
+                i += 2 if regex[ i ] == '\\' else 1
+                
+            
+            i += 1
+            
+            end_run()
+            
+            continue
+            
+        
+        if c == '(':
+            
+            depth += 1
+            
+            end_run()
+            
+        elif c == ')':
+            
+            depth -= 1
+            
+        elif c == '|':
+            
+            if depth == 0:
+                
+                # top-level alternation, nothing is required
+                return []
+                
+            
+        elif depth > 0:
+            
+            pass
+            
+        elif c in '?*{':
+            
+            # the character before was optional
+            
+            if len( current_run ) > 0:
+                
+                current_run.pop()
+                
+            
+            end_run()
+            
+            if c == '{':
+                
+                while i < len( regex ) and regex[ i ] != '}':
+                    
+                    i += 1
+                    
+                
+            
+        elif c == '+':
+            
+            end_run()
+            
+        elif c in '.^$]}':
+            
+            end_run()
+            
+        else:
+            
+            current_run.append( c )
+            
+        
+        i += 1
+        
+    
+    end_run()
+    
+    return [ substring for substring in substrings if len( substring ) >= ClientDBMaster.URL_TRIGRAM_MIN_SUBSTRING_LENGTH ]
+    
+
 class ClientDBURLMap( ClientDBModule.ClientDBModule ):
     
     def __init__( self, cursor: sqlite3.Cursor, modules_urls: ClientDBMaster.ClientDBMasterURLs ):
@@ -20,6 +238,57 @@ class ClientDBURLMap( ClientDBModule.ClientDBModule ):
         super().__init__( 'client urls mapping', cursor )
         
     
+    def _CatchUpURLClassCache( self, url_class_cache_id: int, url_class: ClientNetworkingURLClass.URLClass, domain_ids: collections.abc.Collection[ int ], max_url_id: int ):
+        
+        # urls are never edited, so we only ever have to look at the ones added since we last checked
+        
+        ( current_max_url_id, ) = self._Execute( 'SELECT COALESCE( MAX( url_id ), 0 ) FROM urls;' ).fetchone()
+        
+        if current_max_url_id <= max_url_id:
+            
+            return
+            
+        
+        if max_url_id == 0:
+            
+            with self._MakeTemporaryIntegerTable( domain_ids, 'domain_id' ) as temp_domain_table_name:
+                
+                rows = self._Execute( 'SELECT url_id, url FROM {} CROSS JOIN urls USING ( domain_id );'.format( temp_domain_table_name ) ).fetchall()
+                
+            
+        else:
+            
+            if not isinstance( domain_ids, set ):
+                
+                domain_ids = set( domain_ids )
+                
+            
+            rows = [ ( url_id, url ) for ( url_id, domain_id, url ) in self._Execute( 'SELECT url_id, domain_id, url FROM urls WHERE url_id > ?;', ( max_url_id, ) ) if domain_id in domain_ids ]
+            
+        
+        self._ExecuteMany( 'INSERT OR IGNORE INTO url_class_cache_url_map ( url_class_cache_id, url_id ) VALUES ( ?, ? );', ( ( url_class_cache_id, url_id ) for ( url_id, url ) in rows if url_class.Matches( url ) ) )
+        
+        self._Execute( 'UPDATE url_class_cache_definitions SET max_url_id = ? WHERE url_class_cache_id = ?;', ( current_max_url_id, url_class_cache_id ) )
+        
+    
+    def _CullURLClassCache( self ):
+        
+        url_class_cache_ids = self._STL( self._Execute( 'SELECT url_class_cache_id FROM url_class_cache_definitions ORDER BY last_used_timestamp_ms DESC LIMIT -1 OFFSET ?;', ( URL_CLASS_CACHE_MAX_SIZE, ) ) )
+        
+        for url_class_cache_id in url_class_cache_ids:
+            
+            self._Execute( 'DELETE FROM url_class_cache_url_map WHERE url_class_cache_id = ?;', ( url_class_cache_id, ) )
+            self._Execute( 'DELETE FROM url_class_cache_definitions WHERE url_class_cache_id = ?;', ( url_class_cache_id, ) )
+            
+        
+    
+    def _GetDomainMappingCount( self, domain_table_name: str ) -> int:
+        
+        ( mapping_count, ) = self._Execute( 'SELECT COALESCE( SUM( mapping_count ), 0 ) FROM {} CROSS JOIN url_domain_mapping_counts USING ( domain_id );'.format( domain_table_name ) ).fetchone()
+        
+        return mapping_count
+        
+    
     def _GetInitialIndexGenerationDict( self ) -> dict:
         
         index_generation_dict = {}
@@ -34,16 +303,89 @@ class ClientDBURLMap( ClientDBModule.ClientDBModule ):
     def _GetInitialTableGenerationDict( self ) -> dict:
         
         return {
-            'main.url_map' : ( 'CREATE TABLE IF NOT EXISTS {} ( hash_id INTEGER, url_id INTEGER, PRIMARY KEY ( hash_id, url_id ) );', 485 )
+            'main.url_map' : ( 'CREATE TABLE IF NOT EXISTS {} ( hash_id INTEGER, url_id INTEGER, PRIMARY KEY ( hash_id, url_id ) );', 485 ),
+            'external_caches.url_class_cache_definitions' : ( 'CREATE TABLE IF NOT EXISTS {} ( url_class_cache_id INTEGER PRIMARY KEY, fingerprint BLOB_BYTES UNIQUE, max_url_id INTEGER, last_used_timestamp_ms INTEGER );', 660 ),
+            'external_caches.url_class_cache_url_map' : ( 'CREATE TABLE IF NOT EXISTS {} ( url_class_cache_id INTEGER, url_id INTEGER, PRIMARY KEY ( url_class_cache_id, url_id ) ) WITHOUT ROWID;', 660 ),
+            'external_caches.url_domain_mapping_counts' : ( 'CREATE TABLE IF NOT EXISTS {} ( domain_id INTEGER PRIMARY KEY, mapping_count INTEGER );', 660 )
         }
         
     
+    def _GetURLClassCacheId( self, url_class: ClientNetworkingURLClass.URLClass, domain_ids: collections.abc.Collection[ int ] ) -> int:
+        
+        # the fingerprint covers everything about the url class, so if the user edits it, we'll just make a fresh cache for the new version
+        fingerprint = hashlib.sha256( url_class.DumpToString().encode( 'utf-8' ) ).digest()
+        
+        now_ms = HydrusTime.GetNowMS()
+        
+        result = self._Execute( 'SELECT url_class_cache_id, max_url_id FROM url_class_cache_definitions WHERE fingerprint = ?;', ( sqlite3.Binary( fingerprint ), ) ).fetchone()
+        
+        if result is None:
+            
+            max_url_id = 0
+            
+            self._Execute( 'INSERT INTO url_class_cache_definitions ( fingerprint, max_url_id, last_used_timestamp_ms ) VALUES ( ?, ?, ? );', ( sqlite3.Binary( fingerprint ), max_url_id, now_ms ) )
+            
+            url_class_cache_id = self._GetLastRowId()
+            
+            self._CullURLClassCache()
+            
+        else:
+            
+            ( url_class_cache_id, max_url_id ) = result
+            
+            self._Execute( 'UPDATE url_class_cache_definitions SET last_used_timestamp_ms = ? WHERE url_class_cache_id = ?;', ( now_ms, url_class_cache_id ) )
+            
+        
+        self._CatchUpURLClassCache( url_class_cache_id, url_class, domain_ids, max_url_id )
+        
+        return url_class_cache_id
+        
+    
+    def _RepairRepopulateTables( self, repopulate_table_names, cursor_transaction_wrapper: HydrusDBBase.DBCursorTransactionWrapper ):
+        
+        if 'external_caches.url_class_cache_definitions' in repopulate_table_names or 'external_caches.url_class_cache_url_map' in repopulate_table_names:
+            
+            # these fill themselves back in as they are searched
+            self.ClearURLClassCache()
+            
+        
+        if 'external_caches.url_domain_mapping_counts' in repopulate_table_names:
+            
+            self.RegenerateDomainMappingCounts()
+            
+        
+    
+    def _ShouldSearchFromHashIds( self, hash_ids, hash_ids_table_name, num_rows_the_other_way: int ) -> bool:
+        
+        return hash_ids_table_name is not None and hash_ids is not None and len( hash_ids ) < num_rows_the_other_way
+        
+    
+    def _UpdateDomainMappingCount( self, url_id: int, delta: int ):
+        
+        ( domain_id, ) = self._Execute( 'SELECT domain_id FROM urls WHERE url_id = ?;', ( url_id, ) ).fetchone()
+        
+        self._Execute( 'INSERT OR IGNORE INTO url_domain_mapping_counts ( domain_id, mapping_count ) VALUES ( ?, ? );', ( domain_id, 0 ) )
+        
+        self._Execute( 'UPDATE url_domain_mapping_counts SET mapping_count = mapping_count + ? WHERE domain_id = ?;', ( delta, domain_id ) )
+        
+    
     def AddMapping( self, hash_id: int, url: str ):
         
         url_id = self.modules_urls.GetURLId( url )
         
         self._Execute( 'INSERT OR IGNORE INTO url_map ( hash_id, url_id ) VALUES ( ?, ? );', ( hash_id, url_id ) )
         
+        if self._GetRowCount() > 0:
+            
+            self._UpdateDomainMappingCount( url_id, 1 )
+            
+        
+    
+    def ClearURLClassCache( self ):
+        
+        self._Execute( 'DELETE FROM url_class_cache_url_map;' )
+        self._Execute( 'DELETE FROM url_class_cache_definitions;' )
+        
     
     def DeleteMapping( self, hash_id: int, url: str ):
         
@@ -51,6 +393,11 @@ class ClientDBURLMap( ClientDBModule.ClientDBModule ):
         
         self._Execute( 'DELETE FROM url_map WHERE hash_id = ? AND url_id = ?;', ( hash_id, url_id ) )
         
+        if self._GetRowCount() > 0:
+            
+            self._UpdateDomainMappingCount( url_id, -1 )
+            
+        
     
     def GetHashIds( self, search_url: str ):
         
@@ -145,31 +492,26 @@ class ClientDBURLMap( ClientDBModule.ClientDBModule ):
             
             domain_ids = self.modules_urls.GetURLDomainAndSubdomainIds( url_domain_mask )
             
-            result_hash_ids = set()
+            # this is 'does any url class match', not 'is this the url class it would be sorted into', which is the same as a media result test
+            url_class_cache_id = self._GetURLClassCacheId( url_class, domain_ids )
             
             with self._MakeTemporaryIntegerTable( domain_ids, 'domain_id' ) as temp_domain_table_name:
                 
-                if hash_ids_table_name is not None and hash_ids is not None and len( hash_ids ) < 50000:
-                    
-                    # if we aren't gonk mode with the number of files, temp hashes to url map to urls to domains
-                    # next step here is irl profiling and a domain->url_count cache so I can decide whether to do this or not based on url domain count
-                    select = 'SELECT hash_id, url FROM {} CROSS JOIN url_map USING ( hash_id ) CROSS JOIN urls USING ( url_id ) CROSS JOIN {} USING ( domain_id );'.format( hash_ids_table_name, temp_domain_table_name )
-                    
-                else:
-                    
-                    # domains to urls to url map
-                    select = 'SELECT hash_id, url FROM {} CROSS JOIN urls USING ( domain_id ) CROSS JOIN url_map USING ( url_id );'.format( temp_domain_table_name )
-                    
+                num_mappings = self._GetDomainMappingCount( temp_domain_table_name )
                 
-                for ( hash_id, url ) in self._Execute( select ):
-                    
-                    # this is actually insufficient, as more detailed url classes may match
-                    if hash_id not in result_hash_ids and url_class.Matches( url ):
-                        
-                        result_hash_ids.add( hash_id )
-                        
-                    
+            
+            if self._ShouldSearchFromHashIds( hash_ids, hash_ids_table_name, num_mappings ):
                 
+                # temp hashes to url map to cached url class urls
+                select = 'SELECT hash_id FROM {} CROSS JOIN url_map USING ( hash_id ) CROSS JOIN url_class_cache_url_map USING ( url_id ) WHERE url_class_cache_id = ?;'.format( hash_ids_table_name )
+                
+            else:
+                
+                # cached url class urls to url map
+                select = 'SELECT hash_id FROM url_class_cache_url_map CROSS JOIN url_map USING ( url_id ) WHERE url_class_cache_id = ?;'
+                
+            
+            result_hash_ids = self._STS( self._Execute( select, ( url_class_cache_id, ) ) )
             
             return result_hash_ids
             
@@ -184,10 +526,11 @@ class ClientDBURLMap( ClientDBModule.ClientDBModule ):
             
             with self._MakeTemporaryIntegerTable( domain_ids, 'domain_id' ) as temp_domain_table_name:
                 
-                if hash_ids_table_name is not None and hash_ids is not None and len( hash_ids ) < 50000:
+                num_mappings = self._GetDomainMappingCount( temp_domain_table_name )
+                
+                if self._ShouldSearchFromHashIds( hash_ids, hash_ids_table_name, num_mappings ):
                     
-                    # if we aren't gonk mode with the number of files, temp hashes to url map to urls to domains
-                    # next step here is irl profiling and a domain->url_count cache so I can decide whether to do this or not based on url domain count
+                    # temp hashes to url map to urls to domains
                     select = 'SELECT hash_id FROM {} CROSS JOIN url_map USING ( hash_id ) CROSS JOIN urls USING ( url_id ) CROSS JOIN {} USING ( domain_id )'.format( hash_ids_table_name, temp_domain_table_name )
                     
                 else:
@@ -205,20 +548,42 @@ class ClientDBURLMap( ClientDBModule.ClientDBModule ):
             
             regex = rule
             
-            if hash_ids_table_name is not None and hash_ids is not None and len( hash_ids ) < 50000:
+            result_hash_ids = set()
+            
+            substrings = GetRegexRequiredSubstrings( regex ) if ClientDBMaster.URL_TRIGRAM_INDEX_OK else []
+            
+            if len( substrings ) > 0:
+                
+                # the trigram index gives us every url that has the literal bits of the regex, and we only have to test those
+                candidate_url_ids = self.modules_urls.GetURLIdsFromSubstrings( substrings )
                 
-                # if we aren't gonk mode with the number of files, temp hashes to url map to urls
-                # next step here is irl profiling and a domain->url_count cache so I can decide whether to do this or not based on _TOTAL_ url count
-                select = 'SELECT hash_id, url FROM {} CROSS JOIN url_map USING ( hash_id ) CROSS JOIN urls USING ( url_id );'.format( hash_ids_table_name )
+                num_rows_the_other_way = len( candidate_url_ids )
                 
             else:
                 
-                select = 'SELECT hash_id, url FROM url_map NATURAL JOIN urls;'
+                candidate_url_ids = None
+                
+                ( num_rows_the_other_way, ) = self._Execute( 'SELECT COALESCE( SUM( mapping_count ), 0 ) FROM url_domain_mapping_counts;' ).fetchone()
                 
             
-            result_hash_ids = set()
+            if self._ShouldSearchFromHashIds( hash_ids, hash_ids_table_name, num_rows_the_other_way ):
+                
+                # temp hashes to url map to urls
+                rows = self._Execute( 'SELECT hash_id, url FROM {} CROSS JOIN url_map USING ( hash_id ) CROSS JOIN urls USING ( url_id );'.format( hash_ids_table_name ) ).fetchall()
+                
+            elif candidate_url_ids is not None:
+                
+                with self._MakeTemporaryIntegerTable( candidate_url_ids, 'url_id' ) as temp_url_ids_table_name:
+                    
+                    rows = self._Execute( 'SELECT hash_id, url FROM {} CROSS JOIN urls USING ( url_id ) CROSS JOIN url_map USING ( url_id );'.format( temp_url_ids_table_name ) ).fetchall()
+                    
+                
+            else:
+                
+                rows = self._Execute( 'SELECT hash_id, url FROM url_map NATURAL JOIN urls;' )
+                
             
-            for ( hash_id, url ) in self._Execute( select ):
+            for ( hash_id, url ) in rows:
                 
                 if hash_id not in result_hash_ids and re.search( regex, url ) is not None:
                     
@@ -256,3 +621,10 @@ class ClientDBURLMap( ClientDBModule.ClientDBModule ):
         return tables_and_columns
         
     
+    def RegenerateDomainMappingCounts( self ):
+        
+        self._Execute( 'DELETE FROM url_domain_mapping_counts;' )
+        
+        self._Execute( 'INSERT INTO url_domain_mapping_counts ( domain_id, mapping_count ) SELECT domain_id, COUNT( * ) FROM url_map CROSS JOIN urls USING ( url_id ) GROUP BY domain_id;' )
+        
+    
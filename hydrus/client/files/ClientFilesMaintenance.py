@@ -11,6 +11,7 @@ from hydrus.core import HydrusPaths
 from hydrus.core import HydrusTime
 from hydrus.core.files import HydrusFileHandling
 from hydrus.core.files import HydrusPSDHandling
+from hydrus.core.files import HydrusVideoHandling
 from hydrus.core.files.images import HydrusBlurhash
 from hydrus.core.files.images import HydrusImageHandling
 from hydrus.core.files.images import HydrusImageMetadata
@@ -850,7 +851,30 @@ class FilesMaintenanceManager( ClientDaemons.ManagerWithMainLoop ):
             
             path = self._controller.client_files_manager.GetFilePath( hash, original_mime )
             
-            ( size, mime, width, height, duration_ms, num_frames, has_audio, num_words ) = HydrusFileHandling.GetFileInfo( path, ok_to_look_for_hydrus_updates = True )
+            # a manual frame count is the slow part of this job for video, and it never changes for the same bytes, so we prime it from last time
+            num_frames_counted_manually = None
+            
+            if original_mime in HC.VIDEO or original_mime in HC.ANIMATIONS:
+                
+                num_frames_counted_manually = self._controller.Read( 'video_frame_count', hash )
+                
+                if num_frames_counted_manually is not None:
+                    
+                    HydrusVideoHandling.SetCachedNumFrames( hash, num_frames_counted_manually )
+                    
+                
+            
+            ( size, mime, width, height, duration_ms, num_frames, has_audio, num_words ) = HydrusFileHandling.GetFileInfo( path, ok_to_look_for_hydrus_updates = True, hash = hash )
+            
+            if mime in HC.VIDEO or mime in HC.ANIMATIONS:
+                
+                new_num_frames_counted_manually = HydrusVideoHandling.GetCachedNumFrames( hash )
+                
+                if new_num_frames_counted_manually is not None and new_num_frames_counted_manually != num_frames_counted_manually:
+                    
+                    self._controller.WriteSynchronous( 'video_frame_count', hash, new_num_frames_counted_manually )
+                    
+                
             
             additional_data = ( size, mime, width, height, duration_ms, num_frames, has_audio, num_words )
             
@@ -11,6 +11,16 @@ cv_interpolation_enum_lookup[ CC.ZOOM_AREA ] = cv2.INTER_AREA
 cv_interpolation_enum_lookup[ CC.ZOOM_CUBIC ] = cv2.INTER_CUBIC
 cv_interpolation_enum_lookup[ CC.ZOOM_LANCZOS4 ] = cv2.INTER_LANCZOS4
 
+def GenerateNumPyImageMipmapLevel( numpy_image ):
+    
+    ( image_height, image_width ) = numpy_image.shape[:2]
+    
+    target_resolution = ( max( 1, image_width // 2 ), max( 1, image_height // 2 ) )
+    
+    # area is the correct filter for an exact halving, and it is fast
+    return cv2.resize( numpy_image, target_resolution, interpolation = cv2.INTER_AREA )
+    
+
 def ResizeNumPyImageForMediaViewer( mime, numpy_image, target_resolution ):
     
     ( target_width, target_height ) = target_resolution
@@ -902,9 +902,20 @@ class FrameGUI( CAC.ApplicationCommandProcessorMixin, ClientGUITopLevelWindows.M
             action = 'Create a new'
             
         
+        # in WAL mode we can copy the db through a second connection while everything keeps working
+        do_it_online = HG.db_journal_mode == 'WAL'
+        
         text = action + ' backup at "' + path + '"?'
         text += '\n' * 2
-        text += 'The database will be locked while the backup occurs, which may lock up your gui as well.'
+        
+        if do_it_online:
+            
+            text += 'The client will keep working while the backup occurs, although it may be a little slower. Only new and deleted media files will be copied.'
+            
+        else:
+            
+            text += 'The database will be locked while the backup occurs, which may lock up your gui as well.'
+            
         
         result = ClientGUIDialogsQuick.GetYesNo( self, text )
         
@@ -923,9 +934,16 @@ class FrameGUI( CAC.ApplicationCommandProcessorMixin, ClientGUITopLevelWindows.M
             
             self._controller.SaveGUISession( session )
             
-            self._controller.Write( 'backup', path )
-            
-            CG.client_controller.new_options.SetNoneableInteger( 'last_backup_time', HydrusTime.GetNow() )
+            if do_it_online:
+                
+                self._controller.CallToThread( self._controller.BackupDatabaseOnline, path )
+                
+            else:
+                
+                self._controller.Write( 'backup', path )
+                
+                CG.client_controller.new_options.SetNoneableInteger( 'last_backup_time', HydrusTime.GetNow() )
+                
             
             self._did_a_backup_this_session = True
             
@@ -501,11 +501,27 @@ class Canvas( CAC.ApplicationCommandProcessorMixin, QW.QWidget ):
         
         to_prefetch = self._GetPrefetchNeighboursInPreferenceOrder()
         
-        to_prefetch.insert( 0, self._current_media.GetMediaResult() ) # we stick this at the front to ensure we don't start hitting neightbours before the current image, if there is one, is rendered
+        to_prefetch.insert( 0, self._current_media.GetMediaResult() ) # we stick this at the front to ensure the current image, if there is one, always gets a render slot first
         
         to_prefetch = [ media_result for media_result in to_prefetch if media_result.IsStaticImage() and ClientGUICanvasMedia.WeAreExpectingToLoadThisMediaFile( media_result, self.CANVAS_TYPE ) ]
         
-        CG.client_controller.images_cache.PrefetchImageRenderers( to_prefetch )
+        # we'll also get the renderers ready for the zoom they will open at, so the first tiles are quick
+        
+        hashes_to_zooms = {}
+        
+        canvas_size = self.size()
+        my_dpr = self.devicePixelRatio()
+        
+        for media_result in to_prefetch:
+            
+            ( media_show_action, media_start_paused, media_start_with_embed ) = ClientMedia.GetShowAction( media_result, self.CANVAS_TYPE )
+            
+            zoom_types_to_zooms = ClientGUICanvasMedia.CalculateCanvasZooms( canvas_size, self.CANVAS_TYPE, my_dpr, ClientMedia.MediaSingleton( media_result ), media_show_action )
+            
+            hashes_to_zooms[ media_result.GetHash() ] = zoom_types_to_zooms[ ClientGUICanvasMedia.MEDIA_VIEWER_ZOOM_TYPE_DEFAULT_FOR_FILETYPE ]
+            
+        
+        CG.client_controller.images_cache.PrefetchImageRenderers( to_prefetch, hashes_to_zooms = hashes_to_zooms )
         
     
     def _ManageNotes( self, name_to_start_on = None ):
@@ -3158,6 +3174,12 @@ class CanvasWithHovers( Canvas ):
         
     
 
+# if the user moves to the next file within this many seconds of the last, they are flicking through
+FAST_NAVIGATION_PERIOD = 0.75
+
+# how many more files we'll look ahead when the user is flicking through quickly
+MAX_EXTRA_PREFETCH_LOOKAHEAD = 4
+
 class CanvasMediaList( CanvasWithHovers ):
     
     exitFocusMedia = QC.Signal( ClientMedia.Media )
@@ -3174,6 +3196,12 @@ class CanvasMediaList( CanvasWithHovers ):
         
         self._just_started = True
         
+        # which way and how fast the user is going through the list, for prefetch. 1 is forward, -1 back, 0 a jump
+        self._navigation_direction = 0
+        self._fast_navigation_streak = 0
+        self._last_navigation_media = None
+        self._last_navigation_time = 0.0
+        
         CG.client_controller.sub( self, 'ProcessContentUpdatePackage', 'content_updates_gui' )
         CG.client_controller.sub( self, 'ProcessServiceUpdates', 'service_updates_gui' )
         
@@ -3227,9 +3255,13 @@ class CanvasMediaList( CanvasWithHovers ):
     
     def _GetPrefetchNeighboursInPreferenceOrder( self ) -> list[ ClientMediaResult.MediaResult ]:
         
+        self._UpdateNavigationTracking()
+        
         media_looked_at = set()
         
-        to_render = []
+        forward_to_render = []
+        back_to_render = []
+        interleaved_to_render = []
         
         previous = self._current_media
         next = self._current_media
@@ -3237,6 +3269,19 @@ class CanvasMediaList( CanvasWithHovers ):
         num_to_go_back = CG.client_controller.new_options.GetInteger( 'media_viewer_prefetch_num_previous' )
         num_to_go_forward = CG.client_controller.new_options.GetInteger( 'media_viewer_prefetch_num_next' )
         
+        # if the user is flicking quickly one way, we look further that way
+        
+        extra_lookahead = min( self._fast_navigation_streak, MAX_EXTRA_PREFETCH_LOOKAHEAD )
+        
+        if self._navigation_direction == 1:
+            
+            num_to_go_forward += extra_lookahead
+            
+        elif self._navigation_direction == -1:
+            
+            num_to_go_back += extra_lookahead
+            
+        
         # if media_looked_at nukes the list, we want shorter delays, so do next first
         
         num_looked_forward = 0
@@ -3254,7 +3299,8 @@ class CanvasMediaList( CanvasWithHovers ):
                     
                 else:
                     
-                    to_render.append( next.GetMediaResult() )
+                    forward_to_render.append( next.GetMediaResult() )
+                    interleaved_to_render.append( next.GetMediaResult() )
                     
                     media_looked_at.add( next )
                     
@@ -3272,7 +3318,8 @@ class CanvasMediaList( CanvasWithHovers ):
                     
                 else:
                     
-                    to_render.append( previous.GetMediaResult() )
+                    back_to_render.append( previous.GetMediaResult() )
+                    interleaved_to_render.append( previous.GetMediaResult() )
                     
                     media_looked_at.add( previous )
                     
@@ -3281,7 +3328,20 @@ class CanvasMediaList( CanvasWithHovers ):
                 
             
         
-        return to_render
+        # the way we are going comes first
+        
+        if self._navigation_direction == 1:
+            
+            return forward_to_render + back_to_render
+            
+        elif self._navigation_direction == -1:
+            
+            return back_to_render + forward_to_render
+            
+        else:
+            
+            return interleaved_to_render
+            
         
     
     def _ShowFirst( self ):
@@ -3309,6 +3369,47 @@ class CanvasMediaList( CanvasWithHovers ):
         pass
         
     
+    def _UpdateNavigationTracking( self ):
+        
+        if self._current_media == self._last_navigation_media:
+            
+            return
+            
+        
+        direction = 0
+        
+        if self._media_list.HasMedia( self._current_media ) and self._media_list.HasMedia( self._last_navigation_media ):
+            
+            num_media = len( self._media_list )
+            
+            index_delta = ( self._media_list.IndexOf( self._current_media ) - self._media_list.IndexOf( self._last_navigation_media ) ) % num_media
+            
+            if index_delta == 1:
+                
+                direction = 1
+                
+            elif index_delta == num_media - 1:
+                
+                direction = -1
+                
+            
+        
+        if direction != 0 and direction == self._navigation_direction and not HydrusTime.TimeHasPassedFloat( self._last_navigation_time + FAST_NAVIGATION_PERIOD ):
+            
+            self._fast_navigation_streak += 1
+            
+        else:
+            
+            # a jump or a pause resets us, and anything we were prefetching for the old spot gets dropped
+            
+            self._fast_navigation_streak = 0
+            
+        
+        self._navigation_direction = direction
+        self._last_navigation_media = self._current_media
+        self._last_navigation_time = HydrusTime.GetNowFloat()
+        
+    
     def AddMediaResults( self, page_key, media_results ):
         
         if page_key == self._page_key:
@@ -2255,6 +2255,11 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
         self._statuses_to_file_seeds_dirty = True
         self._file_seeds_to_indices_dirty = True
         
+        # what has been added or changed since the last save, so a big cache can be saved as a small journal delta
+        # if we remove or reorder anything, a delta cannot describe it and the whole object needs to be saved again
+        self._delta_file_seeds = {}
+        self._delta_needs_full_save = False
+        
         self._lock = threading.Lock()
         
     
@@ -2658,9 +2663,27 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
             return
             
         
+        with self._lock:
+            
+            if not self._delta_needs_full_save:
+                
+                for file_seed in file_seeds:
+                    
+                    self._delta_file_seeds[ file_seed ] = None
+                    
+                
+            
+        
         CG.client_controller.pub( 'file_seed_cache_file_seeds_updated', self._file_seed_cache_key, file_seeds )
         
     
+    def _SetDeltaNeedsFullSave( self ):
+        
+        self._delta_needs_full_save = True
+        
+        self._delta_file_seeds = {}
+        
+    
     def _SetFileSeedsToIndicesDirty( self ):
         
         self._file_seeds_to_indices_dirty = True
@@ -2670,7 +2693,7 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
     
     def _SetStatusesToFileSeedsDirty( self ):
         
-        # this is never actually called in normal usage, which is neat! I think we are 'perfect' on this thing maintaining itself after inital generation
+        # this is only called when we replay a saved journal delta, which is neat! I think we are 'perfect' on this thing maintaining itself after inital generation
         
         self._statuses_to_file_seeds_dirty = True
         
@@ -2974,6 +2997,8 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
                     file_seeds_to_indices[ file_seed ] = index - 1
                     file_seeds_to_indices[ swapped_file_seed ] = index
                     
+                    self._SetDeltaNeedsFullSave()
+                    
                     updated_file_seeds = [ file_seed, swapped_file_seed ]
                     
                     self._FixStatusesToFileSeeds( updated_file_seeds )
@@ -2984,6 +3009,40 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
         self._NotifyFileSeedsUpdated( updated_file_seeds )
         
     
+    def ApplyDeltaFileSeeds( self, file_seeds: collections.abc.Collection[ FileSeed ] ):
+        
+        # replaying a saved journal delta, so this does not go back into our own delta
+        
+        if len( file_seeds ) == 0:
+            
+            return
+            
+        
+        with self._lock:
+            
+            file_seeds_to_indices = self._GetFileSeedsToIndices()
+            
+            for file_seed in file_seeds:
+                
+                if file_seed in file_seeds_to_indices:
+                    
+                    self._file_seeds[ file_seeds_to_indices[ file_seed ] ] = file_seed
+                    
+                else:
+                    
+                    self._file_seeds.append( file_seed )
+                    
+                    file_seeds_to_indices[ file_seed ] = len( self._file_seeds ) - 1
+                    
+                
+            
+            # the index and status lookups are keyed on the old objects, so just regen them
+            self._SetFileSeedsToIndicesDirty()
+            self._SetStatusesToFileSeedsDirty()
+            self._SetStatusDirty()
+            
+        
+    
     def CanCompact( self, compaction_number: int, compact_before_this_source_time: int ):
         
         with self._lock:
@@ -3012,6 +3071,15 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
         return False
         
     
+    def ClearDeltaFileSeeds( self ):
+        
+        with self._lock:
+            
+            self._delta_file_seeds = {}
+            self._delta_needs_full_save = False
+            
+        
+    
     def Compact( self, compaction_number: int, compact_before_this_source_time: int ):
         
         with self._lock:
@@ -3063,6 +3131,8 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
                     file_seeds_to_indices[ swapped_file_seed ] = index
                     file_seeds_to_indices[ file_seed ] = index + 1
                     
+                    self._SetDeltaNeedsFullSave()
+                    
                     updated_file_seeds = [ file_seed, swapped_file_seed ]
                     
                     self._FixStatusesToFileSeeds( updated_file_seeds )
@@ -3106,6 +3176,21 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
         return len( self._GetListOfParentsWithChildren() )
         
     
+    def GetDeltaFileSeeds( self ) -> list[ FileSeed ] | None:
+        
+        # None means we changed in a way a delta cannot describe, so the caller needs to save the whole thing
+        
+        with self._lock:
+            
+            if self._delta_needs_full_save:
+                
+                return None
+                
+            
+            return list( self._delta_file_seeds.keys() )
+            
+        
+    
     def GetEarliestSourceTime( self ):
         
         with self._lock:
@@ -3351,6 +3436,8 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
             
             self._SetFileSeedsToIndicesDirty()
             
+            self._SetDeltaNeedsFullSave()
+            
             self._SetStatusDirty()
             
             self._FixStatusesToFileSeeds( new_file_seeds )
@@ -3411,6 +3498,8 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
             
             self._SetFileSeedsToIndicesDirty()
             
+            self._SetDeltaNeedsFullSave()
+            
             self._SetStatusDirty()
             
             self._FixStatusesToFileSeeds( file_seeds_to_delete )
@@ -3479,6 +3568,8 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
                 file_seed.Normalise()
                 
             
+            self._SetDeltaNeedsFullSave()
+            
         
         self._NotifyFileSeedsUpdated( self._file_seeds )
         
@@ -3537,6 +3628,8 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
             
             self._SetFileSeedsToIndicesDirty()
             
+            self._SetDeltaNeedsFullSave()
+            
             updated_file_seeds = list( self._file_seeds )
             
         
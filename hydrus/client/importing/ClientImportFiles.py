@@ -4,6 +4,7 @@ from hydrus.core import HydrusExceptions
 from hydrus.core import HydrusGlobals as HG
 from hydrus.core.files import HydrusFileHandling
 from hydrus.core.files import HydrusPSDHandling
+from hydrus.core.files import HydrusVideoHandling
 from hydrus.core.files.images import HydrusBlurhash
 from hydrus.core.files.images import HydrusImageHandling
 from hydrus.core.files.images import HydrusImageMetadata
@@ -125,6 +126,7 @@ class FileImportJob( object ):
         self._post_import_file_status = FileImportStatus.STATICGetUnknownStatus()
         
         self._file_info = None
+        self._num_frames_counted_manually = None
         self._thumbnail_bytes = None
         self._perceptual_hashes = None
         self._extra_hashes = None
@@ -303,10 +305,18 @@ class FileImportJob( object ):
             status_hook( 'generating file metadata' )
             
         
-        self._file_info = HydrusFileHandling.GetFileInfo( self._temp_path, mime = mime )
+        hash = self._pre_import_file_status.hash
+        
+        self._file_info = HydrusFileHandling.GetFileInfo( self._temp_path, mime = mime, hash = hash )
         
         ( size, mime, width, height, duration_ms, num_frames, has_audio, num_words ) = self._file_info
         
+        if mime in HC.VIDEO or mime in HC.ANIMATIONS:
+            
+            # if we had to count frames, we'll remember it so a later metadata regen doesn't have to
+            self._num_frames_counted_manually = HydrusVideoHandling.GetCachedNumFrames( hash )
+            
+        
         if HG.file_import_report_mode:
             
             HydrusData.ShowText( 'File import job file info: {}'.format( self._file_info ) )
@@ -485,6 +495,11 @@ class FileImportJob( object ):
         return self._pre_import_file_status.mime
         
     
+    def GetNumFramesCountedManually( self ) -> int | None:
+        
+        return self._num_frames_counted_manually
+        
+    
     def GetPerceptualHashes( self ):
         
         return self._perceptual_hashes
@@ -1,4 +1,5 @@
 import collections.abc
+import heapq
 import random
 import threading
 import time
@@ -236,6 +237,26 @@ class Subscription( HydrusSerialisable.SerialisableBaseNamed ):
         return HydrusTime.TimeHasPassed( self._no_work_until )
         
     
+    def _SaveQueryLogContainerAfterFileWork( self, query_log_container: ClientImportSubscriptionQuery.SubscriptionQueryLogContainer ):
+        
+        # file work only adds file seeds or changes their status, so we can usually append that to the container's journal rather than resaving a huge file log
+        
+        file_seed_cache = query_log_container.GetFileSeedCache()
+        
+        delta_file_seeds = file_seed_cache.GetDeltaFileSeeds()
+        
+        if delta_file_seeds is None:
+            
+            CG.client_controller.WriteSynchronous( 'serialisable', query_log_container )
+            
+        elif len( delta_file_seeds ) > 0:
+            
+            CG.client_controller.WriteSynchronous( 'serialisable_named_journal', query_log_container.SERIALISABLE_TYPE, query_log_container.GetName(), HydrusSerialisable.SerialisableList( delta_file_seeds ) )
+            
+        
+        file_seed_cache.ClearDeltaFileSeeds()
+        
+    
     def _ShowHitPeriodicFileLimitMessage( self, query_name: int, query_text: int, file_limit: int ):
         
         message = 'The query "{}" for subscription "{}" found {} new URLs without running into any it had seen before.'.format( query_name, self._name, file_limit )
@@ -978,7 +999,7 @@ class Subscription( HydrusSerialisable.SerialisableBaseNamed ):
                 
             finally:
                 
-                CG.client_controller.WriteSynchronous( 'serialisable', query_log_container )
+                self._SaveQueryLogContainerAfterFileWork( query_log_container )
                 
             
         
@@ -1186,6 +1207,8 @@ class Subscription( HydrusSerialisable.SerialisableBaseNamed ):
                     
                     file_seed.SetStatus( status, note = note )
                     
+                    file_seed_cache.NotifyFileSeedsUpdated( ( file_seed, ) )
+                    
                 except HydrusExceptions.NotFoundException:
                     
                     status = CC.STATUS_VETOED
@@ -1194,6 +1217,8 @@ class Subscription( HydrusSerialisable.SerialisableBaseNamed ):
                     
                     file_seed.SetStatus( status, note = note )
                     
+                    file_seed_cache.NotifyFileSeedsUpdated( ( file_seed, ) )
+                    
                 except Exception as e:
                     
                     status = CC.STATUS_ERROR
@@ -1202,6 +1227,8 @@ class Subscription( HydrusSerialisable.SerialisableBaseNamed ):
                     
                     file_seed.SetStatus( status, exception = e )
                     
+                    file_seed_cache.NotifyFileSeedsUpdated( ( file_seed, ) )
+                    
                     if isinstance( e, HydrusExceptions.DataMissing ):
                         
                         # DataMissing is a quick thing to avoid subscription abandons when lots of deleted files in e621 (or any other booru)
@@ -1861,6 +1888,12 @@ class SubscriptionJob( object ):
         
     
 
+# just a couple of seconds for calculation and human breathing room
+SUB_WORK_DELAY_BUFFER = 3
+
+# we wake up exactly when the next sub is due, or when something pokes us, but let's not trust a long sleep across clock changes and suspends
+SUBSCRIPTION_MANAGER_MAX_WAIT_TIME = 600
+
 class SubscriptionsManager( ClientDaemons.ManagerWithMainLoop ):
     
     def __init__( self, controller, subscriptions: list[ Subscription ] ):
@@ -1872,11 +1905,25 @@ class SubscriptionsManager( ClientDaemons.ManagerWithMainLoop ):
         self._names_that_cannot_run = set()
         self._names_to_next_work_time = {}
         
+        # ( next_work_time, name ), a min-heap. entries go stale when a sub is rescheduled or starts, so we check them against _names_to_next_work_time as they come off
+        self._next_work_time_heap = []
+        
+        # subs that are due, waiting for a free slot. ( sort_key, name ), a min-heap, stale if the name is no longer in _names_ready
+        self._names_ready = set()
+        self._ready_heap = []
+        
         self._pause_subscriptions_for_editing = False
         
         self._big_pauser = HydrusThreading.BigJobPauser( wait_time = 0.8 )
         
+        # we have no timing info on a fresh boot, so everything gets a go
+        for name in self._names_to_subscriptions.keys():
+            
+            self._SetReady( name )
+            
+        
         self._controller.sub( self, 'Wake', 'notify_network_traffic_unpaused' )
+        self._controller.sub( self, 'Wake', 'notify_new_options' )
         
     
     def _ClearFinishedSubscriptions( self ):
@@ -1892,6 +1939,20 @@ class SubscriptionsManager( ClientDaemons.ManagerWithMainLoop ):
             
         
     
+    def _DoSubscriptionJob( self, job: SubscriptionJob ):
+        
+        try:
+            
+            job.Work()
+            
+        finally:
+            
+            # we don't poll for finished jobs, so tell the main loop to come clear us up and fill the slot
+            
+            self.Wake()
+            
+        
+    
     def _GetMainLoopWaitTime( self ):
         
         if self._shutdown:
@@ -1899,78 +1960,163 @@ class SubscriptionsManager( ClientDaemons.ManagerWithMainLoop ):
             return 0.1
             
         
-        if len( self._names_to_running_subscription_info ) > 0:
+        if not self._SubscriptionsCanStart():
+            
+            # we'll be woken when the pause or options change, or when a running job finishes
+            
+            return SUBSCRIPTION_MANAGER_MAX_WAIT_TIME
+            
+        
+        self._PromoteDueSubscriptions()
+        
+        if len( self._names_ready ) > 0:
+            
+            # a little breathing room between starts
             
             return 0.5
             
-        else:
+        
+        next_due_time = self._GetNextDueTime()
+        
+        if next_due_time is None:
             
-            subscription = self._GetSubscriptionReadyToGo()
+            return SUBSCRIPTION_MANAGER_MAX_WAIT_TIME
             
-            if subscription is not None:
-                
-                return 0.5
-                
-            else:
+        
+        return min( max( next_due_time - HydrusTime.GetNowFloat(), 0.5 ), SUBSCRIPTION_MANAGER_MAX_WAIT_TIME )
+        
+    
+    def _GetNextDueTime( self ):
+        
+        while len( self._next_work_time_heap ) > 0:
+            
+            ( next_work_time, name ) = self._next_work_time_heap[0]
+            
+            if self._NextWorkTimeIsCurrent( next_work_time, name ):
                 
-                return 5
+                return next_work_time + SUB_WORK_DELAY_BUFFER
                 
             
+            heapq.heappop( self._next_work_time_heap )
+            
+        
+        return None
         
     
     def _GetSubscriptionReadyToGo( self ):
         
-        p1 = CG.client_controller.new_options.GetBoolean( 'pause_subs_sync' ) or self._pause_subscriptions_for_editing
-        p2 = CG.client_controller.new_options.GetBoolean( 'pause_all_new_network_traffic' )
-        p3 = HG.started_shutdown
-        
-        if p1 or p2 or p3:
+        if not self._SubscriptionsCanStart():
             
             return None
             
         
-        max_simultaneous_subscriptions = CG.client_controller.new_options.GetInteger( 'max_simultaneous_subscriptions' )
+        self._PromoteDueSubscriptions()
         
-        if len( self._names_to_running_subscription_info ) >= max_simultaneous_subscriptions:
+        while len( self._ready_heap ) > 0:
             
-            return None
+            ( sort_key, subscription_name ) = heapq.heappop( self._ready_heap )
+            
+            if subscription_name not in self._names_ready:
+                
+                continue
+                
+            
+            self._names_ready.discard( subscription_name )
+            
+            if subscription_name not in self._names_to_subscriptions or subscription_name in self._names_to_running_subscription_info:
+                
+                # it was removed, or it got rescheduled while still running. it'll get a fresh time when it finishes
+                
+                continue
+                
+            
+            if subscription_name in self._names_to_next_work_time:
+                
+                # it is going now, so this time is used up. we'll get a new one when it finishes
+                
+                del self._names_to_next_work_time[ subscription_name ]
+                
+            
+            if HG.subscription_report_mode:
+                
+                HydrusData.ShowText( 'Subscription manager selected "{}" to start.'.format( subscription_name ) )
+                
+            
+            return self._names_to_subscriptions[ subscription_name ]
             
         
-        possible_names = set( self._names_to_subscriptions.keys() )
-        possible_names.difference_update( set( self._names_to_running_subscription_info.keys() ) )
-        possible_names.difference_update( self._names_that_cannot_run )
+        return None
         
-        # just a couple of seconds for calculation and human breathing room
-        SUB_WORK_DELAY_BUFFER = 3
+    
+    def _NextWorkTimeIsCurrent( self, next_work_time, name ):
         
-        names_not_due = { name for ( name, next_work_time ) in self._names_to_next_work_time.items() if not HydrusTime.TimeHasPassed( next_work_time + SUB_WORK_DELAY_BUFFER ) }
+        return self._names_to_next_work_time.get( name, None ) == next_work_time and name not in self._names_ready
         
-        possible_names.difference_update( names_not_due )
+    
+    def _PromoteDueSubscriptions( self ):
         
-        if len( possible_names ) == 0:
+        while len( self._next_work_time_heap ) > 0:
             
-            return None
+            ( next_work_time, name ) = self._next_work_time_heap[0]
+            
+            if not self._NextWorkTimeIsCurrent( next_work_time, name ):
+                
+                heapq.heappop( self._next_work_time_heap )
+                
+                continue
+                
+            
+            if not HydrusTime.TimeHasPassed( next_work_time + SUB_WORK_DELAY_BUFFER ):
+                
+                break
+                
+            
+            heapq.heappop( self._next_work_time_heap )
+            
+            self._SetReady( name )
+            
+        
+    
+    def _SetReady( self, name ):
+        
+        if name in self._names_ready:
+            
+            return
             
         
-        possible_names = list( possible_names )
+        self._names_ready.add( name )
         
         if CG.client_controller.new_options.GetBoolean( 'process_subs_in_random_order' ):
             
-            subscription_name = random.choice( possible_names )
+            sort_key = ( random.random(), () )
             
         else:
             
-            HydrusText.HumanTextSort( possible_names )
+            sort_key = ( 0.0, HydrusText.HumanTextSortKey( name ) )
+            
+        
+        heapq.heappush( self._ready_heap, ( sort_key, name ) )
+        
+    
+    def _SubscriptionsCanStart( self ):
+        
+        p1 = CG.client_controller.new_options.GetBoolean( 'pause_subs_sync' ) or self._pause_subscriptions_for_editing
+        p2 = CG.client_controller.new_options.GetBoolean( 'pause_all_new_network_traffic' )
+        p3 = HG.started_shutdown
+        
+        if p1 or p2 or p3:
             
-            subscription_name = possible_names.pop( 0 )
+            return False
             
         
-        if HG.subscription_report_mode:
+        max_simultaneous_subscriptions = CG.client_controller.new_options.GetInteger( 'max_simultaneous_subscriptions' )
+        
+        if len( self._names_to_running_subscription_info ) >= max_simultaneous_subscriptions:
             
-            HydrusData.ShowText( 'Subscription manager selected "{}" to start.'.format( subscription_name ) )
+            return False
             
         
-        return self._names_to_subscriptions[ subscription_name ]
+        return True
         
     
     def _UpdateSubscriptionInfo( self, subscription: Subscription, just_finished_work = False ):
@@ -1987,12 +2133,15 @@ class SubscriptionsManager( ClientDaemons.ManagerWithMainLoop ):
             del self._names_to_next_work_time[ name ]
             
         
+        self._names_ready.discard( name )
+        
         if not subscription.IsExpectingToWorkInFuture():
             
             self._names_that_cannot_run.add( name )
             
         else:
             
+            # the bandwidth and domain waits for the sub's file work are folded into this by the query headers
             next_work_time = subscription.GetBestEarliestNextWorkTime()
             
             if next_work_time is None:
@@ -2017,6 +2166,8 @@ class SubscriptionsManager( ClientDaemons.ManagerWithMainLoop ):
                 
                 self._names_to_next_work_time[ name ] = next_work_time
                 
+                heapq.heappush( self._next_work_time_heap, ( next_work_time, name ) )
+                
             
         
     
@@ -2049,7 +2200,7 @@ class SubscriptionsManager( ClientDaemons.ManagerWithMainLoop ):
                         
                         job = SubscriptionJob( self._controller, subscription )
                         
-                        CG.client_controller.CallToThread( job.Work )
+                        CG.client_controller.CallToThread( self._DoSubscriptionJob, job )
                         
                         self._names_to_running_subscription_info[ subscription.GetName() ] = ( job, subscription )
                         
@@ -2111,6 +2262,9 @@ class SubscriptionsManager( ClientDaemons.ManagerWithMainLoop ):
             self._pause_subscriptions_for_editing = False
             
         
+        # the loop may have woken while we were still paused and gone back to a long sleep
+        self.Wake()
+        
     
     def SetSubscriptions( self, subscriptions ):
         
@@ -2121,6 +2275,10 @@ class SubscriptionsManager( ClientDaemons.ManagerWithMainLoop ):
             self._names_that_cannot_run = set()
             self._names_to_next_work_time = {}
             
+            self._next_work_time_heap = []
+            self._names_ready = set()
+            self._ready_heap = []
+            
             for subscription in subscriptions:
                 
                 self._UpdateSubscriptionInfo( subscription )
@@ -2148,6 +2306,8 @@ class SubscriptionsManager( ClientDaemons.ManagerWithMainLoop ):
             message += '\n' * 2
             message += '{} not runnable: {}'.format( HydrusNumbers.ToHumanInt( len( self._names_that_cannot_run ) ), ', '.join( cannot_run ) )
             message += '\n' * 2
+            message += '{} due and waiting for a slot: {}'.format( HydrusNumbers.ToHumanInt( len( self._names_ready ) ), ', '.join( sorted( self._names_ready ) ) )
+            message += '\n' * 2
             message += '{} next times: {}'.format( HydrusNumbers.ToHumanInt( len( self._names_to_next_work_time ) ), ', '.join( ( '{}: {}'.format( name, HydrusTime.TimestampToPrettyTimeDelta( next_work_time ) ) for ( name, next_work_time ) in next_times ) ) )
             
             HydrusData.ShowText( message )
@@ -1,6 +1,5 @@
 import collections
 import collections.abc
-import functools
 import threading
 import time
 
@@ -60,7 +59,10 @@ class NetworkDomainManager( HydrusSerialisable.SerialisableBase ):
         self._url_class_keys_to_display = set()
         self._url_class_keys_to_parser_keys = HydrusSerialisable.SerialisableBytesDictionary()
         
-        self._url_domain_masks_to_url_classes = collections.defaultdict( list )
+        self._url_class_matcher = ClientNetworkingURLClass.URLClassMatcher( [] )
+        
+        self._normalisation_cache_size = 10000
+        self._normalisation_cache = collections.OrderedDict()
         
         # TODO: Replace this with DomainStatus and do Cleanse/IsStub clearing on load
         # one question is whether to store by domains or networkcontexts. consider this, but perhaps not a big deal for now
@@ -334,55 +336,7 @@ class NetworkDomainManager( HydrusSerialisable.SerialisableBase ):
     
     def _GetURLClass( self, url ):
         
-        try:
-            
-            domain = ClientNetworkingFunctions.ConvertURLIntoDomain( url )
-            
-        except HydrusExceptions.URLClassException:
-            
-            return None
-            
-        
-        url_domain_masks = self._GetURLDomainMasks( domain )
-        
-        for url_domain_mask in url_domain_masks:
-            
-            url_classes = self._url_domain_masks_to_url_classes[ url_domain_mask ]
-            
-            for url_class in url_classes:
-                
-                try:
-                    
-                    url_class.Test( url )
-                    
-                    return url_class
-                    
-                except HydrusExceptions.URLClassException:
-                    
-                    continue
-                    
-                
-            
-        
-        return None
-        
-    
-    @functools.lru_cache( 128 )
-    def _GetURLDomainMasks( self, domain ) -> list[ ClientNetworkingURLClass.URLDomainMask ]:
-        
-        url_domain_masks = []
-        
-        for url_domain_mask in self._url_domain_masks_to_url_classes.keys():
-            
-            if url_domain_mask.Matches( domain ):
-                
-                url_domain_masks.append( url_domain_mask )
-                
-            
-        
-        url_domain_masks.sort( key = lambda udm: udm.GetSortingComplexity(), reverse = True )
-        
-        return url_domain_masks
+        return self._url_class_matcher.GetURLClass( url )
         
     
     def _GetURLToFetch( self, url: str ):
@@ -474,19 +428,9 @@ class NetworkDomainManager( HydrusSerialisable.SerialisableBase ):
     
     def _RecalcCache( self ):
         
-        self._GetURLDomainMasks.cache_clear()
-        
-        self._url_domain_masks_to_url_classes = collections.defaultdict( list )
-        
-        for url_class in self._url_classes:
-            
-            self._url_domain_masks_to_url_classes[ url_class.GetURLDomainMask() ].append( url_class )
-            
+        self._url_class_matcher = ClientNetworkingURLClass.URLClassMatcher( self._url_classes )
         
-        for url_classes in self._url_domain_masks_to_url_classes.values():
-            
-            ClientNetworkingURLClass.SortURLClassesListDescendingComplexity( url_classes )
-            
+        self._normalisation_cache = collections.OrderedDict()
         
         self._gug_keys_to_gugs = { gug.GetGUGKey() : gug for gug in self._gugs }
         self._gug_names_to_gugs = { gug.GetName() : gug for gug in self._gugs }
@@ -1623,6 +1567,18 @@ class NetworkDomainManager( HydrusSerialisable.SerialisableBase ):
         
         with self._lock:
             
+            # path parsing depends on this option, so it is part of the key
+            remove_leading_url_double_slashes = CG.client_controller.new_options.GetBoolean( 'remove_leading_url_double_slashes' )
+            
+            cache_key = ( url, for_server, remove_leading_url_double_slashes )
+            
+            if cache_key in self._normalisation_cache:
+                
+                self._normalisation_cache.move_to_end( cache_key )
+                
+                return self._normalisation_cache[ cache_key ]
+                
+            
             try:
                 
                 ClientNetworkingFunctions.CheckLooksLikeAFullURL( url )
@@ -1644,6 +1600,13 @@ class NetworkDomainManager( HydrusSerialisable.SerialisableBase ):
                 normalised_url = url_class.Normalise( url, for_server = for_server )
                 
             
+            self._normalisation_cache[ cache_key ] = normalised_url
+            
+            while len( self._normalisation_cache ) > self._normalisation_cache_size:
+                
+                self._normalisation_cache.popitem( last = False )
+                
+            
             return normalised_url
             
         
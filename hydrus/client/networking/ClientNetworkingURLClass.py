@@ -1,3 +1,5 @@
+import collections
+import collections.abc
 import functools
 import re
 import urllib.parse
@@ -1373,6 +1375,92 @@ class URLClass( HydrusSerialisable.SerialisableBaseNamed ):
         return is_a_gallery_page or is_a_multipost_post_page
         
     
+    def GenerateMatchCallable( self ) -> collections.abc.Callable[ [ list[ str ], dict[ str, str ], list[ str ] ], bool ]:
+        
+        # this is an exception-free, precompiled version of the path and query part of Test, for the domain manager's URLClassMatcher
+        # it takes an already encoded and parsed url, so one url can be checked against many candidate classes cheaply
+        
+        path_component_tests = [ ( string_match.GenerateMatchCallable(), default is None ) for ( string_match, default ) in self._path_components ]
+        num_path_components = len( path_component_tests )
+        no_more_path_components_than_this = self._no_more_path_components_than_this
+        
+        fixed_name_parameters = [ parameter for parameter in self._parameters if isinstance( parameter, URLClassParameterFixedName ) ]
+        
+        parameter_tests = [ ( parameter.GetName(), parameter.MustBeInOriginalURL(), parameter.GetValueStringMatch().GenerateMatchCallable() ) for parameter in fixed_name_parameters ]
+        good_fixed_names = frozenset( ( parameter.GetName() for parameter in fixed_name_parameters ) )
+        no_more_parameters_than_this = self._no_more_parameters_than_this
+        
+        has_single_value_parameters = self._has_single_value_parameters
+        single_value_parameter_test = self._single_value_parameters_string_match.GenerateMatchCallable()
+        
+        def match_callable( path_components: list[ str ], query_dict: dict[ str, str ], single_value_parameters: list[ str ] ) -> bool:
+            
+            if no_more_path_components_than_this and len( path_components ) > num_path_components:
+                
+                return False
+                
+            
+            for ( index, ( path_component_test, is_required ) ) in enumerate( path_component_tests ):
+                
+                if len( path_components ) > index:
+                    
+                    if not path_component_test( path_components[ index ] ):
+                        
+                        return False
+                        
+                    
+                elif is_required:
+                    
+                    return False
+                    
+                
+            
+            if no_more_parameters_than_this and not good_fixed_names.issuperset( query_dict.keys() ):
+                
+                return False
+                
+            
+            for ( name, must_be_in_original_url, value_test ) in parameter_tests:
+                
+                if name not in query_dict:
+                    
+                    if must_be_in_original_url:
+                        
+                        return False
+                        
+                    
+                    continue
+                    
+                
+                if not value_test( query_dict[ name ] ):
+                    
+                    return False
+                    
+                
+            
+            if has_single_value_parameters:
+                
+                if len( single_value_parameters ) == 0:
+                    
+                    return False
+                    
+                
+                if False in ( single_value_parameter_test( single_value_parameter ) for single_value_parameter in single_value_parameters ):
+                    
+                    return False
+                    
+                
+            elif len( single_value_parameters ) > 0 and no_more_parameters_than_this:
+                
+                return False
+                
+            
+            return True
+            
+        
+        return match_callable
+        
+    
     def GetAPILookupConverter( self ):
         
         return self._api_lookup_converter
@@ -1856,3 +1944,151 @@ class URLClass( HydrusSerialisable.SerialisableBaseNamed ):
     
 
 HydrusSerialisable.SERIALISABLE_TYPES_TO_OBJECT_TYPES[ HydrusSerialisable.SERIALISABLE_TYPE_URL_CLASS ] = URLClass
+
+class URLClassMatcher( object ):
+    
+    def __init__( self, url_classes: collections.abc.Iterable[ URLClass ], domain_cache_size = 1024 ):
+        
+        # a precompiled lookup for 'which url class, if any, matches this url?'
+        # raw domains go in a dict we walk by domain suffix, so we only test masks that could plausibly match. regex masks are always candidates
+        # each url class gets a precompiled test that works on a url we parse once, and misses do not raise
+        
+        self._url_domain_masks_to_url_classes = collections.defaultdict( list )
+        
+        for url_class in url_classes:
+            
+            self._url_domain_masks_to_url_classes[ url_class.GetURLDomainMask() ].append( url_class )
+            
+        
+        self._url_domain_masks_to_url_classes_and_match_callables = {}
+        
+        for ( url_domain_mask, mask_url_classes ) in self._url_domain_masks_to_url_classes.items():
+            
+            SortURLClassesListDescendingComplexity( mask_url_classes )
+            
+            self._url_domain_masks_to_url_classes_and_match_callables[ url_domain_mask ] = [ ( url_class, url_class.GenerateMatchCallable() ) for url_class in mask_url_classes ]
+            
+        
+        # we sort candidates by complexity, but on a tie we want to preserve the original order, just like a straight scan of the dict would
+        self._url_domain_masks_to_sort_keys = {}
+        
+        self._raw_domains_to_url_domain_masks = collections.defaultdict( list )
+        self._regex_url_domain_masks = []
+        
+        for ( index, url_domain_mask ) in enumerate( self._url_domain_masks_to_url_classes.keys() ):
+            
+            self._url_domain_masks_to_sort_keys[ url_domain_mask ] = ( - url_domain_mask.GetSortingComplexity(), index )
+            
+            if url_domain_mask.NoRegexes():
+                
+                for raw_domain in url_domain_mask.GetRawDomains():
+                    
+                    self._raw_domains_to_url_domain_masks[ raw_domain ].append( url_domain_mask )
+                    
+                
+            else:
+                
+                self._regex_url_domain_masks.append( url_domain_mask )
+                
+            
+        
+        self._domain_cache_size = domain_cache_size
+        self._domains_to_url_domain_masks = collections.OrderedDict()
+        
+    
+    def _GetURLDomainMasks( self, domain: str ) -> list[ URLDomainMask ]:
+        
+        if domain in self._domains_to_url_domain_masks:
+            
+            self._domains_to_url_domain_masks.move_to_end( domain )
+            
+            return self._domains_to_url_domain_masks[ domain ]
+            
+        
+        candidate_url_domain_masks = set( self._regex_url_domain_masks )
+        
+        # 'www.sub.example.com' -> 'www.sub.example.com', 'sub.example.com', 'example.com', 'com'
+        domain_suffix = domain
+        
+        while True:
+            
+            if domain_suffix in self._raw_domains_to_url_domain_masks:
+                
+                candidate_url_domain_masks.update( self._raw_domains_to_url_domain_masks[ domain_suffix ] )
+                
+            
+            if '.' not in domain_suffix:
+                
+                break
+                
+            
+            domain_suffix = domain_suffix.split( '.', 1 )[1]
+            
+        
+        url_domain_masks = [ url_domain_mask for url_domain_mask in candidate_url_domain_masks if url_domain_mask.Matches( domain ) ]
+        
+        url_domain_masks.sort( key = lambda udm: self._url_domain_masks_to_sort_keys[ udm ] )
+        
+        self._domains_to_url_domain_masks[ domain ] = url_domain_masks
+        
+        while len( self._domains_to_url_domain_masks ) > self._domain_cache_size:
+            
+            self._domains_to_url_domain_masks.popitem( last = False )
+            
+        
+        return url_domain_masks
+        
+    
+    def GetURLClass( self, url: str ) -> URLClass | None:
+        
+        try:
+            
+            domain = ClientNetworkingFunctions.ConvertURLIntoDomain( url )
+            
+        except HydrusExceptions.URLClassException:
+            
+            return None
+            
+        
+        url_domain_masks = self._GetURLDomainMasks( domain )
+        
+        if len( url_domain_masks ) == 0:
+            
+            return None
+            
+        
+        encoded_url = ClientNetworkingFunctions.EnsureURLIsEncoded( url )
+        
+        try:
+            
+            p = ClientNetworkingFunctions.ParseURL( encoded_url )
+            
+        except HydrusExceptions.URLClassException:
+            
+            return None
+            
+        
+        netloc = p.netloc
+        
+        path_components = ClientNetworkingFunctions.ConvertPathTextToList( p.path )
+        ( query_dict, single_value_parameters, param_order ) = ClientNetworkingFunctions.ConvertQueryTextToDict( p.query )
+        
+        for url_domain_mask in url_domain_masks:
+            
+            if netloc != domain and not url_domain_mask.Matches( netloc ):
+                
+                continue
+                
+            
+            for ( url_class, match_callable ) in self._url_domain_masks_to_url_classes_and_match_callables[ url_domain_mask ]:
+                
+                if match_callable( path_components, query_dict, single_value_parameters ):
+                    
+                    return url_class
+                    
+                
+            
+        
+        return None
+        
+    
@@ -38,6 +38,7 @@ from hydrus.client.search import ClientSearchTagContext
 
 # if a variable name isn't defined here, a GET with it won't work
 CLIENT_API_INT_PARAMS = {
+    'batch_size',
     'duplicate_pair_sort_type',
     'file_id',
     'file_sort_type',
@@ -108,7 +109,8 @@ CLIENT_API_JSON_PARAMS = {
     'doublecheck_file_system',
     'only_in_view',
     'include_current_tags',
-    'include_pending_tags'
+    'include_pending_tags',
+    'fields'
 }
 
 CLIENT_API_JSON_BYTE_LIST_PARAMS = {
@@ -165,6 +167,25 @@ def Dumps( data, mime ):
         
     
 
+def DumpsStreamRecord( data, mime ) -> bytes:
+    
+    # one self-delimiting record for a streamed response. cbor items just sit next to each other, json gets a newline (ndjson). no version keys, they go in every record otherwise
+    
+    if mime == HC.APPLICATION_CBOR:
+        
+        if not CBOR_AVAILABLE:
+            
+            raise HydrusExceptions.NotAcceptable( 'Sorry, this service does not support CBOR!' )
+            
+        
+        return cbor2.dumps( data )
+        
+    else:
+        
+        return bytes( json.dumps( data ) + '\n', 'utf-8' )
+        
+    
+
 def CheckHashLength( hashes, hash_type = 'sha256' ):
     
     if len( hashes ) == 0:
@@ -1,13 +1,19 @@
+import json
 import os
+import struct
 import time
+import typing
 
 from hydrus.core import HydrusConstants as HC
 from hydrus.core import HydrusData
 from hydrus.core import HydrusExceptions
+from hydrus.core import HydrusLists
+from hydrus.core import HydrusTime
 from hydrus.core.files import HydrusFileHandling
 from hydrus.core.files.images import HydrusImageHandling
 from hydrus.core.networking import HydrusServerRequest
 from hydrus.core.networking import HydrusServerResources
+from hydrus.core.processes import HydrusThreading
 
 from hydrus.client import ClientAPI
 from hydrus.client import ClientConstants as CC
@@ -15,6 +21,7 @@ from hydrus.client import ClientGlobals as CG
 from hydrus.client import ClientLocation
 from hydrus.client import ClientThreading
 from hydrus.client import ClientUgoiraHandling
+from hydrus.client.caches import ClientCachesBase
 from hydrus.client.media import ClientMedia
 from hydrus.client.media import ClientMediaResult
 from hydrus.client.media import ClientMediaResultAPI
@@ -25,6 +32,21 @@ from hydrus.client.search import ClientSearchFileSearchContext
 from hydrus.client.search import ClientSearchTagContext
 
 
+# the stream endpoint pulls this many files from the db at a time, which is what keeps its memory flat
+FILE_METADATA_STREAM_DEFAULT_BATCH_SIZE = 256
+FILE_METADATA_STREAM_MAX_BATCH_SIZE = 4096
+
+# the file_metadata_stream 'fields' that the cheaper metadata groups can fill. anything else needs a full media result
+FILE_METADATA_IDENTIFIER_FIELDS = { 'file_id', 'hash' }
+FILE_METADATA_BASIC_FIELDS = { 'size', 'mime', 'filetype_human', 'filetype_enum', 'ext', 'width', 'height', 'duration', 'num_frames', 'num_words', 'has_audio', 'filetype_forced', 'original_mime', 'blurhash' }
+
+# originals never change, so browsers can keep them for good
+FILE_MAX_AGE = 86400 * 365
+
+# how long we trust a remembered file/thumbnail path before we check the db again. size and mtime always come fresh from the file we open
+RESOLVED_FILE_PATH_CACHE_SIZE = 16384
+RESOLVED_FILE_PATH_CACHE_TIMEOUT = 60
+
 class HydrusResourceClientAPIRestrictedGetFiles( ClientLocalServerResources.HydrusResourceClientAPIRestricted ):
     
     def _CheckAPIPermissions( self, request: HydrusServerRequest.HydrusRequest ):
@@ -33,59 +55,74 @@ class HydrusResourceClientAPIRestrictedGetFiles( ClientLocalServerResources.Hydr
         
     
 
-class HydrusResourceClientAPIRestrictedGetFilesSearchFiles( HydrusResourceClientAPIRestrictedGetFiles ):
+def ParseFileSearchContext( request: HydrusServerRequest.HydrusRequest ) -> ClientSearchFileSearchContext.FileSearchContext | None:
     
-    def _threadDoGETJob( self, request: HydrusServerRequest.HydrusRequest ):
+    location_context = ClientLocalServerCore.ParseLocationContext( request, ClientLocation.LocationContext.STATICCreateSimple( CC.COMBINED_LOCAL_FILE_DOMAINS_SERVICE_KEY ) )
+    
+    tag_service_key = ClientLocalServerCore.ParseTagServiceKey( request )
+    
+    if tag_service_key == CC.COMBINED_TAG_SERVICE_KEY and location_context.IsAllKnownFiles():
         
-        location_context = ClientLocalServerCore.ParseLocationContext( request, ClientLocation.LocationContext.STATICCreateSimple( CC.COMBINED_LOCAL_FILE_DOMAINS_SERVICE_KEY ) )
+        raise HydrusExceptions.BadRequestException( 'Sorry, search for all known tags over all known files is not supported!' )
         
-        tag_service_key = ClientLocalServerCore.ParseTagServiceKey( request )
+    
+    include_current_tags = request.parsed_request_args.GetValue( 'include_current_tags', bool, default_value = True )
+    include_pending_tags = request.parsed_request_args.GetValue( 'include_pending_tags', bool, default_value = True )
+    
+    tag_context = ClientSearchTagContext.TagContext( service_key = tag_service_key, include_current_tags = include_current_tags, include_pending_tags = include_pending_tags )
+    predicates = ClientLocalServerCore.ParseClientAPISearchPredicates( request )
+    
+    if len( predicates ) == 0:
         
-        if tag_service_key == CC.COMBINED_TAG_SERVICE_KEY and location_context.IsAllKnownFiles():
-            
-            raise HydrusExceptions.BadRequestException( 'Sorry, search for all known tags over all known files is not supported!' )
-            
+        return None
         
-        include_current_tags = request.parsed_request_args.GetValue( 'include_current_tags', bool, default_value = True )
-        include_pending_tags = request.parsed_request_args.GetValue( 'include_pending_tags', bool, default_value = True )
+    
+    return ClientSearchFileSearchContext.FileSearchContext( location_context = location_context, tag_context = tag_context, predicates = predicates )
+    
+
+def ParseFileSort( request: HydrusServerRequest.HydrusRequest ) -> ClientMedia.MediaSort:
+    
+    file_sort_type = CC.SORT_FILES_BY_IMPORT_TIME
+    
+    if 'file_sort_type' in request.parsed_request_args:
+        
+        file_sort_type = request.parsed_request_args[ 'file_sort_type' ]
+        
+    
+    if file_sort_type not in CC.SYSTEM_SORT_TYPES:
         
-        tag_context = ClientSearchTagContext.TagContext( service_key = tag_service_key, include_current_tags = include_current_tags, include_pending_tags = include_pending_tags )
-        predicates = ClientLocalServerCore.ParseClientAPISearchPredicates( request )
+        raise HydrusExceptions.BadRequestException( 'Sorry, did not understand that sort type!' )
+        
+    
+    file_sort_asc = False
+    
+    if 'file_sort_asc' in request.parsed_request_args:
+        
+        file_sort_asc = request.parsed_request_args.GetValue( 'file_sort_asc', bool )
+        
+    
+    sort_order = CC.SORT_ASC if file_sort_asc else CC.SORT_DESC
+    
+    # newest first
+    return ClientMedia.MediaSort( sort_type = ( 'system', file_sort_type ), sort_order = sort_order )
+    
+
+class HydrusResourceClientAPIRestrictedGetFilesSearchFiles( HydrusResourceClientAPIRestrictedGetFiles ):
+    
+    def _threadDoGETJob( self, request: HydrusServerRequest.HydrusRequest ):
+        
+        file_search_context = ParseFileSearchContext( request )
         
         return_hashes = False
         return_file_ids = True
         
-        if len( predicates ) == 0:
+        if file_search_context is None:
             
             hash_ids = []
             
         else:
             
-            file_search_context = ClientSearchFileSearchContext.FileSearchContext( location_context = location_context, tag_context = tag_context, predicates = predicates )
-            
-            file_sort_type = CC.SORT_FILES_BY_IMPORT_TIME
-            
-            if 'file_sort_type' in request.parsed_request_args:
-                
-                file_sort_type = request.parsed_request_args[ 'file_sort_type' ]
-                
-            
-            if file_sort_type not in CC.SYSTEM_SORT_TYPES:
-                
-                raise HydrusExceptions.BadRequestException( 'Sorry, did not understand that sort type!' )
-                
-            
-            file_sort_asc = False
-            
-            if 'file_sort_asc' in request.parsed_request_args:
-                
-                file_sort_asc = request.parsed_request_args.GetValue( 'file_sort_asc', bool )
-                
-            
-            sort_order = CC.SORT_ASC if file_sort_asc else CC.SORT_DESC
-            
-            # newest first
-            sort_by = ClientMedia.MediaSort( sort_type = ( 'system', file_sort_type ), sort_order = sort_order )
+            sort_by = ParseFileSort( request )
             
             if 'return_hashes' in request.parsed_request_args:
                 
@@ -129,29 +166,72 @@ class HydrusResourceClientAPIRestrictedGetFilesSearchFiles( HydrusResourceClient
         
     
 
-def ParseAndFetchMediaResult( request: HydrusServerRequest.HydrusRequest ) -> ClientMediaResult.MediaResult:
+def ParseFileIdentifier( request: HydrusServerRequest.HydrusRequest ) -> tuple[ str, int | bytes ]:
+    
+    if 'file_id' in request.parsed_request_args:
+        
+        file_id = request.parsed_request_args.GetValue( 'file_id', int )
+        
+        request.client_api_permissions.CheckPermissionToSeeFiles( ( file_id, ) )
+        
+        return ( 'file_id', file_id )
+        
+    elif 'hash' in request.parsed_request_args:
+        
+        request.client_api_permissions.CheckCanSeeAllFiles()
+        
+        hash = request.parsed_request_args.GetValue( 'hash', bytes )
+        
+        return ( 'hash', hash )
+        
+    else:
+        
+        raise HydrusExceptions.BadRequestException( 'Please include a file_id or hash parameter!' )
+        
+    
+
+def ParseFileIds( request: HydrusServerRequest.HydrusRequest ) -> list[ int ] | None:
+    """
+    The file_id and/or file_ids parameters, deduped and checked against the permissions. None if neither was given.
+    """
+    
+    if 'file_id' not in request.parsed_request_args and 'file_ids' not in request.parsed_request_args:
+        
+        return None
+        
+    
+    hash_ids = []
+    
+    if 'file_id' in request.parsed_request_args:
+        
+        hash_ids.append( request.parsed_request_args.GetValue( 'file_id', int ) )
+        
+    
+    if 'file_ids' in request.parsed_request_args:
+        
+        hash_ids.extend( request.parsed_request_args.GetValue( 'file_ids', list, expected_list_type = int ) )
+        
+    
+    hash_ids = HydrusLists.DedupeList( hash_ids )
+    
+    request.client_api_permissions.CheckPermissionToSeeFiles( hash_ids )
+    
+    return hash_ids
+    
+
+def FetchMediaResult( file_identifier: tuple[ str, int | bytes ] ) -> ClientMediaResult.MediaResult:
+    
+    ( identifier_type, identifier ) = file_identifier
     
     try:
         
-        if 'file_id' in request.parsed_request_args:
-            
-            file_id = request.parsed_request_args.GetValue( 'file_id', int )
-            
-            request.client_api_permissions.CheckPermissionToSeeFiles( ( file_id, ) )
-            
-            ( media_result, ) = CG.client_controller.Read( 'media_results_from_ids', ( file_id, ) )
+        if identifier_type == 'file_id':
             
-        elif 'hash' in request.parsed_request_args:
-            
-            request.client_api_permissions.CheckCanSeeAllFiles()
-            
-            hash = request.parsed_request_args.GetValue( 'hash', bytes )
-            
-            media_result = CG.client_controller.Read( 'media_result', hash )
+            ( media_result, ) = CG.client_controller.Read( 'media_results_from_ids', ( identifier, ) )
             
         else:
             
-            raise HydrusExceptions.BadRequestException( 'Please include a file_id or hash parameter!' )
+            media_result = CG.client_controller.Read( 'media_result', identifier )
             
         
     except HydrusExceptions.DataMissing as e:
@@ -162,37 +242,215 @@ def ParseAndFetchMediaResult( request: HydrusServerRequest.HydrusRequest ) -> Cl
     return media_result
     
 
-class HydrusResourceClientAPIRestrictedGetFilesGetFile( HydrusResourceClientAPIRestrictedGetFiles ):
+def ParseAndFetchMediaResult( request: HydrusServerRequest.HydrusRequest ) -> ClientMediaResult.MediaResult:
     
-    def _threadDoGETJob( self, request: HydrusServerRequest.HydrusRequest ):
+    return FetchMediaResult( ParseFileIdentifier( request ) )
+    
+
+def GetFileETag( hash: bytes ) -> str:
+    
+    # files are content-addressed, so the hash is a perfect strong etag
+    return f'"{hash.hex()}"'
+    
+
+def GetThumbnailETag( hash: bytes, modified_timestamp: int ) -> str:
+    
+    # thumbnails get regenerated, so they need the mtime too
+    return f'"{hash.hex()}-{modified_timestamp}"'
+    
+
+class ResolvedFilePath( ClientCachesBase.CacheableObject ):
+    
+    def __init__( self, hash: bytes, mime: int, path: str ):
         
-        media_result = ParseAndFetchMediaResult( request )
+        self.hash = hash
+        self.mime = mime
+        self.path = path
         
-        if not media_result.GetLocationsManager().IsLocal():
+        self._resolved_time = HydrusTime.GetNow()
+        
+    
+    def GetEstimatedMemoryFootprint( self ) -> int:
+        
+        return 1
+        
+    
+    def IsFinishedLoading( self ):
+        
+        return True
+        
+    
+    def IsStale( self ):
+        
+        return HydrusTime.TimeHasPassed( self._resolved_time + RESOLVED_FILE_PATH_CACHE_TIMEOUT )
+        
+    
+
+def ResolveFilePath( media_result: ClientMediaResult.MediaResult ) -> ResolvedFilePath:
+    
+    if not media_result.GetLocationsManager().IsLocal():
+        
+        raise HydrusExceptions.FileMissingException( 'The client does not have this file!' )
+        
+    
+    hash = media_result.GetHash()
+    mime = media_result.GetMime()
+    
+    try:
+        
+        path = CG.client_controller.client_files_manager.GetFilePath( hash, mime )
+        
+    except HydrusExceptions.FileMissingException:
+        
+        raise HydrusExceptions.NotFoundException( 'That file seems to be missing!' )
+        
+    
+    return ResolvedFilePath( hash, mime, path )
+    
+
+def ResolveThumbnailPath( media_result: ClientMediaResult.MediaResult ) -> ResolvedFilePath | None:
+    
+    mime = media_result.GetMime()
+    
+    if mime not in HC.MIMES_WITH_THUMBNAILS:
+        
+        return None
+        
+    
+    try:
+        
+        path = CG.client_controller.client_files_manager.GetThumbnailPath( media_result )
+        
+        response_mime = HydrusFileHandling.GetThumbnailMime( path )
+        
+    except ( HydrusExceptions.FileMissingException, OSError ):
+        
+        # not _supposed_ to happen, but it seems in odd situations it can
+        return None
+        
+    
+    return ResolvedFilePath( media_result.GetHash(), response_mime, path )
+    
+
+class HydrusResourceClientAPIRestrictedGetFilesResolvedPathCache( HydrusResourceClientAPIRestrictedGetFiles ):
+    
+    def __init__( self, service, domain ):
+        
+        super().__init__( service, domain )
+        
+        self._resolved_file_path_cache = ClientCachesBase.DataCache( CG.client_controller, 'client api resolved file path cache', RESOLVED_FILE_PATH_CACHE_SIZE, timeout = RESOLVED_FILE_PATH_CACHE_TIMEOUT )
+        
+    
+    def _OpenResolvedFilePath( self, file_identifier: tuple[ str, int | bytes ] ) -> tuple[ ClientMediaResult.MediaResult | None, ResolvedFilePath | None, typing.BinaryIO | None ]:
+        """
+        Returns ( media_result, resolved_file_path, file_object ). The media_result is None if we did not need the db. The other two are None if there is no file to serve.
+        """
+        
+        resolved_file_path: ResolvedFilePath | None = self._resolved_file_path_cache.GetIfHasData( file_identifier )
+        
+        if resolved_file_path is not None and not resolved_file_path.IsStale():
             
-            raise HydrusExceptions.FileMissingException( 'The client does not have this file!' )
+            try:
+                
+                return ( None, resolved_file_path, open( resolved_file_path.path, 'rb' ) )
+                
+            except OSError:
+                
+                # it was moved or deleted, so let's ask the db again
+                pass
+                
+            
+        
+        # AddData does not overwrite
+        self._resolved_file_path_cache.DeleteData( file_identifier )
+        
+        media_result = FetchMediaResult( file_identifier )
+        
+        resolved_file_path = self._ResolveFilePath( media_result )
+        
+        if resolved_file_path is None:
+            
+            return ( media_result, None, None )
             
         
         try:
             
-            hash = media_result.GetHash()
-            mime = media_result.GetMime()
+            file_object = open( resolved_file_path.path, 'rb' )
             
-            path = CG.client_controller.client_files_manager.GetFilePath( hash, mime )
+        except OSError:
             
-            if not os.path.exists( path ):
+            return ( media_result, None, None )
+            
+        
+        self._resolved_file_path_cache.AddData( file_identifier, resolved_file_path )
+        
+        return ( media_result, resolved_file_path, file_object )
+        
+    
+    def _ResolveFilePath( self, media_result: ClientMediaResult.MediaResult ) -> ResolvedFilePath | None:
+        
+        raise NotImplementedError()
+        
+    
+
+class HydrusResourceClientAPIRestrictedGetFilesGetFile( HydrusResourceClientAPIRestrictedGetFilesResolvedPathCache ):
+    
+    def _ResolveFilePath( self, media_result: ClientMediaResult.MediaResult ) -> ResolvedFilePath | None:
+        
+        return ResolveFilePath( media_result )
+        
+    
+    def _threadDoGETJob( self, request: HydrusServerRequest.HydrusRequest ):
+        
+        file_identifier = ParseFileIdentifier( request )
+        
+        is_attachment = request.parsed_request_args.GetValue( 'download', bool, default_value = False )
+        
+        ( identifier_type, identifier ) = file_identifier
+        
+        if identifier_type == 'hash':
+            
+            etag = GetFileETag( identifier )
+            
+            if self._parseConditionalHeaders( request, etag ):
                 
-                raise HydrusExceptions.FileMissingException()
+                # we know what they have without going to the db or the disk
+                return HydrusServerResources.ResponseContext( 304, etag = etag, max_age = FILE_MAX_AGE, immutable = True )
                 
             
-        except HydrusExceptions.FileMissingException:
+        
+        ( media_result, resolved_file_path, file_object ) = self._OpenResolvedFilePath( file_identifier )
+        
+        if file_object is None:
             
             raise HydrusExceptions.NotFoundException( 'That file seems to be missing!' )
             
         
-        is_attachment = request.parsed_request_args.GetValue( 'download', bool, default_value = False )
+        stat_result = os.fstat( file_object.fileno() )
         
-        response_context = HydrusServerResources.ResponseContext( 200, mime = mime, path = path, is_attachment = is_attachment )
+        modified_timestamp = int( stat_result.st_mtime )
+        
+        etag = GetFileETag( resolved_file_path.hash )
+        
+        if self._parseConditionalHeaders( request, etag, modified_timestamp ):
+            
+            file_object.close()
+            
+            return HydrusServerResources.ResponseContext( 304, etag = etag, max_age = FILE_MAX_AGE, immutable = True )
+            
+        
+        response_context = HydrusServerResources.ResponseContext(
+            200,
+            mime = resolved_file_path.mime,
+            path = resolved_file_path.path,
+            is_attachment = is_attachment,
+            max_age = FILE_MAX_AGE,
+            filesize = stat_result.st_size,
+            etag = etag,
+            last_modified_timestamp = modified_timestamp,
+            immutable = True,
+            file_object = file_object
+        )
         
         return response_context
         
@@ -408,6 +666,115 @@ class HydrusResourceClientAPIRestrictedGetFilesFileHashes( HydrusResourceClientA
         
     
 
+def GetFileMetadataList(
+    hashes: list[ bytes ],
+    hashes_to_hash_ids: dict[ bytes, int ],
+    only_return_identifiers = False,
+    only_return_basic_information = False,
+    include_blurhash = False,
+    hide_service_keys_tags = True,
+    detailed_url_information = False,
+    include_notes = False,
+    include_milliseconds = False
+) -> list[ dict ]:
+    
+    hash_ids = { hashes_to_hash_ids[ hash ] for hash in hashes if hash in hashes_to_hash_ids }
+    
+    metadata = []
+    
+    if only_return_identifiers:
+        
+        for hash in hashes:
+            
+            if hash in hashes_to_hash_ids:
+                
+                metadata_row = {
+                    'file_id' : hashes_to_hash_ids[ hash ],
+                    'hash' : hash.hex()
+                }
+                
+                metadata.append( metadata_row )
+                
+            else:
+                
+                ClientMediaResultAPI.AddMissingHashToFileMetadata( metadata, hash )
+                
+            
+        
+    elif only_return_basic_information:
+        
+        file_info_managers: list[ ClientMediaManagers.FileInfoManager ] = CG.client_controller.Read( 'file_info_managers_from_ids', hash_ids )
+        
+        hashes_to_file_info_managers = { file_info_manager.hash : file_info_manager for file_info_manager in file_info_managers }
+        
+        for hash in hashes:
+            
+            if hash in hashes_to_file_info_managers:
+                
+                file_info_manager = hashes_to_file_info_managers[ hash ]
+                
+                metadata_row = {
+                    'file_id' : file_info_manager.hash_id,
+                    'hash' : file_info_manager.hash.hex(),
+                    'size' : file_info_manager.size,
+                    'mime' : HC.mime_mimetype_string_lookup[ file_info_manager.mime ],
+                    'filetype_human' : HC.mime_string_lookup[ file_info_manager.mime ],
+                    'filetype_enum' : file_info_manager.mime,
+                    'ext' : HC.mime_ext_lookup[ file_info_manager.mime ],
+                    'width' : file_info_manager.width,
+                    'height' : file_info_manager.height,
+                    'duration' : file_info_manager.duration_ms,
+                    'num_frames' : file_info_manager.num_frames,
+                    'num_words' : file_info_manager.num_words,
+                    'has_audio' : file_info_manager.has_audio
+                }
+                
+                filetype_forced = file_info_manager.FiletypeIsForced()
+                
+                metadata_row[ 'filetype_forced' ] = filetype_forced
+                
+                if filetype_forced:
+                    
+                    metadata_row[ 'original_mime' ] = HC.mime_mimetype_string_lookup[ file_info_manager.original_mime ]
+                    
+                
+                if include_blurhash:
+                    
+                    metadata_row[ 'blurhash' ] = file_info_manager.blurhash
+                    
+                
+                metadata.append( metadata_row )
+                
+            else:
+                
+                ClientMediaResultAPI.AddMissingHashToFileMetadata( metadata, hash )
+                
+            
+        
+    else:
+        
+        media_results: list[ ClientMediaResult.MediaResult ] = CG.client_controller.Read( 'media_results_from_ids', hash_ids )
+        
+        hashes_to_media_results = { media_result.GetFileInfoManager().hash : media_result for media_result in media_results }
+        
+        ClientMediaResultAPI.PopulateMetadataAPIDict( metadata, hashes, hashes_to_media_results, hide_service_keys_tags = hide_service_keys_tags, detailed_url_information = detailed_url_information, include_notes = include_notes, include_milliseconds = include_milliseconds )
+        
+    
+    return metadata
+    
+
+def GetHashesBatchFromFileIds( hash_ids: list[ int ] ) -> tuple[ list[ bytes ], dict[ bytes, int ] ]:
+    
+    # file_ids that do not exist are skipped
+    hash_ids_to_hashes = CG.client_controller.Read( 'hash_ids_to_hashes', hash_ids = hash_ids )
+    
+    hashes = [ hash_ids_to_hashes[ hash_id ] for hash_id in hash_ids if hash_id in hash_ids_to_hashes ]
+    
+    hashes_to_hash_ids = { hash_ids_to_hashes[ hash_id ] : hash_id for hash_id in hash_ids if hash_id in hash_ids_to_hashes }
+    
+    return ( hashes, hashes_to_hash_ids )
+    
+
 class HydrusResourceClientAPIRestrictedGetFilesFileMetadata( HydrusResourceClientAPIRestrictedGetFiles ):
     
     def _threadDoGETJob( self, request: HydrusServerRequest.HydrusRequest ):
@@ -434,135 +801,349 @@ class HydrusResourceClientAPIRestrictedGetFilesFileMetadata( HydrusResourceClien
         
         body_dict = {}
         
-        metadata = []
+        metadata = GetFileMetadataList(
+            hashes,
+            hashes_to_hash_ids,
+            only_return_identifiers = only_return_identifiers,
+            only_return_basic_information = only_return_basic_information,
+            include_blurhash = include_blurhash,
+            hide_service_keys_tags = hide_service_keys_tags,
+            detailed_url_information = detailed_url_information,
+            include_notes = include_notes,
+            include_milliseconds = include_milliseconds
+        )
         
-        if only_return_identifiers:
+        body_dict[ 'metadata' ] = metadata
+        
+        if include_services_object:
             
-            for hash in hashes:
+            body_dict[ 'services' ] = ClientLocalServerCore.GetServicesDict()
+            
+        
+        mime = request.preferred_mime
+        body = ClientLocalServerCore.Dumps( body_dict, mime )
+        
+        response_context = HydrusServerResources.ResponseContext( 200, mime = mime, body = body )
+        
+        return response_context
+        
+    
+
+class HydrusResourceClientAPIRestrictedGetFilesFileMetadataStream( HydrusResourceClientAPIRestrictedGetFiles ):
+    
+    def _threadDoGETJob( self, request: HydrusServerRequest.HydrusRequest ):
+        
+        only_return_identifiers = request.parsed_request_args.GetValue( 'only_return_identifiers', bool, default_value = False )
+        only_return_basic_information = request.parsed_request_args.GetValue( 'only_return_basic_information', bool, default_value = False )
+        hide_service_keys_tags = request.parsed_request_args.GetValue( 'hide_service_keys_tags', bool, default_value = True )
+        detailed_url_information = request.parsed_request_args.GetValue( 'detailed_url_information', bool, default_value = False )
+        include_notes = request.parsed_request_args.GetValue( 'include_notes', bool, default_value = False )
+        include_milliseconds = request.parsed_request_args.GetValue( 'include_milliseconds', bool, default_value = False )
+        include_blurhash = request.parsed_request_args.GetValue( 'include_blurhash', bool, default_value = False )
+        
+        batch_size = request.parsed_request_args.GetValue( 'batch_size', int, default_value = FILE_METADATA_STREAM_DEFAULT_BATCH_SIZE )
+        
+        if batch_size < 1:
+            
+            raise HydrusExceptions.BadRequestException( 'The batch_size has to be at least 1!' )
+            
+        
+        batch_size = min( batch_size, FILE_METADATA_STREAM_MAX_BATCH_SIZE )
+        
+        fields = None
+        
+        if 'fields' in request.parsed_request_args:
+            
+            fields = set( request.parsed_request_args.GetValue( 'fields', list, expected_list_type = str ) )
+            
+            # we only hydrate the cheapest group that covers what was asked for
+            
+            only_return_identifiers = fields.issubset( FILE_METADATA_IDENTIFIER_FIELDS )
+            only_return_basic_information = fields.issubset( FILE_METADATA_IDENTIFIER_FIELDS.union( FILE_METADATA_BASIC_FIELDS ) )
+            include_blurhash = 'blurhash' in fields
+            detailed_url_information = 'detailed_known_urls' in fields
+            include_notes = 'notes' in fields
+            
+            fields.update( FILE_METADATA_IDENTIFIER_FIELDS )
+            
+        
+        # we stream by file_id if we can, so we only ever look up one batch of hashes at a time
+        hashes = None
+        hashes_to_hash_ids = None
+        hash_ids = None
+        
+        file_search_context = ParseFileSearchContext( request )
+        
+        if file_search_context is None:
+            
+            hash_ids = ParseFileIds( request )
+            
+            if hash_ids is None:
                 
-                if hash in hashes_to_hash_ids:
-                    
-                    metadata_row = {
-                        'file_id' : hashes_to_hash_ids[ hash ],
-                        'hash' : hash.hex()
-                    }
-                    
-                    metadata.append( metadata_row )
-                    
-                else:
-                    
-                    ClientMediaResultAPI.AddMissingHashToFileMetadata( metadata, hash )
-                    
+                hashes = ClientLocalServerCore.ParseHashes( request )
+                
+                hash_ids_to_hashes = CG.client_controller.Read( 'hash_ids_to_hashes', hashes = hashes )
                 
+                hashes_to_hash_ids = { hash : hash_id for ( hash_id, hash ) in hash_ids_to_hashes.items() }
+                
+                request.client_api_permissions.CheckPermissionToSeeFiles( set( hash_ids_to_hashes.keys() ) )
+                
+            
+        else:
+            
+            sort_by = ParseFileSort( request )
+            
+            job_status = ClientThreading.JobStatus( cancellable = True )
             
-        elif only_return_basic_information:
+            request.disconnect_callables.append( job_status.Cancel )
+            
+            hash_ids = CG.client_controller.Read( 'file_query_ids', file_search_context, job_status = job_status, sort_by = sort_by, apply_implicit_limit = False )
             
-            file_info_managers: list[ ClientMediaManagers.FileInfoManager ] = CG.client_controller.Read( 'file_info_managers_from_ids', hash_ids )
+            request.client_api_permissions.SetLastSearchResults( hash_ids )
             
-            hashes_to_file_info_managers = { file_info_manager.hash : file_info_manager for file_info_manager in file_info_managers }
+        
+        mime = request.preferred_mime
+        
+        if mime == HC.APPLICATION_CBOR and not ClientLocalServerCore.CBOR_AVAILABLE:
+            
+            # we have to find out before we send the 200
+            raise HydrusExceptions.NotAcceptable( 'Sorry, this service does not support CBOR!' )
+            
+        
+        def generate_chunks():
             
-            for hash in hashes:
+            if hash_ids is None:
                 
-                if hash in hashes_to_file_info_managers:
-                    
-                    file_info_manager = hashes_to_file_info_managers[ hash ]
-                    
-                    metadata_row = {
-                        'file_id' : file_info_manager.hash_id,
-                        'hash' : file_info_manager.hash.hex(),
-                        'size' : file_info_manager.size,
-                        'mime' : HC.mime_mimetype_string_lookup[ file_info_manager.mime ],
-                        'filetype_human' : HC.mime_string_lookup[ file_info_manager.mime ],
-                        'filetype_enum' : file_info_manager.mime,
-                        'ext' : HC.mime_ext_lookup[ file_info_manager.mime ],
-                        'width' : file_info_manager.width,
-                        'height' : file_info_manager.height,
-                        'duration' : file_info_manager.duration_ms,
-                        'num_frames' : file_info_manager.num_frames,
-                        'num_words' : file_info_manager.num_words,
-                        'has_audio' : file_info_manager.has_audio
-                    }
-                    
-                    filetype_forced = file_info_manager.FiletypeIsForced()
-                    
-                    metadata_row[ 'filetype_forced' ] = filetype_forced
-                    
-                    if filetype_forced:
-                        
-                        metadata_row[ 'original_mime' ] = HC.mime_mimetype_string_lookup[ file_info_manager.original_mime ]
-                        
-                    
-                    if include_blurhash:
-                        
-                        metadata_row[ 'blurhash' ] = file_info_manager.blurhash
-                        
-                    
-                    metadata.append( metadata_row )
-                    
-                else:
+                batches = ( ( batch_of_hashes, hashes_to_hash_ids ) for batch_of_hashes in HydrusLists.SplitListIntoChunks( hashes, batch_size ) )
+                
+            else:
+                
+                batches = ( GetHashesBatchFromFileIds( batch_of_hash_ids ) for batch_of_hash_ids in HydrusLists.SplitListIntoChunks( hash_ids, batch_size ) )
+                
+            
+            for ( batch_of_hashes, batch_hashes_to_hash_ids ) in batches:
+                
+                metadata = GetFileMetadataList(
+                    batch_of_hashes,
+                    batch_hashes_to_hash_ids,
+                    only_return_identifiers = only_return_identifiers,
+                    only_return_basic_information = only_return_basic_information,
+                    include_blurhash = include_blurhash,
+                    hide_service_keys_tags = hide_service_keys_tags,
+                    detailed_url_information = detailed_url_information,
+                    include_notes = include_notes,
+                    include_milliseconds = include_milliseconds
+                )
+                
+                if fields is not None:
                     
-                    ClientMediaResultAPI.AddMissingHashToFileMetadata( metadata, hash )
+                    metadata = [ { key : value for ( key, value ) in metadata_row.items() if key in fields } for metadata_row in metadata ]
                     
                 
+                yield b''.join( ( ClientLocalServerCore.DumpsStreamRecord( metadata_row, mime ) for metadata_row in metadata ) )
+                
             
-        else:
+        
+        response_context = HydrusServerResources.ResponseContext( 200, mime = mime, body_chunks = generate_chunks() )
+        
+        return response_context
+        
+    
+
+class HydrusResourceClientAPIRestrictedGetFilesGetThumbnail( HydrusResourceClientAPIRestrictedGetFilesResolvedPathCache ):
+    
+    def _ResolveFilePath( self, media_result: ClientMediaResult.MediaResult ) -> ResolvedFilePath | None:
+        
+        return ResolveThumbnailPath( media_result )
+        
+    
+    def _threadDoGETJob( self, request: HydrusServerRequest.HydrusRequest ):
+        
+        file_identifier = ParseFileIdentifier( request )
+        
+        ( media_result, resolved_file_path, file_object ) = self._OpenResolvedFilePath( file_identifier )
+        
+        if file_object is None:
+            
+            # the default thumbs are not worth an etag, and we want the real thumb as soon as it exists
+            
+            path = HydrusFileHandling.mimes_to_default_thumbnail_paths[ media_result.GetMime() ]
             
-            media_results: list[ ClientMediaResult.MediaResult ] = CG.client_controller.Read( 'media_results_from_ids', hash_ids )
+            response_mime = HydrusFileHandling.GetThumbnailMime( path )
             
-            hashes_to_media_results = { media_result.GetFileInfoManager().hash : media_result for media_result in media_results }
+            response_context = HydrusServerResources.ResponseContext( 200, mime = response_mime, path = path )
             
-            ClientMediaResultAPI.PopulateMetadataAPIDict( metadata, hashes, hashes_to_media_results, hide_service_keys_tags = hide_service_keys_tags, detailed_url_information = detailed_url_information, include_notes = include_notes, include_milliseconds = include_milliseconds )
+            return response_context
             
         
-        body_dict[ 'metadata' ] = metadata
+        # thumbnails are regenerated in place, so size and mtime have to come from the exact file we are about to send
         
-        if include_services_object:
+        stat_result = os.fstat( file_object.fileno() )
+        
+        modified_timestamp = int( stat_result.st_mtime )
+        
+        etag = GetThumbnailETag( resolved_file_path.hash, modified_timestamp )
+        
+        if self._parseConditionalHeaders( request, etag, modified_timestamp ):
             
-            body_dict[ 'services' ] = ClientLocalServerCore.GetServicesDict()
+            file_object.close()
+            
+            return HydrusServerResources.ResponseContext( 304, etag = etag )
             
         
-        mime = request.preferred_mime
-        body = ClientLocalServerCore.Dumps( body_dict, mime )
-        
-        response_context = HydrusServerResources.ResponseContext( 200, mime = mime, body = body )
+        response_context = HydrusServerResources.ResponseContext(
+            200,
+            mime = resolved_file_path.mime,
+            path = resolved_file_path.path,
+            filesize = stat_result.st_size,
+            etag = etag,
+            last_modified_timestamp = modified_timestamp,
+            file_object = file_object
+        )
         
         return response_context
         
     
 
-class HydrusResourceClientAPIRestrictedGetFilesGetThumbnail( HydrusResourceClientAPIRestrictedGetFiles ):
+class HydrusResourceClientAPIRestrictedGetFilesGetThumbnails( HydrusResourceClientAPIRestrictedGetFiles ):
     
-    def _threadDoGETJob( self, request: HydrusServerRequest.HydrusRequest ):
+    def _GenerateThumbnailRecord( self, media_result: ClientMediaResult.MediaResult, bounding_dimensions: tuple[ int, int ] | None ) -> bytes:
         
-        media_result = ParseAndFetchMediaResult( request )
+        # same rules as a single /thumbnail, so a missing or filetype thumb gets the same default icon
         
-        mime = media_result.GetMime()
+        resolved_file_path = ResolveThumbnailPath( media_result )
         
-        if mime in HC.MIMES_WITH_THUMBNAILS:
+        if resolved_file_path is not None and not os.path.exists( resolved_file_path.path ):
             
-            try:
+            resolved_file_path = None
+            
+        
+        if resolved_file_path is None:
+            
+            path = HydrusFileHandling.mimes_to_default_thumbnail_paths[ media_result.GetMime() ]
+            
+            mime = HydrusFileHandling.GetThumbnailMime( path )
+            
+        else:
+            
+            path = resolved_file_path.path
+            mime = resolved_file_path.mime
+            
+        
+        thumbnail_bytes = None
+        
+        if bounding_dimensions is not None:
+            
+            resolution = HydrusImageHandling.GetImageResolution( path, mime )
+            
+            target_resolution = HydrusImageHandling.GetThumbnailResolution( resolution, bounding_dimensions, HydrusImageHandling.THUMBNAIL_SCALE_DOWN_ONLY, 100 )
+            
+            if target_resolution != resolution:
                 
-                path = CG.client_controller.client_files_manager.GetThumbnailPath( media_result )
+                numpy_image = HydrusImageHandling.GenerateNumPyImage( path, mime )
                 
-                if not os.path.exists( path ):
+                numpy_image = HydrusImageHandling.ResizeNumPyImage( numpy_image, target_resolution )
+                
+                thumbnail_bytes = HydrusImageHandling.GenerateThumbnailBytesFromNumPy( numpy_image )
+                
+                if len( numpy_image.shape ) == 3 and numpy_image.shape[2] == 4:
                     
-                    # not _supposed_ to happen, but it seems in odd situations it can
-                    raise HydrusExceptions.FileMissingException()
+                    mime = HC.IMAGE_PNG
+                    
+                else:
+                    
+                    mime = HC.IMAGE_JPEG
                     
                 
-            except HydrusExceptions.FileMissingException:
+            
+        
+        if thumbnail_bytes is None:
+            
+            with open( path, 'rb' ) as f:
+                
+                thumbnail_bytes = f.read()
+                
+            
+        
+        header = {
+            'file_id' : media_result.GetHashId(),
+            'hash' : media_result.GetHash().hex(),
+            'mime' : HC.mime_mimetype_string_lookup[ mime ]
+        }
+        
+        header_bytes = json.dumps( header ).encode( 'utf-8' )
+        
+        return struct.pack( '>I', len( header_bytes ) ) + header_bytes + struct.pack( '>I', len( thumbnail_bytes ) ) + thumbnail_bytes
+        
+    
+    def _threadDoGETJob( self, request: HydrusServerRequest.HydrusRequest ):
+        
+        bounding_dimensions = None
+        
+        if 'width' in request.parsed_request_args or 'height' in request.parsed_request_args:
+            
+            width = request.parsed_request_args.GetValue( 'width', int )
+            height = request.parsed_request_args.GetValue( 'height', int )
+            
+            if width < 1 or height < 1:
+                
+                raise HydrusExceptions.BadRequestException( 'Width and height must be greater than 0!' )
+                
+            
+            bounding_dimensions = ( width, height )
+            
+        
+        # the whole page in one db read, rather than one per thumb
+        
+        hash_ids = ParseFileIds( request )
+        
+        if hash_ids is not None:
+            
+            try:
+                
+                media_results = CG.client_controller.Read( 'media_results_from_ids', hash_ids )
+                
+            except HydrusExceptions.DataMissing as e:
+                
+                raise HydrusExceptions.NotFoundException( 'One or more of those file identifiers was missing!' )
+                
+            
+            hash_ids_to_media_results = { media_result.GetHashId() : media_result for media_result in media_results }
+            
+            if False in ( hash_id in hash_ids_to_media_results for hash_id in hash_ids ):
                 
-                path = HydrusFileHandling.mimes_to_default_thumbnail_paths[ mime ]
+                raise HydrusExceptions.NotFoundException( 'One or more of those file identifiers was missing!' )
                 
             
+            media_results = [ hash_ids_to_media_results[ hash_id ] for hash_id in hash_ids ]
+            
         else:
             
-            path = HydrusFileHandling.mimes_to_default_thumbnail_paths[ mime ]
+            hashes = HydrusLists.DedupeList( ClientLocalServerCore.ParseHashes( request ) )
+            
+            media_results = CG.client_controller.Read( 'media_results', hashes, sorted = True )
+            
+            request.client_api_permissions.CheckPermissionToSeeFiles( [ media_result.GetHashId() for media_result in media_results ] )
             
         
-        response_mime = HydrusFileHandling.GetThumbnailMime( path )
+        def generate_chunks():
+            
+            if bounding_dimensions is None:
+                
+                for media_result in media_results:
+                    
+                    yield self._GenerateThumbnailRecord( media_result, None )
+                    
+                
+                return
+                
+            
+            # resizing is cpu work, so a few go at once on the thread pool. they still come out in the order they were asked for
+            
+            yield from HydrusThreading.MapOrderedOnThreads( CG.client_controller, lambda media_result: self._GenerateThumbnailRecord( media_result, bounding_dimensions ), media_results )
+            
         
-        response_context = HydrusServerResources.ResponseContext( 200, mime = response_mime, path = path )
+        response_context = HydrusServerResources.ResponseContext( 200, mime = HC.APPLICATION_OCTET_STREAM, body_chunks = generate_chunks() )
         
         return response_context
         
@@ -0,0 +1,289 @@
+import collections.abc
+
+import numpy
+
+# a file search over a big client can make several multi-million-element python sets, which are about 40 bytes an id and slow to intersect
+# this holds the same ids as a sorted, unique numpy array, about 4 bytes an id, and does the set algebra in numpy
+# it quacks like a set, so it can be passed around to anything that iterates, len()s, or 'in's
+
+# below this, a normal python set is simpler and about as fast
+HASH_ID_SET_THRESHOLD = 65536
+
+# when intersecting with something this many times smaller, we look the small side up rather than merging the whole arrays
+SMALL_LOOKUP_RATIO = 32
+
+def _GetDType( min_value: int, max_value: int ):
+    
+    if 0 <= min_value and max_value <= 0xFFFFFFFF:
+        
+        return numpy.uint32
+        
+    
+    return numpy.int64
+    
+
+def _ConvertToSortedUniqueArray( hash_ids ) -> numpy.ndarray:
+    
+    if isinstance( hash_ids, HashIdSet ):
+        
+        return hash_ids.GetArray()
+        
+    
+    if isinstance( hash_ids, numpy.ndarray ):
+        
+        array = hash_ids
+        
+        if array.dtype.kind not in 'iu':
+            
+            array = array.astype( numpy.int64 )
+            
+        
+        return numpy.unique( array )
+        
+    
+    if not isinstance( hash_ids, collections.abc.Collection ):
+        
+        hash_ids = list( hash_ids )
+        
+    
+    if len( hash_ids ) == 0:
+        
+        return numpy.empty( 0, dtype = numpy.uint32 )
+        
+    
+    array = numpy.fromiter( hash_ids, dtype = numpy.int64, count = len( hash_ids ) )
+    
+    array = array.astype( _GetDType( int( array.min() ), int( array.max() ) ) )
+    
+    if isinstance( hash_ids, ( set, frozenset ) ):
+        
+        array.sort()
+        
+        return array
+        
+    
+    return numpy.unique( array )
+    
+
+def _IntersectArrays( array_1: numpy.ndarray, array_2: numpy.ndarray ) -> numpy.ndarray:
+    
+    if len( array_1 ) < len( array_2 ):
+        
+        ( small, big ) = ( array_1, array_2 )
+        
+    else:
+        
+        ( small, big ) = ( array_2, array_1 )
+        
+    
+    if len( small ) == 0:
+        
+        return small[:0]
+        
+    
+    if len( small ) * SMALL_LOOKUP_RATIO < len( big ):
+        
+        # binary search the small side into the big one
+        
+        indices = numpy.searchsorted( big, small )
+        
+        indices[ indices >= len( big ) ] = 0
+        
+        return small[ big[ indices ] == small ]
+        
+    
+    return numpy.intersect1d( array_1, array_2, assume_unique = True )
+    
+
+class HashIdSet( collections.abc.MutableSet ):
+    
+    def __init__( self, hash_ids = None ):
+        
+        if hash_ids is None:
+            
+            self._array = numpy.empty( 0, dtype = numpy.uint32 )
+            
+        else:
+            
+            self._array = _ConvertToSortedUniqueArray( hash_ids )
+            
+            if isinstance( hash_ids, HashIdSet ):
+                
+                self._array = self._array.copy()
+                
+            
+        
+    
+    def __contains__( self, hash_id ) -> bool:
+        
+        if len( self._array ) == 0:
+            
+            return False
+            
+        
+        index = numpy.searchsorted( self._array, hash_id )
+        
+        return index < len( self._array ) and self._array[ index ] == hash_id
+        
+    
+    def __iter__( self ):
+        
+        # tolist gives us python ints, which is what sqlite wants
+        return iter( self._array.tolist() )
+        
+    
+    def __len__( self ) -> int:
+        
+        return len( self._array )
+        
+    
+    def __repr__( self ) -> str:
+        
+        return 'HashIdSet: {} ids'.format( len( self._array ) )
+        
+    
+    @classmethod
+    def _from_iterable( cls, it ):
+        
+        return cls( it )
+        
+    
+    @classmethod
+    def _FromSortedUniqueArray( cls, array: numpy.ndarray ) -> 'HashIdSet':
+        
+        hash_id_set = cls()
+        
+        hash_id_set._array = array
+        
+        return hash_id_set
+        
+    
+    def add( self, hash_id ):
+        
+        self.update( ( hash_id, ) )
+        
+    
+    def copy( self ) -> 'HashIdSet':
+        
+        return HashIdSet._FromSortedUniqueArray( self._array.copy() )
+        
+    
+    def difference( self, *others ) -> 'HashIdSet':
+        
+        result = self.copy()
+        
+        result.difference_update( *others )
+        
+        return result
+        
+    
+    def difference_update( self, *others ):
+        
+        for other in others:
+            
+            if len( self._array ) == 0:
+                
+                return
+                
+            
+            if len( other ) == 0:
+                
+                continue
+                
+            
+            other_array = _ConvertToSortedUniqueArray( other )
+            
+            self._array = numpy.setdiff1d( self._array, other_array, assume_unique = True ).astype( self._array.dtype, copy = False )
+            
+        
+    
+    def discard( self, hash_id ):
+        
+        index = numpy.searchsorted( self._array, hash_id )
+        
+        if index < len( self._array ) and self._array[ index ] == hash_id:
+            
+            self._array = numpy.delete( self._array, index )
+            
+        
+    
+    def GetArray( self ) -> numpy.ndarray:
+        
+        return self._array
+        
+    
+    def intersection( self, *others ) -> 'HashIdSet':
+        
+        result = self.copy()
+        
+        result.intersection_update( *others )
+        
+        return result
+        
+    
+    def intersection_update( self, *others ):
+        
+        for other in others:
+            
+            if len( self._array ) == 0:
+                
+                return
+                
+            
+            other_array = _ConvertToSortedUniqueArray( other )
+            
+            self._array = _IntersectArrays( self._array, other_array )
+            
+        
+    
+    def union( self, *others ) -> 'HashIdSet':
+        
+        result = self.copy()
+        
+        result.update( *others )
+        
+        return result
+        
+    
+    def update( self, *others ):
+        
+        for other in others:
+            
+            other_array = _ConvertToSortedUniqueArray( other )
+            
+            if len( other_array ) == 0:
+                
+                continue
+                
+            
+            if len( self._array ) == 0:
+                
+                self._array = other_array.copy()
+                
+                continue
+                
+            
+            dtype = numpy.promote_types( self._array.dtype, other_array.dtype )
+            
+            self._array = numpy.union1d( self._array.astype( dtype, copy = False ), other_array.astype( dtype, copy = False ) )
+            
+        
+    
+
+def IntersectHashIds( hash_ids_1: collections.abc.Collection[ int ], hash_ids_2: collections.abc.Collection[ int ] ) -> collections.abc.Collection[ int ]:
+    """
+    Intersects two collections of hash ids, using a HashIdSet if either is one or both are big. Does not change either input.
+    """
+    
+    if isinstance( hash_ids_1, HashIdSet ) or isinstance( hash_ids_2, HashIdSet ) or min( len( hash_ids_1 ), len( hash_ids_2 ) ) >= HASH_ID_SET_THRESHOLD:
+        
+        return HashIdSet._FromSortedUniqueArray( _IntersectArrays( _ConvertToSortedUniqueArray( hash_ids_1 ), _ConvertToSortedUniqueArray( hash_ids_2 ) ) )
+        
+    
+    if not isinstance( hash_ids_1, set ):
+        
+        hash_ids_1 = set( hash_ids_1 )
+        
+    
+    return hash_ids_1.intersection( hash_ids_2 )
+
@@ -111,7 +111,7 @@ options = {}
 # Misc
 
 NETWORK_VERSION = 20
-SOFTWARE_VERSION = 659
+SOFTWARE_VERSION = 660
 CLIENT_API_VERSION = 88
 
 SERVER_THUMBNAIL_DIMENSIONS = ( 200, 200 )
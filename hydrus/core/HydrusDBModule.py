@@ -31,9 +31,9 @@ class HydrusDBModule( HydrusDBBase.DBBase ):
     
     def _CreateTable( self, create_query_without_name: str, table_name: str ):
         
-        if 'fts4(' in create_query_without_name.lower():
+        if 'fts4(' in create_query_without_name.lower() or 'fts5(' in create_query_without_name.lower():
             
-            # when we want to repair a missing fts4 table, the damaged old virtual table sometimes still has some sub-tables hanging around, which breaks the new create
+            # when we want to repair a missing fts4/5 table, the damaged old virtual table sometimes still has some sub-tables hanging around, which breaks the new create
             # so, let's route all table creation through here and check for and clear any subtables beforehand!
             
             if '.' in table_name:
@@ -51,7 +51,7 @@ class HydrusDBModule( HydrusDBBase.DBBase ):
             # little test here to make sure we stay idempotent if the primary table actually already exists--don't want to delete things that are actually good!
             if self._Execute( 'SELECT 1 FROM {} WHERE name = ?;'.format( sqlite_master_table ), ( raw_table_name, ) ).fetchone() is None:
                 
-                possible_suffixes = [ '_content', '_docsize', '_segdir', '_segments', '_stat' ]
+                possible_suffixes = [ '_config', '_content', '_data', '_docsize', '_idx', '_segdir', '_segments', '_stat' ]
                 
                 possible_subtable_names = [ '{}{}'.format( raw_table_name, suffix ) for suffix in possible_suffixes ]
                 
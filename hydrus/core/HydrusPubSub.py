@@ -1,10 +1,13 @@
+import collections
 import threading
+import types
 import weakref
 
 from hydrus.core import HydrusData
 from hydrus.core import HydrusExceptions
 from hydrus.core import HydrusGlobals as HG
 from hydrus.core import HydrusProfiling
+from hydrus.core import HydrusTime
 
 class HydrusPubSub( object ):
     
@@ -24,53 +27,231 @@ class HydrusPubSub( object ):
         self._topics_to_objects = {}
         self._topics_to_method_names = {}
         
+        # topic -> list of ( obj weakref, weak method or None, method_name ). made on first pub, thrown away on sub or when a subscriber dies
+        self._topics_to_callable_refs = {}
+        
+        # topic -> merge callable, or None to drop repeated pubs with no arguments
+        self._topics_to_coalesce_callables = {}
+        
+        # topic -> [ num_dispatches, num_coalesced_away, total_time_s, max_time_s ]
+        self._topics_to_timings = collections.defaultdict( lambda: [ 0, 0, 0.0, 0.0 ] )
+        
     
-    def _GetCallableTuples( self, topic ):
+    def _CoalescePubSubs( self, pubsubs ):
         
-        # this now does the obj as well so we have a strong direct ref to it throughout procesing
+        # coalesced pubs go out where the last one of their topic was queued, so nothing is sent earlier than it would have been
         
-        callable_tuples = []
+        topics_to_indices = collections.defaultdict( list )
         
-        if topic in self._topics_to_objects:
+        for ( i, ( topic, args, kwargs ) ) in enumerate( pubsubs ):
             
-            try:
+            if topic in self._topics_to_coalesce_callables:
+                
+                topics_to_indices[ topic ].append( i )
+                
+            
+        
+        indices_to_replacements = {}
+        
+        for ( topic, indices ) in topics_to_indices.items():
+            
+            if len( indices ) < 2:
+                
+                continue
+                
+            
+            merge_callable = self._topics_to_coalesce_callables[ topic ]
+            
+            if merge_callable is None:
+                
+                indices = [ i for i in indices if len( pubsubs[ i ][1] ) == 0 and len( pubsubs[ i ][2] ) == 0 ]
+                
+                if len( indices ) < 2:
+                    
+                    continue
+                    
+                
+                replacement = [ pubsubs[ indices[-1] ] ]
+                
+            else:
+                
+                try:
+                    
+                    merged_rows = merge_callable( [ ( pubsubs[ i ][1], pubsubs[ i ][2] ) for i in indices ] )
+                    
+                except Exception as e:
+                    
+                    HydrusData.ShowException( e )
+                    
+                    continue
+                    
+                
+                replacement = [ ( topic, args, kwargs ) for ( args, kwargs ) in merged_rows ]
+                
+            
+            for i in indices[:-1]:
+                
+                indices_to_replacements[ i ] = []
+                
+            
+            indices_to_replacements[ indices[-1] ] = replacement
+            
+            with self._lock:
+                
+                self._topics_to_timings[ topic ][1] += len( indices ) - len( replacement )
+                
+            
+        
+        if len( indices_to_replacements ) == 0:
+            
+            return pubsubs
+            
+        
+        coalesced_pubsubs = []
+        
+        for ( i, pubsub ) in enumerate( pubsubs ):
+            
+            if i in indices_to_replacements:
+                
+                coalesced_pubsubs.extend( indices_to_replacements[ i ] )
+                
+            else:
                 
-                objects = self._topics_to_objects[ topic ]
+                coalesced_pubsubs.append( pubsub )
                 
-                for obj in objects:
+            
+        
+        return coalesced_pubsubs
+        
+    
+    def _GenerateCallableRefs( self, topic ):
+        
+        callable_refs = []
+        
+        if topic in self._topics_to_objects:
+            
+            objects = list( self._topics_to_objects[ topic ] )
+            method_names = list( self._topics_to_method_names[ topic ] )
+            
+            for obj in objects:
+                
+                for method_name in method_names:
                     
-                    if obj is None or not self._valid_callable( obj ):
+                    if not hasattr( obj, method_name ):
                         
                         continue
                         
                     
-                    method_names = self._topics_to_method_names[ topic ]
+                    callable = getattr( obj, method_name )
                     
-                    for method_name in method_names:
+                    if isinstance( callable, types.MethodType ):
                         
-                        if hasattr( obj, method_name ):
-                            
-                            callable = getattr( obj, method_name )
-                            
-                            callable_tuples.append( ( obj, callable ) )
-                            
+                        method_ref = weakref.WeakMethod( callable )
                         
+                    else:
+                        
+                        # Qt builtins and other odd callables can't be weak-methoded, so we'll getattr them each time
+                        method_ref = None
+                        
+                    
+                    callable_refs.append( ( weakref.ref( obj ), method_ref, method_name ) )
+                    
+                
+            
+        
+        return callable_refs
+        
+    
+    def _GetCallableTuples( self, topic ):
+        
+        # this now does the obj as well so we have a strong direct ref to it throughout procesing
+        
+        callable_refs = self._topics_to_callable_refs.get( topic, None )
+        
+        if callable_refs is None:
+            
+            with self._lock:
+                
+                callable_refs = self._GenerateCallableRefs( topic )
+                
+                self._topics_to_callable_refs[ topic ] = callable_refs
+                
+            
+        
+        callable_tuples = []
+        
+        found_a_dead_ref = False
+        
+        for ( obj_ref, method_ref, method_name ) in callable_refs:
+            
+            obj = obj_ref()
+            
+            if obj is None:
+                
+                found_a_dead_ref = True
+                
+                continue
+                
+            
+            try:
+                
+                if not self._valid_callable( obj ):
+                    
+                    continue
+                    
+                
+                if method_ref is None:
+                    
+                    callable = getattr( obj, method_name )
+                    
+                else:
+                    
+                    callable = method_ref()
                     
                 
             except Exception as e:
                 
-                pass
+                continue
+                
+            
+            if callable is not None:
+                
+                callable_tuples.append( ( obj, callable ) )
                 
             
         
+        if found_a_dead_ref:
+            
+            self._topics_to_callable_refs.pop( topic, None )
+            
+        
         return callable_tuples
         
     
+    def ClearTopicTimings( self ):
+        
+        with self._lock:
+            
+            self._topics_to_timings.clear()
+            
+        
+    
     def DoingWork( self ):
         
         return self._doing_work
         
     
+    def GetTopicTimings( self ) -> dict[ str, tuple[ int, int, float, float ] ]:
+        """
+        Returns topic -> ( num_dispatches, num_coalesced_away, total_time_s, max_time_s ) for everything that went through Process.
+        """
+        
+        with self._lock:
+            
+            return { topic : tuple( timings ) for ( topic, timings ) in self._topics_to_timings.items() }
+            
+        
+    
     def Process( self ):
         
         # only do one list of callables at a time
@@ -96,8 +277,15 @@ class HydrusPubSub( object ):
                 self._pubsubs = []
                 
             
+            if len( self._topics_to_coalesce_callables ) > 0:
+                
+                pubsubs = self._CoalescePubSubs( pubsubs )
+                
+            
             for ( topic, args, kwargs ) in pubsubs:
                 
+                time_started = HydrusTime.GetNowPrecise()
+                
                 try:
                     
                     # do all this _outside_ the lock, lol
@@ -147,6 +335,19 @@ class HydrusPubSub( object ):
                     
                     HydrusData.ShowException( e )
                     
+                finally:
+                    
+                    time_took = HydrusTime.GetNowPrecise() - time_started
+                    
+                    with self._lock:
+                        
+                        timings = self._topics_to_timings[ topic ]
+                        
+                        timings[0] += 1
+                        timings[2] += time_took
+                        timings[3] = max( timings[3], time_took )
+                        
+                    
                 
             
         finally:
@@ -169,10 +370,7 @@ class HydrusPubSub( object ):
     
     def pubimmediate( self, topic, *args, **kwargs ):
         
-        with self._lock:
-            
-            callable_tuples = self._GetCallableTuples( topic )
-            
+        callable_tuples = self._GetCallableTuples( topic )
         
         for ( obj, callable ) in callable_tuples:
             
@@ -190,6 +388,21 @@ class HydrusPubSub( object ):
             self._topics_to_objects[ topic ].add( object )
             self._topics_to_method_names[ topic ].add( method_name )
             
+            self._topics_to_callable_refs.pop( topic, None )
+            
+        
+    
+    def SetTopicCoalescing( self, topic, merge_callable = None ):
+        """
+        Makes pubs to this topic that queue up together go out as fewer calls.
+        With no merge_callable, repeated pubs with no arguments are sent once.
+        Otherwise, merge_callable takes the list of ( args, kwargs ) queued and returns the list of ( args, kwargs ) to send.
+        """
+        
+        with self._lock:
+            
+            self._topics_to_coalesce_callables[ topic ] = merge_callable
+            
         
     
     def WaitOnPub( self ):
@@ -16,6 +16,9 @@ class HydrusSessionManagerServer( object ):
         
         self._lock = threading.Lock()
         
+        # bumped every time an account is invalidated, so a slow refresh that lost a race with a newer one does not put the older account back
+        self._service_keys_to_account_keys_to_versions = collections.defaultdict( collections.Counter )
+        
         self.RefreshAllAccounts()
         
         HG.controller.sub( self, 'RefreshAccounts', 'update_session_accounts' )
@@ -64,6 +67,29 @@ class HydrusSessionManagerServer( object ):
         return account_key
         
     
+    def _SetAccount( self, service_key, account ):
+        
+        account_keys_to_accounts = self._service_keys_to_account_keys_to_accounts[ service_key ]
+        
+        account_key = account.GetAccountKey()
+        
+        if account_key in account_keys_to_accounts:
+            
+            old_account = account_keys_to_accounts[ account_key ]
+            
+            # the db only has bandwidth as of our last dirty save, so our live tracker is always the more up to date one
+            
+            account.SetBandwidthTracker( old_account.GetBandwidthTracker() )
+            
+            if not old_account.IsDirty():
+                
+                account.SetClean()
+                
+            
+        
+        account_keys_to_accounts[ account_key ] = account
+        
+    
     def AddSession( self, service_key, access_key ):
         
         with self._lock:
@@ -132,7 +158,7 @@ class HydrusSessionManagerServer( object ):
             
             for ( service_key, account_keys_to_accounts ) in self._service_keys_to_account_keys_to_accounts.items():
                 
-                dirty_accounts = [ account_key for account_key in account_keys_to_accounts.values() if account_key.IsDirty() ]
+                dirty_accounts = [ account for account in account_keys_to_accounts.values() if account.IsDirty() ]
                 
                 if len( dirty_accounts ) > 0:
                     
@@ -155,11 +181,44 @@ class HydrusSessionManagerServer( object ):
                 account_keys = list( account_keys_to_accounts.keys() )
                 
             
+            # anything we do not have will be fetched fresh when it is next asked for
+            account_keys = [ account_key for account_key in account_keys if account_key in account_keys_to_accounts ]
+            
+            account_keys_to_versions = self._service_keys_to_account_keys_to_versions[ service_key ]
+            
             for account_key in account_keys:
                 
-                account = HG.controller.Read( 'account', service_key, account_key )
+                account_keys_to_versions[ account_key ] += 1
+                
+            
+            account_keys_to_expected_versions = { account_key : account_keys_to_versions[ account_key ] for account_key in account_keys }
+            
+        
+        if len( account_keys ) == 0:
+            
+            return
+            
+        
+        # the db hit happens outside the lock, so everyone else's requests carry on in the meantime
+        
+        accounts = HG.controller.Read( 'accounts', service_key, account_keys )
+        
+        with self._lock:
+            
+            account_keys_to_versions = self._service_keys_to_account_keys_to_versions[ service_key ]
+            
+            for account in accounts:
+                
+                account_key = account.GetAccountKey()
+                
+                if account_keys_to_versions[ account_key ] != account_keys_to_expected_versions[ account_key ]:
+                    
+                    # a newer refresh is on the way
+                    
+                    continue
+                    
                 
-                account_keys_to_accounts[ account_key ] = account
+                self._SetAccount( service_key, account )
                 
             
         
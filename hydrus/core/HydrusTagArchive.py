@@ -22,6 +22,14 @@ import sqlite3
 
 # If you are only adding a couple tags, you can exclude the BigJob stuff. It just makes millions of sequential writes more efficient.
 
+# If you are adding a LOT of mappings, like a whole tag repository, then go:
+
+# hta.BeginBigJob( defer_index_creation = True )
+# for chunk_of_hash_tags_pairs in my_chunked_generator: hta.AddMappingsBulk( chunk_of_hash_tags_pairs )
+# hta.CommitBigJob()
+
+# AddMappingsBulk looks up and inserts all the hashes and tags for a chunk in a handful of statements, and deferring the index means we only build it once at the end.
+
 
 # Also, this manages hashes as bytes, not hex, so if you have something like:
 
@@ -91,6 +99,53 @@ def ReadLargeIdQueryInSeparateChunks( cursor, select_statement, chunk_size ):
     
     cursor.execute( 'DROP TABLE ' + table_name + ';' )
     
+def SplitIntoChunks( items, chunk_size ):
+    
+    items = list( items )
+    
+    for i in range( 0, len( items ), chunk_size ):
+        
+        yield items[ i : i + chunk_size ]
+        
+    
+
+def GetIdsFromValuesBulk( cursor, table_name, value_column_name, id_column_name, values, value_wrapper = None ):
+    
+    # fetches or creates ids for many values with a few IN and executemany calls rather than one SELECT and INSERT per row
+    
+    values = set( values )
+    
+    if value_wrapper is None:
+        
+        value_wrapper = lambda v: v
+        
+    
+    values_to_ids = {}
+    
+    def fetch_existing( values_to_fetch ):
+        
+        for chunk in SplitIntoChunks( values_to_fetch, 256 ):
+            
+            select_statement = 'SELECT {}, {} FROM {} WHERE {} IN ( {} );'.format( value_column_name, id_column_name, table_name, value_column_name, ', '.join( '?' * len( chunk ) ) )
+            
+            values_to_ids.update( cursor.execute( select_statement, [ value_wrapper( value ) for value in chunk ] ) )
+            
+        
+    
+    fetch_existing( values )
+    
+    missing_values = [ value for value in values if value not in values_to_ids ]
+    
+    if len( missing_values ) > 0:
+        
+        cursor.executemany( 'INSERT INTO {} ( {} ) VALUES ( ? );'.format( table_name, value_column_name ), ( ( value_wrapper( value ), ) for value in missing_values ) )
+        
+        fetch_existing( missing_values )
+        
+    
+    return values_to_ids
+    
+
 class HydrusTagArchive( object ):
     
     def __init__( self, path ):
@@ -107,12 +162,53 @@ class HydrusTagArchive( object ):
         self._namespaces = { namespace for ( namespace, ) in self._c.execute( 'SELECT namespace FROM namespaces;' ) }
         self._namespaces.add( '' )
         
+        self._index_creation_deferred = False
+        
     
     def _AddMappings( self, hash_id, tag_ids ):
         
         self._c.executemany( 'INSERT OR IGNORE INTO mappings ( hash_id, tag_id ) VALUES ( ?, ? );', ( ( hash_id, tag_id ) for tag_id in tag_ids ) )
         
     
+    def _CreateDeferrableIndices( self ):
+        
+        self._c.execute( 'CREATE INDEX IF NOT EXISTS mappings_hash_id_index ON mappings ( hash_id );' )
+        
+    
+    def _GetHashIds( self, hashes ):
+        
+        return GetIdsFromValuesBulk( self._c, 'hashes', 'hash', 'hash_id', hashes, value_wrapper = sqlite3.Binary )
+        
+    
+    def _GetTagIds( self, tags ):
+        
+        tags_to_tag_ids = GetIdsFromValuesBulk( self._c, 'tags', 'tag', 'tag_id', tags )
+        
+        new_namespaces = set()
+        
+        for tag in tags_to_tag_ids.keys():
+            
+            if ':' in tag:
+                
+                ( namespace, subtag ) = tag.split( ':', 1 )
+                
+                if namespace != '' and namespace not in self._namespaces:
+                    
+                    new_namespaces.add( namespace )
+                    
+                
+            
+        
+        if len( new_namespaces ) > 0:
+            
+            self._c.executemany( 'INSERT INTO namespaces ( namespace ) VALUES ( ? );', ( ( namespace, ) for namespace in new_namespaces ) )
+            
+            self._namespaces.update( new_namespaces )
+            
+        
+        return tags_to_tag_ids
+        
+    
     def _InitDB( self ):
         
         self._c.execute( 'CREATE TABLE hash_type ( hash_type INTEGER );' )
@@ -121,7 +217,8 @@ class HydrusTagArchive( object ):
         self._c.execute( 'CREATE UNIQUE INDEX hashes_hash_index ON hashes ( hash );' )
         
         self._c.execute( 'CREATE TABLE mappings ( hash_id INTEGER, tag_id INTEGER, PRIMARY KEY ( hash_id, tag_id ) );' )
-        self._c.execute( 'CREATE INDEX mappings_hash_id_index ON mappings ( hash_id );' )
+        
+        self._CreateDeferrableIndices()
         
         self._c.execute( 'CREATE TABLE namespaces ( namespace TEXT );' )
         
@@ -208,13 +305,30 @@ class HydrusTagArchive( object ):
         return tag_id
         
     
-    def BeginBigJob( self ):
+    def BeginBigJob( self, defer_index_creation = False ):
         
         self._c.execute( 'BEGIN IMMEDIATE;' )
         
+        if defer_index_creation:
+            
+            # the hash/tag lookup indices are needed as we go, but the mappings secondary index can be built once at the end
+            # this is inside the transaction, so if we are interrupted, a rollback restores it
+            
+            self._c.execute( 'DROP INDEX IF EXISTS mappings_hash_id_index;' )
+            
+            self._index_creation_deferred = True
+            
+        
     
     def CommitBigJob( self ):
         
+        if self._index_creation_deferred:
+            
+            self._CreateDeferrableIndices()
+            
+            self._index_creation_deferred = False
+            
+        
         self._c.execute( 'COMMIT;' )
         
     
@@ -235,6 +349,21 @@ class HydrusTagArchive( object ):
         self._AddMappings( hash_id, tag_ids )
         
     
+    def AddMappingsBulk( self, hashes_and_tags ):
+        
+        hashes_and_tags = list( hashes_and_tags )
+        
+        hashes_to_hash_ids = self._GetHashIds( ( hash for ( hash, tags ) in hashes_and_tags ) )
+        tags_to_tag_ids = self._GetTagIds( ( tag for ( hash, tags ) in hashes_and_tags for tag in tags ) )
+        
+        # sorted inserts are kinder to the primary key b-tree
+        inserts = sorted( { ( hashes_to_hash_ids[ hash ], tags_to_tag_ids[ tag ] ) for ( hash, tags ) in hashes_and_tags for tag in tags } )
+        
+        self._c.executemany( 'INSERT OR IGNORE INTO mappings ( hash_id, tag_id ) VALUES ( ?, ? );', inserts )
+        
+        return len( inserts )
+        
+    
     def Close( self ):
         
         self._c.close()
@@ -543,6 +672,11 @@ class HydrusTagPairArchive( object ):
         self._c = self._db.cursor()
         
     
+    def _GetTagIds( self, tags ):
+        
+        return GetIdsFromValuesBulk( self._c, 'tags', 'tag', 'tag_id', tags )
+        
+    
     def _GetTagId( self, tag ):
         
         result = self._c.execute( 'SELECT tag_id FROM tags WHERE tag = ?;', ( tag, ) ).fetchone()
@@ -592,7 +726,11 @@ class HydrusTagPairArchive( object ):
             raise Exception( 'Please set the pair type first before you start populating the database!' )
             
         
-        pair_id_inserts = [ ( self._GetTagId( tag_1 ), self._GetTagId( tag_2 ) ) for ( tag_1, tag_2 ) in pairs ]
+        pairs = list( pairs )
+        
+        tags_to_tag_ids = self._GetTagIds( ( tag for pair in pairs for tag in pair ) )
+        
+        pair_id_inserts = sorted( { ( tags_to_tag_ids[ tag_1 ], tags_to_tag_ids[ tag_2 ] ) for ( tag_1, tag_2 ) in pairs } )
         
         self._c.executemany( 'INSERT OR IGNORE INTO pairs ( tag_id_1, tag_id_2 ) VALUES ( ?, ? );', pair_id_inserts )
         
@@ -398,7 +398,7 @@ def GetExtraHashesFromPath( path ):
     return ( md5, sha1, sha512 )
     
 
-def GetFileInfo( path, mime = None, ok_to_look_for_hydrus_updates = False ):
+def GetFileInfo( path, mime = None, ok_to_look_for_hydrus_updates = False, hash: bytes | None = None ):
     
     size = os.path.getsize( path )
     
@@ -598,7 +598,7 @@ def GetFileInfo( path, mime = None, ok_to_look_for_hydrus_updates = False ):
         
     elif mime in HC.VIDEO or mime in HC.HEIF_TYPE_SEQUENCES or mime in ( HC.IMAGE_AVIF_SEQUENCE, HC.ANIMATION_JXL ):
         
-        ( ( width, height ), duration_ms, num_frames, has_audio ) = HydrusVideoHandling.GetFFMPEGVideoProperties( path )
+        ( ( width, height ), duration_ms, num_frames, has_audio ) = HydrusVideoHandling.GetFFMPEGVideoProperties( path, hash = hash )
         
     elif mime in HC.VIEWABLE_ANIMATIONS:
         
@@ -1,6 +1,9 @@
+import bisect
+import collections
 import numpy
 import os
 import re
+import threading
 
 from hydrus.core import HydrusConstants as HC
 from hydrus.core import HydrusData
@@ -10,6 +13,30 @@ from hydrus.core.files import HydrusAudioHandling
 from hydrus.core.files import HydrusFFMPEG
 from hydrus.core.processes import HydrusSubprocess
 
+# when a video renderer knows its keyframes, it keeps the decoder it was using paused at its old position, so a seek back there is instant
+# these hold decoder state, which is not nothing for 4k, so a video never has more than this many plus the one it is playing from
+WARM_DECODER_CACHE_SIZE = 1
+
+# skipping this many frames in an open decoder is cheaper than starting a new process, even across a keyframe
+WARM_DECODER_SKIP_TOLERANCE = 12
+
+# a packet scan counts frames without decoding, but these codecs can put packets in the stream that never become a shown frame (vp8 alt-ref), so they still get a full decode
+PACKET_COUNT_UNRELIABLE_CODECS = { 'vp8' }
+
+# framecrc packet flags
+AV_PKT_FLAG_KEY = 0x1
+AV_PKT_FLAG_DISCARD = 0x4
+AV_NOPTS_VALUE = -0x8000000000000000
+
+# field-coded interlaced video can have a packet per field. if the packet count is this far over what the container says, we do the full decode instead
+PACKET_COUNT_MAX_EXPECTED_RATIO = 1.5
+
+# manual frame counts are expensive, so we remember them per file hash. the client also persists them in the db
+FRAME_COUNT_CACHE_SIZE = 256
+
+_frame_count_cache = collections.OrderedDict()
+_frame_count_cache_lock = threading.Lock()
+
 def FileIsAnimated( path ):
     
     # TODO: this guy can be better, or at least it deserves some work
@@ -86,7 +113,118 @@ def GetFFMPEGInfoLines( path, count_frames_manually = False, only_first_second =
     return lines
     
 
-def GetFFMPEGVideoProperties( path, force_count_frames_manually = False ):
+def GetCachedNumFrames( hash: bytes ) -> int | None:
+    
+    with _frame_count_cache_lock:
+        
+        if hash not in _frame_count_cache:
+            
+            return None
+            
+        
+        _frame_count_cache.move_to_end( hash )
+        
+        return _frame_count_cache[ hash ]
+        
+    
+
+def GetFFMPEGKeyframeIndex( path ) -> list[ tuple[ int, int ] ]:
+    """
+    Returns the ( frame_index, timestamp_ms ) of every keyframe in the first video stream.
+    This does a packet scan with no decode, so it is fast even for long 4k stuff.
+    """
+    
+    lines = GetFFMPEGPacketScanLines( path )
+    
+    return ParseFFMPEGFrameCRCKeyframeIndex( lines )
+    
+
+def GetFFMPEGNumFrames( path, hash: bytes | None = None, packet_count_ok = True, expected_num_frames: float | None = None ) -> int:
+    """
+    Counts the frames in the first video stream, as cheaply as we can trust.
+    We count packets with no decode, and only do the full low-res decode if the codec is known to lie, the stream is interlaced, or the packet count looks wrong.
+    If you give the file's hash, we remember the count for next time.
+    """
+    
+    if hash is not None:
+        
+        num_frames = GetCachedNumFrames( hash )
+        
+        if num_frames is not None:
+            
+            return num_frames
+            
+        
+    
+    num_frames = None
+    
+    if packet_count_ok:
+        
+        try:
+            
+            lines = GetFFMPEGPacketScanLines( path )
+            
+            if ParseFFMPEGFrameCRCCodec( lines ) not in PACKET_COUNT_UNRELIABLE_CODECS:
+                
+                num_frames = ParseFFMPEGFrameCRCNumFrames( lines )
+                
+            
+        except HydrusExceptions.DamagedOrUnusualFileException:
+            
+            num_frames = None
+            
+        
+        if num_frames is not None and expected_num_frames is not None and expected_num_frames > 0 and num_frames > expected_num_frames * PACKET_COUNT_MAX_EXPECTED_RATIO:
+            
+            num_frames = None
+            
+        
+    
+    if num_frames is None or num_frames == 0:
+        
+        lines = GetFFMPEGInfoLines( path, count_frames_manually = True )
+        
+        num_frames = ParseFFMPEGNumFramesManually( lines )
+        
+    
+    if hash is not None:
+        
+        SetCachedNumFrames( hash, num_frames )
+        
+    
+    return num_frames
+    
+
+def GetFFMPEGPacketScanLines( path ) -> list[ str ]:
+    
+    # framecrc with stream copy writes one line per packet, with an F= flags field whenever the flags are anything other than just keyframe
+    
+    cmd = [ HydrusFFMPEG.FFMPEG_PATH, '-loglevel', 'error', '-i', path, '-map', '0:v:0', '-c', 'copy', '-f', 'framecrc', '-' ]
+    
+    HydrusData.CheckProgramIsNotShuttingDown()
+    
+    try:
+        
+        ( stdout, stderr ) = HydrusSubprocess.RunSubprocess( cmd, timeout = 60 )
+        
+    except HydrusExceptions.SubprocessTimedOut:
+        
+        raise HydrusExceptions.DamagedOrUnusualFileException( 'ffmpeg could not scan the video packets quick enough!' )
+        
+    except FileNotFoundError as e:
+        
+        raise HydrusFFMPEG.HandleFFMPEGFileNotFoundAndGenerateException( e, path )
+        
+    
+    if stdout is None or len( stdout ) == 0:
+        
+        raise HydrusExceptions.DamagedOrUnusualFileException( 'ffmpeg did not give any packet info for that video!' )
+        
+    
+    return stdout.splitlines()
+    
+
+def GetFFMPEGVideoProperties( path, force_count_frames_manually = False, hash: bytes | None = None ):
     
     lines_for_first_second = GetFFMPEGInfoLines( path, count_frames_manually = True, only_first_second = True )
     
@@ -143,9 +281,9 @@ def GetFFMPEGVideoProperties( path, force_count_frames_manually = False ):
     
     if force_count_frames_manually:
         
-        lines = GetFFMPEGInfoLines( path, count_frames_manually = True )
+        expected_num_frames = None if duration_s is None else duration_s * fps
         
-        num_frames = ParseFFMPEGNumFramesManually( lines )
+        num_frames = GetFFMPEGNumFrames( path, hash = hash, packet_count_ok = not ParseFFMPEGVideoIsInterlaced( lines_for_first_second ), expected_num_frames = expected_num_frames )
         
         if num_frames > 0 and duration_s is not None:
             
@@ -565,6 +703,168 @@ def ParseFFMPEGFPSPossibleResults( video_line ) -> tuple[ set[ float ], bool ]:
     
     return ( possible_results, confident )
     
+def ParseFFMPEGFrameCRCCodec( lines ) -> str | None:
+    
+    for line in lines:
+        
+        if line.startswith( '#codec_id 0:' ):
+            
+            return line.split( ':', 1 )[1].strip()
+            
+        
+    
+    return None
+    
+
+def ParseFFMPEGFrameCRCKeyframeIndex( lines ) -> list[ tuple[ int, int ] ]:
+    
+    ( timebase, packets, all_packets_have_distinct_pts ) = ParseFFMPEGFrameCRCPackets( lines )
+    
+    if len( packets ) == 0:
+        
+        return []
+        
+    
+    ( first_pts, is_keyframe ) = packets[0]
+    
+    keyframe_index = [ ( frame_index, int( ( pts - first_pts ) * timebase * 1000 ) ) for ( frame_index, ( pts, is_keyframe ) ) in enumerate( packets ) if is_keyframe ]
+    
+    return keyframe_index
+    
+
+def ParseFFMPEGFrameCRCNumFrames( lines ) -> int | None:
+    """
+    Returns None if the packets cannot be trusted to be one per frame.
+    """
+    
+    ( timebase, packets, all_packets_have_distinct_pts ) = ParseFFMPEGFrameCRCPackets( lines )
+    
+    if not all_packets_have_distinct_pts:
+        
+        # packets with no pts or sharing a pts are fields or other weirdness, not frames
+        return None
+        
+    
+    return len( packets )
+    
+
+def ParseFFMPEGFrameCRCPackets( lines ) -> tuple[ float, list[ tuple[ int, bool ] ], bool ]:
+    """
+    Returns the timebase, the ( pts, is_keyframe ) of every decodable packet sorted by pts, and whether every packet had its own pts.
+    """
+    
+    timebase = None
+    
+    packets = []
+    
+    all_packets_have_distinct_pts = True
+    
+    for line in lines:
+        
+        if line.startswith( '#tb 0:' ):
+            
+            ( numerator, denominator ) = line.split( ':', 1 )[1].strip().split( '/' )
+            
+            timebase = int( numerator ) / int( denominator )
+            
+            continue
+            
+        
+        if line.startswith( '#' ) or ',' not in line:
+            
+            continue
+            
+        
+        # stream, dts, pts, duration, size, crc, then 'F=0x..' if the flags are anything other than just keyframe, then 'S=n' and n size/crc pairs if there is side data
+        components = [ component.strip() for component in line.split( ',' ) ]
+        
+        if len( components ) < 6:
+            
+            continue
+            
+        
+        try:
+            
+            pts = int( components[2] )
+            
+        except ValueError:
+            
+            continue
+            
+        
+        flags = AV_PKT_FLAG_KEY
+        
+        for component in components[ 6 : ]:
+            
+            if component.startswith( 'S=' ):
+                
+                break
+                
+            
+            if component.startswith( 'F=' ):
+                
+                try:
+                    
+                    flags = int( component[2:], 16 )
+                    
+                except ValueError:
+                    
+                    pass
+                    
+                
+            
+        
+        if flags & AV_PKT_FLAG_DISCARD:
+            
+            continue
+            
+        
+        if pts == AV_NOPTS_VALUE:
+            
+            all_packets_have_distinct_pts = False
+            
+            continue
+            
+        
+        is_keyframe = flags & AV_PKT_FLAG_KEY != 0
+        
+        packets.append( ( pts, is_keyframe ) )
+        
+    
+    if timebase is None:
+        
+        raise HydrusExceptions.DamagedOrUnusualFileException( 'Could not parse the timebase from the ffmpeg packet scan!' )
+        
+    
+    packets.sort()
+    
+    if True in ( packets[ i ][0] == packets[ i + 1 ][0] for i in range( len( packets ) - 1 ) ):
+        
+        all_packets_have_distinct_pts = False
+        
+    
+    # anything before the first keyframe is preroll we cannot decode to, so frame 0 is the first keyframe
+    
+    first_keyframe_position = None
+    
+    for ( position, ( pts, is_keyframe ) ) in enumerate( packets ):
+        
+        if is_keyframe:
+            
+            first_keyframe_position = position
+            
+            break
+            
+        
+    
+    if first_keyframe_position is None:
+        
+        return ( timebase, [], all_packets_have_distinct_pts )
+        
+    
+    return ( timebase, packets[ first_keyframe_position : ], all_packets_have_distinct_pts )
+    
+
 def ParseFFMPEGHasVideo( lines ) -> bool:
     
     try:
@@ -699,6 +999,22 @@ def ParseFFMPEGVideoFormat( lines ):
     return ( True, video_format )
     
 
+def ParseFFMPEGVideoIsInterlaced( lines ) -> bool:
+    
+    # Video: mpeg2video (Main), yuv420p(tv, top first), 720x576 ...
+    
+    try:
+        
+        line = ParseFFMPEGVideoLine( lines )
+        
+    except HydrusExceptions.UnsupportedFileException:
+        
+        return False
+        
+    
+    return re.search( r'\b(top|bottom) (coded )?first\b', line ) is not None
+    
+
 def ParseFFMPEGVideoLine( lines, png_ok = False ) -> str:
     
     if png_ok:
@@ -785,6 +1101,21 @@ def ParseFFMPEGVideoResolution( lines, png_ok = False ) -> tuple[ int, int ]:
         
     
 
+def SetCachedNumFrames( hash: bytes, num_frames: int ):
+    
+    with _frame_count_cache_lock:
+        
+        _frame_count_cache[ hash ] = num_frames
+        
+        _frame_count_cache.move_to_end( hash )
+        
+        while len( _frame_count_cache ) > FRAME_COUNT_CACHE_SIZE:
+            
+            _frame_count_cache.popitem( last = False )
+            
+        
+    
+
 def VideoHasAudio( path, info_lines ) -> bool:
     
     ( audio_found, audio_format ) = HydrusAudioHandling.ParseFFMPEGAudio( info_lines )
@@ -837,7 +1168,7 @@ def VideoHasAudio( path, info_lines ) -> bool:
 # This was built from moviepy's FFMPEG_VideoReader
 class VideoRendererFFMPEG( object ):
     
-    def __init__( self, path, mime, duration_ms, num_frames, target_resolution, clip_rect = None, start_pos = None ):
+    def __init__( self, path, mime, duration_ms, num_frames, target_resolution, clip_rect = None, start_pos = None, keyframe_index = None ):
         
         if duration_ms <= 0 or duration_ms is None:
             
@@ -861,6 +1192,7 @@ class VideoRendererFFMPEG( object ):
             
         
         self.lastread = None
+        self._has_read_a_frame = False
         
         self.fps = self._num_frames / self._duration_s
         
@@ -882,10 +1214,24 @@ class VideoRendererFFMPEG( object ):
         
         bufsize = self.depth * x * y
         
-        self.process_reader: HydrusSubprocess.SubprocessContextReader | None = None
+        self.process_reader: HydrusSubprocess.SubprocessContextIntoReader | None = None
         
         self.bufsize = bufsize
         
+        # skipped frames go here, so we aren't allocating for stuff we throw away
+        self._scratch_frame: numpy.ndarray | None = None
+        
+        # ( frame_index, timestamp_ms ), sorted. this is swapped in whole, so it is fine to set from another thread
+        self._keyframe_index: list[ tuple[ int, int ] ] = []
+        
+        # ( pos, process_reader ), most recently used at the end
+        self._warm_decoders: list[ tuple[ int, HydrusSubprocess.SubprocessContextIntoReader ] ] = []
+        
+        if keyframe_index is not None:
+            
+            self.SetKeyframeIndex( keyframe_index )
+            
+        
         if start_pos is None:
             
             start_pos = 0
@@ -899,7 +1245,26 @@ class VideoRendererFFMPEG( object ):
         self.close()
         
     
-    def close( self ) -> None:
+    def _CanSkipCheaply( self, from_index, to_index ) -> bool:
+        
+        if to_index < from_index:
+            
+            return False
+            
+        
+        if self._HasKeyframeIndex():
+            
+            # a fresh decoder would have to decode forward from the keyframe before to_index anyway, so if we are already past that keyframe, skipping is no worse
+            
+            ( keyframe_frame_index, keyframe_timestamp_ms ) = self._GetKeyframeAtOrBefore( to_index )
+            
+            return from_index >= keyframe_frame_index or to_index - from_index <= WARM_DECODER_SKIP_TOLERANCE
+            
+        
+        return to_index - from_index <= 60
+        
+    
+    def _CloseCurrentDecoder( self ):
         
         if self.process_reader is not None:
             
@@ -909,16 +1274,83 @@ class VideoRendererFFMPEG( object ):
             
         
     
-    def initialize( self, start_index = 0 ):
+    def _GenerateEmptyFrame( self ) -> numpy.ndarray:
         
-        self.close()
+        ( w, h ) = self._target_resolution
+        
+        return numpy.empty( ( h, w, self.depth ), dtype = numpy.uint8 )
+        
+    
+    def _GetKeyframeAtOrBefore( self, frame_index ) -> tuple[ int, int ]:
+        
+        keyframe_index = self._keyframe_index
+        
+        i = bisect.bisect_right( keyframe_index, frame_index, key = lambda row: row[0] ) - 1
+        
+        if i < 0:
+            
+            return ( 0, 0 )
+            
+        
+        return keyframe_index[ i ]
+        
+    
+    def _HasKeyframeIndex( self ) -> bool:
+        
+        return len( self._keyframe_index ) > 0
+        
+    
+    def _ParkCurrentDecoder( self ):
+        
+        if self.process_reader is None:
+            
+            return
+            
+        
+        if self._HasKeyframeIndex() and self.process_reader.process.poll() is None and self.pos < self._num_frames:
+            
+            self._ParkDecoder( self.pos, self.process_reader )
+            
+            self.process_reader = None
+            
+        else:
+            
+            self._CloseCurrentDecoder()
+            
+        
+    
+    def _ParkDecoder( self, pos, process_reader ):
+        
+        self._warm_decoders.append( ( pos, process_reader ) )
+        
+        while len( self._warm_decoders ) > WARM_DECODER_CACHE_SIZE:
+            
+            ( old_pos, old_process_reader ) = self._warm_decoders.pop( 0 )
+            
+            old_process_reader.CloseProcess()
+            
+        
+    
+    def _SpawnDecoder( self, start_index ) -> tuple[ int, HydrusSubprocess.SubprocessContextIntoReader ]:
         
         if self._mime in HC.ANIMATIONS: # ffmpeg is pretty bad at scanning these, and they tend to be short, so we'll skip frames instead
             
             do_ss = False
             ss = 0
-            self.pos = 0
-            skip_frames = start_index
+            accurate_seek = True
+            pos = 0
+            
+        elif self._HasKeyframeIndex():
+            
+            # we know exactly where the keyframes are, so we seek to the one at or before our frame and let the caller skip the rest
+            
+            ( keyframe_frame_index, keyframe_timestamp_ms ) = self._GetKeyframeAtOrBefore( start_index )
+            
+            do_ss = keyframe_frame_index > 0
+            # half a frame in, so rounding never drops us back a whole gop. noaccurate_seek then starts us right on the keyframe
+            ss = HydrusTime.SecondiseMSFloat( keyframe_timestamp_ms ) + ( 0.5 / self.fps )
+            accurate_seek = False
+            pos = keyframe_frame_index
             
         else:
             
@@ -932,8 +1364,8 @@ class VideoRendererFFMPEG( object ):
                 
             
             ss = start_index / self.fps
-            self.pos = start_index
-            skip_frames = 0
+            accurate_seek = True
+            pos = start_index
             
         
         do_fast_seek = True
@@ -944,6 +1376,11 @@ class VideoRendererFFMPEG( object ):
         
         if do_ss and do_fast_seek: # fast seek
             
+            if not accurate_seek:
+                
+                cmd.append( '-noaccurate_seek' )
+                
+            
             cmd.extend( [ '-ss', "%.03f" % ss ] )
             
         
@@ -976,13 +1413,73 @@ class VideoRendererFFMPEG( object ):
         
         try:
             
-            self.process_reader = HydrusSubprocess.SubprocessContextReader( cmd, bufsize = self.bufsize, text = False )
+            process_reader = HydrusSubprocess.SubprocessContextIntoReader( cmd, bufsize = self.bufsize, text = False )
             
         except FileNotFoundError as e:
             
             raise HydrusFFMPEG.HandleFFMPEGFileNotFoundAndGenerateException( e, self._path )
             
         
+        return ( pos, process_reader )
+        
+    
+    def _TakeWarmDecoder( self, start_index ) -> tuple[ int, HydrusSubprocess.SubprocessContextIntoReader ] | None:
+        
+        best_i = None
+        
+        for ( i, ( pos, process_reader ) ) in enumerate( self._warm_decoders ):
+            
+            if process_reader.process.poll() is not None:
+                
+                continue
+                
+            
+            if self._CanSkipCheaply( pos, start_index ):
+                
+                if best_i is None or pos > self._warm_decoders[ best_i ][0]:
+                    
+                    best_i = i
+                    
+                
+            
+        
+        if best_i is None:
+            
+            return None
+            
+        
+        return self._warm_decoders.pop( best_i )
+        
+    
+    def close( self ) -> None:
+        
+        self._CloseCurrentDecoder()
+        
+        for ( pos, process_reader ) in self._warm_decoders:
+            
+            process_reader.CloseProcess()
+            
+        
+        self._warm_decoders = []
+        
+    
+    def initialize( self, start_index = 0 ):
+        
+        self._ParkCurrentDecoder()
+        
+        warm_decoder = self._TakeWarmDecoder( start_index )
+        
+        if warm_decoder is None:
+            
+            ( self.pos, self.process_reader ) = self._SpawnDecoder( start_index )
+            
+        else:
+            
+            ( self.pos, self.process_reader ) = warm_decoder
+            
+        
+        skip_frames = start_index - self.pos
+        
         if skip_frames > 0:
             
             self.skip_frames( skip_frames )
@@ -993,15 +1490,18 @@ class VideoRendererFFMPEG( object ):
         
         n = int( n )
         
-        ( w, h ) = self._target_resolution
-        
         for i in range( n ):
             
             if self.process_reader is not None:
                 
+                if self._scratch_frame is None:
+                    
+                    self._scratch_frame = self._GenerateEmptyFrame()
+                    
+                
                 try:
                     
-                    frame_of_data = self.process_reader.ReadChunk()
+                    self.process_reader.ReadChunkInto( self._scratch_frame )
                     
                 except HydrusExceptions.SubprocessTimedOut:
                     
@@ -1015,6 +1515,25 @@ class VideoRendererFFMPEG( object ):
     
     def read_frame( self ):
         
+        result = self._GenerateEmptyFrame()
+        
+        if self.read_frame_into( result ):
+            
+            self.lastread = result
+            
+            return result
+            
+        else:
+            
+            return self.lastread
+            
+        
+    
+    def read_frame_into( self, destination: numpy.ndarray ) -> bool:
+        """
+        Decodes the next frame straight into the given ( h, w, depth ) uint8 array. Returns False if there was no new frame to give. A short or timed-out read may already have written part of a frame, so if this returns False or raises, the destination holds garbage and the caller has to fill it itself.
+        """
+        
         if self.pos == self._num_frames:
             
             self.initialize()
@@ -1022,17 +1541,15 @@ class VideoRendererFFMPEG( object ):
         
         if self.process_reader is None:
             
-            result = self.lastread
+            got_a_frame = False
             
         else:
             
-            ( w, h ) = self._target_resolution
+            num_bytes_read = self.process_reader.ReadChunkInto( destination )
             
-            frame_of_data = self.process_reader.ReadChunk()
-            
-            if len( frame_of_data ) != w * h * self.depth:
+            if num_bytes_read != self.bufsize:
                 
-                if self.lastread is None:
+                if not self._has_read_a_frame:
                     
                     if self.pos != 0:
                         
@@ -1045,7 +1562,7 @@ class VideoRendererFFMPEG( object ):
                         
                         self.set_position( 0 )
                         
-                        return self.read_frame()
+                        return self.read_frame_into( destination )
                         
                     
                     if HC.RUNNING_FROM_SOURCE:
@@ -1060,39 +1577,41 @@ class VideoRendererFFMPEG( object ):
                     raise HydrusExceptions.DamagedOrUnusualFileException( message )
                     
                 
-                result = self.lastread
+                got_a_frame = False
                 
-                self.close()
+                self._CloseCurrentDecoder()
                 
             else:
                 
-                result = numpy.frombuffer( frame_of_data, dtype = 'uint8' ).reshape( ( h, w, self.depth ) )
+                got_a_frame = True
                 
-                self.lastread = result
+                self._has_read_a_frame = True
                 
             
         
         self.pos += 1
         
-        return result
+        return got_a_frame
         
     
     def set_position( self, pos ) -> None:
         
-        rewind = pos < self.pos
-        jump_a_long_way_ahead = pos > self.pos + 60
-        
-        if rewind or jump_a_long_way_ahead:
+        if self.process_reader is not None and self._CanSkipCheaply( self.pos, pos ):
             
-            self.initialize( pos )
+            self.skip_frames( pos - self.pos )
             
         else:
             
-            self.skip_frames( pos - self.pos )
+            self.initialize( pos )
             
         
     
+    def SetKeyframeIndex( self, keyframe_index: list[ tuple[ int, int ] ] ):
+        
+        self._keyframe_index = sorted( ( tuple( row ) for row in keyframe_index ) )
+        
+    
     def Stop( self ) -> None:
         
         self.close()
-        
+
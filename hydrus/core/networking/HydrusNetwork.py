@@ -3138,7 +3138,7 @@ class ServerServiceRepository( ServerServiceRestricted ):
                     
                     end = begin + update_period
                     
-                    update_hashes = HG.controller.WriteSynchronous( 'create_update', service_key, begin, end )
+                    update_hashes = HG.controller.CreateRepositoryUpdate( service_key, begin, end )
                     
                     update_created = True
                     
@@ -3287,17 +3287,32 @@ class ServerServiceAdmin( ServerServiceRestricted ):
     
 class UpdateBuilder( object ):
     
-    def __init__( self, update_class, max_rows ):
+    def __init__( self, update_class, max_rows, finished_update_callable = None ):
         
         self._update_class = update_class
         self._max_rows = max_rows
         
+        # if set, each update is handed on as soon as it is full, rather than all of them being held until the end
+        self._finished_update_callable = finished_update_callable
+        
         self._updates = []
         
         self._current_update = self._update_class()
         self._current_num_rows = 0
         
     
+    def _FinishUpdate( self, update ):
+        
+        if self._finished_update_callable is None:
+            
+            self._updates.append( update )
+            
+        else:
+            
+            self._finished_update_callable( update )
+            
+        
+    
     def AddRow( self, row, row_weight = 1 ):
         
         self._current_update.AddRow( row )
@@ -3305,7 +3320,7 @@ class UpdateBuilder( object ):
         
         if self._current_num_rows > self._max_rows:
             
-            self._updates.append( self._current_update )
+            self._FinishUpdate( self._current_update )
             
             self._current_update = self._update_class()
             self._current_num_rows = 0
@@ -3316,7 +3331,7 @@ class UpdateBuilder( object ):
         
         if self._current_update.GetNumRows() > 0:
             
-            self._updates.append( self._current_update )
+            self._FinishUpdate( self._current_update )
             
         
         self._current_update = None
@@ -302,6 +302,143 @@ class BandwidthRules( HydrusSerialisable.SerialisableBase ):
     
 HydrusSerialisable.SERIALISABLE_TYPES_TO_OBJECT_TYPES[ HydrusSerialisable.SERIALISABLE_TYPE_BANDWIDTH_RULES ] = BandwidthRules
 
+class BandwidthRingBuffer( object ):
+    
+    def __init__( self, bucket_width: int, num_buckets: int ):
+        
+        self._bucket_width = bucket_width
+        self._num_buckets = num_buckets
+        
+        # rather than each bucket's usage, we store the running total through each bucket since we started counting
+        # a window's usage is then just the difference of two of these, and a report only touches the newest bucket
+        # we only make the list on first use, since plenty of trackers never see any traffic
+        self._cumulative_totals = None
+        
+        self._head_bucket_index = None
+        self._total_before_oldest_bucket = 0
+        self._total = 0
+        
+    
+    def _AdvanceTo( self, bucket_index: int ):
+        
+        if self._head_bucket_index is None or not self._head_bucket_index - self._num_buckets < bucket_index < self._head_bucket_index + self._num_buckets:
+            
+            # a fresh start, a long quiet spell, or the clock jumped way back. nothing we hold is in range any more
+            
+            self._cumulative_totals = [ self._total ] * self._num_buckets
+            self._total_before_oldest_bucket = self._total
+            self._head_bucket_index = bucket_index
+            
+            return
+            
+        
+        while self._head_bucket_index < bucket_index:
+            
+            self._head_bucket_index += 1
+            
+            i = self._head_bucket_index % self._num_buckets
+            
+            # this slot held the bucket that just fell off the end
+            self._total_before_oldest_bucket = self._cumulative_totals[ i ]
+            self._cumulative_totals[ i ] = self._total
+            
+        
+    
+    def _GetCumulativeTotal( self, bucket_index: int ) -> int:
+        
+        if self._head_bucket_index is None:
+            
+            return 0
+            
+        
+        if bucket_index >= self._head_bucket_index:
+            
+            return self._total
+            
+        
+        if bucket_index <= self._head_bucket_index - self._num_buckets:
+            
+            return self._total_before_oldest_bucket
+            
+        
+        return self._cumulative_totals[ bucket_index % self._num_buckets ]
+        
+    
+    def Add( self, timestamp: int, value: int ):
+        
+        bucket_index = timestamp // self._bucket_width
+        
+        if self._head_bucket_index is None or not self._head_bucket_index - self._num_buckets < bucket_index <= self._head_bucket_index:
+            
+            self._AdvanceTo( bucket_index )
+            
+        
+        # normally this is just the head. if the clock went back a little, the buckets after it carry the new total too
+        for index in range( bucket_index, self._head_bucket_index + 1 ):
+            
+            self._cumulative_totals[ index % self._num_buckets ] += value
+            
+        
+        self._total += value
+        
+    
+    def GetUsage( self, since: int, until: int ) -> int:
+        
+        # all the buckets that start in since->until, inclusive
+        
+        first_bucket_index = - ( - since // self._bucket_width )
+        last_bucket_index = until // self._bucket_width
+        
+        if last_bucket_index < first_bucket_index:
+            
+            return 0
+            
+        
+        return self._GetCumulativeTotal( last_bucket_index ) - self._GetCumulativeTotal( first_bucket_index - 1 )
+        
+    
+    def GetUsageRows( self, since = None, until = None ) -> list[ tuple[ int, int ] ]:
+        
+        if self._head_bucket_index is None:
+            
+            return []
+            
+        
+        first_bucket_index = self._head_bucket_index - self._num_buckets + 1
+        last_bucket_index = self._head_bucket_index
+        
+        if since is not None:
+            
+            first_bucket_index = max( first_bucket_index, - ( - since // self._bucket_width ) )
+            
+        
+        if until is not None:
+            
+            last_bucket_index = min( last_bucket_index, until // self._bucket_width )
+            
+        
+        rows = []
+        
+        previous_cumulative_total = self._GetCumulativeTotal( first_bucket_index - 1 )
+        
+        for bucket_index in range( first_bucket_index, last_bucket_index + 1 ):
+            
+            cumulative_total = self._GetCumulativeTotal( bucket_index )
+            
+            value = cumulative_total - previous_cumulative_total
+            
+            if value > 0:
+                
+                rows.append( ( bucket_index * self._bucket_width, value ) )
+                
+            
+            previous_cumulative_total = cumulative_total
+            
+        
+        return rows
+        
+    
+
 class BandwidthTracker( HydrusSerialisable.SerialisableBase ):
     
     SERIALISABLE_TYPE = HydrusSerialisable.SERIALISABLE_TYPE_BANDWIDTH_TRACKER
@@ -315,8 +452,6 @@ class BandwidthTracker( HydrusSerialisable.SerialisableBase ):
     MAX_HOURS_TIME_DELTA = 72 * 3600
     MAX_DAYS_TIME_DELTA = 31 * 86400
     
-    CACHE_MAINTENANCE_TIME_DELTA = 120
-    
     MIN_TIME_DELTA_FOR_USER = 10
     
     def __init__( self ):
@@ -325,28 +460,31 @@ class BandwidthTracker( HydrusSerialisable.SerialisableBase ):
         
         self._lock = threading.Lock()
         
-        self._next_cache_maintenance_timestamp = HydrusTime.GetNow() + self.CACHE_MAINTENANCE_TIME_DELTA
+        self._current_month_time = 0
+        self._next_month_time = 0
         
         self._months_bytes = collections.Counter()
-        self._days_bytes = collections.Counter()
-        self._hours_bytes = collections.Counter()
-        self._minutes_bytes = collections.Counter()
-        self._seconds_bytes = collections.Counter()
-        
         self._months_requests = collections.Counter()
-        self._days_requests = collections.Counter()
-        self._hours_requests = collections.Counter()
-        self._minutes_requests = collections.Counter()
-        self._seconds_requests = collections.Counter()
+        
+        self._InitialiseRingBuffers()
         
     
     def _GetSerialisableInfo( self ):
         
         dicts_flat = []
         
-        for d in ( self._months_bytes, self._days_bytes, self._hours_bytes, self._minutes_bytes, self._seconds_bytes, self._months_requests, self._days_requests, self._hours_requests, self._minutes_requests, self._seconds_requests ):
+        dicts_flat.append( list( self._months_bytes.items() ) )
+        
+        for ring_buffer in ( self._days_bytes, self._hours_bytes, self._minutes_bytes, self._seconds_bytes ):
+            
+            dicts_flat.append( ring_buffer.GetUsageRows() )
+            
+        
+        dicts_flat.append( list( self._months_requests.items() ) )
+        
+        for ring_buffer in ( self._days_requests, self._hours_requests, self._minutes_requests, self._seconds_requests ):
             
-            dicts_flat.append( list( d.items() ) )
+            dicts_flat.append( ring_buffer.GetUsageRows() )
             
         
         return dicts_flat
@@ -354,56 +492,84 @@ class BandwidthTracker( HydrusSerialisable.SerialisableBase ):
     
     def _InitialiseFromSerialisableInfo( self, serialisable_info ):
         
-        counters = [ collections.Counter( dict( flat_dict ) ) for flat_dict in serialisable_info ]
-        
         # unusual error someone reported by email--it came back an empty list, fugg
-        if len( counters ) != 10:
+        if len( serialisable_info ) != 10:
             
             return
             
         
-        self._months_bytes = counters[ 0 ]
-        self._days_bytes = counters[ 1 ]
-        self._hours_bytes = counters[ 2 ]
-        self._minutes_bytes = counters[ 3 ]
-        self._seconds_bytes = counters[ 4 ]
+        self._months_bytes = collections.Counter( dict( serialisable_info[ 0 ] ) )
+        self._months_requests = collections.Counter( dict( serialisable_info[ 5 ] ) )
+        
+        self._InitialiseRingBuffers()
+        
+        now = HydrusTime.GetNow()
         
-        self._months_requests = counters[ 5 ]
-        self._days_requests = counters[ 6 ]
-        self._hours_requests = counters[ 7 ]
-        self._minutes_requests = counters[ 8 ]
-        self._seconds_requests = counters[ 9 ]
+        ring_buffers = ( self._days_bytes, self._hours_bytes, self._minutes_bytes, self._seconds_bytes, self._days_requests, self._hours_requests, self._minutes_requests, self._seconds_requests )
+        flat_dicts = serialisable_info[ 1 : 5 ] + serialisable_info[ 6 : 10 ]
+        
+        for ( ring_buffer, flat_dict ) in zip( ring_buffers, flat_dicts ):
+            
+            # anything from the future (a clock reset) was never counted anyway, and it would push everything real out of the buffer
+            for ( timestamp, value ) in sorted( flat_dict ):
+                
+                if timestamp <= now:
+                    
+                    ring_buffer.Add( timestamp, value )
+                    
+                
+            
         
     
-    def _GetCurrentDateTime( self ):
+    def _GetMonthTime( self, now ) -> int:
+        
+        # we take 'now' from getnow rather than the system clock to aid in testing, which patches it to do time shifting
+        
+        if not self._current_month_time <= now < self._next_month_time:
+            
+            dt = HydrusDateTime.fromtimestamputc( now )
+            
+            ( year, month ) = ( dt.year, dt.month )
+            
+            next_month_year = year
+            
+            if month == 12:
+                
+                next_month_year += 1
+                
+            
+            next_month = ( month % 12 ) + 1
+            
+            self._current_month_time = int( calendar.timegm( datetime.datetime( year, month, 1 ).timetuple() ) )
+            self._next_month_time = int( calendar.timegm( datetime.datetime( next_month_year, next_month, 1 ).timetuple() ) )
+            
         
-        # keep getnow in here for the moment to aid in testing, which patches it to do time shifting
-        return HydrusDateTime.fromtimestamputc( HydrusTime.GetNow() )
+        return self._current_month_time
         
     
-    def _GetWindowAndCounter( self, bandwidth_type, time_delta ):
+    def _GetWindowAndRingBuffer( self, bandwidth_type, time_delta ) -> tuple[ int, BandwidthRingBuffer ]:
         
         if bandwidth_type == HC.BANDWIDTH_TYPE_DATA:
             
             if time_delta < self.MAX_SECONDS_TIME_DELTA:
                 
                 window = 0
-                counter = self._seconds_bytes
+                ring_buffer = self._seconds_bytes
                 
             elif time_delta < self.MAX_MINUTES_TIME_DELTA:
                 
                 window = 59
-                counter = self._minutes_bytes
+                ring_buffer = self._minutes_bytes
                 
             elif time_delta < self.MAX_HOURS_TIME_DELTA:
                 
                 window = 3599
-                counter = self._hours_bytes
+                ring_buffer = self._hours_bytes
                 
             else:
                 
                 window = 86399
-                counter = self._days_bytes
+                ring_buffer = self._days_bytes
                 
             
         elif bandwidth_type == HC.BANDWIDTH_TYPE_REQUESTS:
@@ -411,46 +577,39 @@ class BandwidthTracker( HydrusSerialisable.SerialisableBase ):
             if time_delta < self.MAX_SECONDS_TIME_DELTA:
                 
                 window = 0
-                counter = self._seconds_requests
+                ring_buffer = self._seconds_requests
                 
             elif time_delta < self.MAX_MINUTES_TIME_DELTA:
                 
                 window = 59
-                counter = self._minutes_requests
+                ring_buffer = self._minutes_requests
                 
             elif time_delta < self.MAX_HOURS_TIME_DELTA:
                 
                 window = 3599
-                counter = self._hours_requests
+                ring_buffer = self._hours_requests
                 
             else:
                 
                 window = 86399
-                counter = self._days_requests
+                ring_buffer = self._days_requests
                 
             
+        else:
+            
+            raise NotImplementedError( 'Unknown bandiwidth type!' )
+            
         
-        return ( window, counter )
-        
-    
-    def _GetMonthTime( self, dt ):
-        
-        ( year, month ) = ( dt.year, dt.month )
-        
-        month_dt = datetime.datetime( year, month, 1 )
-        
-        month_time = int( calendar.timegm( month_dt.timetuple() ) )
-        
-        return month_time
+        return ( window, ring_buffer )
         
     
     def _GetRawUsage( self, bandwidth_type, time_delta ) -> int:
         
+        now = HydrusTime.GetNow()
+        
         if time_delta is None:
             
-            dt = self._GetCurrentDateTime()
-            
-            month_time = self._GetMonthTime( dt )
+            month_time = self._GetMonthTime( now )
             
             if bandwidth_type == HC.BANDWIDTH_TYPE_DATA:
                 
@@ -466,7 +625,7 @@ class BandwidthTracker( HydrusSerialisable.SerialisableBase ):
                 
             
         
-        ( window, counter ) = self._GetWindowAndCounter( bandwidth_type, time_delta )
+        ( window, ring_buffer ) = self._GetWindowAndRingBuffer( bandwidth_type, time_delta )
         
         if time_delta == 1:
             
@@ -475,16 +634,7 @@ class BandwidthTracker( HydrusSerialisable.SerialisableBase ):
             # this causes 50% consumption as we consume in the second after the one we verified was clear
             # so, let's just check the current second and be happy with it
             
-            now = HydrusTime.GetNow()
-            
-            if now in counter:
-                
-                return counter[ now ]
-                
-            else:
-                
-                return 0
-                
+            return ring_buffer.GetUsage( now, now )
             
         else:
             
@@ -493,36 +643,14 @@ class BandwidthTracker( HydrusSerialisable.SerialisableBase ):
             
             search_time_delta = time_delta + window
             
-            now = HydrusTime.GetNow()
             since = now - search_time_delta
             
             # we test 'now' as upper bound because a lad once had a motherboard reset and lost his clock time, ending up with a lump of data recorded several decades in the future
             # I'm pretty sure this ended up in the seconds thing, so all his short-time tests were failing
-            return sum( ( value for ( timestamp, value ) in counter.items() if since <= timestamp <= now ) )
+            return ring_buffer.GetUsage( since, now )
             
         
     
-    def _GetTimes( self, dt ):
-        
-        # collapse each time portion to the latest timestamp it covers
-        
-        ( year, month, day, hour, minute ) = ( dt.year, dt.month, dt.day, dt.hour, dt.minute )
-        
-        month_dt = datetime.datetime( year, month, 1 )
-        day_dt = datetime.datetime( year, month, day )
-        hour_dt = datetime.datetime( year, month, day, hour )
-        minute_dt = datetime.datetime( year, month, day, hour, minute )
-        
-        month_time = int( calendar.timegm( month_dt.timetuple() ) )
-        day_time = int( calendar.timegm( day_dt.timetuple() ) )
-        hour_time = int( calendar.timegm( hour_dt.timetuple() ) )
-        minute_time = int( calendar.timegm( minute_dt.timetuple() ) )
-        
-        second_time = int( calendar.timegm( dt.timetuple() ) )
-        
-        return ( month_time, day_time, hour_time, minute_time, second_time )
-        
-    
     def _GetAllUsage( self, bandwidth_type: int ) -> int:
         
         if bandwidth_type == HC.BANDWIDTH_TYPE_DATA:
@@ -546,8 +674,6 @@ class BandwidthTracker( HydrusSerialisable.SerialisableBase ):
             usage = self._GetRawUsage( bandwidth_type, time_delta )
             
         
-        self._MaintainCache()
-        
         return usage
         
     
@@ -555,15 +681,13 @@ class BandwidthTracker( HydrusSerialisable.SerialisableBase ):
         
         SEARCH_DELTA = self.MIN_TIME_DELTA_FOR_USER
         
-        counter = self._seconds_bytes
-        
         now = HydrusTime.GetNow()
         
         since = now - SEARCH_DELTA
         
-        valid_timestamps = [ timestamp for timestamp in counter.keys() if since <= timestamp <= now ]
+        rows = self._seconds_bytes.GetUsageRows( since = since, until = now )
         
-        if len( valid_timestamps ) == 0:
+        if len( rows ) == 0:
             
             return 0
             
@@ -571,49 +695,30 @@ class BandwidthTracker( HydrusSerialisable.SerialisableBase ):
         # If we want the average speed over past five secs but nothing has happened in sec 4 and 5, we don't want to count them
         # otherwise your 1MB/s counts as 200KB/s
         
-        earliest_timestamp = min( valid_timestamps )
+        ( earliest_timestamp, value ) = rows[0]
         
         SAMPLE_DELTA = max( now - earliest_timestamp, 1 )
         
-        total_bytes = sum( ( counter[ timestamp ] for timestamp in valid_timestamps ) )
+        total_bytes = sum( ( value for ( timestamp, value ) in rows ) )
         
         time_delta_average_per_sec = total_bytes / SAMPLE_DELTA
         
         return int( time_delta_average_per_sec * time_delta )
         
     
-    def _MaintainCache( self ):
+    def _InitialiseRingBuffers( self ):
         
-        if HydrusTime.TimeHasPassed( self._next_cache_maintenance_timestamp ):
-            
-            now = HydrusTime.GetNow()
-            
-            oldest_second = now - self.MAX_SECONDS_TIME_DELTA
-            oldest_minute = now - self.MAX_MINUTES_TIME_DELTA
-            oldest_hour = now - self.MAX_HOURS_TIME_DELTA
-            oldest_day = now - self.MAX_DAYS_TIME_DELTA
-            
-            def clear_counter( counter, oldest_timestamp ):
-                
-                bad_keys = [ timestamp for timestamp in counter.keys() if timestamp < oldest_timestamp ]
-                
-                for bad_key in bad_keys:
-                    
-                    del counter[ bad_key ]
-                    
-                
-            
-            clear_counter( self._days_bytes, oldest_day )
-            clear_counter( self._days_requests, oldest_day )
-            clear_counter( self._hours_bytes, oldest_hour )
-            clear_counter( self._hours_requests, oldest_hour )
-            clear_counter( self._minutes_bytes, oldest_minute )
-            clear_counter( self._minutes_requests, oldest_minute )
-            clear_counter( self._seconds_bytes, oldest_second )
-            clear_counter( self._seconds_requests, oldest_second )
-            
-            self._next_cache_maintenance_timestamp = HydrusTime.GetNow() + self.CACHE_MAINTENANCE_TIME_DELTA
-            
+        # a couple of spare buckets so the oldest, partially covered bracket is still there
+        
+        self._days_bytes = BandwidthRingBuffer( 86400, self.MAX_DAYS_TIME_DELTA // 86400 + 2 )
+        self._hours_bytes = BandwidthRingBuffer( 3600, self.MAX_HOURS_TIME_DELTA // 3600 + 2 )
+        self._minutes_bytes = BandwidthRingBuffer( 60, self.MAX_MINUTES_TIME_DELTA // 60 + 2 )
+        self._seconds_bytes = BandwidthRingBuffer( 1, self.MAX_SECONDS_TIME_DELTA + 2 )
+        
+        self._days_requests = BandwidthRingBuffer( 86400, self.MAX_DAYS_TIME_DELTA // 86400 + 2 )
+        self._hours_requests = BandwidthRingBuffer( 3600, self.MAX_HOURS_TIME_DELTA // 3600 + 2 )
+        self._minutes_requests = BandwidthRingBuffer( 60, self.MAX_MINUTES_TIME_DELTA // 60 + 2 )
+        self._seconds_requests = BandwidthRingBuffer( 1, self.MAX_SECONDS_TIME_DELTA + 2 )
         
     
     def GetCurrentMonthSummary( self ):
@@ -676,24 +781,9 @@ class BandwidthTracker( HydrusSerialisable.SerialisableBase ):
             
             if time_delta is None: # this is monthly
                 
-                dt = self._GetCurrentDateTime()
-                
-                ( year, month ) = ( dt.year, dt.month )
+                self._GetMonthTime( HydrusTime.GetNow() )
                 
-                next_month_year = year
-                
-                if month == 12:
-                    
-                    next_month_year += 1
-                    
-                
-                next_month = ( month % 12 ) + 1
-                
-                next_month_dt = datetime.datetime( next_month_year, next_month, 1 )
-                
-                next_month_time = int( calendar.timegm( next_month_dt.timetuple() ) )
-                
-                return HydrusTime.GetTimeDeltaUntilTime( next_month_time )
+                return HydrusTime.GetTimeDeltaUntilTime( self._next_month_time )
                 
             else:
                 
@@ -701,18 +791,14 @@ class BandwidthTracker( HydrusSerialisable.SerialisableBase ):
                 # time_delta subtract that amount is the time we have to wait for usage to be less than max_allowed
                 # e.g. if in the past 24 hours there was a bunch of usage 16 hours ago clogging it up, we'll have to wait ~8 hours
                 
-                ( window, counter ) = self._GetWindowAndCounter( bandwidth_type, time_delta )
+                ( window, ring_buffer ) = self._GetWindowAndRingBuffer( bandwidth_type, time_delta )
                 
                 time_delta_in_which_bandwidth_counts = time_delta + window
                 
-                time_and_values = list( counter.items() )
-                
-                time_and_values.sort( reverse = True )
-                
                 now = HydrusTime.GetNow()
                 usage = 0
                 
-                for ( timestamp, value ) in time_and_values:
+                for ( timestamp, value ) in reversed( ring_buffer.GetUsageRows() ):
                     
                     current_search_time_delta = now - timestamp
                     
@@ -738,21 +824,14 @@ class BandwidthTracker( HydrusSerialisable.SerialisableBase ):
         
         with self._lock:
             
-            dt = self._GetCurrentDateTime()
-            
-            ( month_time, day_time, hour_time, minute_time, second_time ) = self._GetTimes( dt )
-            
-            self._months_bytes[ month_time ] += num_bytes
-            
-            self._days_bytes[ day_time ] += num_bytes
-            
-            self._hours_bytes[ hour_time ] += num_bytes
-            
-            self._minutes_bytes[ minute_time ] += num_bytes
+            now = HydrusTime.GetNow()
             
-            self._seconds_bytes[ second_time ] += num_bytes
+            self._months_bytes[ self._GetMonthTime( now ) ] += num_bytes
             
-            self._MaintainCache()
+            self._days_bytes.Add( now, num_bytes )
+            self._hours_bytes.Add( now, num_bytes )
+            self._minutes_bytes.Add( now, num_bytes )
+            self._seconds_bytes.Add( now, num_bytes )
             
         
     
@@ -760,21 +839,14 @@ class BandwidthTracker( HydrusSerialisable.SerialisableBase ):
         
         with self._lock:
             
-            dt = self._GetCurrentDateTime()
-            
-            ( month_time, day_time, hour_time, minute_time, second_time ) = self._GetTimes( dt )
-            
-            self._months_requests[ month_time ] += num_requests
-            
-            self._days_requests[ day_time ] += num_requests
-            
-            self._hours_requests[ hour_time ] += num_requests
-            
-            self._minutes_requests[ minute_time ] += num_requests
+            now = HydrusTime.GetNow()
             
-            self._seconds_requests[ second_time ] += num_requests
+            self._months_requests[ self._GetMonthTime( now ) ] += num_requests
             
-            self._MaintainCache()
+            self._days_requests.Add( now, num_requests )
+            self._hours_requests.Add( now, num_requests )
+            self._minutes_requests.Add( now, num_requests )
+            self._seconds_requests.Add( now, num_requests )
             
         
     
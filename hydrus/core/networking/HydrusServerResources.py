@@ -1,6 +1,9 @@
+import collections.abc
+import email.utils
 import json
 import os
 import time
+import typing
 
 import twisted.internet.error
 from twisted.internet import reactor, defer
@@ -18,6 +21,12 @@ from hydrus.core import HydrusSerialisable
 from hydrus.core import HydrusTemp
 from hydrus.core.networking import HydrusServerRequest
 
+# streamed responses are a sequence of records, not one document, so they get the record-sequence content types
+STREAMING_MIMES_TO_CONTENT_TYPES = {
+    HC.APPLICATION_JSON : 'application/x-ndjson',
+    HC.APPLICATION_CBOR : 'application/cbor-seq'
+}
+
 def GetServerSummaryTexts( service ):
     
     name = service.GetName()
@@ -547,6 +556,8 @@ class HydrusResource( Resource ):
             # Connection was lost, it seems.
             # no need for request.finish
             
+            request.hydrus_response_context.CloseFileObject()
+            
             return
             
         
@@ -564,13 +575,18 @@ class HydrusResource( Resource ):
             
             path = response_context.GetPath()
             
-            if not os.path.exists( path ):
+            filesize = response_context.GetFilesize()
+            
+            if filesize is None:
+                
+                if not os.path.exists( path ):
+                    
+                    raise HydrusExceptions.NotFoundException( 'File not found. This was discovered later than expected, so hydev might like to know about this.' )
+                    
                 
-                raise HydrusExceptions.NotFoundException( 'File not found. This was discovered later than expected, so hydev might like to know about this.' )
+                filesize = os.path.getsize( path )
                 
             
-            filesize = os.path.getsize( path )
-            
             offset_and_block_size_pairs = self._parseRangeHeader( request, filesize )
             
         else:
@@ -609,21 +625,53 @@ class HydrusResource( Resource ):
             
             request.setHeader( 'Expires', time.strftime( '%a, %d %b %Y %H:%M:%S GMT', time.gmtime( time.time() + max_age ) ) )
             
-            request.setHeader( 'Cache-Control', 'max-age={}'.format( max_age ) )
+            cache_control = 'max-age={}'.format( max_age )
+            
+            if response_context.IsImmutable():
+                
+                cache_control += ', immutable'
+                
+            
+            request.setHeader( 'Cache-Control', cache_control )
             
+        
+        etag = response_context.GetETag()
+        
+        if etag is not None:
+            
+            request.setHeader( 'ETag', etag )
+            
+        
+        last_modified_timestamp = response_context.GetLastModifiedTimestamp()
+        
+        if last_modified_timestamp is not None:
+            
+            request.setHeader( 'Last-Modified', time.strftime( '%a, %d %b %Y %H:%M:%S GMT', time.gmtime( last_modified_timestamp ) ) )
+            
+        
         if response_context.HasPath():
             
             path = response_context.GetPath()
             
-            filesize = os.path.getsize( path )
-            
             mime = response_context.GetMime()
             
             content_type = HC.mime_mimetype_string_lookup[ mime ]
             
             ( base, filename ) = os.path.split( path )
             
-            fileObject = open( path, 'rb' )
+            fileObject = response_context.GetFileObject()
+            
+            if fileObject is None:
+                
+                try:
+                    
+                    fileObject = open( path, 'rb' )
+                    
+                except FileNotFoundError:
+                    
+                    raise HydrusExceptions.NotFoundException( 'File not found. This was discovered later than expected, so hydev might like to know about this.' )
+                    
+                
             
             content_disposition = f'{content_disposition_type}; filename="{filename}"'
             
@@ -669,6 +717,32 @@ class HydrusResource( Resource ):
             
             do_finish = False
             
+        elif response_context.HasBodyChunks():
+            
+            mime = response_context.GetMime()
+            
+            if mime in STREAMING_MIMES_TO_CONTENT_TYPES:
+                
+                content_type = STREAMING_MIMES_TO_CONTENT_TYPES[ mime ]
+                
+            else:
+                
+                content_type = HC.mime_mimetype_string_lookup[ mime ]
+                
+            
+            # no Content-Length, so twisted sends it chunked
+            request.setHeader( 'Content-Type', content_type )
+            request.setHeader( 'Content-Disposition', content_disposition_type )
+            
+            producer = ThreadedChunkProducer( request, response_context.GetBodyChunks(), self._reportDataUsed )
+            
+            producer.start()
+            
+            # the producer reports its own data when it is done
+            content_length = 0
+            
+            do_finish = False
+            
         elif response_context.HasBody():
             
             mime = response_context.GetMime()
@@ -696,7 +770,7 @@ class HydrusResource( Resource ):
             
             content_length = 0
             
-            if status_code != 204: # 204 is No Content
+            if status_code not in ( 204, 304 ): # No Content, Not Modified
                 
                 request.setHeader( 'Content-Length', str( content_length ) )
                 
@@ -847,6 +921,12 @@ class HydrusResource( Resource ):
                 pass
                 
             
+            if request.hydrus_response_context is not None:
+                
+                # we may have been halfway through serving an open file
+                request.hydrus_response_context.CloseFileObject()
+                
+            
             error_summary = str( e )
             
             if isinstance( e, HydrusExceptions.BadRequestException ):
@@ -1008,6 +1088,49 @@ class HydrusResource( Resource ):
         return access_key
         
     
+    def _parseConditionalHeaders( self, request: HydrusServerRequest.HydrusRequest, etag: str | None, last_modified_timestamp: int | None = None ) -> bool:
+        """
+        True if the client's If-None-Match or If-Modified-Since says it already has this version, i.e. we can send a 304.
+        """
+        
+        if request.requestHeaders.hasHeader( 'If-None-Match' ):
+            
+            # if they sent an etag, we ignore If-Modified-Since
+            
+            if etag is None:
+                
+                return False
+                
+            
+            if_none_match = ','.join( request.requestHeaders.getRawHeaders( 'If-None-Match' ) )
+            
+            client_etags = [ client_etag.strip() for client_etag in if_none_match.split( ',' ) ]
+            
+            # If-None-Match uses the weak comparison, so a W/ prefix does not matter
+            client_etags = [ client_etag[2:] if client_etag.startswith( 'W/' ) else client_etag for client_etag in client_etags ]
+            
+            return '*' in client_etags or etag in client_etags
+            
+        
+        if last_modified_timestamp is not None and request.requestHeaders.hasHeader( 'If-Modified-Since' ):
+            
+            if_modified_since = request.requestHeaders.getRawHeaders( 'If-Modified-Since' )[0]
+            
+            try:
+                
+                if_modified_since_timestamp = email.utils.parsedate_to_datetime( if_modified_since ).timestamp()
+                
+            except ( TypeError, ValueError ):
+                
+                return False
+                
+            
+            return last_modified_timestamp <= if_modified_since_timestamp
+            
+        
+        return False
+        
+    
     def _parseRangeHeader( self, request, filesize ):
         
         offset_and_block_size_pairs = []
@@ -1295,9 +1418,143 @@ class HydrusResourceWelcome( HydrusResource ):
         return response_context
         
     
+class ThreadedChunkProducer( object ):
+    
+    # a push producer that writes a response out of an iterator of bytes
+    # the iterator is pulled on a worker thread, so it can do db work, and we stop pulling while the transport is paused, so a slow client does not make us buffer the whole thing
+    
+    def __init__( self, request: HydrusServerRequest.HydrusRequest, chunks: collections.abc.Iterator[ bytes ], report_data_used_callable ):
+        
+        self._request = request
+        self._chunks = chunks
+        self._report_data_used_callable = report_data_used_callable
+        
+        self._num_bytes = 0
+        
+        self._paused = False
+        self._fetching = False
+        self._stopped = False
+        
+    
+    def _ChunkFailed( self, failure ):
+        
+        self._fetching = False
+        
+        HydrusData.DebugPrint( failure.getTraceback() )
+        
+        if self._stopped:
+            
+            return
+            
+        
+        self._Stop()
+        
+        # we already sent a 200, so the best we can do is cut the chunked stream short so the client knows it did not get everything
+        self._request.loseConnection()
+        
+    
+    def _ChunkFetched( self, chunk: bytes | None ):
+        
+        self._fetching = False
+        
+        if self._stopped:
+            
+            self._CloseChunks()
+            
+            return
+            
+        
+        if chunk is None:
+            
+            self._Stop()
+            
+            self._request.unregisterProducer()
+            self._request.finish()
+            
+            return
+            
+        
+        self._request.write( chunk )
+        
+        self._num_bytes += len( chunk )
+        
+        if not self._paused:
+            
+            self._FetchNextChunk()
+            
+        
+    
+    def _CloseChunks( self ):
+        
+        if hasattr( self._chunks, 'close' ):
+            
+            self._chunks.close()
+            
+        
+    
+    def _FetchNextChunk( self ):
+        
+        if self._fetching or self._stopped:
+            
+            return
+            
+        
+        self._fetching = True
+        
+        d = deferToThread( next, self._chunks, None )
+        
+        d.addCallbacks( self._ChunkFetched, self._ChunkFailed )
+        
+    
+    def _Stop( self ):
+        
+        self._stopped = True
+        
+        if not self._fetching:
+            
+            self._CloseChunks()
+            
+        
+        self._report_data_used_callable( self._request, self._num_bytes )
+        
+    
+    def pauseProducing( self ):
+        
+        self._paused = True
+        
+    
+    def resumeProducing( self ):
+        
+        self._paused = False
+        
+        self._FetchNextChunk()
+        
+    
+    def start( self ):
+        
+        self._request.registerProducer( self, True )
+        
+        self._FetchNextChunk()
+        
+    
+    def stopProducing( self ):
+        
+        # connection lost
+        
+        if self._stopped:
+            
+            return
+            
+        
+        self._Stop()
+        
+    
+
 class ResponseContext( object ):
     
-    def __init__( self, status_code, mime = HC.APPLICATION_JSON, body = None, path = None, cookies = None, is_attachment = False, max_age = None ):
+    def __init__( self, status_code, mime = HC.APPLICATION_JSON, body = None, path = None, cookies = None, is_attachment = False, max_age = None, body_chunks: collections.abc.Iterator[ bytes ] | None = None, filesize: int | None = None, etag: str | None = None, last_modified_timestamp: int | None = None, immutable = False, file_object: typing.BinaryIO | None = None ):
+        
+        # if you pass an open file_object for the path, we serve and close that, so what you stat is what gets sent
         
         if body is None:
             
@@ -1327,7 +1584,7 @@ class ResponseContext( object ):
         
         if max_age is None:
             
-            if body is not None:
+            if body is not None or body_chunks is not None:
                 
                 max_age = 4
                 
@@ -1340,10 +1597,26 @@ class ResponseContext( object ):
         self._status_code = status_code
         self._mime = mime
         self._body_bytes = body_bytes
+        self._body_chunks = body_chunks
         self._path = path
         self._cookies = cookies
         self._is_attachment = is_attachment
         self._max_age = max_age
+        self._filesize = filesize
+        self._etag = etag
+        self._last_modified_timestamp = last_modified_timestamp
+        self._immutable = immutable
+        self._file_object = file_object
+        
+    
+    def CloseFileObject( self ):
+        
+        if self._file_object is not None:
+            
+            self._file_object.close()
+            
+            self._file_object = None
+            
         
     
     def GetBodyBytes( self ):
@@ -1351,11 +1624,36 @@ class ResponseContext( object ):
         return self._body_bytes
         
     
+    def GetBodyChunks( self ) -> collections.abc.Iterator[ bytes ] | None:
+        
+        return self._body_chunks
+        
+    
     def GetCookies( self ):
         
         return self._cookies
         
     
+    def GetETag( self ) -> str | None:
+        
+        return self._etag
+        
+    
+    def GetFileObject( self ) -> typing.BinaryIO | None:
+        
+        return self._file_object
+        
+    
+    def GetFilesize( self ) -> int | None:
+        
+        return self._filesize
+        
+    
+    def GetLastModifiedTimestamp( self ) -> int | None:
+        
+        return self._last_modified_timestamp
+        
+    
     def GetMime( self ):
         
         return self._mime
@@ -1386,6 +1684,11 @@ class ResponseContext( object ):
         return self._body_bytes is not None
         
     
+    def HasBodyChunks( self ):
+        
+        return self._body_chunks is not None
+        
+    
     def HasPath( self ):
         
         return self._path is not None
@@ -1396,3 +1699,8 @@ class ResponseContext( object ):
         return self._is_attachment
         
     
+    def IsImmutable( self ):
+        
+        return self._immutable
+        
+    
@@ -502,6 +502,145 @@ class SubprocessContextReader( SubprocessContext ):
         
     
 
+# after a timeout, how long we wait for the reader thread to let go of the caller's buffer once the process is dead
+INTO_READER_RELEASE_TIMEOUT = 5
+
+class SubprocessContextIntoReader( SubprocessContext ):
+    
+    # this guy does not read ahead. you hand it a buffer and it fills it straight from the pipe, so there is no chunk allocation
+    
+    def __init__( self, *args, **kwargs ):
+        
+        self._destination_queue = queue.Queue()
+        self._reader_finished = False
+        
+        # set when the caller gives up on a read, so we stop touching their buffer
+        self._abandoned = threading.Event()
+        self._reader_done = threading.Event()
+        
+        super().__init__( *args, **kwargs )
+        
+    
+    def _THREADReader( self ):
+        
+        try:
+            
+            while True:
+                
+                try:
+                    
+                    HydrusData.CheckProgramIsNotShuttingDown()
+                    
+                except HydrusExceptions.ShutdownException:
+                    
+                    return
+                    
+                
+                if self.process.returncode is not None or self._abandoned.is_set():
+                    
+                    return
+                    
+                
+                try:
+                    
+                    destination = self._destination_queue.get( timeout = 1.0 )
+                    
+                except queue.Empty:
+                    
+                    continue
+                    
+                
+                if self._abandoned.is_set():
+                    
+                    return
+                    
+                
+                num_bytes_wanted = len( destination )
+                num_bytes_read = 0
+                
+                try:
+                    
+                    while num_bytes_read < num_bytes_wanted and not self._abandoned.is_set():
+                        
+                        num_bytes_read_this_time = self.process.stdout.readinto( destination[ num_bytes_read : ] )
+                        
+                        if num_bytes_read_this_time is None or num_bytes_read_this_time == 0:
+                            
+                            break
+                            
+                        
+                        num_bytes_read += num_bytes_read_this_time
+                        
+                    
+                except ValueError: # probably got terminated at an inconvenient time
+                    
+                    HydrusData.Print( f'Probably not a big deal, but the Subprocess Command "{self._cmd}" closed its stdout early. If this keeps happening, please let hydev know!' )
+                    
+                    return
+                    
+                
+                self._chunk_queue.put( num_bytes_read )
+                
+                if num_bytes_read < num_bytes_wanted:
+                    
+                    return
+                    
+                
+            
+        finally:
+            
+            self._chunk_queue.put( self.SENTINEL )
+            
+            self._reader_done.set()
+            
+        
+    
+    def ReadChunkInto( self, destination ) -> int:
+        """
+        Fills the writeable buffer from the process's stdout and returns the number of bytes read. Less than the buffer's size means the stream is done.
+        """
+        
+        if self._reader_finished:
+            
+            return 0
+            
+        
+        destination = memoryview( destination ).cast( 'B' )
+        
+        self._destination_queue.put( destination )
+        
+        try:
+            
+            num_bytes_read = self._chunk_queue.get( timeout = self._timeout )
+            
+        except queue.Empty:
+            
+            # the reader may be halfway through filling the caller's buffer. we make sure it has stopped before we raise, or it could write into the buffer after the caller reuses it
+            
+            self._abandoned.set()
+            self._reader_finished = True
+            
+            ( stdout, stderr ) = TerminateAndReapProcess( self.process )
+            
+            if not self._reader_done.wait( INTO_READER_RELEASE_TIMEOUT ):
+                
+                HydrusData.Print( f'The Subprocess Command "{self._cmd}" timed out, and its reader did not stop after the process was killed! The buffer it was filling should not be reused.' )
+                
+            
+            ReportTimeoutError( self._cmd, self._timeout, stdout, stderr )
+            
+        
+        if num_bytes_read == self.SENTINEL:
+            
+            self._reader_finished = True
+            
+            return 0
+            
+        
+        return num_bytes_read
+        
+    
+
 class SubprocessContextStreamer( SubprocessContext ):
     
     def IterateChunks( self ):
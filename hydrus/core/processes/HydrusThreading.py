@@ -1,4 +1,6 @@
 import bisect
+import collections
+import os
 import queue
 import random
 import threading
@@ -17,6 +19,9 @@ NEXT_THREAD_CLEAROUT = 0
 THREADS_TO_THREAD_INFO = {}
 THREAD_INFO_LOCK = threading.Lock()
 
+# thread pool work that chews cpu, like resizing or compressing, goes this many at once. we leave a core for the ui and the db
+CPU_HEAVY_MAX_SIMULTANEOUS_JOBS = max( 1, min( 4, ( os.cpu_count() or 2 ) - 1 ) )
+
 def CheckIfThreadShuttingDown()-> None:
     
     if IsThreadShuttingDown():
@@ -151,6 +156,199 @@ class BigJobPauser( object ):
         
     
 
+class OrderedJob( object ):
+    
+    def __init__( self, work_callable, *args ):
+        
+        self._work_callable = work_callable
+        self._args = args
+        
+        self._done = threading.Event()
+        
+        self._result = None
+        self._error = None
+        
+    
+    def DoWork( self ):
+        
+        try:
+            
+            self._result = self._work_callable( *self._args )
+            
+        except Exception as e:
+            
+            self._error = e
+            
+        finally:
+            
+            self._done.set()
+            
+        
+    
+    def GetResult( self ):
+        
+        while not self._done.wait( timeout = 0.5 ):
+            
+            HydrusData.CheckProgramIsNotShuttingDown()
+            
+        
+        if self._error is not None:
+            
+            raise self._error
+            
+        
+        return self._result
+        
+    
+    def SetError( self, e: Exception ):
+        
+        self._error = e
+        
+        self._done.set()
+        
+    
+
+class OrderedJobQueue( object ):
+    """
+    Runs work on the thread pool, no more than max_simultaneous_jobs at once, and hands the results back in the order the work was added.
+    """
+    
+    def __init__( self, controller: "HG.HydrusController.HydrusController", max_simultaneous_jobs: int = CPU_HEAVY_MAX_SIMULTANEOUS_JOBS ):
+        
+        self._controller = controller
+        
+        self._lock = threading.Lock()
+        
+        self._slots = threading.BoundedSemaphore( max_simultaneous_jobs )
+        
+        self._jobs = collections.deque()
+        
+    
+    def _DoJob( self, job: OrderedJob ):
+        
+        try:
+            
+            job.DoWork()
+            
+        finally:
+            
+            self._slots.release()
+            
+        
+    
+    def AddJob( self, work_callable, *args ):
+        
+        while not self._slots.acquire( timeout = 0.5 ):
+            
+            HydrusData.CheckProgramIsNotShuttingDown()
+            
+        
+        job = OrderedJob( work_callable, *args )
+        
+        with self._lock:
+            
+            self._jobs.append( job )
+            
+        
+        try:
+            
+            self._controller.CallToThread( self._DoJob, job )
+            
+        except Exception as e:
+            
+            # the job never started, so it is not going to give back its slot. whoever collects the results hears about it too
+            
+            self._slots.release()
+            
+            job.SetError( e )
+            
+            raise
+            
+        
+    
+    def GetAllResults( self ) -> list:
+        
+        with self._lock:
+            
+            jobs = list( self._jobs )
+            
+            self._jobs.clear()
+            
+        
+        results = []
+        first_error = None
+        
+        # we wait for everything, even after an error, so nothing is still running when we return
+        
+        for job in jobs:
+            
+            try:
+                
+                results.append( job.GetResult() )
+                
+            except HydrusExceptions.ShutdownException:
+                
+                raise
+                
+            except Exception as e:
+                
+                if first_error is None:
+                    
+                    first_error = e
+                    
+                
+            
+        
+        if first_error is not None:
+            
+            raise first_error
+            
+        
+        return results
+        
+    
+    def GetNextResult( self ):
+        
+        with self._lock:
+            
+            job = self._jobs.popleft()
+            
+        
+        return job.GetResult()
+        
+    
+    def GetNumJobs( self ) -> int:
+        
+        with self._lock:
+            
+            return len( self._jobs )
+            
+        
+    
+
+def MapOrderedOnThreads( controller: "HG.HydrusController.HydrusController", work_callable, items, max_simultaneous_jobs: int = CPU_HEAVY_MAX_SIMULTANEOUS_JOBS ):
+    """
+    Like map, but the work happens on the thread pool. Results come back in order, and we never hold more than max_simultaneous_jobs of them.
+    """
+    
+    job_queue = OrderedJobQueue( controller, max_simultaneous_jobs )
+    
+    for item in items:
+        
+        if job_queue.GetNumJobs() >= max_simultaneous_jobs:
+            
+            yield job_queue.GetNextResult()
+            
+        
+        job_queue.AddJob( work_callable, item )
+        
+    
+    while job_queue.GetNumJobs() > 0:
+        
+        yield job_queue.GetNextResult()
+        
+    
+
 class DAEMON( threading.Thread ):
     
     def __init__( self, controller: "HG.HydrusController.HydrusController", name: str ):
@@ -192,6 +192,25 @@ class Controller( HydrusController.HydrusController ):
         self.db = ServerDB.DB( self, self.db_dir, 'server' )
         
     
+    def CreateRepositoryUpdate( self, service_key, begin, end ) -> list[ bytes ]:
+        
+        update_file_writer = ServerFiles.UpdateFileWriter()
+        
+        # the db is only busy for the reading. the files are serialised and written on the thread pool, and the db is free for everyone else while we wait on the last of them
+        
+        self.WriteSynchronous( 'create_update', service_key, begin, end, update_file_writer )
+        
+        update_hashes = update_file_writer.WaitForUpdateHashes()
+        
+        self.WriteSynchronous( 'register_update', service_key, update_hashes )
+        
+        ( num_definition_rows, num_content_rows ) = update_file_writer.GetNumRows()
+        
+        HydrusData.Print( 'Update OK. ' + HydrusNumbers.ToHumanInt( num_definition_rows ) + ' definition rows and ' + HydrusNumbers.ToHumanInt( num_content_rows ) + ' content rows in ' + HydrusNumbers.ToHumanInt( len( update_hashes ) ) + ' update files.' )
+        
+        return update_hashes
+        
+    
     def DAEMONPubSub( self ):
         
         while not HG.model_shutdown:
@@ -297,6 +316,15 @@ class Controller( HydrusController.HydrusController ):
         
         [ self._admin_service ] = [ service for service in self._services if service.GetServiceType() == HC.SERVER_ADMIN ]
         
+        # nothing is writing update files yet, so any .temp is left over from a crash
+        
+        num_temp_files_deleted = ServerFiles.DeleteStaleTempFiles()
+        
+        if num_temp_files_deleted > 0:
+            
+            HydrusData.Print( 'Deleted {} unfinished update files left over from last time.'.format( HydrusNumbers.ToHumanInt( num_temp_files_deleted ) ) )
+            
+        
         self.server_session_manager = HydrusSessions.HydrusSessionManagerServer()
         
         self._service_keys_to_connected_ports = {}
@@ -29,6 +29,9 @@ ALLOWABLE_SERVICE_INFO_TYPES = collections.defaultdict( list )
 ALLOWABLE_SERVICE_INFO_TYPES[ HC.FILE_REPOSITORY ] = HC.FILE_REPOSITORY_SERVICE_INFO_TYPES
 ALLOWABLE_SERVICE_INFO_TYPES[ HC.TAG_REPOSITORY ] = HC.TAG_REPOSITORY_SERVICE_INFO_TYPES
 
+# a client to server update that takes longer than this gets its per-stage timings printed to the log
+CLIENT_TO_SERVER_UPDATE_REPORT_THRESHOLD = 5.0
+
 def GenerateRepositoryMasterMapTableNames( service_id ):
     
     suffix = str( service_id )
@@ -64,6 +67,11 @@ def GenerateRepositoryMappingsTableNames( service_id ):
     return ( current_mappings_table_name, deleted_mappings_table_name, pending_mappings_table_name, petitioned_mappings_table_name )
     
 
+def GenerateRepositoryPetitionSummariesTableName( service_id ):
+    
+    return 'petition_summaries_' + str( service_id )
+    
+
 def GenerateRepositoryTagParentsTableNames( service_id ):
     
     suffix = str( service_id )
@@ -482,6 +490,10 @@ class DB( HydrusDB.HydrusDB ):
         self._ExecuteMany( 'DELETE FROM ' + pending_tag_siblings_table_name + ' WHERE account_id = ?;', ( ( subject_account_id, ) for subject_account_id in subject_account_ids ) )
         self._ExecuteMany( 'DELETE FROM ' + petitioned_tag_siblings_table_name + ' WHERE account_id = ?;', ( ( subject_account_id, ) for subject_account_id in subject_account_ids ) )
         
+        petition_summaries_table_name = GenerateRepositoryPetitionSummariesTableName( service_id )
+        
+        self._ExecuteMany( 'DELETE FROM ' + petition_summaries_table_name + ' WHERE account_id = ?;', ( ( subject_account_id, ) for subject_account_id in subject_account_ids ) )
+        
     
     def _DeleteService( self, service_key ):
         
@@ -739,6 +751,15 @@ class DB( HydrusDB.HydrusDB ):
         return self._GetAccount( service_id, account_id )
         
     
+    def _GetAccountsFromAccountKeys( self, service_key, account_keys ):
+        
+        service_id = self._GetServiceId( service_key )
+        
+        account_ids = [ self._GetAccountId( account_key ) for account_key in account_keys ]
+        
+        return [ self._GetAccount( service_id, account_id ) for account_id in account_ids ]
+        
+    
     def _GetAccountKeyFromAccessKey( self, service_key, access_key ):
         
         service_id = self._GetServiceId( service_key )
@@ -961,6 +982,35 @@ class DB( HydrusDB.HydrusDB ):
             
         
     
+    def _GetHashesToMasterHashIds( self, hashes ) -> dict[ bytes, int ]:
+        
+        # a big upload can carry a million hashes, so we do this with a couple of executemanys and a join rather than a query per hash
+        
+        hashes = { hash for hash in hashes if hash is not None }
+        
+        if len( hashes ) == 0:
+            
+            return {}
+            
+        
+        self._ExecuteMany( 'INSERT OR IGNORE INTO hashes ( hash ) VALUES ( ? );', ( ( sqlite3.Binary( hash ), ) for hash in hashes ) )
+        
+        self._Execute( 'CREATE TABLE IF NOT EXISTS mem.temp_hashes ( hash BLOB_BYTES PRIMARY KEY );' )
+        
+        try:
+            
+            self._ExecuteMany( 'INSERT INTO mem.temp_hashes ( hash ) VALUES ( ? );', ( ( sqlite3.Binary( hash ), ) for hash in hashes ) )
+            
+            hashes_to_master_hash_ids = { bytes( hash ) : master_hash_id for ( hash, master_hash_id ) in self._Execute( 'SELECT hash, master_hash_id FROM mem.temp_hashes CROSS JOIN hashes USING ( hash );' ) }
+            
+        finally:
+            
+            self._Execute( 'DELETE FROM mem.temp_hashes;' )
+            
+        
+        return hashes_to_master_hash_ids
+        
+    
     def _GetMasterHashId( self, hash ):
         
         result = self._Execute( 'SELECT master_hash_id FROM hashes WHERE hash = ?;', ( sqlite3.Binary( hash ), ) ).fetchone()
@@ -983,43 +1033,7 @@ class DB( HydrusDB.HydrusDB ):
     
     def _GetMasterHashIds( self, hashes ):
         
-        master_hash_ids = set()
-        hashes_not_in_db = set()
-        
-        for hash in hashes:
-            
-            if hash is None:
-                
-                continue
-                
-            
-            result = self._Execute( 'SELECT master_hash_id FROM hashes WHERE hash = ?;', ( sqlite3.Binary( hash ), ) ).fetchone()
-            
-            if result is None:
-                
-                hashes_not_in_db.add( hash )
-                
-            else:
-                
-                ( master_hash_id, ) = result
-                
-                master_hash_ids.add( master_hash_id )
-                
-            
-        
-        if len( hashes_not_in_db ) > 0:
-            
-            self._ExecuteMany( 'INSERT INTO hashes ( hash ) VALUES ( ? );', ( ( sqlite3.Binary( hash ), ) for hash in hashes_not_in_db ) )
-            
-            for hash in hashes_not_in_db:
-                
-                ( master_hash_id, ) = self._Execute( 'SELECT master_hash_id FROM hashes WHERE hash = ?;', ( sqlite3.Binary( hash ), ) ).fetchone()
-                
-                master_hash_ids.add( master_hash_id )
-                
-            
-        
-        return master_hash_ids
+        return set( self._GetHashesToMasterHashIds( hashes ).values() )
         
     
     def _GetMasterTagId( self, tag ):
@@ -1249,6 +1263,53 @@ class DB( HydrusDB.HydrusDB ):
         return tag
         
     
+    def _GetTagsToMasterTagIds( self, tags ) -> dict[ str, int ]:
+        
+        # tags that do not clean to something valid are left out, just like the single lookup raising
+        
+        tags_to_clean_tags = {}
+        
+        for tag in tags:
+            
+            try:
+                
+                clean_tag = HydrusTags.CleanTag( tag )
+                
+                HydrusTags.CheckTagNotEmpty( clean_tag )
+                
+            except Exception as e:
+                
+                continue
+                
+            
+            tags_to_clean_tags[ tag ] = clean_tag
+            
+        
+        clean_tags = set( tags_to_clean_tags.values() )
+        
+        if len( clean_tags ) == 0:
+            
+            return {}
+            
+        
+        self._ExecuteMany( 'INSERT OR IGNORE INTO tags ( tag ) VALUES ( ? );', ( ( clean_tag, ) for clean_tag in clean_tags ) )
+        
+        self._Execute( 'CREATE TABLE IF NOT EXISTS mem.temp_tags ( tag TEXT PRIMARY KEY );' )
+        
+        try:
+            
+            self._ExecuteMany( 'INSERT INTO mem.temp_tags ( tag ) VALUES ( ? );', ( ( clean_tag, ) for clean_tag in clean_tags ) )
+            
+            clean_tags_to_master_tag_ids = dict( self._Execute( 'SELECT tag, master_tag_id FROM mem.temp_tags CROSS JOIN tags USING ( tag );' ) )
+            
+        finally:
+            
+            self._Execute( 'DELETE FROM mem.temp_tags;' )
+            
+        
+        return { tag : clean_tags_to_master_tag_ids[ clean_tag ] for ( tag, clean_tag ) in tags_to_clean_tags.items() }
+        
+    
     def _HashExists( self, hash ):
         
         result = self._Execute( 'SELECT 1 FROM hashes WHERE hash = ?;', ( sqlite3.Binary( hash ), ) ).fetchone()
@@ -1282,6 +1343,7 @@ class DB( HydrusDB.HydrusDB ):
                 'account_info' : self._GetAccountInfo,
                 'account_key_from_access_key' : self._GetAccountKeyFromAccessKey,
                 'account_key_from_content' : self._GetAccountKeyFromContent,
+                'accounts' : self._GetAccountsFromAccountKeys,
                 'account_types' : self._GetAccountTypes,
                 'auto_create_account_types' : self._GetAutoCreateAccountTypes,
                 'auto_create_registration_key' : self._GetAutoCreateRegistrationKey,
@@ -1322,6 +1384,7 @@ class DB( HydrusDB.HydrusDB ):
                 'modify_account_set_message' : self._ModifyAccountSetMessage,
                 'modify_account_unban' : self._ModifyAccountUnban,
                 'nullify_history' : self._RepositoryNullifyHistory,
+                'register_update' : self._RepositoryRegisterUpdate,
                 'services' : self._ModifyServices,
                 'session' : self._AddSession,
                 'update' : self._RepositoryProcessClientToServerUpdate,
@@ -1719,7 +1782,7 @@ class DB( HydrusDB.HydrusDB ):
         # now we are done, no rollback, so let's update the cache
         self._RefreshAccountInfoCache()
         
-        self._cursor_transaction_wrapper.pub_after_job( 'update_all_session_accounts', service_key )
+        self._cursor_transaction_wrapper.pub_after_job( 'update_session_accounts', service_key )
         
     
     def _ModifyServices( self, account, services ):
@@ -1841,35 +1904,41 @@ class DB( HydrusDB.HydrusDB ):
         self._ClearDeferredPhysicalDeleteIds( file_master_hash_id = master_hash_id, thumbnail_master_hash_id = master_hash_id )
         
     
-    def _RepositoryAddMappings( self, service_id, account_id, master_tag_id, master_hash_ids, overwrite_deleted, timestamp ):
-        
-        service_tag_id = self._RepositoryGetServiceTagId( service_id, master_tag_id, timestamp )
-        service_hash_ids = self._RepositoryGetServiceHashIds( service_id, master_hash_ids, timestamp )
+    def _RepositoryAddMappings( self, service_id, account_id, service_tag_id, service_hash_ids, overwrite_deleted, timestamp ):
         
         ( current_mappings_table_name, deleted_mappings_table_name, pending_mappings_table_name, petitioned_mappings_table_name ) = GenerateRepositoryMappingsTableNames( service_id )
         
-        if overwrite_deleted:
+        with self._MakeTemporaryIntegerTable( service_hash_ids, 'service_hash_id' ) as temp_hash_ids_table_name:
             
-            self._ExecuteMany( 'DELETE FROM ' + deleted_mappings_table_name + ' WHERE service_tag_id = ? AND service_hash_id = ?;', ( ( service_tag_id, service_hash_id ) for service_hash_id in service_hash_ids ) )
+            if overwrite_deleted:
+                
+                self._Execute( 'DELETE FROM {} WHERE service_tag_id = ? AND service_hash_id IN ( SELECT service_hash_id FROM {} );'.format( deleted_mappings_table_name, temp_hash_ids_table_name ), ( service_tag_id, ) )
+                
+                self._RepositoryUpdateServiceInfo( service_id, HC.SERVICE_INFO_NUM_DELETED_MAPPINGS, - self._GetRowCount() )
+                
+                deleted_pred = ''
+                
+            else:
+                
+                deleted_pred = ' WHERE NOT EXISTS ( SELECT 1 FROM {} AS deleted_mappings WHERE deleted_mappings.service_tag_id = ? AND deleted_mappings.service_hash_id = temp_hashes.service_hash_id )'.format( deleted_mappings_table_name )
+                
             
-            self._RepositoryUpdateServiceInfo( service_id, HC.SERVICE_INFO_NUM_DELETED_MAPPINGS, - self._GetRowCount() )
+            # if we ever do pending mappings, delete from pending with the master ids here
             
-        else:
+            query = 'INSERT OR IGNORE INTO {} ( service_tag_id, service_hash_id, account_id, mapping_timestamp ) SELECT ?, service_hash_id, ?, ? FROM {} AS temp_hashes{};'.format( current_mappings_table_name, temp_hash_ids_table_name, deleted_pred )
             
-            with self._MakeTemporaryIntegerTable( service_hash_ids, 'service_hash_id' ) as temp_hash_ids_table_name:
+            if overwrite_deleted:
                 
-                deleted_service_hash_ids = self._STS( self._Execute( 'SELECT service_hash_id FROM {} CROSS JOIN {} USING ( service_hash_id ) WHERE service_tag_id = ?;'.format( temp_hash_ids_table_name, deleted_mappings_table_name ), ( service_tag_id, ) ) )
+                self._Execute( query, ( service_tag_id, account_id, timestamp ) )
+                
+            else:
+                
+                self._Execute( query, ( service_tag_id, account_id, timestamp, service_tag_id ) )
                 
             
-            service_hash_ids = set( service_hash_ids ).difference( deleted_service_hash_ids )
+            self._RepositoryUpdateServiceInfo( service_id, HC.SERVICE_INFO_NUM_MAPPINGS, self._GetRowCount() )
             
         
-        # if we ever do pending mappings, delete from pending with the master ids here
-        
-        self._ExecuteMany( 'INSERT OR IGNORE INTO ' + current_mappings_table_name + ' ( service_tag_id, service_hash_id, account_id, mapping_timestamp ) VALUES ( ?, ?, ?, ? );', [ ( service_tag_id, service_hash_id, account_id, timestamp ) for service_hash_id in service_hash_ids ] )
-        
-        self._RepositoryUpdateServiceInfo( service_id, HC.SERVICE_INFO_NUM_MAPPINGS, self._GetRowCount() )
-        
     
     def _RepositoryAddTagParent( self, service_id, account_id, child_master_tag_id, parent_master_tag_id, overwrite_deleted, timestamp ):
         
@@ -2066,6 +2135,13 @@ class DB( HydrusDB.HydrusDB ):
         
         #
         
+        petition_summaries_table_name = GenerateRepositoryPetitionSummariesTableName( service_id )
+        
+        self._Execute( 'CREATE TABLE ' + petition_summaries_table_name + ' ( content_type INTEGER, status INTEGER, account_id INTEGER, reason_id INTEGER, num_rows INTEGER, oldest_timestamp INTEGER, PRIMARY KEY ( content_type, status, account_id, reason_id ) ) WITHOUT ROWID;' )
+        self._CreateIndex( petition_summaries_table_name, [ 'account_id' ] )
+        
+        #
+        
         ( update_table_name ) = GenerateRepositoryUpdateTableName( service_id )
         
         self._Execute( 'CREATE TABLE ' + update_table_name + ' ( master_hash_id INTEGER PRIMARY KEY );' )
@@ -2073,7 +2149,7 @@ class DB( HydrusDB.HydrusDB ):
         self._RepositoryRegenerateServiceInfo( service_id = service_id )
         
     
-    def _RepositoryCreateUpdate( self, service_key, begin, end ):
+    def _RepositoryCreateUpdate( self, service_key, begin, end, update_file_writer: ServerFiles.UpdateFileWriter ):
         
         service_id = self._GetServiceId( service_key )
         
@@ -2081,57 +2157,9 @@ class DB( HydrusDB.HydrusDB ):
         
         HydrusData.Print( 'Creating update for ' + repr( name ) + ' from ' + HydrusTime.TimestampToPrettyTime( begin, in_utc = True ) + ' to ' + HydrusTime.TimestampToPrettyTime( end, in_utc = True ) )
         
-        updates = self._RepositoryGenerateUpdates( service_id, begin, end )
-        
-        update_hashes = []
-        
-        total_definition_rows = 0
-        total_content_rows = 0
-        
-        if len( updates ) > 0:
-            
-            for update in updates:
-                
-                num_rows = update.GetNumRows()
-                
-                if isinstance( update, HydrusNetwork.DefinitionsUpdate ):
-                    
-                    total_definition_rows += num_rows
-                    
-                elif isinstance( update, HydrusNetwork.ContentUpdate ):
-                    
-                    total_content_rows += num_rows
-                    
-                
-                update_bytes = update.DumpToNetworkBytes()
-                
-                update_hash = hashlib.sha256( update_bytes ).digest()
-                
-                dest_path = ServerFiles.GetExpectedFilePath( update_hash )
-                
-                with open( dest_path, 'wb' ) as f:
-                    
-                    f.write( update_bytes )
-                    
-                
-                update_hashes.append( update_hash )
-                
-            
-            update_table_name = GenerateRepositoryUpdateTableName( service_id )
-            
-            master_hash_ids = self._GetMasterHashIds( update_hashes )
-            
-            self._ExecuteMany( 'INSERT OR IGNORE INTO ' + update_table_name + ' ( master_hash_id ) VALUES ( ? );', ( ( master_hash_id, ) for master_hash_id in master_hash_ids ) )
-            
-            for master_hash_id in master_hash_ids:
-                
-                self._ClearDeferredPhysicalDeleteIds( file_master_hash_id = master_hash_id )
-                
-            
-        
-        HydrusData.Print( 'Update OK. ' + HydrusNumbers.ToHumanInt( total_definition_rows ) + ' definition rows and ' + HydrusNumbers.ToHumanInt( total_content_rows ) + ' content rows in ' + HydrusNumbers.ToHumanInt( len( updates ) ) + ' update files.' )
+        # we only read here. each update goes to the writer as soon as it is full, and the serialising and writing happens off the db
         
-        return update_hashes
+        self._RepositoryGenerateUpdates( service_id, begin, end, finished_update_callable = update_file_writer.AddUpdate )
         
     
     def _RepositoryDeleteAllCurrentContent( self, service_id, admin_account_id, subject_account_id ):
@@ -2268,15 +2296,18 @@ class DB( HydrusDB.HydrusDB ):
         
         self._RepositoryRewardMappingPetitioners( service_id, service_tag_id, valid_service_hash_ids, 1 )
         
-        self._ExecuteMany( 'DELETE FROM ' + current_mappings_table_name + ' WHERE service_tag_id = ? AND service_hash_id = ?;', ( ( service_tag_id, service_hash_id ) for service_hash_id in valid_service_hash_ids ) )
-        
-        self._RepositoryUpdateServiceInfo( service_id, HC.SERVICE_INFO_NUM_MAPPINGS, - self._GetRowCount() )
-        
-        self._RepositoryDeleteRawPetitionedMappingRows( service_id, service_tag_id, valid_service_hash_ids )
-        
-        self._ExecuteMany( 'INSERT OR IGNORE INTO ' + deleted_mappings_table_name + ' ( service_tag_id, service_hash_id, account_id, mapping_timestamp ) VALUES ( ?, ?, ?, ? );', ( ( service_tag_id, service_hash_id, account_id, timestamp ) for service_hash_id in valid_service_hash_ids ) )
-        
-        self._RepositoryUpdateServiceInfo( service_id, HC.SERVICE_INFO_NUM_DELETED_MAPPINGS, self._GetRowCount() )
+        with self._MakeTemporaryIntegerTable( valid_service_hash_ids, 'service_hash_id' ) as temp_hash_ids_table_name:
+            
+            self._Execute( 'DELETE FROM {} WHERE service_tag_id = ? AND service_hash_id IN ( SELECT service_hash_id FROM {} );'.format( current_mappings_table_name, temp_hash_ids_table_name ), ( service_tag_id, ) )
+            
+            self._RepositoryUpdateServiceInfo( service_id, HC.SERVICE_INFO_NUM_MAPPINGS, - self._GetRowCount() )
+            
+            self._RepositoryDeleteRawPetitionedMappingRows( service_id, service_tag_id, valid_service_hash_ids )
+            
+            self._Execute( 'INSERT OR IGNORE INTO {} ( service_tag_id, service_hash_id, account_id, mapping_timestamp ) SELECT ?, service_hash_id, ?, ? FROM {};'.format( deleted_mappings_table_name, temp_hash_ids_table_name ), ( service_tag_id, account_id, timestamp ) )
+            
+            self._RepositoryUpdateServiceInfo( service_id, HC.SERVICE_INFO_NUM_DELETED_MAPPINGS, self._GetRowCount() )
+            
         
     
     def _RepositoryDeleteRawPendingTagParentRows( self, service_id: int, child_master_tag_id: int, parent_master_tag_id: int ):
@@ -2287,10 +2318,14 @@ class DB( HydrusDB.HydrusDB ):
         
         pre_change_count = self._RepositoryGetCountOfActionableAddTagParentPetitionsForAccounts( service_id, account_ids )
         
+        petition_count_deltas = [ ( account_id, reason_id, - count ) for ( account_id, reason_id, count ) in self._Execute( 'SELECT account_id, reason_id, COUNT( * ) FROM {} WHERE child_master_tag_id = ? AND parent_master_tag_id = ? GROUP BY account_id, reason_id;'.format( pending_tag_parents_table_name ), ( child_master_tag_id, parent_master_tag_id ) ) ]
+        
         self._Execute( 'DELETE FROM {} WHERE child_master_tag_id = ? AND parent_master_tag_id = ?;'.format( pending_tag_parents_table_name ), ( child_master_tag_id, parent_master_tag_id ) )
         
         self._RepositoryUpdateServiceInfo( service_id, HC.SERVICE_INFO_NUM_PENDING_TAG_PARENTS, - self._GetRowCount() )
         
+        self._RepositoryUpdatePetitionSummaries( service_id, HC.CONTENT_TYPE_TAG_PARENTS, HC.CONTENT_STATUS_PENDING, petition_count_deltas )
+        
         post_change_count = self._RepositoryGetCountOfActionableAddTagParentPetitionsForAccounts( service_id, account_ids )
         
         self._RepositoryUpdateServiceInfo( service_id, HC.SERVICE_INFO_NUM_ACTIONABLE_PARENT_ADD_PETITIONS, post_change_count - pre_change_count )
@@ -2304,10 +2339,14 @@ class DB( HydrusDB.HydrusDB ):
         
         pre_change_count = self._RepositoryGetCountOfActionableAddTagSiblingPetitionsForAccounts( service_id, account_ids )
         
+        petition_count_deltas = [ ( account_id, reason_id, - count ) for ( account_id, reason_id, count ) in self._Execute( 'SELECT account_id, reason_id, COUNT( * ) FROM {} WHERE bad_master_tag_id = ? AND good_master_tag_id = ? GROUP BY account_id, reason_id;'.format( pending_tag_siblings_table_name ), ( bad_master_tag_id, good_master_tag_id ) ) ]
+        
         self._Execute( 'DELETE FROM {} WHERE bad_master_tag_id = ? AND good_master_tag_id = ?;'.format( pending_tag_siblings_table_name ), ( bad_master_tag_id, good_master_tag_id ) )
         
         self._RepositoryUpdateServiceInfo( service_id, HC.SERVICE_INFO_NUM_PENDING_TAG_SIBLINGS, - self._GetRowCount() )
         
+        self._RepositoryUpdatePetitionSummaries( service_id, HC.CONTENT_TYPE_TAG_SIBLINGS, HC.CONTENT_STATUS_PENDING, petition_count_deltas )
+        
         post_change_count = self._RepositoryGetCountOfActionableAddTagSiblingPetitionsForAccounts( service_id, account_ids )
         
         self._RepositoryUpdateServiceInfo( service_id, HC.SERVICE_INFO_NUM_ACTIONABLE_SIBLING_ADD_PETITIONS, post_change_count - pre_change_count )
@@ -2321,6 +2360,8 @@ class DB( HydrusDB.HydrusDB ):
             
             account_ids = self._RepositoryGetAccountIdsWithActionableDeleteFilePetitions( service_id, temp_hash_ids_table_name )
             
+            petition_count_deltas = [ ( account_id, reason_id, - count ) for ( account_id, reason_id, count ) in self._Execute( 'SELECT account_id, reason_id, COUNT( * ) FROM {} CROSS JOIN {} USING ( service_hash_id ) GROUP BY account_id, reason_id;'.format( temp_hash_ids_table_name, petitioned_files_table_name ) ) ]
+            
         
         pre_change_count = self._RepositoryGetCountOfActionableDeleteFilePetitionsForAccounts( service_id, account_ids )
         
@@ -2328,6 +2369,8 @@ class DB( HydrusDB.HydrusDB ):
         
         self._RepositoryUpdateServiceInfo( service_id, HC.SERVICE_INFO_NUM_PETITIONED_FILES, - self._GetRowCount() )
         
+        self._RepositoryUpdatePetitionSummaries( service_id, HC.CONTENT_TYPE_FILES, HC.CONTENT_STATUS_PETITIONED, petition_count_deltas )
+        
         post_change_count = self._RepositoryGetCountOfActionableDeleteFilePetitionsForAccounts( service_id, account_ids )
         
         self._RepositoryUpdateServiceInfo( service_id, HC.SERVICE_INFO_NUM_ACTIONABLE_FILE_DELETE_PETITIONS, post_change_count - pre_change_count )
@@ -2341,6 +2384,8 @@ class DB( HydrusDB.HydrusDB ):
             
             account_ids = self._RepositoryGetAccountIdsWithActionableDeleteMappingPetitions( service_id, service_tag_id, temp_hash_ids_table_name )
             
+            petition_count_deltas = [ ( account_id, reason_id, - count ) for ( account_id, reason_id, count ) in self._Execute( 'SELECT account_id, reason_id, COUNT( * ) FROM {} CROSS JOIN {} USING ( service_hash_id ) WHERE service_tag_id = ? GROUP BY account_id, reason_id;'.format( temp_hash_ids_table_name, petitioned_mappings_table_name ), ( service_tag_id, ) ) ]
+            
         
         pre_change_count = self._RepositoryGetCountOfActionableDeleteMappingPetitionsForAccounts( service_id, service_tag_id, account_ids )
         
@@ -2348,6 +2393,8 @@ class DB( HydrusDB.HydrusDB ):
         
         self._RepositoryUpdateServiceInfo( service_id, HC.SERVICE_INFO_NUM_PETITIONED_MAPPINGS, - self._GetRowCount() )
         
+        self._RepositoryUpdatePetitionSummaries( service_id, HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_STATUS_PETITIONED, petition_count_deltas )
+        
         post_change_count = self._RepositoryGetCountOfActionableDeleteMappingPetitionsForAccounts( service_id, service_tag_id, account_ids )
         
         self._RepositoryUpdateServiceInfo( service_id, HC.SERVICE_INFO_NUM_ACTIONABLE_MAPPING_DELETE_PETITIONS, post_change_count - pre_change_count )
@@ -2363,10 +2410,14 @@ class DB( HydrusDB.HydrusDB ):
         
         pre_delete_change_count = self._RepositoryGetCountOfActionableDeleteTagParentPetitionsForAccounts( service_id, account_ids )
         
+        petition_count_deltas = [ ( account_id, reason_id, - count ) for ( account_id, reason_id, count ) in self._Execute( 'SELECT account_id, reason_id, COUNT( * ) FROM {} WHERE child_service_tag_id = ? AND parent_service_tag_id = ? GROUP BY account_id, reason_id;'.format( petitioned_tag_parents_table_name ), ( child_service_tag_id, parent_service_tag_id ) ) ]
+        
         self._Execute( 'DELETE FROM {} WHERE child_service_tag_id = ? AND parent_service_tag_id = ?;'.format( petitioned_tag_parents_table_name ), ( child_service_tag_id, parent_service_tag_id ) )
         
         self._RepositoryUpdateServiceInfo( service_id, HC.SERVICE_INFO_NUM_PETITIONED_TAG_PARENTS, - self._GetRowCount() )
         
+        self._RepositoryUpdatePetitionSummaries( service_id, HC.CONTENT_TYPE_TAG_PARENTS, HC.CONTENT_STATUS_PETITIONED, petition_count_deltas )
+        
         post_add_change_count = self._RepositoryGetCountOfActionableAddTagParentPetitionsForAccounts( service_id, account_ids )
         
         post_delete_change_count = self._RepositoryGetCountOfActionableDeleteTagParentPetitionsForAccounts( service_id, account_ids )
@@ -2386,10 +2437,14 @@ class DB( HydrusDB.HydrusDB ):
         
         pre_delete_change_count = self._RepositoryGetCountOfActionableDeleteTagSiblingPetitionsForAccounts( service_id, account_ids )
         
+        petition_count_deltas = [ ( account_id, reason_id, - count ) for ( account_id, reason_id, count ) in self._Execute( 'SELECT account_id, reason_id, COUNT( * ) FROM {} WHERE bad_service_tag_id = ? AND good_service_tag_id = ? GROUP BY account_id, reason_id;'.format( petitioned_tag_siblings_table_name ), ( bad_service_tag_id, good_service_tag_id ) ) ]
+        
         self._Execute( 'DELETE FROM {} WHERE bad_service_tag_id = ? AND good_service_tag_id = ?;'.format( petitioned_tag_siblings_table_name ), ( bad_service_tag_id, good_service_tag_id ) )
         
         self._RepositoryUpdateServiceInfo( service_id, HC.SERVICE_INFO_NUM_PETITIONED_TAG_SIBLINGS, - self._GetRowCount() )
         
+        self._RepositoryUpdatePetitionSummaries( service_id, HC.CONTENT_TYPE_TAG_SIBLINGS, HC.CONTENT_STATUS_PETITIONED, petition_count_deltas )
+        
         post_add_change_count = self._RepositoryGetCountOfActionableAddTagSiblingPetitionsForAccounts( service_id, account_ids )
         
         post_delete_change_count = self._RepositoryGetCountOfActionableDeleteTagSiblingPetitionsForAccounts( service_id, account_ids )
@@ -2506,6 +2561,8 @@ class DB( HydrusDB.HydrusDB ):
         
         table_names.extend( GenerateRepositoryTagSiblingsTableNames( service_id ) )
         
+        table_names.append( GenerateRepositoryPetitionSummariesTableName( service_id ) )
+        
         table_names.append( GenerateRepositoryUpdateTableName( service_id ) )
         
         for table_name in table_names:
@@ -2525,7 +2582,7 @@ class DB( HydrusDB.HydrusDB ):
         return updates
         
     
-    def _RepositoryGenerateUpdates( self, service_id, begin, end ):
+    def _RepositoryGenerateUpdates( self, service_id, begin, end, finished_update_callable = None ):
         
         MAX_DEFINITIONS_ROWS = 50000
         MAX_CONTENT_ROWS = 250000
@@ -2534,8 +2591,8 @@ class DB( HydrusDB.HydrusDB ):
         
         updates = []
         
-        definitions_update_builder = HydrusNetwork.UpdateBuilder( HydrusNetwork.DefinitionsUpdate, MAX_DEFINITIONS_ROWS )
-        content_update_builder = HydrusNetwork.UpdateBuilder( HydrusNetwork.ContentUpdate, MAX_CONTENT_ROWS )
+        definitions_update_builder = HydrusNetwork.UpdateBuilder( HydrusNetwork.DefinitionsUpdate, MAX_DEFINITIONS_ROWS, finished_update_callable = finished_update_callable )
+        content_update_builder = HydrusNetwork.UpdateBuilder( HydrusNetwork.ContentUpdate, MAX_CONTENT_ROWS, finished_update_callable = finished_update_callable )
         
         ( service_hash_ids_table_name, service_tag_ids_table_name ) = GenerateRepositoryMasterMapTableNames( service_id )
         
@@ -2785,52 +2842,35 @@ class DB( HydrusDB.HydrusDB ):
         return account_info
         
     
-    def _RepositoryGetCountOfActionableAddTagParentPetitionsForAccounts( self, service_id: int, account_ids: collections.abc.Collection[ int ] ):
-        
-        ( current_tag_parents_table_name, deleted_tag_parents_table_name, pending_tag_parents_table_name, petitioned_tag_parents_table_name ) = GenerateRepositoryTagParentsTableNames( service_id )
+    def _RepositoryGetCountOfActionablePetitionsForAccount( self, service_id: int, content_type: int, status: int, account_id: int ) -> int:
         
-        total = 0
+        petition_summaries_table_name = GenerateRepositoryPetitionSummariesTableName( service_id )
         
-        for account_id in account_ids:
+        if status == HC.CONTENT_STATUS_PENDING:
             
-            ( count, ) = self._Execute( 'SELECT COUNT( * ) FROM ( SELECT DISTINCT reason_id FROM {} WHERE account_id = ? EXCEPT SELECT DISTINCT reason_id FROM {} WHERE account_id = ? );'.format( pending_tag_parents_table_name, petitioned_tag_parents_table_name ), ( account_id, account_id ) ).fetchone()
+            ( count, ) = self._Execute( f'SELECT COUNT( * ) FROM {petition_summaries_table_name} AS pending_summaries WHERE content_type = ? AND status = ? AND account_id = ? AND NOT EXISTS ( SELECT 1 FROM {petition_summaries_table_name} AS petitioned_summaries WHERE petitioned_summaries.content_type = pending_summaries.content_type AND petitioned_summaries.status = ? AND petitioned_summaries.account_id = pending_summaries.account_id AND petitioned_summaries.reason_id = pending_summaries.reason_id );', ( content_type, status, account_id, HC.CONTENT_STATUS_PETITIONED ) ).fetchone()
             
-            total += count
+        else:
+            
+            ( count, ) = self._Execute( f'SELECT COUNT( * ) FROM {petition_summaries_table_name} WHERE content_type = ? AND status = ? AND account_id = ?;', ( content_type, status, account_id ) ).fetchone()
             
         
-        return total
+        return count
         
     
-    def _RepositoryGetCountOfActionableAddTagSiblingPetitionsForAccounts( self, service_id: int, account_ids: collections.abc.Collection[ int ] ):
-        
-        ( current_tag_siblings_table_name, deleted_tag_siblings_table_name, pending_tag_siblings_table_name, petitioned_tag_siblings_table_name ) = GenerateRepositoryTagSiblingsTableNames( service_id )
+    def _RepositoryGetCountOfActionableAddTagParentPetitionsForAccounts( self, service_id: int, account_ids: collections.abc.Collection[ int ] ):
         
-        total = 0
+        return sum( ( self._RepositoryGetCountOfActionablePetitionsForAccount( service_id, HC.CONTENT_TYPE_TAG_PARENTS, HC.CONTENT_STATUS_PENDING, account_id ) for account_id in account_ids ) )
         
-        for account_id in account_ids:
-            
-            ( count, ) = self._Execute( 'SELECT COUNT( * ) FROM ( SELECT DISTINCT reason_id FROM {} WHERE account_id = ? EXCEPT SELECT DISTINCT reason_id FROM {} WHERE account_id = ? );'.format( pending_tag_siblings_table_name, petitioned_tag_siblings_table_name ), ( account_id, account_id ) ).fetchone()
-            
-            total += count
-            
+    
+    def _RepositoryGetCountOfActionableAddTagSiblingPetitionsForAccounts( self, service_id: int, account_ids: collections.abc.Collection[ int ] ):
         
-        return total
+        return sum( ( self._RepositoryGetCountOfActionablePetitionsForAccount( service_id, HC.CONTENT_TYPE_TAG_SIBLINGS, HC.CONTENT_STATUS_PENDING, account_id ) for account_id in account_ids ) )
         
     
     def _RepositoryGetCountOfActionableDeleteFilePetitionsForAccounts( self, service_id: int, account_ids: collections.abc.Collection[ int ] ):
         
-        ( current_files_table_name, deleted_files_table_name, pending_files_table_name, petitioned_files_table_name, ip_addresses_table_name ) = GenerateRepositoryFilesTableNames( service_id )
-        
-        total = 0
-        
-        for account_id in account_ids:
-            
-            ( count, ) = self._Execute( 'SELECT COUNT( * ) FROM ( SELECT DISTINCT reason_id FROM {} WHERE account_id = ? );'.format( petitioned_files_table_name ), ( account_id, ) ).fetchone()
-            
-            total += count
-            
-        
-        return total
+        return sum( ( self._RepositoryGetCountOfActionablePetitionsForAccount( service_id, HC.CONTENT_TYPE_FILES, HC.CONTENT_STATUS_PETITIONED, account_id ) for account_id in account_ids ) )
         
     
     def _RepositoryGetCountOfActionableDeleteMappingPetitionsForAccounts( self, service_id: int, service_tag_id: int, account_ids: collections.abc.Collection[ int ] ):
@@ -2851,34 +2891,12 @@ class DB( HydrusDB.HydrusDB ):
     
     def _RepositoryGetCountOfActionableDeleteTagParentPetitionsForAccounts( self, service_id: int, account_ids: collections.abc.Collection[ int ] ):
         
-        ( current_tag_parents_table_name, deleted_tag_parents_table_name, pending_tag_parents_table_name, petitioned_tag_parents_table_name ) = GenerateRepositoryTagParentsTableNames( service_id )
-        
-        total = 0
-        
-        for account_id in account_ids:
-            
-            ( count, ) = self._Execute( 'SELECT COUNT( * ) FROM ( SELECT DISTINCT reason_id FROM {} WHERE account_id = ? );'.format( petitioned_tag_parents_table_name ), ( account_id, ) ).fetchone()
-            
-            total += count
-            
-        
-        return total
+        return sum( ( self._RepositoryGetCountOfActionablePetitionsForAccount( service_id, HC.CONTENT_TYPE_TAG_PARENTS, HC.CONTENT_STATUS_PETITIONED, account_id ) for account_id in account_ids ) )
         
     
     def _RepositoryGetCountOfActionableDeleteTagSiblingPetitionsForAccounts( self, service_id: int, account_ids: collections.abc.Collection[ int ] ):
         
-        ( current_tag_siblings_table_name, deleted_tag_siblings_table_name, pending_tag_siblings_table_name, petitioned_tag_siblings_table_name ) = GenerateRepositoryTagSiblingsTableNames( service_id )
-        
-        total = 0
-        
-        for account_id in account_ids:
-            
-            ( count, ) = self._Execute( 'SELECT COUNT( * ) FROM ( SELECT DISTINCT reason_id FROM {} WHERE account_id = ? );'.format( petitioned_tag_siblings_table_name ), ( account_id, ) ).fetchone()
-            
-            total += count
-            
-        
-        return total
+        return sum( ( self._RepositoryGetCountOfActionablePetitionsForAccount( service_id, HC.CONTENT_TYPE_TAG_SIBLINGS, HC.CONTENT_STATUS_PETITIONED, account_id ) for account_id in account_ids ) )
         
     
     def _RepositoryGetCurrentMappingsCount( self, service_id, service_tag_id ):
@@ -2953,30 +2971,7 @@ class DB( HydrusDB.HydrusDB ):
     
     def _RepositoryGetFilePetitionsSummary( self, service_id, limit = 100, account_id = None, reason_id = None ) -> list:
         
-        ( current_files_table_name, deleted_files_table_name, pending_files_table_name, petitioned_files_table_name, ip_addresses_table_name ) = GenerateRepositoryFilesTableNames( service_id )
-        
-        petition_search_limit = max( limit * 5, 100 )
-        
-        preds = []
-        
-        if account_id is not None:
-            
-            preds.append( f'account_id = {account_id}' )
-            
-        
-        if reason_id is not None:
-            
-            preds.append( f'reason_id = {reason_id}' )
-            
-        
-        pred_string = ''
-        
-        if len( preds ) > 0:
-            
-            pred_string = ' WHERE {}'.format( ' AND '.join( preds ) )
-            
-        
-        potential_petition_ids = self._Execute( f'SELECT DISTINCT account_id, reason_id FROM {petitioned_files_table_name}{pred_string} ORDER BY account_id LIMIT ?;', ( petition_search_limit, ) ).fetchall()
+        potential_petition_ids = self._RepositoryGetPotentialPetitionIds( service_id, HC.CONTENT_TYPE_FILES, HC.CONTENT_STATUS_PETITIONED, limit, account_id = account_id, reason_id = reason_id )
         
         return self._RepositoryConvertPetitionIdsToSummary( HC.CONTENT_TYPE_FILES, HC.CONTENT_STATUS_PETITIONED, potential_petition_ids, limit )
         
@@ -3062,30 +3057,7 @@ class DB( HydrusDB.HydrusDB ):
     
     def _RepositoryGetMappingPetitionsSummary( self, service_id, limit = 100, account_id = None, reason_id = None ) -> list:
         
-        ( current_mappings_table_name, deleted_mappings_table_name, pending_mappings_table_name, petitioned_mappings_table_name ) = GenerateRepositoryMappingsTableNames( service_id )
-        
-        petition_search_limit = max( limit * 5, 100 )
-        
-        preds = []
-        
-        if account_id is not None:
-            
-            preds.append( f'account_id = {account_id}' )
-            
-        
-        if reason_id is not None:
-            
-            preds.append( f'reason_id = {reason_id}' )
-            
-        
-        pred_string = ''
-        
-        if len( preds ) > 0:
-            
-            pred_string = ' WHERE {}'.format( ' AND '.join( preds ) )
-            
-        
-        potential_petition_ids = self._Execute( f'SELECT DISTINCT account_id, reason_id FROM {petitioned_mappings_table_name}{pred_string} ORDER BY account_id LIMIT ?;', ( petition_search_limit, ) ).fetchall()
+        potential_petition_ids = self._RepositoryGetPotentialPetitionIds( service_id, HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_STATUS_PETITIONED, limit, account_id = account_id, reason_id = reason_id )
         
         return self._RepositoryConvertPetitionIdsToSummary( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_STATUS_PETITIONED, potential_petition_ids, limit )
         
@@ -3107,13 +3079,29 @@ class DB( HydrusDB.HydrusDB ):
         return master_hash_ids
         
     
-    def _RepositoryGetMasterTagId( self, service_id, service_tag_id ):
+    def _RepositoryGetMasterHashIdsToServiceHashIds( self, service_id, master_hash_ids, timestamp ) -> dict[ int, int ]:
         
         ( hash_id_map_table_name, tag_id_map_table_name ) = GenerateRepositoryMasterMapTableNames( service_id )
         
-        result = self._Execute( 'SELECT master_tag_id FROM ' + tag_id_map_table_name + ' WHERE service_tag_id = ?;', ( service_tag_id, ) ).fetchone()
+        self._ExecuteMany( 'INSERT OR IGNORE INTO ' + hash_id_map_table_name + ' ( master_hash_id, hash_id_timestamp ) VALUES ( ?, ? );', ( ( master_hash_id, timestamp ) for master_hash_id in master_hash_ids ) )
         
-        if result is None:
+        self._RepositoryUpdateServiceInfo( service_id, HC.SERVICE_INFO_NUM_FILE_HASHES, self._GetRowCount() )
+        
+        with self._MakeTemporaryIntegerTable( master_hash_ids, 'master_hash_id' ) as temp_hash_ids_table_name:
+            
+            master_hash_ids_to_service_hash_ids = dict( self._Execute( 'SELECT master_hash_id, service_hash_id FROM {} CROSS JOIN {} USING ( master_hash_id );'.format( temp_hash_ids_table_name, hash_id_map_table_name ) ) )
+            
+        
+        return master_hash_ids_to_service_hash_ids
+        
+    
+    def _RepositoryGetMasterTagId( self, service_id, service_tag_id ):
+        
+        ( hash_id_map_table_name, tag_id_map_table_name ) = GenerateRepositoryMasterMapTableNames( service_id )
+        
+        result = self._Execute( 'SELECT master_tag_id FROM ' + tag_id_map_table_name + ' WHERE service_tag_id = ?;', ( service_tag_id, ) ).fetchone()
+        
+        if result is None:
             
             raise HydrusExceptions.DataMissing( 'Missing master_tag_id map error!' )
             
@@ -3123,6 +3111,22 @@ class DB( HydrusDB.HydrusDB ):
         return master_tag_id
         
     
+    def _RepositoryGetMasterTagIdsToServiceTagIds( self, service_id, master_tag_ids, timestamp ) -> dict[ int, int ]:
+        
+        ( hash_id_map_table_name, tag_id_map_table_name ) = GenerateRepositoryMasterMapTableNames( service_id )
+        
+        self._ExecuteMany( 'INSERT OR IGNORE INTO ' + tag_id_map_table_name + ' ( master_tag_id, tag_id_timestamp ) VALUES ( ?, ? );', ( ( master_tag_id, timestamp ) for master_tag_id in master_tag_ids ) )
+        
+        self._RepositoryUpdateServiceInfo( service_id, HC.SERVICE_INFO_NUM_TAGS, self._GetRowCount() )
+        
+        with self._MakeTemporaryIntegerTable( master_tag_ids, 'master_tag_id' ) as temp_tag_ids_table_name:
+            
+            master_tag_ids_to_service_tag_ids = dict( self._Execute( 'SELECT master_tag_id, service_tag_id FROM {} CROSS JOIN {} USING ( master_tag_id );'.format( temp_tag_ids_table_name, tag_id_map_table_name ) ) )
+            
+        
+        return master_tag_ids_to_service_tag_ids
+        
+    
     def _RepositoryGetNumPetitions( self, service_key, account, subject_account_key = None ):
         
         service_id = self._GetServiceId( service_key )
@@ -3346,6 +3350,41 @@ class DB( HydrusDB.HydrusDB ):
         return petitions_summary
         
     
+    def _RepositoryGetPotentialPetitionIds( self, service_id: int, content_type: int, status: int, limit: int, account_id = None, reason_id = None ) -> list[ tuple[ int, int ] ]:
+        
+        petition_summaries_table_name = GenerateRepositoryPetitionSummariesTableName( service_id )
+        
+        petition_search_limit = max( limit * 5, 100 )
+        
+        preds = [ 'content_type = ?', 'status = ?' ]
+        params = [ content_type, status ]
+        
+        if account_id is not None:
+            
+            preds.append( 'account_id = ?' )
+            params.append( account_id )
+            
+        
+        if reason_id is not None:
+            
+            preds.append( 'reason_id = ?' )
+            params.append( reason_id )
+            
+        
+        if status == HC.CONTENT_STATUS_PENDING:
+            
+            # a pend that comes with a petition under the same account and reason is a 'replace', which we present as the petition
+            preds.append( f'NOT EXISTS ( SELECT 1 FROM {petition_summaries_table_name} AS petitioned_summaries WHERE petitioned_summaries.content_type = pending_summaries.content_type AND petitioned_summaries.status = ? AND petitioned_summaries.account_id = pending_summaries.account_id AND petitioned_summaries.reason_id = pending_summaries.reason_id )' )
+            params.append( HC.CONTENT_STATUS_PETITIONED )
+            
+        
+        pred_string = ' AND '.join( preds )
+        
+        params.append( petition_search_limit )
+        
+        return self._Execute( f'SELECT account_id, reason_id FROM {petition_summaries_table_name} AS pending_summaries WHERE {pred_string} ORDER BY account_id LIMIT ?;', params ).fetchall()
+        
+    
     def _RepositoryGetServiceHashId( self, service_id, master_hash_id, timestamp ):
         
         ( hash_id_map_table_name, tag_id_map_table_name ) = GenerateRepositoryMasterMapTableNames( service_id )
@@ -3372,42 +3411,7 @@ class DB( HydrusDB.HydrusDB ):
     
     def _RepositoryGetServiceHashIds( self, service_id, master_hash_ids, timestamp ):
         
-        ( hash_id_map_table_name, tag_id_map_table_name ) = GenerateRepositoryMasterMapTableNames( service_id )
-        
-        service_hash_ids = set()
-        master_hash_ids_not_in_table = set()
-        
-        for master_hash_id in master_hash_ids:
-            
-            result = self._Execute( 'SELECT service_hash_id FROM ' + hash_id_map_table_name + ' WHERE master_hash_id = ?;', ( master_hash_id, ) ).fetchone()
-            
-            if result is None:
-                
-                master_hash_ids_not_in_table.add( master_hash_id )
-                
-            else:
-                
-                ( service_hash_id, ) = result
-                
-                service_hash_ids.add( service_hash_id )
-                
-            
-        
-        if len( master_hash_ids_not_in_table ) > 0:
-            
-            self._ExecuteMany( 'INSERT INTO ' + hash_id_map_table_name + ' ( master_hash_id, hash_id_timestamp ) VALUES ( ?, ? );', ( ( master_hash_id, timestamp ) for master_hash_id in master_hash_ids_not_in_table ) )
-            
-            for master_hash_id in master_hash_ids_not_in_table:
-                
-                ( service_hash_id, ) = self._Execute( 'SELECT service_hash_id FROM ' + hash_id_map_table_name + ' WHERE master_hash_id = ?;', ( master_hash_id, ) ).fetchone()
-                
-                service_hash_ids.add( service_hash_id )
-                
-            
-            self._RepositoryUpdateServiceInfo( service_id, HC.SERVICE_INFO_NUM_FILE_HASHES, len( master_hash_ids_not_in_table ) )
-            
-        
-        return service_hash_ids
+        return set( self._RepositoryGetMasterHashIdsToServiceHashIds( service_id, master_hash_ids, timestamp ).values() )
         
     
     def _RepositoryGetServiceInfoSpecificForAccount( self, service_id: int, info_type: int, account_id: int ):
@@ -3439,7 +3443,7 @@ class DB( HydrusDB.HydrusDB ):
             
         elif info_type == HC.SERVICE_INFO_NUM_ACTIONABLE_FILE_DELETE_PETITIONS:
             
-            ( info, ) = self._Execute( 'SELECT COUNT( * ) FROM ( SELECT DISTINCT reason_id FROM {} WHERE account_id = ? );'.format( petitioned_files_table_name ), ( account_id, ) ).fetchone()
+            info = self._RepositoryGetCountOfActionablePetitionsForAccount( service_id, HC.CONTENT_TYPE_FILES, HC.CONTENT_STATUS_PETITIONED, account_id )
             
         elif info_type == HC.SERVICE_INFO_NUM_MAPPINGS:
             
@@ -3483,11 +3487,11 @@ class DB( HydrusDB.HydrusDB ):
             
         elif info_type == HC.SERVICE_INFO_NUM_ACTIONABLE_SIBLING_ADD_PETITIONS:
             
-            ( info, ) = self._Execute( 'SELECT COUNT( * ) FROM ( SELECT DISTINCT reason_id FROM {} WHERE account_id = ? EXCEPT SELECT DISTINCT reason_id FROM {} WHERE account_id = ? );'.format( pending_tag_siblings_table_name, petitioned_tag_siblings_table_name ), ( account_id, account_id ) ).fetchone()
+            info = self._RepositoryGetCountOfActionablePetitionsForAccount( service_id, HC.CONTENT_TYPE_TAG_SIBLINGS, HC.CONTENT_STATUS_PENDING, account_id )
             
         elif info_type == HC.SERVICE_INFO_NUM_ACTIONABLE_SIBLING_DELETE_PETITIONS:
             
-            ( info, ) = self._Execute( 'SELECT COUNT( * ) FROM ( SELECT DISTINCT reason_id FROM {} WHERE account_id = ? );'.format( petitioned_tag_siblings_table_name ), ( account_id, ) ).fetchone()
+            info = self._RepositoryGetCountOfActionablePetitionsForAccount( service_id, HC.CONTENT_TYPE_TAG_SIBLINGS, HC.CONTENT_STATUS_PETITIONED, account_id )
             
         elif info_type == HC.SERVICE_INFO_NUM_TAG_PARENTS:
             
@@ -3507,11 +3511,11 @@ class DB( HydrusDB.HydrusDB ):
             
         elif info_type == HC.SERVICE_INFO_NUM_ACTIONABLE_PARENT_ADD_PETITIONS:
             
-            ( info, ) = self._Execute( 'SELECT COUNT( * ) FROM ( SELECT DISTINCT reason_id FROM {} WHERE account_id = ? EXCEPT SELECT DISTINCT reason_id FROM {} WHERE account_id = ? );'.format( pending_tag_parents_table_name, petitioned_tag_parents_table_name ), ( account_id, account_id ) ).fetchone()
+            info = self._RepositoryGetCountOfActionablePetitionsForAccount( service_id, HC.CONTENT_TYPE_TAG_PARENTS, HC.CONTENT_STATUS_PENDING, account_id )
             
         elif info_type == HC.SERVICE_INFO_NUM_ACTIONABLE_PARENT_DELETE_PETITIONS:
             
-            ( info, ) = self._Execute( 'SELECT COUNT( * ) FROM ( SELECT DISTINCT reason_id FROM {} WHERE account_id = ? );'.format( petitioned_tag_parents_table_name ), ( account_id, ) ).fetchone()
+            info = self._RepositoryGetCountOfActionablePetitionsForAccount( service_id, HC.CONTENT_TYPE_TAG_PARENTS, HC.CONTENT_STATUS_PETITIONED, account_id )
             
         else:
             
@@ -3589,25 +3593,7 @@ class DB( HydrusDB.HydrusDB ):
     
     def _RepositoryGetTagParentPendsSummary( self, service_id, limit = 100, account_id = None, reason_id = None ) -> list:
         
-        ( current_tag_parents_table_name, deleted_tag_parents_table_name, pending_tag_parents_table_name, petitioned_tag_parents_table_name ) = GenerateRepositoryTagParentsTableNames( service_id )
-        
-        petition_search_limit = max( limit * 5, 100 )
-        
-        preds = [ f'1 NOT IN ( SELECT 1 FROM {petitioned_tag_parents_table_name} WHERE account_id = a1 AND reason_id = r1 )' ]
-        
-        if account_id is not None:
-            
-            preds.append( f'account_id = {account_id}' )
-            
-        
-        if reason_id is not None:
-            
-            preds.append( f'reason_id = {reason_id}' )
-            
-        
-        pred_string = ' WHERE {}'.format( ' AND '.join( preds ) )
-        
-        potential_petition_ids = self._Execute( f'SELECT DISTINCT account_id as a1, reason_id as r1 FROM {pending_tag_parents_table_name}{pred_string} ORDER BY account_id LIMIT ?;', ( petition_search_limit, ) ).fetchall()
+        potential_petition_ids = self._RepositoryGetPotentialPetitionIds( service_id, HC.CONTENT_TYPE_TAG_PARENTS, HC.CONTENT_STATUS_PENDING, limit, account_id = account_id, reason_id = reason_id )
         
         return self._RepositoryConvertPetitionIdsToSummary( HC.CONTENT_TYPE_TAG_PARENTS, HC.CONTENT_STATUS_PENDING, potential_petition_ids, limit )
         
@@ -3686,30 +3672,7 @@ class DB( HydrusDB.HydrusDB ):
     
     def _RepositoryGetTagParentPetitionsSummary( self, service_id, limit = 100, account_id = None, reason_id = None ) -> list:
         
-        ( current_tag_parents_table_name, deleted_tag_parents_table_name, pending_tag_parents_table_name, petitioned_tag_parents_table_name ) = GenerateRepositoryTagParentsTableNames( service_id )
-        
-        petition_search_limit = max( limit * 5, 100 )
-        
-        preds = []
-        
-        if account_id is not None:
-            
-            preds.append( f'account_id = {account_id}' )
-            
-        
-        if reason_id is not None:
-            
-            preds.append( f'reason_id = {reason_id}' )
-            
-        
-        pred_string = ''
-        
-        if len( preds ) > 0:
-            
-            pred_string = ' WHERE {}'.format( ' AND '.join( preds ) )
-            
-        
-        potential_petition_ids = self._Execute( f'SELECT DISTINCT account_id, reason_id FROM {petitioned_tag_parents_table_name}{pred_string} ORDER BY account_id LIMIT ?;', ( petition_search_limit, ) ).fetchall()
+        potential_petition_ids = self._RepositoryGetPotentialPetitionIds( service_id, HC.CONTENT_TYPE_TAG_PARENTS, HC.CONTENT_STATUS_PETITIONED, limit, account_id = account_id, reason_id = reason_id )
         
         return self._RepositoryConvertPetitionIdsToSummary( HC.CONTENT_TYPE_TAG_PARENTS, HC.CONTENT_STATUS_PETITIONED, potential_petition_ids, limit )
         
@@ -3758,25 +3721,7 @@ class DB( HydrusDB.HydrusDB ):
     
     def _RepositoryGetTagSiblingPendsSummary( self, service_id, limit = 100, account_id = None, reason_id = None ) -> list:
         
-        ( current_tag_siblings_table_name, deleted_tag_siblings_table_name, pending_tag_siblings_table_name, petitioned_tag_siblings_table_name ) = GenerateRepositoryTagSiblingsTableNames( service_id )
-        
-        petition_search_limit = max( limit * 5, 100 )
-        
-        preds = [ f'1 NOT IN ( SELECT 1 FROM {petitioned_tag_siblings_table_name} WHERE account_id = a1 AND reason_id = r1 )' ]
-        
-        if account_id is not None:
-            
-            preds.append( f'account_id = {account_id}' )
-            
-        
-        if reason_id is not None:
-            
-            preds.append( f'reason_id = {reason_id}' )
-            
-        
-        pred_string = ' WHERE {}'.format( ' AND '.join( preds ) )
-        
-        potential_petition_ids = self._Execute( f'SELECT DISTINCT account_id as a1, reason_id as r1 FROM {pending_tag_siblings_table_name}{pred_string} ORDER BY account_id LIMIT ?;', ( petition_search_limit, ) ).fetchall()
+        potential_petition_ids = self._RepositoryGetPotentialPetitionIds( service_id, HC.CONTENT_TYPE_TAG_SIBLINGS, HC.CONTENT_STATUS_PENDING, limit, account_id = account_id, reason_id = reason_id )
         
         return self._RepositoryConvertPetitionIdsToSummary( HC.CONTENT_TYPE_TAG_SIBLINGS, HC.CONTENT_STATUS_PENDING, potential_petition_ids, limit )
         
@@ -3855,30 +3800,7 @@ class DB( HydrusDB.HydrusDB ):
     
     def _RepositoryGetTagSiblingPetitionsSummary( self, service_id, limit = 100, account_id = None, reason_id = None ) -> list:
         
-        ( current_tag_siblings_table_name, deleted_tag_siblings_table_name, pending_tag_siblings_table_name, petitioned_tag_siblings_table_name ) = GenerateRepositoryTagSiblingsTableNames( service_id )
-        
-        petition_search_limit = max( limit * 5, 100 )
-        
-        preds = []
-        
-        if account_id is not None:
-            
-            preds.append( f'account_id = {account_id}' )
-            
-        
-        if reason_id is not None:
-            
-            preds.append( f'reason_id = {reason_id}' )
-            
-        
-        pred_string = ''
-        
-        if len( preds ) > 0:
-            
-            pred_string = ' WHERE {}'.format( ' AND '.join( preds ) )
-            
-        
-        potential_petition_ids = self._Execute( f'SELECT DISTINCT account_id, reason_id FROM {petitioned_tag_siblings_table_name}{pred_string} ORDER BY account_id LIMIT ?;', ( petition_search_limit, ) ).fetchall()
+        potential_petition_ids = self._RepositoryGetPotentialPetitionIds( service_id, HC.CONTENT_TYPE_TAG_SIBLINGS, HC.CONTENT_STATUS_PETITIONED, limit, account_id = account_id, reason_id = reason_id )
         
         return self._RepositoryConvertPetitionIdsToSummary( HC.CONTENT_TYPE_TAG_SIBLINGS, HC.CONTENT_STATUS_PETITIONED, potential_petition_ids, limit )
         
@@ -3980,6 +3902,8 @@ class DB( HydrusDB.HydrusDB ):
         
         pre_change_count = self._RepositoryGetCountOfActionableAddTagParentPetitionsForAccounts( service_id, ( account_id, ) )
         
+        petition_count_deltas = [ ( account_id, existing_reason_id, -1 ) for ( existing_reason_id, ) in self._Execute( 'SELECT reason_id FROM {} WHERE child_master_tag_id = ? AND parent_master_tag_id = ? AND account_id = ?;'.format( pending_tag_parents_table_name ), ( child_master_tag_id, parent_master_tag_id, account_id ) ) ]
+        
         self._Execute( 'DELETE FROM {} WHERE child_master_tag_id = ? AND parent_master_tag_id = ? AND account_id = ?;'.format( pending_tag_parents_table_name ), ( child_master_tag_id, parent_master_tag_id, account_id ) )
         
         num_raw_deleted = self._GetRowCount()
@@ -3990,6 +3914,10 @@ class DB( HydrusDB.HydrusDB ):
         
         self._RepositoryUpdateServiceInfo( service_id, HC.SERVICE_INFO_NUM_PENDING_TAG_PARENTS, num_raw_added - num_raw_deleted )
         
+        petition_count_deltas.append( ( account_id, reason_id, num_raw_added ) )
+        
+        self._RepositoryUpdatePetitionSummaries( service_id, HC.CONTENT_TYPE_TAG_PARENTS, HC.CONTENT_STATUS_PENDING, petition_count_deltas )
+        
         post_change_count = self._RepositoryGetCountOfActionableAddTagParentPetitionsForAccounts( service_id, ( account_id, ) )
         
         self._RepositoryUpdateServiceInfo( service_id, HC.SERVICE_INFO_NUM_ACTIONABLE_PARENT_ADD_PETITIONS, post_change_count - pre_change_count )
@@ -4017,6 +3945,8 @@ class DB( HydrusDB.HydrusDB ):
         
         pre_change_count = self._RepositoryGetCountOfActionableAddTagSiblingPetitionsForAccounts( service_id, ( account_id, ) )
         
+        petition_count_deltas = [ ( account_id, existing_reason_id, -1 ) for ( existing_reason_id, ) in self._Execute( 'SELECT reason_id FROM {} WHERE bad_master_tag_id = ? AND good_master_tag_id = ? AND account_id = ?;'.format( pending_tag_siblings_table_name ), ( bad_master_tag_id, good_master_tag_id, account_id ) ) ]
+        
         self._Execute( 'DELETE FROM {} WHERE bad_master_tag_id = ? AND good_master_tag_id = ? AND account_id = ?;'.format( pending_tag_siblings_table_name ), ( bad_master_tag_id, good_master_tag_id, account_id ) )
         
         num_raw_deleted = self._GetRowCount()
@@ -4027,6 +3957,10 @@ class DB( HydrusDB.HydrusDB ):
         
         self._RepositoryUpdateServiceInfo( service_id, HC.SERVICE_INFO_NUM_PENDING_TAG_SIBLINGS, num_raw_added - num_raw_deleted )
         
+        petition_count_deltas.append( ( account_id, reason_id, num_raw_added ) )
+        
+        self._RepositoryUpdatePetitionSummaries( service_id, HC.CONTENT_TYPE_TAG_SIBLINGS, HC.CONTENT_STATUS_PENDING, petition_count_deltas )
+        
         post_change_count = self._RepositoryGetCountOfActionableAddTagSiblingPetitionsForAccounts( service_id, ( account_id, ) )
         
         self._RepositoryUpdateServiceInfo( service_id, HC.SERVICE_INFO_NUM_ACTIONABLE_SIBLING_ADD_PETITIONS, post_change_count - pre_change_count )
@@ -4041,6 +3975,11 @@ class DB( HydrusDB.HydrusDB ):
             valid_service_hash_ids = self._STL( self._Execute( 'SELECT service_hash_id FROM {} CROSS JOIN {} USING ( service_hash_id );'.format( temp_hash_ids_table_name, current_files_table_name ) ) )
             
         
+        with self._MakeTemporaryIntegerTable( valid_service_hash_ids, 'service_hash_id' ) as temp_hash_ids_table_name:
+            
+            petition_count_deltas = [ ( account_id, existing_reason_id, - count ) for ( existing_reason_id, count ) in self._Execute( 'SELECT reason_id, COUNT( * ) FROM {} CROSS JOIN {} USING ( service_hash_id ) WHERE account_id = ? GROUP BY reason_id;'.format( temp_hash_ids_table_name, petitioned_files_table_name ), ( account_id, ) ) ]
+            
+        
         pre_change_count = self._RepositoryGetCountOfActionableDeleteFilePetitionsForAccounts( service_id, ( account_id, ) )
         
         self._ExecuteMany( 'DELETE FROM {} WHERE service_hash_id = ? AND account_id = ?;'.format( petitioned_files_table_name ), ( ( service_hash_id, account_id ) for service_hash_id in valid_service_hash_ids ) )
@@ -4053,6 +3992,10 @@ class DB( HydrusDB.HydrusDB ):
         
         self._RepositoryUpdateServiceInfo( service_id, HC.SERVICE_INFO_NUM_PETITIONED_FILES, num_raw_added - num_raw_deleted )
         
+        petition_count_deltas.append( ( account_id, reason_id, num_raw_added ) )
+        
+        self._RepositoryUpdatePetitionSummaries( service_id, HC.CONTENT_TYPE_FILES, HC.CONTENT_STATUS_PETITIONED, petition_count_deltas )
+        
         post_change_count = self._RepositoryGetCountOfActionableDeleteFilePetitionsForAccounts( service_id, ( account_id, ) )
         
         self._RepositoryUpdateServiceInfo( service_id, HC.SERVICE_INFO_NUM_ACTIONABLE_FILE_DELETE_PETITIONS, post_change_count - pre_change_count )
@@ -4067,6 +4010,11 @@ class DB( HydrusDB.HydrusDB ):
             valid_service_hash_ids = self._STL( self._Execute( 'SELECT service_hash_id FROM {} CROSS JOIN {} USING ( service_hash_id ) WHERE service_tag_id = ?;'.format( temp_hash_ids_table_name, current_mappings_table_name ), ( service_tag_id, ) ) )
             
         
+        with self._MakeTemporaryIntegerTable( valid_service_hash_ids, 'service_hash_id' ) as temp_hash_ids_table_name:
+            
+            petition_count_deltas = [ ( account_id, existing_reason_id, - count ) for ( existing_reason_id, count ) in self._Execute( 'SELECT reason_id, COUNT( * ) FROM {} CROSS JOIN {} USING ( service_hash_id ) WHERE service_tag_id = ? AND account_id = ? GROUP BY reason_id;'.format( temp_hash_ids_table_name, petitioned_mappings_table_name ), ( service_tag_id, account_id ) ) ]
+            
+        
         pre_change_count = self._RepositoryGetCountOfActionableDeleteMappingPetitionsForAccounts( service_id, service_tag_id, ( account_id, ) )
         
         self._ExecuteMany( 'DELETE FROM {} WHERE service_tag_id = ? AND service_hash_id = ? AND account_id = ?;'.format( petitioned_mappings_table_name ), ( ( service_tag_id, service_hash_id, account_id ) for service_hash_id in valid_service_hash_ids ) )
@@ -4079,6 +4027,10 @@ class DB( HydrusDB.HydrusDB ):
         
         self._RepositoryUpdateServiceInfo( service_id, HC.SERVICE_INFO_NUM_PETITIONED_MAPPINGS, num_raw_added - num_raw_deleted )
         
+        petition_count_deltas.append( ( account_id, reason_id, num_raw_added ) )
+        
+        self._RepositoryUpdatePetitionSummaries( service_id, HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_STATUS_PETITIONED, petition_count_deltas )
+        
         post_change_count = self._RepositoryGetCountOfActionableDeleteMappingPetitionsForAccounts( service_id, service_tag_id, ( account_id, ) )
         
         self._RepositoryUpdateServiceInfo( service_id, HC.SERVICE_INFO_NUM_ACTIONABLE_MAPPING_DELETE_PETITIONS, post_change_count - pre_change_count )
@@ -4099,6 +4051,8 @@ class DB( HydrusDB.HydrusDB ):
         
         pre_delete_change_count = self._RepositoryGetCountOfActionableDeleteTagParentPetitionsForAccounts( service_id, ( account_id, ) )
         
+        petition_count_deltas = [ ( account_id, existing_reason_id, -1 ) for ( existing_reason_id, ) in self._Execute( 'SELECT reason_id FROM {} WHERE child_service_tag_id = ? AND parent_service_tag_id = ? AND account_id = ?;'.format( petitioned_tag_parents_table_name ), ( child_service_tag_id, parent_service_tag_id, account_id ) ) ]
+        
         self._Execute( 'DELETE FROM {} WHERE child_service_tag_id = ? AND parent_service_tag_id = ? AND account_id = ?;'.format( petitioned_tag_parents_table_name ), ( child_service_tag_id, parent_service_tag_id, account_id ) )
         
         num_raw_deleted = self._GetRowCount()
@@ -4109,6 +4063,10 @@ class DB( HydrusDB.HydrusDB ):
         
         self._RepositoryUpdateServiceInfo( service_id, HC.SERVICE_INFO_NUM_PETITIONED_TAG_PARENTS, num_raw_added - num_raw_deleted )
         
+        petition_count_deltas.append( ( account_id, reason_id, num_raw_added ) )
+        
+        self._RepositoryUpdatePetitionSummaries( service_id, HC.CONTENT_TYPE_TAG_PARENTS, HC.CONTENT_STATUS_PETITIONED, petition_count_deltas )
+        
         post_add_change_count = self._RepositoryGetCountOfActionableAddTagParentPetitionsForAccounts( service_id, ( account_id, ) )
         
         post_delete_change_count = self._RepositoryGetCountOfActionableDeleteTagParentPetitionsForAccounts( service_id, ( account_id, ) )
@@ -4133,6 +4091,8 @@ class DB( HydrusDB.HydrusDB ):
         
         pre_delete_change_count = self._RepositoryGetCountOfActionableDeleteTagSiblingPetitionsForAccounts( service_id, ( account_id, ) )
         
+        petition_count_deltas = [ ( account_id, existing_reason_id, -1 ) for ( existing_reason_id, ) in self._Execute( 'SELECT reason_id FROM {} WHERE bad_service_tag_id = ? AND good_service_tag_id = ? AND account_id = ?;'.format( petitioned_tag_siblings_table_name ), ( bad_service_tag_id, good_service_tag_id, account_id ) ) ]
+        
         self._Execute( 'DELETE FROM {} WHERE bad_service_tag_id = ? AND good_service_tag_id = ? AND account_id = ?;'.format( petitioned_tag_siblings_table_name ), ( bad_service_tag_id, good_service_tag_id, account_id ) )
         
         num_raw_deleted = self._GetRowCount()
@@ -4143,6 +4103,10 @@ class DB( HydrusDB.HydrusDB ):
         
         self._RepositoryUpdateServiceInfo( service_id, HC.SERVICE_INFO_NUM_PETITIONED_TAG_SIBLINGS, num_raw_added - num_raw_deleted )
         
+        petition_count_deltas.append( ( account_id, reason_id, num_raw_added ) )
+        
+        self._RepositoryUpdatePetitionSummaries( service_id, HC.CONTENT_TYPE_TAG_SIBLINGS, HC.CONTENT_STATUS_PETITIONED, petition_count_deltas )
+        
         post_add_change_count = self._RepositoryGetCountOfActionableAddTagSiblingPetitionsForAccounts( service_id, ( account_id, ) )
         
         post_delete_change_count = self._RepositoryGetCountOfActionableDeleteTagSiblingPetitionsForAccounts( service_id, ( account_id, ) )
@@ -4225,6 +4189,22 @@ class DB( HydrusDB.HydrusDB ):
         can_create_tag_siblings = account.HasPermission( HC.CONTENT_TYPE_TAG_SIBLINGS, HC.PERMISSION_ACTION_CREATE )
         can_moderate_tag_siblings = account.HasPermission( HC.CONTENT_TYPE_TAG_SIBLINGS, HC.PERMISSION_ACTION_MODERATE )
         
+        stage_timings = []
+        stage_started = HydrusTime.GetNowPrecise()
+        
+        def record_stage( stage_name ):
+            
+            nonlocal stage_started
+            
+            now_precise = HydrusTime.GetNowPrecise()
+            
+            stage_timings.append( ( stage_name, now_precise - stage_started ) )
+            
+            stage_started = now_precise
+            
+        
+        num_mappings = 0
+        
         if can_moderate_files or can_petition_files:
             
             for ( hashes, reason ) in client_to_server_update.GetContentDataIterator( HC.CONTENT_TYPE_FILES, HC.CONTENT_UPDATE_PETITION ):
@@ -4258,49 +4238,39 @@ class DB( HydrusDB.HydrusDB ):
                 
             
         
+        record_stage( 'files' )
+        
         #
         
         # later add pend mappings here however that is neat
         
+        # a heavy uploader can send a million mappings at once, so we resolve every tag and hash in each group up front in a few set-based statements and then write per tag with INSERT ... SELECT
+        
         if can_create_mappings or can_moderate_mappings:
             
-            for ( ( tag, hashes ), reason ) in client_to_server_update.GetContentDataIterator( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_PEND ):
-                
-                try:
-                    
-                    master_tag_id = self._GetMasterTagId( tag )
-                    
-                except Exception as e:
-                    
-                    continue
-                    
-                
-                master_hash_ids = self._GetMasterHashIds( hashes )
+            resolved_mapping_rows = self._RepositoryResolveMappingRows( service_id, client_to_server_update.GetContentDataIterator( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_PEND ), timestamp )
+            
+            record_stage( 'mapping pend ids' )
+            
+            overwrite_deleted = can_moderate_mappings
+            
+            for ( service_tag_id, service_hash_ids, reason ) in resolved_mapping_rows:
                 
-                overwrite_deleted = can_moderate_mappings
+                self._RepositoryAddMappings( service_id, account_id, service_tag_id, service_hash_ids, overwrite_deleted, timestamp )
                 
-                self._RepositoryAddMappings( service_id, account_id, master_tag_id, master_hash_ids, overwrite_deleted, timestamp )
+                num_mappings += len( service_hash_ids )
                 
             
+            record_stage( 'mapping pend writes' )
+            
         
         if can_moderate_mappings or can_petition_mappings:
             
-            for ( ( tag, hashes ), reason ) in client_to_server_update.GetContentDataIterator( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_PETITION ):
-                
-                try:
-                    
-                    master_tag_id = self._GetMasterTagId( tag )
-                    
-                except Exception as e:
-                    
-                    continue
-                    
-                
-                service_tag_id = self._RepositoryGetServiceTagId( service_id, master_tag_id, timestamp )
-                
-                master_hash_ids = self._GetMasterHashIds( hashes )
-                
-                service_hash_ids = self._RepositoryGetServiceHashIds( service_id, master_hash_ids, timestamp )
+            resolved_mapping_rows = self._RepositoryResolveMappingRows( service_id, client_to_server_update.GetContentDataIterator( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_PETITION ), timestamp )
+            
+            record_stage( 'mapping petition ids' )
+            
+            for ( service_tag_id, service_hash_ids, reason ) in resolved_mapping_rows:
                 
                 if can_moderate_mappings:
                     
@@ -4313,29 +4283,26 @@ class DB( HydrusDB.HydrusDB ):
                     self._RepositoryPetitionMappings( service_id, account_id, service_tag_id, service_hash_ids, reason_id )
                     
                 
+                num_mappings += len( service_hash_ids )
+                
+            
+            record_stage( 'mapping petition writes' )
             
         
         if can_moderate_mappings:
             
-            for ( ( tag, hashes ), reason ) in client_to_server_update.GetContentDataIterator( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_DENY_PETITION ):
-                
-                try:
-                    
-                    master_tag_id = self._GetMasterTagId( tag )
-                    
-                except Exception as e:
-                    
-                    continue
-                    
-                
-                service_tag_id = self._RepositoryGetServiceTagId( service_id, master_tag_id, timestamp )
-                
-                master_hash_ids = self._GetMasterHashIds( hashes )
-                
-                service_hash_ids = self._RepositoryGetServiceHashIds( service_id, master_hash_ids, timestamp )
+            resolved_mapping_rows = self._RepositoryResolveMappingRows( service_id, client_to_server_update.GetContentDataIterator( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_DENY_PETITION ), timestamp )
+            
+            record_stage( 'mapping deny ids' )
+            
+            for ( service_tag_id, service_hash_ids, reason ) in resolved_mapping_rows:
                 
                 self._RepositoryDenyMappingPetition( service_id, service_tag_id, service_hash_ids )
                 
+                num_mappings += len( service_hash_ids )
+                
+            
+            record_stage( 'mapping deny writes' )
             
         
         #
@@ -4432,6 +4399,8 @@ class DB( HydrusDB.HydrusDB ):
                 
             
         
+        record_stage( 'tag parents' )
+        
         #
         
         if can_create_tag_siblings or can_moderate_tag_siblings or can_petition_tag_siblings:
@@ -4528,6 +4497,46 @@ class DB( HydrusDB.HydrusDB ):
                 
             
         
+        record_stage( 'tag siblings' )
+        
+        total_time = sum( ( time_took for ( stage_name, time_took ) in stage_timings ) )
+        
+        if total_time > CLIENT_TO_SERVER_UPDATE_REPORT_THRESHOLD or HG.db_report_mode:
+            
+            stage_summary = ', '.join( ( '{} {}'.format( stage_name, HydrusTime.TimeDeltaToPrettyTimeDelta( time_took ) ) for ( stage_name, time_took ) in stage_timings ) )
+            
+            HydrusData.Print( 'Processed an update with {} mappings for "{}" in {}: {}'.format( HydrusNumbers.ToHumanInt( num_mappings ), self._GetServiceName( service_id ), HydrusTime.TimeDeltaToPrettyTimeDelta( total_time ), stage_summary ) )
+            
+        
+    
+    def _RepositoryRegeneratePetitionSummaries( self, service_id: int ):
+        
+        ( current_files_table_name, deleted_files_table_name, pending_files_table_name, petitioned_files_table_name, ip_addresses_table_name ) = GenerateRepositoryFilesTableNames( service_id )
+        ( current_mappings_table_name, deleted_mappings_table_name, pending_mappings_table_name, petitioned_mappings_table_name ) = GenerateRepositoryMappingsTableNames( service_id )
+        ( current_tag_parents_table_name, deleted_tag_parents_table_name, pending_tag_parents_table_name, petitioned_tag_parents_table_name ) = GenerateRepositoryTagParentsTableNames( service_id )
+        ( current_tag_siblings_table_name, deleted_tag_siblings_table_name, pending_tag_siblings_table_name, petitioned_tag_siblings_table_name ) = GenerateRepositoryTagSiblingsTableNames( service_id )
+        
+        petition_summaries_table_name = GenerateRepositoryPetitionSummariesTableName( service_id )
+        
+        self._Execute( 'DELETE FROM {};'.format( petition_summaries_table_name ) )
+        
+        # the raw petition tables do not record when a row came in, so a regenerated summary is as old as the regen
+        now = HydrusTime.GetNow()
+        
+        summary_sources = [
+            ( HC.CONTENT_TYPE_FILES, HC.CONTENT_STATUS_PETITIONED, petitioned_files_table_name ),
+            ( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_STATUS_PETITIONED, petitioned_mappings_table_name ),
+            ( HC.CONTENT_TYPE_TAG_PARENTS, HC.CONTENT_STATUS_PENDING, pending_tag_parents_table_name ),
+            ( HC.CONTENT_TYPE_TAG_PARENTS, HC.CONTENT_STATUS_PETITIONED, petitioned_tag_parents_table_name ),
+            ( HC.CONTENT_TYPE_TAG_SIBLINGS, HC.CONTENT_STATUS_PENDING, pending_tag_siblings_table_name ),
+            ( HC.CONTENT_TYPE_TAG_SIBLINGS, HC.CONTENT_STATUS_PETITIONED, petitioned_tag_siblings_table_name )
+        ]
+        
+        for ( content_type, status, table_name ) in summary_sources:
+            
+            self._Execute( 'INSERT INTO {} ( content_type, status, account_id, reason_id, num_rows, oldest_timestamp ) SELECT ?, ?, account_id, reason_id, COUNT( * ), ? FROM {} GROUP BY account_id, reason_id;'.format( petition_summaries_table_name, table_name ), ( content_type, status, now ) )
+            
+        
     
     def _RepositoryRegenerateServiceInfo( self, service_id = None, info_type = None ):
         
@@ -4584,6 +4593,8 @@ class DB( HydrusDB.HydrusDB ):
         
         self._RepositoryRegenerateServiceInfo( service_id = service_id )
         
+        self._RepositoryRegeneratePetitionSummaries( service_id )
+        
         HG.server_busy.release()
         
     
@@ -4716,6 +4727,54 @@ class DB( HydrusDB.HydrusDB ):
             
         
     
+    def _RepositoryRegisterUpdate( self, service_key, update_hashes ):
+        
+        # all the files are on disk by now, so they go in as one transaction and the update appears all at once
+        
+        service_id = self._GetServiceId( service_key )
+        
+        if len( update_hashes ) > 0:
+            
+            update_table_name = GenerateRepositoryUpdateTableName( service_id )
+            
+            master_hash_ids = self._GetMasterHashIds( update_hashes )
+            
+            self._ExecuteMany( 'INSERT OR IGNORE INTO ' + update_table_name + ' ( master_hash_id ) VALUES ( ? );', ( ( master_hash_id, ) for master_hash_id in master_hash_ids ) )
+            
+            for master_hash_id in master_hash_ids:
+                
+                self._ClearDeferredPhysicalDeleteIds( file_master_hash_id = master_hash_id )
+                
+            
+        
+    
+    def _RepositoryResolveMappingRows( self, service_id, mapping_rows, timestamp ) -> list[ tuple[ int, list[ int ], str | None ] ]:
+        
+        mapping_rows = list( mapping_rows )
+        
+        tags_to_master_tag_ids = self._GetTagsToMasterTagIds( { tag for ( ( tag, hashes ), reason ) in mapping_rows } )
+        
+        mapping_rows = [ ( ( tag, hashes ), reason ) for ( ( tag, hashes ), reason ) in mapping_rows if tag in tags_to_master_tag_ids ]
+        
+        hashes_to_master_hash_ids = self._GetHashesToMasterHashIds( { hash for ( ( tag, hashes ), reason ) in mapping_rows for hash in hashes } )
+        
+        master_tag_ids_to_service_tag_ids = self._RepositoryGetMasterTagIdsToServiceTagIds( service_id, set( tags_to_master_tag_ids.values() ), timestamp )
+        master_hash_ids_to_service_hash_ids = self._RepositoryGetMasterHashIdsToServiceHashIds( service_id, set( hashes_to_master_hash_ids.values() ), timestamp )
+        
+        resolved_mapping_rows = []
+        
+        for ( ( tag, hashes ), reason ) in mapping_rows:
+            
+            service_tag_id = master_tag_ids_to_service_tag_ids[ tags_to_master_tag_ids[ tag ] ]
+            
+            service_hash_ids = [ master_hash_ids_to_service_hash_ids[ hashes_to_master_hash_ids[ hash ] ] for hash in hashes if hash is not None ]
+            
+            resolved_mapping_rows.append( ( service_tag_id, service_hash_ids, reason ) )
+            
+        
+        return resolved_mapping_rows
+        
+    
     def _RepositoryRewardFilePetitioners( self, service_id, service_hash_ids, multiplier ):
         
         ( current_files_table_name, deleted_files_table_name, pending_files_table_name, petitioned_files_table_name, ip_addresses_table_name ) = GenerateRepositoryFilesTableNames( service_id )
@@ -4872,6 +4931,33 @@ class DB( HydrusDB.HydrusDB ):
             
         
     
+    def _RepositoryUpdatePetitionSummaries( self, service_id: int, content_type: int, status: int, petition_count_deltas: collections.abc.Iterable[ tuple[ int, int, int ] ] ):
+        
+        petition_ids_to_deltas = collections.Counter()
+        
+        for ( account_id, reason_id, delta ) in petition_count_deltas:
+            
+            petition_ids_to_deltas[ ( account_id, reason_id ) ] += delta
+            
+        
+        rows = [ ( account_id, reason_id, delta ) for ( ( account_id, reason_id ), delta ) in petition_ids_to_deltas.items() if delta != 0 ]
+        
+        if len( rows ) == 0:
+            
+            return
+            
+        
+        petition_summaries_table_name = GenerateRepositoryPetitionSummariesTableName( service_id )
+        
+        now = HydrusTime.GetNow()
+        
+        self._ExecuteMany( 'INSERT OR IGNORE INTO {} ( content_type, status, account_id, reason_id, num_rows, oldest_timestamp ) VALUES ( ?, ?, ?, ?, ?, ? );'.format( petition_summaries_table_name ), ( ( content_type, status, account_id, reason_id, 0, now ) for ( account_id, reason_id, delta ) in rows if delta > 0 ) )
+        
+        self._ExecuteMany( 'UPDATE {} SET num_rows = num_rows + ? WHERE content_type = ? AND status = ? AND account_id = ? AND reason_id = ?;'.format( petition_summaries_table_name ), ( ( delta, content_type, status, account_id, reason_id ) for ( account_id, reason_id, delta ) in rows ) )
+        
+        self._ExecuteMany( 'DELETE FROM {} WHERE content_type = ? AND status = ? AND account_id = ? AND reason_id = ? AND num_rows <= 0;'.format( petition_summaries_table_name ), ( ( content_type, status, account_id, reason_id ) for ( account_id, reason_id, delta ) in rows if delta < 0 ) )
+        
+    
     def _RepositoryUpdateServiceInfo( self, service_id: int, info_type: int, delta: int ):
         
         if delta == 0:
@@ -4891,13 +4977,20 @@ class DB( HydrusDB.HydrusDB ):
     
     def _SaveAccounts( self, service_id, accounts ):
         
+        rows = []
+        
         for account in accounts:
             
             ( account_key, account_type, created, expires, dictionary ) = HydrusNetwork.Account.GenerateTupleFromAccount( account )
             
             dictionary_string = dictionary.DumpToString()
             
-            self._Execute( 'UPDATE accounts SET dictionary_string = ? WHERE account_key = ?;', ( dictionary_string, sqlite3.Binary( account_key ) ) )
+            rows.append( ( dictionary_string, sqlite3.Binary( account_key ) ) )
+            
+        
+        self._ExecuteMany( 'UPDATE accounts SET dictionary_string = ? WHERE account_key = ?;', rows )
+        
+        for account in accounts:
             
             account.SetClean()
             
@@ -4905,11 +4998,25 @@ class DB( HydrusDB.HydrusDB ):
     
     def _SaveDirtyAccounts( self, service_keys_to_dirty_accounts ):
         
+        # the session manager's accounts only go dirty from bandwidth use, and they can be a moment behind a moderator's ban or message, so we only take their bandwidth
+        
         for ( service_key, dirty_accounts ) in service_keys_to_dirty_accounts.items():
             
             service_id = self._GetServiceId( service_key )
             
-            self._SaveAccounts( service_id, dirty_accounts )
+            accounts = self._GetAccountsFromAccountKeys( service_key, [ dirty_account.GetAccountKey() for dirty_account in dirty_accounts ] )
+            
+            for ( account, dirty_account ) in zip( accounts, dirty_accounts ):
+                
+                account.SetBandwidthTracker( dirty_account.GetBandwidthTracker() )
+                
+            
+            self._SaveAccounts( service_id, accounts )
+            
+            for dirty_account in dirty_accounts:
+                
+                dirty_account.SetClean()
+                
             
         
     
@@ -5017,6 +5124,21 @@ class DB( HydrusDB.HydrusDB ):
             self._RepositoryRegenerateServiceInfo()
             
         
+        if version == 659:
+            
+            HydrusData.Print( 'Populating new petition summary tables' + HC.UNICODE_ELLIPSIS )
+            
+            for service_id in self._GetServiceIds( HC.REPOSITORIES ):
+                
+                petition_summaries_table_name = GenerateRepositoryPetitionSummariesTableName( service_id )
+                
+                self._Execute( 'CREATE TABLE IF NOT EXISTS ' + petition_summaries_table_name + ' ( content_type INTEGER, status INTEGER, account_id INTEGER, reason_id INTEGER, num_rows INTEGER, oldest_timestamp INTEGER, PRIMARY KEY ( content_type, status, account_id, reason_id ) ) WITHOUT ROWID;' )
+                self._CreateIndex( petition_summaries_table_name, [ 'account_id' ] )
+                
+                self._RepositoryRegeneratePetitionSummaries( service_id )
+                
+            
+        
         HydrusData.Print( 'The server has updated to version ' + str( version + 1 ) )
         
         self._Execute( 'UPDATE version SET version = ?;', ( version + 1, ) )
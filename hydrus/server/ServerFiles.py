@@ -1,10 +1,44 @@
+import hashlib
 import os
+import threading
 
 from hydrus.core import HydrusExceptions
+from hydrus.core import HydrusPaths
 from hydrus.core.files import HydrusFilesPhysicalStorage
+from hydrus.core.networking import HydrusNetwork
+from hydrus.core.processes import HydrusThreading
 
 from hydrus.server import ServerGlobals as SG
 
+# update files are serialised, compressed, hashed and written on the thread pool while the db reads the next one
+# we cap how many are in flight, since a full content update is a good chunk of memory until it is on disk
+UPDATE_FILE_WRITER_MAX_SIMULTANEOUS_JOBS = HydrusThreading.CPU_HEAVY_MAX_SIMULTANEOUS_JOBS
+
+def DeleteStaleTempFiles() -> int:
+    
+    # update files are written to a .temp neighbour and then renamed. if we crashed in the middle, the .temp is never going to be finished
+    
+    files_dir = SG.server_controller.GetFilesDir()
+    
+    num_deleted = 0
+    
+    for prefix in HydrusFilesPhysicalStorage.IteratePrefixes( '', prefix_length = 2 ):
+        
+        dir = os.path.join( files_dir, prefix )
+        
+        for filename in os.listdir( dir ):
+            
+            if filename.endswith( '.temp' ):
+                
+                HydrusPaths.DeletePath( os.path.join( dir, filename ) )
+                
+                num_deleted += 1
+                
+            
+        
+    
+    return num_deleted
+    
 def GetAllHashes( file_type ):
     
     return { bytes.fromhex( os.path.split( path )[1] ) for path in IterateAllPaths( file_type ) }
@@ -67,6 +101,13 @@ def IterateAllPaths( file_type ):
         
         for filename in filenames:
             
+            if filename.endswith( '.temp' ):
+                
+                # an update file that is still being written
+                
+                continue
+                
+            
             if file_type == 'file' and filename.endswith( '.thumbnail' ):
                 
                 continue
@@ -80,3 +121,71 @@ def IterateAllPaths( file_type ):
             
         
     
+class UpdateFileWriter( object ):
+    
+    def __init__( self ):
+        
+        self._lock = threading.Lock()
+        
+        self._job_queue = HydrusThreading.OrderedJobQueue( SG.server_controller, UPDATE_FILE_WRITER_MAX_SIMULTANEOUS_JOBS )
+        
+        self._num_definition_rows = 0
+        self._num_content_rows = 0
+        
+    
+    def _WriteUpdate( self, update ) -> bytes:
+        
+        update_bytes = update.DumpToNetworkBytes()
+        
+        update_hash = hashlib.sha256( update_bytes ).digest()
+        
+        dest_path = GetExpectedFilePath( update_hash )
+        
+        # a half-written file must never sit at a real update path, so we write next door and rename
+        
+        temp_path = dest_path + '.temp'
+        
+        with open( temp_path, 'wb' ) as f:
+            
+            f.write( update_bytes )
+            
+        
+        os.replace( temp_path, dest_path )
+        
+        return update_hash
+        
+    
+    def AddUpdate( self, update ):
+        
+        with self._lock:
+            
+            num_rows = update.GetNumRows()
+            
+            if isinstance( update, HydrusNetwork.DefinitionsUpdate ):
+                
+                self._num_definition_rows += num_rows
+                
+            elif isinstance( update, HydrusNetwork.ContentUpdate ):
+                
+                self._num_content_rows += num_rows
+                
+            
+        
+        self._job_queue.AddJob( self._WriteUpdate, update )
+        
+    
+    def GetNumRows( self ) -> tuple[ int, int ]:
+        
+        with self._lock:
+            
+            return ( self._num_definition_rows, self._num_content_rows )
+            
+        
+    
+    def WaitForUpdateHashes( self ) -> list[ bytes ]:
+        
+        # in the order they were added, so definitions still come before the content that uses them
+        
+        return self._job_queue.GetAllResults()
+        
+    
@@ -792,8 +792,6 @@ class HydrusResourceRestrictedAccountTypes( HydrusResourceRestricted ):
         
         SG.server_controller.WriteSynchronous( 'account_types', self._service_key, request.hydrus_account, account_types, deletee_account_type_keys_to_new_account_type_keys )
         
-        SG.server_controller.server_session_manager.RefreshAccounts( self._service_key )
-        
         response_context = HydrusServerResources.ResponseContext( 200 )
         
         return response_context
@@ -1,8 +1,10 @@
 import hashlib
 import http.client
+import io
 import json
 import os
 import random
+import struct
 import time
 import typing
 import unittest
@@ -8069,6 +8071,47 @@ class TestClientAPI( unittest.TestCase ):
         
         self.assertEqual( d, expected_result )
         
+        # streamed, in small batches
+        
+        path = '/get_files/file_metadata_stream?file_ids={}&batch_size=2'.format( urllib.parse.quote( json.dumps( [ 1, 2, 3 ] ) ) )
+        
+        connection.request( 'GET', path, headers = headers )
+        
+        response = connection.getresponse()
+        
+        data = response.read()
+        
+        text = str( data, 'utf-8' )
+        
+        self.assertEqual( response.status, 200 )
+        self.assertEqual( response.getheader( 'Content-Type' ), 'application/x-ndjson' )
+        
+        records = [ json.loads( line ) for line in text.splitlines() ]
+        
+        self.assertEqual( records, expected_metadata_result[ 'metadata' ] )
+        
+        # streamed, only hydrating what we asked for
+        
+        path = '/get_files/file_metadata_stream?hashes={}&fields={}'.format( urllib.parse.quote( json.dumps( [ file_ids_to_hashes[ hash_id ].hex() for hash_id in expected_order ] ) ), urllib.parse.quote( json.dumps( [ 'size', 'width' ] ) ) )
+        
+        connection.request( 'GET', path, headers = headers )
+        
+        response = connection.getresponse()
+        
+        data = response.read()
+        
+        text = str( data, 'utf-8' )
+        
+        self.assertEqual( response.status, 200 )
+        
+        records = [ json.loads( line ) for line in text.splitlines() ]
+        
+        expected_records = [ { key : metadata_row[ key ] for key in ( 'file_id', 'hash', 'size', 'width' ) } for metadata_row in only_return_basic_information_metadata ]
+        
+        expected_records.sort( key = lambda basic: expected_order.index( basic[ 'file_id' ] ) )
+        
+        self.assertEqual( records, expected_records )
+        
     
     def _test_get_files( self, connection, set_up_permissions ):
         
@@ -8187,6 +8230,52 @@ class TestClientAPI( unittest.TestCase ):
         
         self.assertIn( 'inline', response.headers[ 'Content-Disposition' ] )
         
+        self.assertEqual( response.headers[ 'ETag' ], f'"{hash_hex}"' )
+        self.assertIn( 'immutable', response.headers[ 'Cache-Control' ] )
+        
+        last_modified = response.headers[ 'Last-Modified' ]
+        
+        # the browser already has it
+        
+        conditional_headers = dict( headers )
+        conditional_headers[ 'If-None-Match' ] = f'"{hash_hex}"'
+        
+        connection.request( 'GET', path, headers = conditional_headers )
+        
+        response = connection.getresponse()
+        
+        data = response.read()
+        
+        self.assertEqual( response.status, 304 )
+        self.assertEqual( data, b'' )
+        self.assertEqual( response.headers[ 'ETag' ], f'"{hash_hex}"' )
+        
+        conditional_headers = dict( headers )
+        conditional_headers[ 'If-Modified-Since' ] = last_modified
+        
+        connection.request( 'GET', path, headers = conditional_headers )
+        
+        response = connection.getresponse()
+        
+        data = response.read()
+        
+        self.assertEqual( response.status, 304 )
+        
+        # the browser has something else
+        
+        conditional_headers = dict( headers )
+        conditional_headers[ 'If-None-Match' ] = '"{}"'.format( os.urandom( 32 ).hex() )
+        
+        connection.request( 'GET', path, headers = conditional_headers )
+        
+        response = connection.getresponse()
+        
+        data = response.read()
+        
+        self.assertEqual( response.status, 200 )
+        
+        self.assertEqual( hashlib.sha256( data ).digest(), hash )
+        
         # succeed with attachment
         
         path = '/get_files/file?file_id={}&download=true'.format( 1 )
@@ -8317,6 +8406,61 @@ class TestClientAPI( unittest.TestCase ):
         
         self.assertEqual( hashlib.sha256( data ).digest(), thumb_hash )
         
+        thumbnail_etag = response.headers[ 'ETag' ]
+        
+        self.assertTrue( thumbnail_etag.startswith( f'"{hash_hex}-' ) )
+        self.assertNotIn( 'immutable', response.headers[ 'Cache-Control' ] )
+        
+        conditional_headers = dict( headers )
+        conditional_headers[ 'If-None-Match' ] = f'W/{thumbnail_etag}'
+        
+        connection.request( 'GET', path, headers = conditional_headers )
+        
+        response = connection.getresponse()
+        
+        data = response.read()
+        
+        self.assertEqual( response.status, 304 )
+        self.assertEqual( data, b'' )
+        
+        # regenerated in place while the path is cached, we should get the new size and a new etag
+        
+        HydrusPaths.safe_copy2( HydrusStaticDir.GetStaticPath( 'hydrus.png' ), thumb_path )
+        
+        os.utime( thumb_path, ( time.time() - 3600, time.time() - 3600 ) )
+        
+        with open( thumb_path, 'rb' ) as f:
+            
+            regenerated_thumb_data = f.read()
+            
+        
+        connection.request( 'GET', path, headers = conditional_headers )
+        
+        response = connection.getresponse()
+        
+        data = response.read()
+        
+        self.assertEqual( response.status, 200 )
+        self.assertEqual( data, regenerated_thumb_data )
+        self.assertEqual( int( response.headers[ 'Content-Length' ] ), len( regenerated_thumb_data ) )
+        self.assertNotEqual( response.headers[ 'ETag' ], thumbnail_etag )
+        
+        # gone while the path is cached, we should go back to the client files manager, not 404
+        
+        os.unlink( thumb_path )
+        
+        connection.request( 'GET', path, headers = headers )
+        
+        response = connection.getresponse()
+        
+        data = response.read()
+        
+        self.assertEqual( response.status, 200 )
+        self.assertEqual( int( response.headers[ 'Content-Length' ] ), len( data ) )
+        self.assertNotEqual( data, regenerated_thumb_data )
+        
+        HydrusPaths.safe_copy2( HydrusStaticDir.GetStaticPath( 'hydrus_small.png' ), thumb_path )
+        
         #
         
         api_permissions = set_up_permissions[ 'everything' ]
@@ -8339,6 +8483,19 @@ class TestClientAPI( unittest.TestCase ):
         
         self.assertEqual( hashlib.sha256( data ).digest(), hash )
         
+        # a hash is its own etag, so this one does not need the db
+        
+        conditional_headers = dict( headers )
+        conditional_headers[ 'If-None-Match' ] = f'"{hash_hex}"'
+        
+        connection.request( 'GET', path, headers = conditional_headers )
+        
+        response = connection.getresponse()
+        
+        data = response.read()
+        
+        self.assertEqual( response.status, 304 )
+        
         #
         
         path = '/get_files/thumbnail?hash={}'.format( hash_hex )
@@ -8353,6 +8510,88 @@ class TestClientAPI( unittest.TestCase ):
         
         self.assertEqual( hashlib.sha256( data ).digest(), thumb_hash )
         
+        # batch thumbnails
+        
+        def parse_thumbnail_records( data ):
+            
+            records = []
+            
+            i = 0
+            
+            while i < len( data ):
+                
+                ( header_length, ) = struct.unpack( '>I', data[ i : i + 4 ] )
+                i += 4
+                
+                header = json.loads( data[ i : i + header_length ] )
+                i += header_length
+                
+                ( thumbnail_length, ) = struct.unpack( '>I', data[ i : i + 4 ] )
+                i += 4
+                
+                thumbnail_bytes = data[ i : i + thumbnail_length ]
+                i += thumbnail_length
+                
+                records.append( ( header, thumbnail_bytes ) )
+                
+            
+            return records
+            
+        
+        path = '/get_files/thumbnails?file_ids={}'.format( urllib.parse.quote( json.dumps( [ 1, 1 ] ) ) )
+        
+        connection.request( 'GET', path, headers = headers )
+        
+        response = connection.getresponse()
+        
+        data = response.read()
+        
+        self.assertEqual( response.status, 200 )
+        self.assertEqual( response.headers[ 'Content-Type' ], HC.mime_mimetype_string_lookup[ HC.APPLICATION_OCTET_STREAM ] )
+        
+        records = parse_thumbnail_records( data )
+        
+        self.assertEqual( len( records ), 1 )
+        
+        ( header, thumbnail_bytes ) = records[0]
+        
+        self.assertEqual( header, { 'file_id' : 1, 'hash' : hash_hex, 'mime' : 'image/png' } )
+        self.assertEqual( hashlib.sha256( thumbnail_bytes ).digest(), thumb_hash )
+        
+        TG.test_controller.SetRead( 'media_results', [ media_result ] )
+        
+        path = '/get_files/thumbnails?hashes={}&width=10&height=10'.format( urllib.parse.quote( json.dumps( [ hash_hex ] ) ) )
+        
+        connection.request( 'GET', path, headers = headers )
+        
+        response = connection.getresponse()
+        
+        data = response.read()
+        
+        self.assertEqual( response.status, 200 )
+        
+        records = parse_thumbnail_records( data )
+        
+        self.assertEqual( len( records ), 1 )
+        
+        ( header, thumbnail_bytes ) = records[0]
+        
+        self.assertEqual( header[ 'hash' ], hash_hex )
+        
+        pil_image = HydrusImageHandling.GeneratePILImage( io.BytesIO( thumbnail_bytes ) )
+        
+        self.assertEqual( pil_image.size, ( 10, 10 ) )
+        
+        path = '/get_files/thumbnails?file_ids={}&width=0&height=10'.format( urllib.parse.quote( json.dumps( [ 1 ] ) ) )
+        
+        connection.request( 'GET', path, headers = headers )
+        
+        response = connection.getresponse()
+        
+        data = response.read()
+        
+        self.assertEqual( response.status, 400 )
+        
         # file path
         
         path = '/get_files/file_path?hash={}'.format( hash_hex )
@@ -1,31 +1,42 @@
 import os
+import re
+import sqlite3
 import time
 import typing
 import unittest
+from unittest import mock
 
 from hydrus.core import HydrusConstants as HC
 from hydrus.core import HydrusData
+from hydrus.core import HydrusExceptions
 from hydrus.core import HydrusNumbers
+from hydrus.core import HydrusPaths
 from hydrus.core import HydrusSerialisable
 from hydrus.core import HydrusStaticDir
+from hydrus.core import HydrusTemp
 from hydrus.core import HydrusTime
 from hydrus.core.files import HydrusFilesPhysicalStorage
 from hydrus.core.files.images import HydrusImageHandling
 from hydrus.core.networking import HydrusNetwork
 
+from hydrus.client import ClientBackup
 from hydrus.client import ClientConstants as CC
 from hydrus.client import ClientDefaults
 from hydrus.client import ClientLocation
 from hydrus.client import ClientServices
 from hydrus.client.db import ClientDB
+from hydrus.client.db import ClientDBMappingsCounts
 from hydrus.client.exporting import ClientExportingFiles
 from hydrus.client.files import ClientFilesPhysical
 from hydrus.client.files.images import ClientImagePerceptualHashes
 from hydrus.client.gui.pages import ClientGUIPageManager
 from hydrus.client.gui.pages import ClientGUISession
 from hydrus.client.importing import ClientImportLocal
+from hydrus.client.importing import ClientImportFileSeeds
 from hydrus.client.importing import ClientImportFiles
+from hydrus.client.importing import ClientImportSubscriptionQuery
 from hydrus.client.importing.options import FileImportOptionsLegacy
+from hydrus.client.media import ClientMedia
 from hydrus.client.metadata import ClientContentUpdates
 from hydrus.client.metadata import ClientTags
 from hydrus.client.search import ClientNumberTest
@@ -241,6 +252,323 @@ class TestClientDB( unittest.TestCase ):
         self.assertEqual( set( result ), preds )
         
     
+    def test_autocomplete_cache( self ):
+        
+        # the same search text again and again should stay correct as counts and tags come and go
+        
+        file_import_options = FileImportOptionsLegacy.FileImportOptionsLegacy()
+        file_import_options.SetIsDefault( True )
+        
+        location_context = ClientLocation.LocationContext.STATICCreateSimple( CC.COMBINED_FILE_SERVICE_KEY )
+        tag_context = ClientSearchTagContext.TagContext( service_key = CC.DEFAULT_LOCAL_TAG_SERVICE_KEY )
+        
+        file_search_context = ClientSearchFileSearchContext.FileSearchContext( location_context = location_context, tag_context = tag_context )
+        
+        TestClientDB._clear_db()
+        
+        hash = b'\xadm5\x99\xa6\xc4\x89\xa5u\xeb\x19\xc0&\xfa\xce\x97\xa9\xcdey\xe7G(\xb0\xce\x94\xa6\x01\xd22\xf3\xc3'
+        
+        path = HydrusStaticDir.GetStaticPath( 'hydrus.png' )
+        
+        file_import_job = ClientImportFiles.FileImportJob( path, file_import_options )
+        
+        file_import_job.GeneratePreImportHashAndStatus()
+        
+        file_import_job.GenerateInfo()
+        
+        self._write( 'import_file', file_import_job )
+        
+        def do_update( action, tag ):
+            
+            content_updates = [ ClientContentUpdates.ContentUpdate( HC.CONTENT_TYPE_MAPPINGS, action, ( tag, ( hash, ) ) ) ]
+            
+            content_update_package = ClientContentUpdates.ContentUpdatePackage.STATICCreateFromContentUpdates( CC.DEFAULT_LOCAL_TAG_SERVICE_KEY, content_updates )
+            
+            self._write( 'content_updates', content_update_package )
+            
+        
+        def get_tags_and_counts():
+            
+            result = self._read( 'autocomplete_predicates', ClientTags.TAG_DISPLAY_STORAGE, file_search_context, search_text = 'ca*' )
+            
+            return { predicate.GetValue() : predicate.GetCount().GetMinCount( HC.CONTENT_STATUS_CURRENT ) for predicate in result }
+            
+        
+        self.assertEqual( get_tags_and_counts(), {} )
+        
+        do_update( HC.CONTENT_UPDATE_ADD, 'car' )
+        
+        self.assertEqual( get_tags_and_counts(), { 'car' : 1 } )
+        self.assertEqual( get_tags_and_counts(), { 'car' : 1 } )
+        
+        do_update( HC.CONTENT_UPDATE_ADD, 'cat' )
+        
+        self.assertEqual( get_tags_and_counts(), { 'car' : 1, 'cat' : 1 } )
+        
+        do_update( HC.CONTENT_UPDATE_DELETE, 'car' )
+        
+        self.assertEqual( get_tags_and_counts(), { 'cat' : 1 } )
+        
+        do_update( HC.CONTENT_UPDATE_DELETE, 'cat' )
+        
+        self.assertEqual( get_tags_and_counts(), {} )
+        
+        do_update( HC.CONTENT_UPDATE_ADD, 'car' )
+        
+        self.assertEqual( get_tags_and_counts(), { 'car' : 1 } )
+        
+        # the in-memory counts cache stays under its cap. a call bigger than the cap goes straight to the db
+        
+        for tag in ( 'cab', 'cat', 'dog', 'dot' ):
+            
+            do_update( HC.CONTENT_UPDATE_ADD, tag )
+            
+        
+        def get_tags_and_counts_for( search_text ):
+            
+            result = self._read( 'autocomplete_predicates', ClientTags.TAG_DISPLAY_STORAGE, file_search_context, search_text = search_text )
+            
+            return { predicate.GetValue() : predicate.GetCount().GetMinCount( HC.CONTENT_STATUS_CURRENT ) for predicate in result }
+            
+        
+        tag_ids_to_counts_caches = TestClientDB._db.modules_mappings_counts._counts_cache_table_names_to_tag_ids_to_counts
+        
+        def get_num_cached():
+            
+            return max( [ 0 ] + [ len( tag_ids_to_counts ) for tag_ids_to_counts in tag_ids_to_counts_caches.values() ] )
+            
+        
+        tag_ids_to_counts_caches.clear()
+        
+        with mock.patch.object( ClientDBMappingsCounts, 'COUNTS_CACHE_MAX_SIZE_PER_TABLE', 2 ):
+            
+            for i in range( 2 ):
+                
+                self.assertEqual( get_tags_and_counts_for( 'ca*' ), { 'cab' : 1, 'car' : 1, 'cat' : 1 } )
+                
+                self.assertEqual( get_num_cached(), 0 )
+                
+            
+        
+        with mock.patch.object( ClientDBMappingsCounts, 'COUNTS_CACHE_MAX_SIZE_PER_TABLE', 4 ):
+            
+            self.assertEqual( get_tags_and_counts_for( 'ca*' ), { 'cab' : 1, 'car' : 1, 'cat' : 1 } )
+            
+            self.assertEqual( get_num_cached(), 3 )
+            
+            # only one of the 'ca' rows goes to make room
+            
+            self.assertEqual( get_tags_and_counts_for( 'do*' ), { 'dog' : 1, 'dot' : 1 } )
+            
+            self.assertEqual( get_num_cached(), 4 )
+            
+            self.assertEqual( get_tags_and_counts_for( 'ca*' ), { 'cab' : 1, 'car' : 1, 'cat' : 1 } )
+            
+            self.assertEqual( get_num_cached(), 4 )
+            
+        
+    
+    def test_backup( self ):
+        
+        backup_dir = HydrusTemp.GetSubTempDir( 'online_backup_test' )
+        
+        try:
+            
+            ( db_filenames, additional_filenames ) = self._read( 'backup_filenames' )
+            
+            self.assertEqual( db_filenames[ 'main' ], 'client.db' )
+            
+            # the db stays live and writeable through all of this
+            
+            ClientBackup.BackupDBFilesOnline( TestController.DB_DIR, db_filenames, backup_dir, pages_per_step = 16 )
+            
+            for filename in db_filenames.values():
+                
+                path = os.path.join( backup_dir, filename )
+                
+                self.assertTrue( os.path.exists( path ) )
+                self.assertFalse( os.path.exists( path + ClientBackup.DB_BACKUP_TEMP_SUFFIX ) )
+                
+                db = sqlite3.connect( path )
+                
+                try:
+                    
+                    ( result, ) = db.execute( 'PRAGMA integrity_check;' ).fetchone()
+                    
+                finally:
+                    
+                    db.close()
+                    
+                
+                self.assertEqual( result, 'ok' )
+                
+            
+            db = sqlite3.connect( os.path.join( backup_dir, db_filenames[ 'main' ] ) )
+            
+            try:
+                
+                ( num_services, ) = db.execute( 'SELECT COUNT( * ) FROM services;' ).fetchone()
+                
+            finally:
+                
+                db.close()
+                
+            
+            self.assertEqual( num_services, len( self._read( 'services' ) ) )
+            
+            def is_cancelled_hook():
+                
+                return True
+                
+            
+            with self.assertRaises( HydrusExceptions.CancelledException ):
+                
+                ClientBackup.BackupDBFilesOnline( TestController.DB_DIR, db_filenames, backup_dir, pages_per_step = 16, is_cancelled_hook = is_cancelled_hook )
+                
+            
+            self.assertFalse( os.path.exists( os.path.join( backup_dir, db_filenames[ 'main' ] + ClientBackup.DB_BACKUP_TEMP_SUFFIX ) ) )
+            self.assertTrue( os.path.exists( os.path.join( backup_dir, db_filenames[ 'main' ] ) ) )
+            
+            # client_files
+            
+            source = os.path.join( backup_dir, 'source_client_files' )
+            dest = os.path.join( backup_dir, 'client_files' )
+            
+            hashes = [ HydrusData.GenerateKey() for i in range( 20 ) ]
+            
+            def write_file( path, data ):
+                
+                HydrusPaths.MakeSureDirectoryExists( os.path.dirname( path ) )
+                
+                with open( path, 'wb' ) as f:
+                    
+                    f.write( data )
+                    
+                
+            
+            def get_relative_paths( hashes ):
+                
+                return { os.path.join( 'f' + hash.hex()[:2], hash.hex() + '.jpg' ) for hash in hashes }
+                
+            
+            for hash in hashes:
+                
+                write_file( os.path.join( source, 'f' + hash.hex()[:2], hash.hex() + '.jpg' ), hash )
+                write_file( os.path.join( source, 't' + hash.hex()[:2], hash.hex() + '.thumbnail' ), hash )
+                
+            
+            # cancel once the scans are done and the copy has started. the empty dest is one more call
+            
+            num_scan_calls = 1 + len( os.listdir( source ) ) + 1
+            
+            cancel_calls = []
+            
+            def is_cancelled_hook():
+                
+                cancel_calls.append( 1 )
+                
+                return len( cancel_calls ) > num_scan_calls
+                
+            
+            with self.assertRaises( HydrusExceptions.CancelledException ):
+                
+                ClientBackup.MirrorClientFilesIncrementally( source, dest, backup_dir, num_workers = 1, is_cancelled_hook = is_cancelled_hook )
+                
+            
+            manifest = ClientBackup.ClientFilesBackupManifest( backup_dir )
+            
+            try:
+                
+                entries = manifest.GetEntries()
+                
+            finally:
+                
+                manifest.Close()
+                
+            
+            for relative_path in entries.keys():
+                
+                self.assertTrue( os.path.exists( os.path.join( dest, relative_path ) ) )
+                
+            
+            # resume
+            
+            ClientBackup.MirrorClientFilesIncrementally( source, dest, backup_dir )
+            
+            self.assertEqual( { relative_path for relative_path in get_relative_paths( hashes ) if os.path.exists( os.path.join( dest, relative_path ) ) }, get_relative_paths( hashes ) )
+            
+            # deletes, adds, and a regenerated thumbnail
+            
+            deletee_hash = hashes.pop()
+            
+            HydrusPaths.DeletePath( os.path.join( source, 'f' + deletee_hash.hex()[:2], deletee_hash.hex() + '.jpg' ) )
+            HydrusPaths.DeletePath( os.path.join( source, 't' + deletee_hash.hex()[:2], deletee_hash.hex() + '.thumbnail' ) )
+            
+            new_hash = HydrusData.GenerateKey()
+            
+            hashes.append( new_hash )
+            
+            write_file( os.path.join( source, 'f' + new_hash.hex()[:2], new_hash.hex() + '.jpg' ), new_hash )
+            
+            regen_thumbnail_relative_path = os.path.join( 't' + hashes[0].hex()[:2], hashes[0].hex() + '.thumbnail' )
+            
+            write_file( os.path.join( source, regen_thumbnail_relative_path ), b'a bigger regenerated thumbnail' )
+            
+            ClientBackup.MirrorClientFilesIncrementally( source, dest, backup_dir )
+            
+            self.assertFalse( os.path.exists( os.path.join( dest, 'f' + deletee_hash.hex()[:2], deletee_hash.hex() + '.jpg' ) ) )
+            self.assertFalse( os.path.exists( os.path.join( dest, 't' + deletee_hash.hex()[:2], deletee_hash.hex() + '.thumbnail' ) ) )
+            self.assertTrue( os.path.exists( os.path.join( dest, 'f' + new_hash.hex()[:2], new_hash.hex() + '.jpg' ) ) )
+            
+            with open( os.path.join( dest, regen_thumbnail_relative_path ), 'rb' ) as f:
+                
+                self.assertEqual( f.read(), b'a bigger regenerated thumbnail' )
+                
+            
+            # the manifest does not get the last word. a damaged copy is copied again, and strays in the backup are cleared out
+            
+            damaged_relative_path = os.path.join( 'f' + hashes[1].hex()[:2], hashes[1].hex() + '.jpg' )
+            missing_relative_path = os.path.join( 'f' + hashes[2].hex()[:2], hashes[2].hex() + '.jpg' )
+            stray_relative_path = os.path.join( 'f' + hashes[3].hex()[:2], HydrusData.GenerateKey().hex() + '.jpg' )
+            
+            with open( os.path.join( dest, damaged_relative_path ), 'wb' ) as f:
+                
+                f.write( b'trunc' )
+                
+            
+            HydrusPaths.DeletePath( os.path.join( dest, missing_relative_path ) )
+            
+            write_file( os.path.join( dest, stray_relative_path ), b'not in the source' )
+            
+            ClientBackup.MirrorClientFilesIncrementally( source, dest, backup_dir )
+            
+            with open( os.path.join( dest, damaged_relative_path ), 'rb' ) as f:
+                
+                self.assertEqual( f.read(), hashes[1] )
+                
+            
+            self.assertTrue( os.path.exists( os.path.join( dest, missing_relative_path ) ) )
+            self.assertFalse( os.path.exists( os.path.join( dest, stray_relative_path ) ) )
+            
+            # only real file storage paths are trusted by name
+            
+            hash_hex = hashes[0].hex()
+            
+            self.assertTrue( ClientBackup._PathIsContentAddressed( os.path.join( 'f' + hash_hex[:2], hash_hex + '.jpg' ) ) )
+            self.assertTrue( ClientBackup._PathIsContentAddressed( os.path.join( 'f' + hash_hex[:2], hash_hex[2], hash_hex + '.png' ) ) )
+            self.assertTrue( ClientBackup._PathIsContentAddressed( os.path.join( 'f' + hash_hex[0], hash_hex ) ) )
+            self.assertFalse( ClientBackup._PathIsContentAddressed( os.path.join( 't' + hash_hex[:2], hash_hex + '.thumbnail' ) ) )
+            self.assertFalse( ClientBackup._PathIsContentAddressed( os.path.join( 'f' + hash_hex[:2], 'notes.txt' ) ) )
+            self.assertFalse( ClientBackup._PathIsContentAddressed( os.path.join( 'files_extra', hash_hex + '.jpg' ) ) )
+            self.assertFalse( ClientBackup._PathIsContentAddressed( os.path.join( 'fzz', hash_hex + '.jpg' ) ) )
+            self.assertFalse( ClientBackup._PathIsContentAddressed( hash_hex + '.jpg' ) )
+            
+        finally:
+            
+            HydrusPaths.DeletePath( backup_dir )
+            
+        
+    
     def test_export_folders( self ):
         
         tag_context = ClientSearchTagContext.TagContext( service_key = HydrusData.GenerateKey() )
@@ -1362,6 +1690,33 @@ class TestClientDB( unittest.TestCase ):
             self.assertEqual( mr_num_words, num_words )
             
         
+        # a system:limit search should give the same top results as a full sort
+        
+        location_context = ClientLocation.LocationContext.STATICCreateSimple( CC.LOCAL_FILE_SERVICE_KEY )
+        
+        full_search_context = ClientSearchFileSearchContext.FileSearchContext( location_context = location_context, predicates = [ ClientSearchPredicate.Predicate( ClientSearchPredicate.PREDICATE_TYPE_SYSTEM_EVERYTHING ) ] )
+        limited_search_context = ClientSearchFileSearchContext.FileSearchContext( location_context = location_context, predicates = [ ClientSearchPredicate.Predicate( ClientSearchPredicate.PREDICATE_TYPE_SYSTEM_LIMIT, 3 ) ] )
+        
+        for sort_data in ( CC.SORT_FILES_BY_IMPORT_TIME, CC.SORT_FILES_BY_FILESIZE, CC.SORT_FILES_BY_WIDTH, CC.SORT_FILES_BY_APPROX_BITRATE, CC.SORT_FILES_BY_HASH ):
+            
+            for sort_order in ( CC.SORT_ASC, CC.SORT_DESC ):
+                
+                sort_by = ClientMedia.MediaSort( sort_type = ( 'system', sort_data ), sort_order = sort_order )
+                
+                full_file_query_ids = self._read( 'file_query_ids', full_search_context, sort_by = sort_by, apply_implicit_limit = False )
+                limited_file_query_ids = self._read( 'file_query_ids', limited_search_context, sort_by = sort_by )
+                
+                self.assertEqual( len( full_file_query_ids ), len( test_files ) )
+                self.assertEqual( limited_file_query_ids, full_file_query_ids[:3] )
+                
+            
+        
+        sort_by = ClientMedia.MediaSort( sort_type = ( 'system', CC.SORT_FILES_BY_RANDOM ), sort_order = CC.SORT_ASC )
+        
+        limited_file_query_ids = self._read( 'file_query_ids', limited_search_context, sort_by = sort_by )
+        
+        self.assertEqual( len( set( limited_file_query_ids ) ), 3 )
+        
     
     def test_import_folders( self ):
         
@@ -2015,6 +2370,45 @@ class TestClientDB( unittest.TestCase ):
         self.assertEqual( result, [ pixiv_id, password ] )
         
     
+    def test_related_tags_sketches( self ):
+        
+        TestClientDB._clear_db()
+        
+        hashes = [ HydrusData.GenerateKey() for i in range( 1200 ) ]
+        
+        content_updates = []
+        
+        content_updates.append( ClientContentUpdates.ContentUpdate( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_ADD, ( 'series:sketch test', hashes ) ) )
+        content_updates.append( ClientContentUpdates.ContentUpdate( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_ADD, ( 'half the files', hashes[ : 600 ] ) ) )
+        content_updates.append( ClientContentUpdates.ContentUpdate( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_ADD, ( 'a few files', hashes[ : 10 ] ) ) )
+        
+        self._write( 'content_updates', ClientContentUpdates.ContentUpdatePackage.STATICCreateFromContentUpdates( CC.DEFAULT_LOCAL_TAG_SERVICE_KEY, content_updates ) )
+        
+        def get_tags_to_counts():
+            
+            ( num_done, num_to_do, num_skipped, predicates ) = self._read( 'related_tags', CC.COMBINED_FILE_SERVICE_KEY, CC.DEFAULT_LOCAL_TAG_SERVICE_KEY, [ 'series:sketch test' ], max_time_to_take = 5 )
+            
+            return { predicate.GetValue() : predicate.GetCount().GetMinCount() for predicate in predicates }
+            
+        
+        # no sketch yet, so this is a live sample, and the tag is queued
+        
+        tags_to_counts = get_tags_to_counts()
+        
+        self.assertIn( 'half the files', tags_to_counts )
+        
+        self._write( 'maintain_related_tags_cache', maintenance_mode = HC.MAINTENANCE_FORCED )
+        
+        # the sketch sampled everything, so this is exact: 600 / sqrt( 600 * 1200 )
+        
+        tags_to_counts = get_tags_to_counts()
+        
+        self.assertEqual( tags_to_counts[ 'half the files' ], 707 )
+        self.assertNotIn( 'a few files', tags_to_counts )
+        
+        self.assertEqual( get_tags_to_counts(), tags_to_counts )
+        
+    
     def test_services( self ):
         
         TestClientDB._clear_db()
@@ -2101,3 +2495,280 @@ class TestClientDB( unittest.TestCase ):
             
         
     
+    def test_subscription_query_log_journal( self ):
+        
+        def get_statuses( query_log_container ):
+            
+            return [ ( file_seed.file_seed_data, file_seed.status ) for file_seed in query_log_container.GetFileSeedCache().GetFileSeeds() ]
+            
+        
+        def append_delta( query_log_container ):
+            
+            file_seed_cache = query_log_container.GetFileSeedCache()
+            
+            delta_file_seeds = file_seed_cache.GetDeltaFileSeeds()
+            
+            self._write( 'serialisable_named_journal', query_log_container.SERIALISABLE_TYPE, query_log_container.GetName(), HydrusSerialisable.SerialisableList( delta_file_seeds ) )
+            
+            file_seed_cache.ClearDeltaFileSeeds()
+            
+        
+        name = ClientImportSubscriptionQuery.GenerateQueryLogContainerName()
+        
+        query_log_container = ClientImportSubscriptionQuery.SubscriptionQueryLogContainer( name )
+        
+        file_seeds = [ ClientImportFileSeeds.FileSeed( ClientImportFileSeeds.FILE_SEED_TYPE_URL, f'https://example.com/post/{i}' ) for i in range( 20 ) ]
+        
+        query_log_container.GetFileSeedCache().AddFileSeeds( file_seeds )
+        
+        self._write( 'serialisable', query_log_container )
+        
+        expected_statuses = get_statuses( query_log_container )
+        
+        query_log_container = self._read( 'serialisable_named', HydrusSerialisable.SERIALISABLE_TYPE_SUBSCRIPTION_QUERY_LOG_CONTAINER, name )
+        
+        file_seed_cache = query_log_container.GetFileSeedCache()
+        
+        self.assertEqual( file_seed_cache.GetDeltaFileSeeds(), [] )
+        
+        # status changes and adds go in the journal
+        
+        for file_seed in file_seed_cache.GetFileSeeds()[ : 5 ]:
+            
+            file_seed.SetStatus( CC.STATUS_SUCCESSFUL_AND_NEW )
+            
+            file_seed_cache.NotifyFileSeedsUpdated( ( file_seed, ) )
+            
+        
+        file_seed_cache.AddFileSeeds( [ ClientImportFileSeeds.FileSeed( ClientImportFileSeeds.FILE_SEED_TYPE_URL, f'https://example.com/post/{i}' ) for i in range( 20, 23 ) ] )
+        
+        self.assertEqual( len( file_seed_cache.GetDeltaFileSeeds() ), 8 )
+        
+        append_delta( query_log_container )
+        
+        expected_statuses = get_statuses( query_log_container )
+        
+        query_log_container = self._read( 'serialisable_named', HydrusSerialisable.SERIALISABLE_TYPE_SUBSCRIPTION_QUERY_LOG_CONTAINER, name )
+        
+        self.assertEqual( get_statuses( query_log_container ), expected_statuses )
+        self.assertEqual( query_log_container.GetFileSeedCache().GetFileSeedCount( CC.STATUS_UNKNOWN ), 18 )
+        self.assertEqual( query_log_container.GetFileSeedCache().GetDeltaFileSeeds(), [] )
+        
+        # enough deltas to force a compaction or two
+        
+        for i in range( 23, 150 ):
+            
+            file_seed_cache = query_log_container.GetFileSeedCache()
+            
+            file_seed = file_seed_cache.GetNextFileSeed( CC.STATUS_UNKNOWN )
+            
+            file_seed.SetStatus( CC.STATUS_ERROR, note = 'bad luck' )
+            
+            file_seed_cache.NotifyFileSeedsUpdated( ( file_seed, ) )
+            
+            file_seed_cache.AddFileSeeds( ( ClientImportFileSeeds.FileSeed( ClientImportFileSeeds.FILE_SEED_TYPE_URL, f'https://example.com/post/{i}' ), ) )
+            
+            append_delta( query_log_container )
+            
+        
+        expected_statuses = get_statuses( query_log_container )
+        
+        query_log_container = self._read( 'serialisable_named', HydrusSerialisable.SERIALISABLE_TYPE_SUBSCRIPTION_QUERY_LOG_CONTAINER, name )
+        
+        self.assertEqual( get_statuses( query_log_container ), expected_statuses )
+        self.assertEqual( query_log_container.GetFileSeedCache().GetFileSeedCount( CC.STATUS_ERROR ), 127 )
+        
+        # a removal cannot be a delta, so we need a full save, which clears the journal
+        
+        file_seed_cache = query_log_container.GetFileSeedCache()
+        
+        file_seed_cache.RemoveFileSeedsByStatus( ( CC.STATUS_ERROR, ) )
+        
+        file_seed_cache.AddFileSeeds( ( ClientImportFileSeeds.FileSeed( ClientImportFileSeeds.FILE_SEED_TYPE_URL, 'https://example.com/post/new' ), ) )
+        
+        self.assertIsNone( file_seed_cache.GetDeltaFileSeeds() )
+        
+        self._write( 'serialisable', query_log_container )
+        
+        file_seed_cache.ClearDeltaFileSeeds()
+        
+        expected_statuses = get_statuses( query_log_container )
+        
+        query_log_container = self._read( 'serialisable_named', HydrusSerialisable.SERIALISABLE_TYPE_SUBSCRIPTION_QUERY_LOG_CONTAINER, name )
+        
+        self.assertEqual( get_statuses( query_log_container ), expected_statuses )
+        
+        #
+        
+        self._write( 'delete_serialisable_named', HydrusSerialisable.SERIALISABLE_TYPE_SUBSCRIPTION_QUERY_LOG_CONTAINER, name )
+        
+        with self.assertRaises( HydrusExceptions.DBException ):
+            
+            self._read( 'serialisable_named', HydrusSerialisable.SERIALISABLE_TYPE_SUBSCRIPTION_QUERY_LOG_CONTAINER, name )
+            
+        
+    
+    def test_url_searches( self ):
+        
+        from hydrus.client import ClientStrings
+        from hydrus.client.db import ClientDBURLMap
+        from hydrus.client.networking import ClientNetworkingURLClass
+        
+        self.assertEqual( ClientDBURLMap.GetRegexRequiredSubstrings( r'^https?://(www\.)?site\.com/post/\d+' ), [ 'http', '://', 'site.com/post/' ] )
+        self.assertEqual( ClientDBURLMap.GetRegexRequiredSubstrings( r'site\.com|other\.org' ), [] )
+        self.assertEqual( ClientDBURLMap.GetRegexRequiredSubstrings( r'(?i)site\.com' ), [] )
+        self.assertEqual( ClientDBURLMap.GetRegexRequiredSubstrings( r'abc[xyz]defg?h' ), [ 'abc', 'def' ] )
+        
+        # escapes with digits must be stepped over whole, or the digits become 'required'
+        
+        self.assertEqual( ClientDBURLMap.GetRegexRequiredSubstrings( r'\x41bcdef' ), [ 'bcdef' ] )
+        self.assertEqual( ClientDBURLMap.GetRegexRequiredSubstrings( r'\u0041bcdef' ), [ 'bcdef' ] )
+        self.assertEqual( ClientDBURLMap.GetRegexRequiredSubstrings( r'\U00000041bcdef' ), [ 'bcdef' ] )
+        self.assertEqual( ClientDBURLMap.GetRegexRequiredSubstrings( r'\N{LATIN CAPITAL LETTER A}bcdef' ), [ 'bcdef' ] )
+        self.assertEqual( ClientDBURLMap.GetRegexRequiredSubstrings( r'\101bcdef' ), [ 'bcdef' ] )
+        self.assertEqual( ClientDBURLMap.GetRegexRequiredSubstrings( r'\0123abc' ), [ '3abc' ] )
+        self.assertEqual( ClientDBURLMap.GetRegexRequiredSubstrings( r'(abc)\1xyz' ), [ 'xyz' ] )
+        self.assertEqual( ClientDBURLMap.GetRegexRequiredSubstrings( r'(a)(b)(c)(d)(e)(f)(g)(h)(i)(j)(k)\11xyz' ), [ 'xyz' ] )
+        
+        for ( regex, text ) in [
+            ( r'\x41bcdef', 'Abcdef' ),
+            ( r'\101bcdef', 'Abcdef' ),
+            ( r'\0123abc', '\n3abc' ),
+            ( r'(abc)\1xyz', 'abcabcxyz' )
+        ]:
+            
+            self.assertIsNotNone( re.search( regex, text ) )
+            
+            for substring in ClientDBURLMap.GetRegexRequiredSubstrings( regex ):
+                
+                self.assertIn( substring, text )
+                
+            
+        
+        
+        TestClientDB._clear_db()
+        
+        path = HydrusStaticDir.GetStaticPath( 'hydrus.png' )
+        
+        file_import_options = FileImportOptionsLegacy.FileImportOptionsLegacy()
+        file_import_options.SetIsDefault( True )
+        
+        file_import_job = ClientImportFiles.FileImportJob( path, file_import_options )
+        
+        file_import_job.GeneratePreImportHashAndStatus()
+        
+        file_import_job.GenerateInfo()
+        
+        self._write( 'import_file', file_import_job )
+        
+        hash = file_import_job.GetHash()
+        
+        def set_urls( action, urls ):
+            
+            content_update_package = ClientContentUpdates.ContentUpdatePackage.STATICCreateFromContentUpdates( CC.LOCAL_FILE_SERVICE_KEY, [ ClientContentUpdates.ContentUpdate( HC.CONTENT_TYPE_URLS, action, ( urls, { hash } ) ) ] )
+            
+            self._write( 'content_updates', content_update_package )
+            
+        
+        def generate_url_class( domain ):
+            
+            return ClientNetworkingURLClass.URLClass(
+                'test',
+                url_type = HC.URL_TYPE_POST,
+                url_domain_mask = ClientNetworkingURLClass.URLDomainMask( raw_domains = [ domain ] ),
+                path_components = [
+                    ( ClientStrings.StringMatch( match_type = ClientStrings.STRING_MATCH_FIXED, match_value = 'post', example_string = 'post' ), None ),
+                    ( ClientStrings.StringMatch( match_type = ClientStrings.STRING_MATCH_ANY, example_string = '123456' ), None )
+                ],
+                parameters = []
+            )
+            
+        
+        def run_known_url_tests( tests ):
+            
+            for ( known_url_rule, result ) in tests:
+                
+                predicates = [ ClientSearchPredicate.Predicate( ClientSearchPredicate.PREDICATE_TYPE_SYSTEM_KNOWN_URLS, known_url_rule + ( 'test', ) ) ]
+                
+                location_context = ClientLocation.LocationContext.STATICCreateSimple( CC.LOCAL_FILE_SERVICE_KEY )
+                
+                search_context = ClientSearchFileSearchContext.FileSearchContext( location_context = location_context, predicates = predicates )
+                
+                file_query_ids = self._read( 'file_query_ids', search_context )
+                
+                self.assertEqual( len( file_query_ids ), result, known_url_rule )
+                
+            
+        
+        set_urls( HC.CONTENT_UPDATE_ADD, [ 'https://site.com/post/123', 'https://site.com/post/456', 'https://other.org/gallery/abc' ] )
+        
+        tests = []
+        
+        # site.com has more mappings than we have files, other.org does not, so we go from both ends here
+        tests.append( ( ( True, 'domain', 'site.com' ), 1 ) )
+        tests.append( ( ( True, 'domain', 'other.org' ), 1 ) )
+        tests.append( ( ( True, 'domain', 'nothing.net' ), 0 ) )
+        tests.append( ( ( False, 'domain', 'site.com' ), 0 ) )
+        
+        tests.append( ( ( True, 'url_class', generate_url_class( 'site.com' ) ), 1 ) )
+        tests.append( ( ( True, 'url_class', generate_url_class( 'other.org' ) ), 0 ) )
+        tests.append( ( ( True, 'url_class', generate_url_class( 'nothing.net' ) ), 0 ) )
+        
+        tests.append( ( ( True, 'regex', r'site\.com/post/\d+' ), 1 ) )
+        tests.append( ( ( True, 'regex', r'GALLERY' ), 0 ) )
+        tests.append( ( ( True, 'regex', r'gallery/[a-c]+$' ), 1 ) )
+        tests.append( ( ( True, 'regex', r'gallery/xyz' ), 0 ) )
+        tests.append( ( ( True, 'regex', r'.*' ), 1 ) )
+        
+        run_known_url_tests( tests )
+        
+        # new urls get picked up by an already cached url class
+        
+        set_urls( HC.CONTENT_UPDATE_ADD, [ 'https://nothing.net/post/789' ] )
+        set_urls( HC.CONTENT_UPDATE_DELETE, [ 'https://other.org/gallery/abc' ] )
+        
+        tests = []
+        
+        tests.append( ( ( True, 'domain', 'nothing.net' ), 1 ) )
+        tests.append( ( ( True, 'domain', 'other.org' ), 0 ) )
+        
+        tests.append( ( ( True, 'url_class', generate_url_class( 'nothing.net' ) ), 1 ) )
+        
+        tests.append( ( ( True, 'regex', r'gallery' ), 0 ) )
+        tests.append( ( ( True, 'regex', r'nothing\.net' ), 1 ) )
+        
+        run_known_url_tests( tests )
+        
+    
+    def test_video_frame_count( self ):
+        
+        hash = os.urandom( 32 )
+        
+        self.assertEqual( self._read( 'video_frame_count', hash ), None )
+        
+        self._write( 'video_frame_count', hash, 120 )
+        
+        self.assertEqual( self._read( 'video_frame_count', hash ), 120 )
+        
+        self._write( 'video_frame_count', hash, 121 )
+        
+        self.assertEqual( self._read( 'video_frame_count', hash ), 121 )
+        
+    
+    def test_video_keyframe_index( self ):
+        
+        hash = os.urandom( 32 )
+        
+        self.assertEqual( self._read( 'video_keyframe_index', hash ), None )
+        
+        keyframe_index = [ ( 0, 0 ), ( 12, 400 ), ( 24, 800 ) ]
+        
+        self._write( 'video_keyframe_index', hash, keyframe_index )
+        
+        self.assertEqual( self._read( 'video_keyframe_index', hash ), keyframe_index )
+        
+        self._write( 'video_keyframe_index', hash, [] )
+        
+        self.assertEqual( self._read( 'video_keyframe_index', hash ), [] )
+        
+    
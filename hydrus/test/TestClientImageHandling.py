@@ -1,13 +1,104 @@
+import numpy
+import os
+import sys
+import threading
+import time
 import unittest
+from unittest import mock
+
+from qtpy import QtGui as QG
+from qtpy import QtWidgets as QW
 
 from hydrus.core import HydrusConstants as HC
+from hydrus.core import HydrusData
+from hydrus.core import HydrusExceptions
 from hydrus.core import HydrusStaticDir
+from hydrus.core.files import HydrusFileHandling
+from hydrus.core.files import HydrusVideoHandling
+from hydrus.core.processes import HydrusSubprocess
 
 from hydrus.client import ClientConstants as CC
+from hydrus.client import ClientPDFHandling
+from hydrus.client import ClientRasterisation
+from hydrus.client import ClientRendering
+from hydrus.client import ClientSVGHandling
+from hydrus.client.caches import ClientCaches
+from hydrus.client.caches import ClientCachesBase
+from hydrus.client.files.images import ClientImageHandling
 from hydrus.client.files.images import ClientImagePerceptualHashes
+from hydrus.client.gui.canvas import ClientGUICanvas
+
+from hydrus.test import HelperFunctions as HF
+from hydrus.test import TestGlobals as TG
+
+def RunOnThreadsWhilePumpingQt( func, num_threads ):
+    
+    # the tests run on the qt thread, so we keep its events going while the workers wait on it
+    
+    results = []
+    errors = []
+    
+    def do_it():
+        
+        try:
+            
+            results.append( func() )
+            
+        except Exception as e:
+            
+            errors.append( e )
+            
+        
+    
+    threads = [ threading.Thread( target = do_it ) for i in range( num_threads ) ]
+    
+    for thread in threads:
+        
+        thread.start()
+        
+    
+    max_num_jobs_running = 0
+    
+    time_started = time.time()
+    
+    while any( ( thread.is_alive() for thread in threads ) ) and time.time() - time_started < 30:
+        
+        QW.QApplication.processEvents()
+        
+        ( num_jobs_running, num_jobs_done ) = ClientRasterisation.rasterisation_pool.GetStatus()
+        
+        max_num_jobs_running = max( max_num_jobs_running, num_jobs_running )
+        
+        time.sleep( 0.001 )
+        
+    
+    if len( errors ) > 0:
+        
+        raise errors[0]
+        
+    
+    return ( results, max_num_jobs_running )
+    
 
 class TestImageHandling( unittest.TestCase ):
     
+    def test_mipmap_level( self ):
+        
+        numpy_image = numpy.zeros( ( 101, 64, 3 ), dtype = 'uint8' )
+        
+        numpy_image[ :, 32: ] = 200
+        
+        mipmap_level = ClientImageHandling.GenerateNumPyImageMipmapLevel( numpy_image )
+        
+        self.assertEqual( mipmap_level.shape, ( 50, 32, 3 ) )
+        self.assertEqual( mipmap_level[ 0, 15 ].tolist(), [ 0, 0, 0 ] )
+        self.assertEqual( mipmap_level[ 0, 16 ].tolist(), [ 200, 200, 200 ] )
+        
+        mipmap_level = ClientImageHandling.GenerateNumPyImageMipmapLevel( numpy.zeros( ( 1, 1, 4 ), dtype = 'uint8' ) )
+        
+        self.assertEqual( mipmap_level.shape, ( 1, 1, 4 ) )
+        
+    
     def test_perceptual_hash( self ):
         
         perceptual_hashes = ClientImagePerceptualHashes.GenerateUsefulShapePerceptualHashes( HydrusStaticDir.GetStaticPath( 'hydrus.png' ), HC.IMAGE_PNG )
@@ -23,3 +114,594 @@ class TestImageHandling( unittest.TestCase ):
         self.assertEqual( perceptual_hashes, set( [ b'\xb4M\xc7\xb2M\xcb8\x1c' ] ) )
         
     
+    def test_tile_cache_groups( self ):
+        
+        class Tile( ClientCachesBase.CacheableObject ):
+            
+            def GetEstimatedMemoryFootprint( self ):
+                
+                return 100
+                
+            
+            def IsFinishedLoading( self ):
+                
+                return True
+                
+            
+        
+        data_cache = ClientCachesBase.DataCache( TG.test_controller, 'test tile cache', 250, key_to_group_callable = lambda key: key[0] )
+        
+        data_cache.AddData( ( b'a', 0 ), Tile() )
+        data_cache.AddData( ( b'a', 1 ), Tile() )
+        data_cache.AddData( ( b'b', 0 ), Tile() )
+        
+        data_cache.DeleteGroup( b'a' )
+        
+        self.assertEqual( data_cache.GetAllKeys(), [ ( b'b', 0 ) ] )
+        
+        data_cache.DeleteGroup( b'c' )
+        
+        # eviction keeps the index tidy too
+        
+        data_cache.AddData( ( b'a', 2 ), Tile() )
+        data_cache.AddData( ( b'a', 3 ), Tile() )
+        data_cache.AddData( ( b'c', 0 ), Tile() )
+        
+        self.assertFalse( data_cache.HasData( ( b'b', 0 ) ) )
+        
+        data_cache.DeleteGroup( b'a' )
+        
+        self.assertEqual( data_cache.GetAllKeys(), [ ( b'c', 0 ) ] )
+        
+    
+    def test_cache_data_grows( self ):
+        
+        class GrowingData( ClientCachesBase.CacheableObject ):
+            
+            def __init__( self ):
+                
+                super().__init__()
+                
+                self.size = 100
+                
+            
+            def GetEstimatedMemoryFootprint( self ):
+                
+                return self.size
+                
+            
+            def IsFinishedLoading( self ):
+                
+                return True
+                
+            
+        
+        data_cache = ClientCachesBase.DataCache( TG.test_controller, 'test image cache', 250 )
+        
+        old_data = GrowingData()
+        new_data = GrowingData()
+        
+        data_cache.AddData( b'a', old_data )
+        data_cache.AddData( b'b', new_data )
+        
+        # like a renderer building its mipmap levels after it was added
+        
+        new_data.size = 200
+        
+        data_cache.UpdateEstimatedMemoryFootprint( b'b' )
+        
+        self.assertFalse( data_cache.HasData( b'a' ) )
+        self.assertTrue( data_cache.HasData( b'b' ) )
+        
+        data_cache.UpdateEstimatedMemoryFootprint( b'c' )
+        
+        # and the new size is what comes off when it goes
+        
+        new_data.size = 300
+        
+        data_cache.UpdateEstimatedMemoryFootprint( b'b' )
+        
+        self.assertEqual( data_cache.GetAllKeys(), [] )
+        
+        data_cache.AddData( b'a', old_data )
+        
+        self.assertTrue( data_cache.HasData( b'a' ) )
+        
+    
+    def test_pdf_rasterisation( self ):
+        
+        if not ClientPDFHandling.PDF_OK:
+            
+            return
+            
+        
+        path = os.path.join( TG.test_controller.db_dir, 'rasterisation_test.pdf' )
+        
+        pdf_writer = QG.QPdfWriter( path )
+        
+        painter = QG.QPainter( pdf_writer )
+        
+        painter.drawText( 100, 100, 'hello pdf world' )
+        
+        painter.end()
+        
+        del pdf_writer
+        
+        try:
+            
+            def do_it():
+                
+                return ( ClientPDFHandling.GenerateThumbnailNumPyFromPDFPath( path, ( 48, 64 ) ), ClientPDFHandling.GetPDFInfo( path ) )
+                
+            
+            ( results, max_num_jobs_running ) = RunOnThreadsWhilePumpingQt( do_it, 6 )
+            
+            self.assertEqual( len( results ), 6 )
+            self.assertLessEqual( max_num_jobs_running, ClientRasterisation.RASTERISATION_MAX_SIMULTANEOUS_JOBS )
+            
+            for ( numpy_image, ( num_words, resolution ) ) in results:
+                
+                self.assertEqual( numpy_image.shape[:2], ( 64, 48 ) )
+                self.assertEqual( num_words, 3 )
+                
+            
+        finally:
+            
+            os.remove( path )
+            
+        
+    
+    def test_svg_rasterisation( self ):
+        
+        path = HydrusStaticDir.GetStaticPath( 'position_random.svg' )
+        
+        def do_it():
+            
+            return ClientSVGHandling.GenerateThumbnailNumPyFromSVGPath( path, ( 64, 48 ) )
+            
+        
+        # several import threads at once. they queue up for the qt thread, a couple at a time
+        
+        ( results, max_num_jobs_running ) = RunOnThreadsWhilePumpingQt( do_it, 6 )
+        
+        self.assertEqual( len( results ), 6 )
+        self.assertLessEqual( max_num_jobs_running, ClientRasterisation.RASTERISATION_MAX_SIMULTANEOUS_JOBS )
+        
+        for numpy_image in results:
+            
+            self.assertEqual( numpy_image.shape[:2], ( 48, 64 ) )
+            
+        
+        ( num_jobs_running, num_jobs_done ) = ClientRasterisation.rasterisation_pool.GetStatus()
+        
+        self.assertEqual( num_jobs_running, 0 )
+        self.assertGreaterEqual( num_jobs_done, 6 )
+        
+        with self.assertRaises( HydrusExceptions.NoThumbnailFileException ):
+            
+            ClientSVGHandling.GenerateThumbnailNumPyFromSVGPath( HydrusStaticDir.GetStaticPath( 'hydrus.png' ), ( 64, 48 ) )
+            
+        
+    
+
+class TestImagePrefetch( unittest.TestCase ):
+    
+    def test_prefetch_cancellation( self ):
+        
+        class FakeImageRenderer( ClientCachesBase.CacheableObject ):
+            
+            def __init__( self, media_result, this_is_for_metadata_alone = False ):
+                
+                super().__init__()
+                
+                self.ready = False
+                
+                renderers_made.append( media_result.GetHash() )
+                
+            
+            def GetEstimatedMemoryFootprint( self ):
+                
+                return 100
+                
+            
+            def IsFinishedLoading( self ):
+                
+                return self.ready
+                
+            
+            def IsReady( self ):
+                
+                return self.ready
+                
+            
+            def MipmapIsWarmForZoom( self, zoom ):
+                
+                return True
+                
+            
+        
+        renderers_made = []
+        
+        media_results = [ HF.GetFakeMediaResult( HydrusData.GenerateKey(), mime = HC.IMAGE_JPEG ) for i in range( 5 ) ]
+        
+        ( a, b, c, d, e ) = media_results
+        
+        with mock.patch.object( ClientRendering, 'ImageRenderer', FakeImageRenderer ), mock.patch.object( ClientCaches, 'PREFETCH_MAX_IN_FLIGHT', 2 ):
+            
+            images_cache = ClientCaches.ImageRendererCache( TG.test_controller )
+            
+            # only two at once, in the order given
+            
+            images_cache.PrefetchImageRenderers( [ a, b, c ] )
+            
+            self.assertEqual( renderers_made, [ a.GetHash(), b.GetHash() ] )
+            
+            # the user jumped, so the renders for the old spot are superseded and dropped
+            
+            images_cache.PrefetchImageRenderers( [ c, d ] )
+            
+            self.assertFalse( images_cache.HasImageRenderer( a.GetHash() ) )
+            self.assertFalse( images_cache.HasImageRenderer( b.GetHash() ) )
+            self.assertTrue( images_cache.HasImageRenderer( c.GetHash() ) )
+            self.assertTrue( images_cache.HasImageRenderer( d.GetHash() ) )
+            
+            # but anything that finished stays, since it is cheap to keep
+            
+            images_cache.GetImageRenderer( c ).ready = True
+            
+            images_cache.PrefetchImageRenderers( [ e ] )
+            
+            self.assertTrue( images_cache.HasImageRenderer( c.GetHash() ) )
+            self.assertFalse( images_cache.HasImageRenderer( d.GetHash() ) )
+            self.assertTrue( images_cache.HasImageRenderer( e.GetHash() ) )
+            
+            self.assertEqual( renderers_made, [ a.GetHash(), b.GetHash(), c.GetHash(), d.GetHash(), e.GetHash() ] )
+            
+        
+    
+    def test_prefetch_direction( self ):
+        
+        class FakeMedia( object ):
+            
+            def __init__( self, index ):
+                
+                self.index = index
+                
+            
+            def GetMediaResult( self ):
+                
+                return self.index
+                
+            
+        
+        class FakeMediaList( object ):
+            
+            def __init__( self, num_media ):
+                
+                self.media = [ FakeMedia( i ) for i in range( num_media ) ]
+                
+            
+            def __len__( self ):
+                
+                return len( self.media )
+                
+            
+            def GetNext( self, media ):
+                
+                return self.media[ ( media.index + 1 ) % len( self.media ) ]
+                
+            
+            def GetPrevious( self, media ):
+                
+                return self.media[ ( media.index - 1 ) % len( self.media ) ]
+                
+            
+            def HasMedia( self, media ):
+                
+                return media in self.media
+                
+            
+            def IndexOf( self, media ):
+                
+                return self.media.index( media )
+                
+            
+        
+        class FakeCanvas( object ):
+            
+            _GetPrefetchNeighboursInPreferenceOrder = ClientGUICanvas.CanvasMediaList._GetPrefetchNeighboursInPreferenceOrder
+            _UpdateNavigationTracking = ClientGUICanvas.CanvasMediaList._UpdateNavigationTracking
+            
+            def __init__( self ):
+                
+                self._media_list = FakeMediaList( 10 )
+                
+                self._current_media = None
+                
+                self._navigation_direction = 0
+                self._fast_navigation_streak = 0
+                self._last_navigation_media = None
+                self._last_navigation_time = 0.0
+                
+            
+            def ShowIndex( self, index ):
+                
+                self._current_media = self._media_list.media[ index ]
+                
+                return self._GetPrefetchNeighboursInPreferenceOrder()
+                
+            
+        
+        canvas = FakeCanvas()
+        
+        num_previous = TG.test_controller.new_options.GetInteger( 'media_viewer_prefetch_num_previous' )
+        num_next = TG.test_controller.new_options.GetInteger( 'media_viewer_prefetch_num_next' )
+        
+        self.assertEqual( ( num_previous, num_next ), ( 2, 3 ) )
+        
+        # opening the viewer, we have no direction, so we go out both ways evenly
+        
+        self.assertEqual( canvas.ShowIndex( 5 ), [ 6, 4, 7, 3, 8 ] )
+        
+        # going forward, forward comes first
+        
+        self.assertEqual( canvas.ShowIndex( 6 ), [ 7, 8, 9, 5, 4 ] )
+        
+        # flicking forward quickly looks further ahead, wrapping around the end
+        
+        self.assertEqual( canvas.ShowIndex( 7 ), [ 8, 9, 0, 1, 6, 5 ] )
+        self.assertEqual( canvas.ShowIndex( 8 ), [ 9, 0, 1, 2, 3, 7, 6 ] )
+        
+        # turning round resets the streak and puts back first
+        
+        self.assertEqual( canvas.ShowIndex( 7 ), [ 6, 5, 8, 9, 0 ] )
+        
+        # a jump is no direction at all
+        
+        self.assertEqual( canvas.ShowIndex( 2 ), [ 3, 1, 4, 0, 5 ] )
+        
+        # and the wrap from the end to the start is still forward
+        
+        canvas.ShowIndex( 9 )
+        
+        self.assertEqual( canvas.ShowIndex( 0 ), [ 1, 2, 3, 9, 8 ] )
+        
+    
+
+class TestVideoHandling( unittest.TestCase ):
+    
+    def test_frame_count( self ):
+        
+        lines = [
+            '#tb 0: 1/90000',
+            '#media_type 0: video',
+            '#codec_id 0: h264',
+            '0,      -3003,      -3003,     3003,    100, 0x00000000, F=0x0',
+            '0,      -3003,          0,     3003,    32338, 0xebb94729',
+            '0,          0,       6006,     3003,    1000, 0x00000000, F=0x0',
+            '0,       3003,       3003,     3003,    1000, 0x00000000, F=0x0'
+        ]
+        
+        self.assertEqual( HydrusVideoHandling.ParseFFMPEGFrameCRCCodec( lines ), 'h264' )
+        self.assertEqual( HydrusVideoHandling.ParseFFMPEGFrameCRCNumFrames( lines ), 3 )
+        
+        # discard packets are not frames, and side data does not confuse the flags
+        
+        lines = [
+            '#tb 0: 1/90000',
+            '#codec_id 0: h264',
+            '0,      -6006,      -6006,     3003,    100, 0x00000000, F=0x5',
+            '0,      -3003,          0,     3003,    32338, 0xebb94729, S=1,       10, 0x00010001',
+            '0,          0,       6006,     3003,    1000, 0x00000000, F=0x0, S=1,       10, 0x00010001',
+            '0,       3003,       3003,     3003,    1000, 0x00000000, F=0x4'
+        ]
+        
+        self.assertEqual( HydrusVideoHandling.ParseFFMPEGFrameCRCNumFrames( lines ), 2 )
+        
+        # packets with no pts, or sharing a pts, are fields or similar, so we will not trust a count
+        
+        lines = [
+            '#tb 0: 1/90000',
+            '0,      -3003,          0,     3003,    32338, 0xebb94729',
+            '0,          0, -9223372036854775808,     1501,    1000, 0x00000000, F=0x0',
+            '0,       3003,       3003,     3003,    1000, 0x00000000, F=0x0'
+        ]
+        
+        self.assertIsNone( HydrusVideoHandling.ParseFFMPEGFrameCRCNumFrames( lines ) )
+        
+        lines = [
+            '#tb 0: 1/90000',
+            '0,      -3003,          0,     3003,    32338, 0xebb94729',
+            '0,          0,          0,     1501,    1000, 0x00000000, F=0x0'
+        ]
+        
+        self.assertIsNone( HydrusVideoHandling.ParseFFMPEGFrameCRCNumFrames( lines ) )
+        
+        self.assertTrue( HydrusVideoHandling.ParseFFMPEGVideoIsInterlaced( [ '  Stream #0:0[0x1e0]: Video: mpeg2video (Main), yuv420p(tv, top first), 720x576 [SAR 16:15 DAR 4:3], 25 fps, 25 tbr, 90k tbn' ] ) )
+        self.assertTrue( HydrusVideoHandling.ParseFFMPEGVideoIsInterlaced( [ '  Stream #0:0: Video: h264 (High), yuv420p(tv, bt709, bottom coded first (swapped)), 1920x1080, 25 fps, 25 tbr, 1k tbn' ] ) )
+        self.assertFalse( HydrusVideoHandling.ParseFFMPEGVideoIsInterlaced( [ '  Stream #0:0: Video: h264 (High), yuv420p(tv, bt709, progressive), 1920x1080, 25 fps, 25 tbr, 1k tbn' ] ) )
+        
+        # mp4 packets are trustworthy. the vp8 webm has alt-ref packets, so it has to fall back to a decode
+        
+        for ( filename, expected_num_frames ) in [ ( 'muh_mp4.mp4', 151 ), ( 'muh_mpeg.mpeg', 105 ), ( 'muh_webm.webm', 120 ) ]:
+            
+            path = HydrusStaticDir.GetStaticPath( os.path.join( 'testing', filename ) )
+            
+            hash = HydrusFileHandling.GetHashFromPath( path )
+            
+            self.assertEqual( HydrusVideoHandling.GetFFMPEGNumFrames( path, hash = hash ), expected_num_frames )
+            self.assertEqual( HydrusVideoHandling.GetCachedNumFrames( hash ), expected_num_frames )
+            
+        
+        # the alt-ref packets share a pts with the frame they go with, so the packet count is not trusted even without the codec check
+        
+        path = HydrusStaticDir.GetStaticPath( os.path.join( 'testing', 'muh_webm.webm' ) )
+        
+        self.assertIsNone( HydrusVideoHandling.ParseFFMPEGFrameCRCNumFrames( HydrusVideoHandling.GetFFMPEGPacketScanLines( path ) ) )
+        
+        # a packet count way over what the container says is not trusted
+        
+        path = HydrusStaticDir.GetStaticPath( os.path.join( 'testing', 'muh_mpeg.mpeg' ) )
+        
+        with mock.patch.object( HydrusVideoHandling, 'ParseFFMPEGFrameCRCNumFrames', return_value = 210 ):
+            
+            self.assertEqual( HydrusVideoHandling.GetFFMPEGNumFrames( path, expected_num_frames = 105 ), 105 )
+            
+        
+    
+    def test_frame_ring_buffer( self ):
+        
+        frame_ring_buffer = ClientRendering.VideoFrameRingBuffer( 3, ( 8, 4 ), 3 )
+        
+        self.assertEqual( frame_ring_buffer.GetSlotArray( 0 ).shape, ( 4, 8, 3 ) )
+        
+        slots = [ frame_ring_buffer.ClaimSlot() for i in range( 3 ) ]
+        
+        self.assertEqual( sorted( slots ), [ 0, 1, 2 ] )
+        self.assertEqual( frame_ring_buffer.ClaimSlot(), None )
+        
+        # a pinned slot is not recycled until something else is pinned
+        
+        frame_ring_buffer.PinSlot( slots[0] )
+        frame_ring_buffer.ReleaseSlot( slots[0] )
+        
+        self.assertEqual( frame_ring_buffer.ClaimSlot(), None )
+        
+        frame_ring_buffer.PinSlot( slots[1] )
+        
+        self.assertEqual( frame_ring_buffer.ClaimSlot(), slots[0] )
+        
+        frame_ring_buffer.ReleaseSlot( slots[2] )
+        
+        self.assertEqual( frame_ring_buffer.ClaimSlot(), slots[2] )
+        
+        # the views are zero-copy
+        
+        frame = ClientRendering.VideoFrameRingBufferFrame( frame_ring_buffer, slots[1] )
+        
+        frame_ring_buffer.GetSlotArray( slots[1] )[:] = 7
+        
+        self.assertEqual( frame.GetNumPyImage().sum(), 7 * 4 * 8 * 3 )
+        self.assertEqual( frame.GetSize(), ( 8, 4 ) )
+        
+    
+    def test_frame_read_timeout( self ):
+        
+        # a decoder that stalls partway through a frame. once the read times out, the reader must be done with the buffer
+        
+        cmd = [ sys.executable, '-c', 'import sys, time; sys.stdout.buffer.write( b"a" * 10 ); sys.stdout.flush(); time.sleep( 30 ); sys.stdout.buffer.write( b"b" * 90 )' ]
+        
+        process_reader = HydrusSubprocess.SubprocessContextIntoReader( cmd, timeout = 1, bufsize = 100, text = False )
+        
+        destination = numpy.zeros( 100, dtype = numpy.uint8 )
+        
+        with self.assertRaises( HydrusExceptions.SubprocessTimedOut ):
+            
+            process_reader.ReadChunkInto( destination )
+            
+        
+        self.assertTrue( process_reader._reader_done.is_set() )
+        
+        self.assertEqual( bytes( destination[:10] ), b'a' * 10 )
+        self.assertEqual( destination[10:].sum(), 0 )
+        
+        self.assertEqual( process_reader.ReadChunkInto( destination ), 0 )
+        
+    
+    def test_keyframe_index( self ):
+        
+        lines = [
+            '#tb 0: 1/90000',
+            '#media_type 0: video',
+            '0,      -3003,      -3003,     3003,    100, 0x00000000, F=0x0',
+            '0,      -3003,          0,     3003,    32338, 0xebb94729',
+            '0,          0,       6006,     3003,    1000, 0x00000000, F=0x0',
+            '0,       3003,       3003,     3003,    1000, 0x00000000, F=0x0',
+            '0,       6006,       9009,     3003,    12240, 0x34b06524',
+            '0,       9009,      12012,     3003,    1000, 0x00000000, F=0x0'
+        ]
+        
+        self.assertEqual( HydrusVideoHandling.ParseFFMPEGFrameCRCKeyframeIndex( lines ), [ ( 0, 0 ), ( 3, 100 ) ] )
+        
+        # a keyframe with extra flags or side data is still a keyframe, and discard packets are not frames
+        
+        lines = [
+            '#tb 0: 1/90000',
+            '0,      -6006,      -6006,     3003,    100, 0x00000000, F=0x5',
+            '0,      -3003,          0,     3003,    32338, 0xebb94729, S=1,       10, 0x00010001',
+            '0,          0,       3003,     3003,    1000, 0x00000000, F=0x0, S=1,       10, 0x00010001',
+            '0,       3003,       6006,     3003,    12240, 0x34b06524, F=0x9',
+            '0,       6006,       9009,     3003,    1000, 0x00000000, F=0x4'
+        ]
+        
+        self.assertEqual( HydrusVideoHandling.ParseFFMPEGFrameCRCKeyframeIndex( lines ), [ ( 0, 0 ), ( 2, 66 ) ] )
+        
+        path = HydrusStaticDir.GetStaticPath( os.path.join( 'testing', 'muh_mpeg.mpeg' ) )
+        
+        keyframe_index = HydrusVideoHandling.GetFFMPEGKeyframeIndex( path )
+        
+        self.assertEqual( [ frame_index for ( frame_index, timestamp_ms ) in keyframe_index ], list( range( 0, 105, 12 ) ) )
+        self.assertEqual( keyframe_index[1], ( 12, 400 ) )
+        
+    
+    def test_keyframe_seek( self ):
+        
+        path = HydrusStaticDir.GetStaticPath( os.path.join( 'testing', 'muh_mpeg.mpeg' ) )
+        
+        ( resolution, duration_ms, num_frames, has_audio ) = HydrusVideoHandling.GetFFMPEGVideoProperties( path )
+        
+        target_resolution = ( 64, 48 )
+        
+        renderer = HydrusVideoHandling.VideoRendererFFMPEG( path, HC.VIDEO_MPEG, duration_ms, num_frames, target_resolution )
+        
+        try:
+            
+            frames = [ renderer.read_frame().copy() for i in range( 40 ) ]
+            
+        finally:
+            
+            renderer.close()
+            
+        
+        keyframe_index = HydrusVideoHandling.GetFFMPEGKeyframeIndex( path )
+        
+        renderer = HydrusVideoHandling.VideoRendererFFMPEG( path, HC.VIDEO_MPEG, duration_ms, num_frames, target_resolution, start_pos = 10, keyframe_index = keyframe_index )
+        
+        try:
+            
+            destination = numpy.zeros( ( 48, 64, 3 ), dtype = numpy.uint8 )
+            
+            for pos in range( 10, 14 ):
+                
+                self.assertTrue( renderer.read_frame_into( destination ) )
+                
+                self.assertEqual( destination.tolist(), frames[ pos ].tolist() )
+                
+            
+        finally:
+            
+            renderer.close()
+            
+        
+        renderer = HydrusVideoHandling.VideoRendererFFMPEG( path, HC.VIDEO_MPEG, duration_ms, num_frames, target_resolution, start_pos = 30, keyframe_index = keyframe_index )
+        
+        try:
+            
+            # on a keyframe, mid-gop, back into a gop we have a warm decoder for, and then repeats
+            
+            for pos in ( 30, 24, 27, 13, 5, 36, 24, 30 ):
+                
+                renderer.set_position( pos )
+                
+                self.assertEqual( renderer.read_frame().tolist(), frames[ pos ].tolist() )
+                self.assertEqual( renderer.read_frame().tolist(), frames[ pos + 1 ].tolist() )
+                
+            
+            self.assertLessEqual( len( renderer._warm_decoders ), HydrusVideoHandling.WARM_DECODER_CACHE_SIZE )
+            
+        finally:
+            
+            renderer.close()
+            
+        
+        self.assertEqual( renderer._warm_decoders, [] )
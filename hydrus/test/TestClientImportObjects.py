@@ -3,10 +3,12 @@ import random
 import unittest
 
 from hydrus.core import HydrusConstants as HC
+from hydrus.core import HydrusTime
 
 from hydrus.client import ClientConstants as CC
 from hydrus.client import ClientStrings
 from hydrus.client.importing import ClientImportFileSeeds
+from hydrus.client.importing import ClientImportSubscriptions
 from hydrus.client.networking import ClientNetworkingURLClass
 
 from hydrus.test import TestGlobals as TG
@@ -330,3 +332,137 @@ class TestFileSeedCache( unittest.TestCase ):
         dm.SetURLClasses( original_url_classes )
         
     
+
+class FakeSubscription( object ):
+    
+    def __init__( self, name, next_work_time ):
+        
+        self._name = name
+        self._next_work_time = next_work_time
+        
+    
+    def GetBestEarliestNextWorkTime( self ):
+        
+        return self._next_work_time
+        
+    
+    def GetName( self ):
+        
+        return self._name
+        
+    
+    def IsExpectingToWorkInFuture( self ):
+        
+        return self._next_work_time is not None
+        
+    
+
+class TestSubscriptionsManager( unittest.TestCase ):
+    
+    def test_scheduling( self ):
+        
+        now = HydrusTime.GetNow()
+        
+        subscriptions = [
+            FakeSubscription( 'sub 10', now - 100 ),
+            FakeSubscription( 'sub 2', now - 50 ),
+            FakeSubscription( 'sub 1', now + 1000 ),
+            FakeSubscription( 'sub 3', None )
+        ]
+        
+        TG.test_controller.new_options.SetBoolean( 'process_subs_in_random_order', False )
+        
+        subscriptions_manager = ClientImportSubscriptions.SubscriptionsManager( TG.test_controller, subscriptions )
+        
+        # fresh boot, no timing info, everything goes in human order
+        
+        selected = []
+        
+        while True:
+            
+            subscription = subscriptions_manager._GetSubscriptionReadyToGo()
+            
+            if subscription is None:
+                
+                break
+                
+            
+            selected.append( subscription.GetName() )
+            
+        
+        self.assertEqual( selected, [ 'sub 1', 'sub 2', 'sub 3', 'sub 10' ] )
+        
+        #
+        
+        subscriptions_manager.SetSubscriptions( subscriptions )
+        
+        selected = []
+        
+        while True:
+            
+            subscription = subscriptions_manager._GetSubscriptionReadyToGo()
+            
+            if subscription is None:
+                
+                break
+                
+            
+            selected.append( subscription.GetName() )
+            
+        
+        self.assertEqual( selected, [ 'sub 2', 'sub 10' ] )
+        
+        # we sleep until the next due sub, not a poll
+        
+        wait_time = subscriptions_manager._GetMainLoopWaitTime()
+        
+        self.assertGreater( wait_time, 500 )
+        self.assertLessEqual( wait_time, ClientImportSubscriptions.SUBSCRIPTION_MANAGER_MAX_WAIT_TIME )
+        
+        # a reschedule makes the old heap entry stale
+        
+        subscriptions[2] = FakeSubscription( 'sub 1', now - 10 )
+        
+        subscriptions_manager._UpdateSubscriptionInfo( subscriptions[2] )
+        
+        self.assertEqual( subscriptions_manager._GetMainLoopWaitTime(), 0.5 )
+        self.assertEqual( subscriptions_manager._GetSubscriptionReadyToGo().GetName(), 'sub 1' )
+        self.assertIsNone( subscriptions_manager._GetSubscriptionReadyToGo() )
+        
+        self.assertEqual( subscriptions_manager._GetMainLoopWaitTime(), ClientImportSubscriptions.SUBSCRIPTION_MANAGER_MAX_WAIT_TIME )
+        
+        #
+        
+        TG.test_controller.new_options.SetBoolean( 'process_subs_in_random_order', True )
+        
+        subscriptions_manager.SetSubscriptions( [ FakeSubscription( f'sub {i}', now - 100 - i ) for i in range( 20 ) ] )
+        
+        selected = set()
+        
+        while True:
+            
+            subscription = subscriptions_manager._GetSubscriptionReadyToGo()
+            
+            if subscription is None:
+                
+                break
+                
+            
+            selected.add( subscription.GetName() )
+            
+        
+        self.assertEqual( selected, { f'sub {i}' for i in range( 20 ) } )
+        
+        # resuming after an edit wakes the loop, which may have gone to a long sleep while we were paused
+        
+        subscriptions_manager.PauseSubscriptionsForEditing()
+        
+        subscriptions_manager._wake_from_work_sleep_event.clear()
+        
+        self.assertEqual( subscriptions_manager._GetMainLoopWaitTime(), ClientImportSubscriptions.SUBSCRIPTION_MANAGER_MAX_WAIT_TIME )
+        
+        subscriptions_manager.ResumeSubscriptionsAfterEditing()
+        
+        self.assertTrue( subscriptions_manager._wake_from_work_sleep_event.is_set() )
+        
+    
@@ -2,6 +2,7 @@ import collections
 import collections.abc
 import os
 import random
+import sqlite3
 import time
 import typing
 import unittest
@@ -1285,6 +1286,73 @@ class TestMigration( unittest.TestCase ):
         self._test_mappings_list_to_service()
         
     
+    def test_hta_bulk_writers( self ):
+        
+        hta_path = os.path.join( TestController.DB_DIR, 'bulk_hta.db' )
+        
+        hashes_and_tags = [ ( HydrusData.GenerateKey(), { 'blue eyes', 'character:samus aran' } ) for i in range( 100 ) ]
+        
+        # dupes across and within chunks are fine
+        hashes_and_tags.append( ( hashes_and_tags[0][0], { 'blue eyes', 'series:metroid' } ) )
+        
+        hta = HydrusTagArchive.HydrusTagArchive( hta_path )
+        
+        hta.SetHashType( HydrusTagArchive.HASH_TYPE_SHA256 )
+        
+        hta.BeginBigJob( defer_index_creation = True )
+        
+        hta.AddMappingsBulk( hashes_and_tags[ : 50 ] )
+        hta.AddMappingsBulk( hashes_and_tags[ 50 : ] )
+        
+        hta.CommitBigJob()
+        
+        expected_data = collections.defaultdict( set )
+        
+        for ( hash, tags ) in hashes_and_tags:
+            
+            expected_data[ hash ].update( tags )
+            
+        
+        self.assertEqual( dict( hta.IterateMappings() ), dict( expected_data ) )
+        
+        self.assertEqual( set( hta.GetNamespaces() ), { '', 'character', 'series' } )
+        
+        hta.Close()
+        
+        #
+        
+        db = sqlite3.connect( hta_path )
+        
+        index_names = { name for ( name, ) in db.execute( 'SELECT name FROM sqlite_master WHERE type = ?;', ( 'index', ) ) }
+        
+        db.close()
+        
+        self.assertIn( 'mappings_hash_id_index', index_names )
+        
+        os.remove( hta_path )
+        
+        #
+        
+        htpa_path = os.path.join( TestController.DB_DIR, 'bulk_htpa.db' )
+        
+        htpa = HydrusTagArchive.HydrusTagPairArchive( htpa_path )
+        
+        htpa.SetPairType( HydrusTagArchive.TAG_PAIR_TYPE_SIBLINGS )
+        
+        htpa.BeginBigJob()
+        
+        htpa.AddPairs( current_siblings_pool )
+        htpa.AddPairs( current_siblings_pool[ : 2 ] )
+        
+        htpa.CommitBigJob()
+        
+        self.assertEqual( set( htpa.IteratePairs() ), set( current_siblings_pool ) )
+        
+        htpa.Close()
+        
+        os.remove( htpa_path )
+        
+    
     def test_migration_parents( self ):
         
         self._clear_db()
@@ -1,3 +1,5 @@
+import collections
+import os
 import time
 import unittest
 
@@ -13,6 +15,7 @@ from hydrus.core import HydrusTime
 from hydrus.core.networking import HydrusNetworking
 
 from hydrus.client import ClientConstants as CC
+from hydrus.client import ClientDefaults
 from hydrus.client import ClientStrings
 from hydrus.client import ClientServices
 from hydrus.client.networking import ClientNetworking
@@ -28,6 +31,9 @@ from hydrus.client.networking import ClientNetworkingURLClass
 
 from hydrus.test import TestController
 
+# the slow microbenchmarks only run when asked for
+RUN_BENCHMARKS = os.environ.get( 'HYDRUS_TEST_BENCHMARKS', '' ) != ''
+
 # some gumpf
 GOOD_RESPONSE = bytes( range( 256 ) )
 
@@ -1135,6 +1141,178 @@ class TestURLClasses( unittest.TestCase ):
         
     
 
+class TestURLClassMatcher( unittest.TestCase ):
+    
+    def _GetNaiveLookup( self, url_classes ):
+        
+        url_domain_masks_to_url_classes = collections.defaultdict( list )
+        
+        for url_class in url_classes:
+            
+            url_domain_masks_to_url_classes[ url_class.GetURLDomainMask() ].append( url_class )
+            
+        
+        for mask_url_classes in url_domain_masks_to_url_classes.values():
+            
+            ClientNetworkingURLClass.SortURLClassesListDescendingComplexity( mask_url_classes )
+            
+        
+        return url_domain_masks_to_url_classes
+        
+    
+    def _GetURLClassNaive( self, url_domain_masks_to_url_classes, url ):
+        
+        # the old linear scan, for comparison
+        
+        try:
+            
+            domain = ClientNetworkingFunctions.ConvertURLIntoDomain( url )
+            
+        except HydrusExceptions.URLClassException:
+            
+            return None
+            
+        
+        url_domain_masks = [ url_domain_mask for url_domain_mask in url_domain_masks_to_url_classes.keys() if url_domain_mask.Matches( domain ) ]
+        
+        url_domain_masks.sort( key = lambda udm: udm.GetSortingComplexity(), reverse = True )
+        
+        for url_domain_mask in url_domain_masks:
+            
+            for url_class in url_domain_masks_to_url_classes[ url_domain_mask ]:
+                
+                if url_class.Matches( url ):
+                    
+                    return url_class
+                    
+                
+            
+        
+        return None
+        
+    
+    def _GetTestURLs( self, url_classes ):
+        
+        urls = []
+        
+        for url_class in url_classes:
+            
+            example_url = url_class.GetExampleURL()
+            
+            urls.append( example_url )
+            urls.append( example_url + '&extra_gumpf=1' )
+            urls.append( example_url.replace( 'https://', 'https://www.' ) )
+            urls.append( example_url.replace( 'https://', 'https://subdomain.' ) )
+            urls.append( example_url.rsplit( '/', 1 )[0] )
+            urls.append( example_url + '/extra_component' )
+            
+        
+        urls.append( 'https://unknown.site/post/123456' )
+        urls.append( 'not a url at all' )
+        
+        return urls
+        
+    
+    def test_matcher_matches_naive_scan( self ):
+        
+        url_classes = ClientDefaults.GetDefaultURLClasses()
+        
+        naive_lookup = self._GetNaiveLookup( url_classes )
+        
+        matcher = ClientNetworkingURLClass.URLClassMatcher( url_classes )
+        
+        for url in self._GetTestURLs( url_classes ):
+            
+            self.assertEqual( matcher.GetURLClass( url ), self._GetURLClassNaive( naive_lookup, url ), url )
+            
+        
+    
+    def test_domain_manager_normalisation_cache( self ):
+        
+        domain_manager = ClientNetworkingDomain.NetworkDomainManager()
+        
+        url_classes = ClientDefaults.GetDefaultURLClasses()
+        
+        domain_manager.SetURLClasses( url_classes )
+        
+        naive_lookup = self._GetNaiveLookup( url_classes )
+        
+        for url_class in url_classes:
+            
+            example_url = url_class.GetExampleURL()
+            
+            expected_url_class = self._GetURLClassNaive( naive_lookup, example_url )
+            
+            if expected_url_class is None:
+                
+                continue
+                
+            
+            expected_normalised_url = expected_url_class.Normalise( example_url )
+            
+            self.assertEqual( domain_manager.NormaliseURL( example_url ), expected_normalised_url )
+            self.assertEqual( domain_manager.NormaliseURL( example_url ), expected_normalised_url )
+            
+        
+        # changing the url classes must clear the cache
+        
+        example_url = url_classes[0].GetExampleURL()
+        
+        domain_manager.NormaliseURL( example_url )
+        
+        domain_manager.SetURLClasses( [] )
+        
+        self.assertEqual( domain_manager.NormaliseURL( example_url ), ClientNetworkingFunctions.EnsureURLIsEncoded( example_url, keep_fragment = False ) )
+        
+    
+    def test_matcher_speed( self ):
+        
+        # the naive scan comparison above covers correctness. this is just the timing, so it only runs when the env var is set
+        
+        if not RUN_BENCHMARKS:
+            
+            return
+            
+        
+        url_classes = ClientDefaults.GetDefaultURLClasses()
+        
+        urls = self._GetTestURLs( url_classes )
+        
+        num_rounds = 5
+        
+        naive_lookup = self._GetNaiveLookup( url_classes )
+        
+        time_started = HydrusTime.GetNowPrecise()
+        
+        naive_results = []
+        
+        for i in range( num_rounds ):
+            
+            naive_results = [ self._GetURLClassNaive( naive_lookup, url ) for url in urls ]
+            
+        
+        naive_time = HydrusTime.GetNowPrecise() - time_started
+        
+        time_started = HydrusTime.GetNowPrecise()
+        
+        matcher_results = []
+        
+        for i in range( num_rounds ):
+            
+            # fresh each round, so the domain cache does not flatter us
+            matcher = ClientNetworkingURLClass.URLClassMatcher( url_classes )
+            
+            matcher_results = [ matcher.GetURLClass( url ) for url in urls ]
+            
+        
+        matcher_time = HydrusTime.GetNowPrecise() - time_started
+        
+        self.assertEqual( naive_results, matcher_results )
+        
+        HydrusData.Print( f'URL Class matching, {len( urls ) * num_rounds} lookups against {len( url_classes )} url classes: naive scan {HydrusTime.TimeDeltaToPrettyTimeDelta( naive_time )}, compiled matcher {HydrusTime.TimeDeltaToPrettyTimeDelta( matcher_time )}' )
+        
+    
+
 class TestNetworkingEngine( unittest.TestCase ):
     
     def test_engine_shutdown_app( self ):
@@ -1,12 +1,15 @@
 import os
+import random
 import unittest
 
 from hydrus.core import HydrusConstants as HC
 
 from hydrus.client import ClientConstants as CC
+from hydrus.client.db import ClientDBFilesSearch
 from hydrus.client.metadata import ClientTagsHandling
 from hydrus.client.search import ClientNumberTest
 from hydrus.client.search import ClientSearchAutocomplete
+from hydrus.client.search import ClientSearchHashIdSet
 from hydrus.client.search import ClientSearchParseSystemPredicates
 from hydrus.client.search import ClientSearchPredicate
 
@@ -1877,3 +1880,97 @@ class TestAutocompletePredGubbins( unittest.TestCase ):
         self.assertEqual( tag_autocomplete_options.GetExactMatchCharacterThreshold(), 2 )
         
     
+
+class TestHashIdSet( unittest.TestCase ):
+    
+    def test_algebra( self ):
+        
+        for ( size_1, size_2 ) in [ ( 0, 100 ), ( 1000, 1000 ), ( 50, 100000 ), ( 100000, 50 ), ( 70000, 80000 ) ]:
+            
+            python_1 = set( random.sample( range( 200000 ), size_1 ) )
+            python_2 = set( random.sample( range( 200000 ), size_2 ) )
+            
+            hash_id_set_1 = ClientSearchHashIdSet.HashIdSet( python_1 )
+            hash_id_set_2 = ClientSearchHashIdSet.HashIdSet( list( python_2 ) + list( python_2 )[:10] )
+            
+            self.assertEqual( len( hash_id_set_1 ), len( python_1 ) )
+            self.assertEqual( set( hash_id_set_2 ), python_2 )
+            
+            self.assertEqual( set( hash_id_set_1.intersection( python_2 ) ), python_1.intersection( python_2 ) )
+            self.assertEqual( set( hash_id_set_1.intersection( hash_id_set_2 ) ), python_1.intersection( python_2 ) )
+            self.assertEqual( set( hash_id_set_1.difference( python_2 ) ), python_1.difference( python_2 ) )
+            self.assertEqual( set( hash_id_set_1.union( hash_id_set_2 ) ), python_1.union( python_2 ) )
+            self.assertEqual( set( hash_id_set_1 & hash_id_set_2 ), python_1 & python_2 )
+            self.assertEqual( set( hash_id_set_1 - python_2 ), python_1 - python_2 )
+            
+            self.assertEqual( set( ClientSearchHashIdSet.IntersectHashIds( python_1, hash_id_set_2 ) ), python_1.intersection( python_2 ) )
+            
+            # the inputs are untouched
+            
+            self.assertEqual( set( hash_id_set_1 ), python_1 )
+            self.assertEqual( set( hash_id_set_2 ), python_2 )
+            
+        
+        hash_id_set = ClientSearchHashIdSet.HashIdSet( [ 5, 3, 1 ] )
+        
+        self.assertEqual( list( hash_id_set ), [ 1, 3, 5 ] )
+        self.assertTrue( all( type( hash_id ) == int for hash_id in hash_id_set ) )
+        
+        self.assertIn( 3, hash_id_set )
+        self.assertNotIn( 4, hash_id_set )
+        self.assertNotIn( 6, hash_id_set )
+        
+        hash_id_set.add( 4 )
+        hash_id_set.discard( 1 )
+        hash_id_set.discard( 100 )
+        
+        self.assertEqual( list( hash_id_set ), [ 3, 4, 5 ] )
+        
+        hash_id_set.intersection_update( { 4, 5, 6 } )
+        
+        self.assertEqual( list( hash_id_set ), [ 4, 5 ] )
+        
+        hash_id_set.difference_update( [ 5 ] )
+        
+        self.assertEqual( list( hash_id_set ), [ 4 ] )
+        
+        hash_id_set.update( { 2 ** 40 } )
+        
+        self.assertEqual( list( hash_id_set ), [ 4, 2 ** 40 ] )
+        
+    
+    def test_intersection_update_qhi( self ):
+        
+        big = set( range( ClientSearchHashIdSet.HASH_ID_SET_THRESHOLD * 2 ) )
+        small = { 3, 5, 7, -1 }
+        
+        query_hash_ids = ClientDBFilesSearch.intersection_update_qhi( None, big )
+        
+        self.assertIsInstance( query_hash_ids, ClientSearchHashIdSet.HashIdSet )
+        self.assertEqual( len( query_hash_ids ), len( big ) )
+        
+        query_hash_ids = ClientDBFilesSearch.intersection_update_qhi( query_hash_ids, small )
+        
+        self.assertEqual( set( query_hash_ids ), { 3, 5, 7 } )
+        
+        # force_create_new_set must not hand back something the caller owns
+        
+        original = ClientSearchHashIdSet.HashIdSet( big )
+        
+        query_hash_ids = ClientDBFilesSearch.intersection_update_qhi( None, original, force_create_new_set = True )
+        
+        query_hash_ids.intersection_update( small )
+        
+        self.assertEqual( len( original ), len( big ) )
+        
+        # small python set against a big HashIdSet
+        
+        query_hash_ids = ClientDBFilesSearch.intersection_update_qhi( set( small ), original )
+        
+        self.assertEqual( set( query_hash_ids ), { 3, 5, 7 } )
+        
+        query_hash_ids = ClientDBFilesSearch.intersection_update_qhi( None, small )
+        
+        self.assertIsInstance( query_hash_ids, set )
+        
+    
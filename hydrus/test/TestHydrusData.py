@@ -3,6 +3,7 @@ import unittest
 
 from hydrus.core import HydrusLists
 from hydrus.core import HydrusNumbers
+from hydrus.core import HydrusPubSub
 
 class TestHydrusNumbers( unittest.TestCase ):
     
@@ -22,6 +23,99 @@ class TestHydrusNumbers( unittest.TestCase ):
         
     
 
+class TestHydrusPubSub( unittest.TestCase ):
+    
+    class _Listener( object ):
+        
+        def __init__( self ):
+            
+            self.calls = []
+            
+        
+        def Receive( self, *args, **kwargs ):
+            
+            self.calls.append( ( args, kwargs ) )
+            
+        
+    
+    def test_coalescing( self ):
+        
+        pubsub = HydrusPubSub.HydrusPubSub( lambda obj: True )
+        
+        listener = self._Listener()
+        
+        pubsub.sub( listener, 'Receive', 'argless' )
+        pubsub.sub( listener, 'Receive', 'merged' )
+        pubsub.sub( listener, 'Receive', 'normal' )
+        
+        pubsub.SetTopicCoalescing( 'argless' )
+        pubsub.SetTopicCoalescing( 'merged', merge_callable = lambda rows: [ ( ( sum( args[0] for ( args, kwargs ) in rows ), ), {} ) ] )
+        
+        pubsub.pub( 'argless' )
+        pubsub.pub( 'merged', 1 )
+        pubsub.pub( 'argless', 5 )
+        pubsub.pub( 'normal', 1 )
+        pubsub.pub( 'normal', 1 )
+        pubsub.pub( 'argless' )
+        pubsub.pub( 'merged', 2 )
+        
+        pubsub.Process()
+        
+        self.assertEqual( listener.calls, [ ( ( 5, ), {} ), ( ( 1, ), {} ), ( ( 1, ), {} ), ( (), {} ), ( ( 3, ), {} ) ] )
+        
+        timings = pubsub.GetTopicTimings()
+        
+        self.assertEqual( timings[ 'argless' ][:2], ( 2, 1 ) )
+        self.assertEqual( timings[ 'merged' ][:2], ( 1, 1 ) )
+        self.assertEqual( timings[ 'normal' ][:2], ( 2, 0 ) )
+        
+        pubsub.ClearTopicTimings()
+        
+        self.assertEqual( pubsub.GetTopicTimings(), {} )
+        
+    
+    def test_weak_subscriptions( self ):
+        
+        pubsub = HydrusPubSub.HydrusPubSub( lambda obj: True )
+        
+        listener_1 = self._Listener()
+        
+        pubsub.sub( listener_1, 'Receive', 'topic' )
+        
+        pubsub.pub( 'topic', 1 )
+        
+        pubsub.Process()
+        
+        self.assertEqual( listener_1.calls, [ ( ( 1, ), {} ) ] )
+        
+        # a new sub after the callables were cached still hears the next pub
+        
+        listener_2 = self._Listener()
+        
+        pubsub.sub( listener_2, 'Receive', 'topic' )
+        
+        pubsub.pub( 'topic', 2 )
+        
+        pubsub.Process()
+        
+        self.assertEqual( listener_1.calls[-1], ( ( 2, ), {} ) )
+        self.assertEqual( listener_2.calls, [ ( ( 2, ), {} ) ] )
+        
+        # and the pubsub does not keep a listener alive
+        
+        listener_1_calls = listener_1.calls
+        
+        del listener_1
+        
+        pubsub.pub( 'topic', 3 )
+        
+        pubsub.Process()
+        
+        self.assertEqual( len( listener_1_calls ), 2 )
+        self.assertEqual( listener_2.calls[-1], ( ( 3, ), {} ) )
+        
+    
+
 class TestHydrusLists( unittest.TestCase ):
     
     def test_unique_fast_list( self ):
@@ -1,12 +1,19 @@
+import collections
+import os
 import random
 import unittest
 
 from unittest import mock
 
 from hydrus.core import HydrusConstants as HC
+from hydrus.core import HydrusData
+from hydrus.core import HydrusSerialisable
 from hydrus.core import HydrusTime
 from hydrus.core.networking import HydrusNetworking
 
+# the slow microbenchmarks only run when asked for
+RUN_BENCHMARKS = os.environ.get( 'HYDRUS_TEST_BENCHMARKS', '' ) != ''
+
 now = HydrusTime.GetNow()
 
 now_10 = now + 10
@@ -409,6 +416,93 @@ class TestBandwidthRules( unittest.TestCase ):
             
         
     
+# the old all-timestamps-in-a-counter tracker logic, to check the ring buffers against and to time them against
+class NaiveBandwidthTracker( object ):
+    
+    WIDTHS_TO_MAX_AGES = {
+        1 : HydrusNetworking.BandwidthTracker.MAX_SECONDS_TIME_DELTA,
+        60 : HydrusNetworking.BandwidthTracker.MAX_MINUTES_TIME_DELTA,
+        3600 : HydrusNetworking.BandwidthTracker.MAX_HOURS_TIME_DELTA,
+        86400 : HydrusNetworking.BandwidthTracker.MAX_DAYS_TIME_DELTA
+    }
+    
+    def __init__( self ):
+        
+        self._bytes = { width : collections.Counter() for width in self.WIDTHS_TO_MAX_AGES }
+        self._requests = { width : collections.Counter() for width in self.WIDTHS_TO_MAX_AGES }
+        
+    
+    def _GetWidthAndWindow( self, time_delta ):
+        
+        if time_delta < HydrusNetworking.BandwidthTracker.MAX_SECONDS_TIME_DELTA:
+            
+            return ( 1, 0 )
+            
+        elif time_delta < HydrusNetworking.BandwidthTracker.MAX_MINUTES_TIME_DELTA:
+            
+            return ( 60, 59 )
+            
+        elif time_delta < HydrusNetworking.BandwidthTracker.MAX_HOURS_TIME_DELTA:
+            
+            return ( 3600, 3599 )
+            
+        else:
+            
+            return ( 86400, 86399 )
+            
+        
+    
+    def _Report( self, counters, value ):
+        
+        now = HydrusTime.GetNow()
+        
+        for ( width, counter ) in counters.items():
+            
+            counter[ now - ( now % width ) ] += value
+            
+            # the old tracker culled every couple of minutes. we cull every time, which flatters this side of the benchmark
+            # we keep a couple of spare buckets, as the ring buffers do, so the partially covered oldest bracket is still there
+            
+            oldest_timestamp = now - ( self.WIDTHS_TO_MAX_AGES[ width ] + 2 * width )
+            
+            for timestamp in [ timestamp for timestamp in counter.keys() if timestamp < oldest_timestamp ]:
+                
+                del counter[ timestamp ]
+                
+            
+        
+    
+    def GetUsage( self, bandwidth_type, time_delta ):
+        
+        counters = self._bytes if bandwidth_type == HC.BANDWIDTH_TYPE_DATA else self._requests
+        
+        ( width, window ) = self._GetWidthAndWindow( time_delta )
+        
+        counter = counters[ width ]
+        
+        now = HydrusTime.GetNow()
+        
+        if time_delta == 1:
+            
+            return counter[ now ] if now in counter else 0
+            
+        
+        since = now - ( time_delta + window )
+        
+        return sum( ( value for ( timestamp, value ) in counter.items() if since <= timestamp <= now ) )
+        
+    
+    def ReportDataUsed( self, num_bytes ):
+        
+        self._Report( self._bytes, num_bytes )
+        
+    
+    def ReportRequestUsed( self, num_requests = 1 ):
+        
+        self._Report( self._requests, num_requests )
+        
+    
+
 class TestBandwidthTracker( unittest.TestCase ):
     
     def test_bandwidth_tracker( self ):
@@ -519,3 +613,129 @@ class TestBandwidthTracker( unittest.TestCase ):
             
         
     
+    def test_ring_buffers( self ):
+        
+        bandwidth_tracker = HydrusNetworking.BandwidthTracker()
+        naive_tracker = NaiveBandwidthTracker()
+        
+        time_deltas = [ 1, 2, 6, 60, 239, 240, 1000, 3600, 10799, 10800, 86400, 72 * 3600, 5 * 86400 ]
+        
+        fake_now = ( HydrusTime.GetNow() // 86400 ) * 86400 + 5
+        
+        r = random.Random( 1 )
+        
+        for i in range( 400 ):
+            
+            # mostly seconds apart, sometimes minutes or hours, now and then the clock jumps back a bit
+            fake_now += r.choice( [ 0, 1, 1, 2, 5, 30, 100, 700, 4000, -3 ] )
+            
+            with mock.patch.object( HydrusTime, 'GetNow', return_value = fake_now ):
+                
+                num_bytes = r.randint( 1, 4096 )
+                
+                bandwidth_tracker.ReportDataUsed( num_bytes )
+                bandwidth_tracker.ReportRequestUsed()
+                
+                naive_tracker.ReportDataUsed( num_bytes )
+                naive_tracker.ReportRequestUsed()
+                
+                for time_delta in time_deltas:
+                    
+                    for bandwidth_type in ( HC.BANDWIDTH_TYPE_DATA, HC.BANDWIDTH_TYPE_REQUESTS ):
+                        
+                        self.assertEqual( bandwidth_tracker.GetUsage( bandwidth_type, time_delta ), naive_tracker.GetUsage( bandwidth_type, time_delta ) )
+                        
+                    
+                
+            
+        
+        # and it still reads and writes the old format
+        
+        with mock.patch.object( HydrusTime, 'GetNow', return_value = fake_now ):
+            
+            dupe_tracker = HydrusSerialisable.CreateFromString( bandwidth_tracker.DumpToString() )
+            
+            for time_delta in time_deltas + [ None ]:
+                
+                for bandwidth_type in ( HC.BANDWIDTH_TYPE_DATA, HC.BANDWIDTH_TYPE_REQUESTS ):
+                    
+                    self.assertEqual( dupe_tracker.GetUsage( bandwidth_type, time_delta ), bandwidth_tracker.GetUsage( bandwidth_type, time_delta ) )
+                    
+                
+                self.assertEqual( dupe_tracker.GetWaitingEstimate( HC.BANDWIDTH_TYPE_DATA, time_delta, 10000 ), bandwidth_tracker.GetWaitingEstimate( HC.BANDWIDTH_TYPE_DATA, time_delta, 10000 ) )
+                
+            
+        
+        # a quiet spell longer than any buffer empties everything but the month
+        
+        with mock.patch.object( HydrusTime, 'GetNow', return_value = fake_now + 40 * 86400 ):
+            
+            bandwidth_tracker.ReportDataUsed( 7 )
+            
+            self.assertEqual( bandwidth_tracker.GetUsage( HC.BANDWIDTH_TYPE_DATA, 2 ), 7 )
+            self.assertEqual( bandwidth_tracker.GetUsage( HC.BANDWIDTH_TYPE_DATA, 5 * 86400 ), 7 )
+            
+        
+    
+    def test_tracker_speed( self ):
+        
+        # the ring buffers have to agree with a plain scan of every report. set the env var to run a busy day's worth and see the timings
+        
+        bandwidth_tracker = HydrusNetworking.BandwidthTracker()
+        naive_tracker = NaiveBandwidthTracker()
+        
+        fake_now = HydrusTime.GetNow()
+        
+        if RUN_BENCHMARKS:
+            
+            # a busy four hours, a report every second
+            
+            ( num_reports, report_period, num_rounds ) = ( 4 * 3600, 1, 500 )
+            
+        else:
+            
+            ( num_reports, report_period, num_rounds ) = ( 240, 60, 1 )
+            
+        
+        for i in range( num_reports ):
+            
+            fake_now += report_period
+            
+            with mock.patch.object( HydrusTime, 'GetNow', return_value = fake_now ):
+                
+                bandwidth_tracker.ReportDataUsed( 1024 )
+                naive_tracker.ReportDataUsed( 1024 )
+                
+            
+        
+        time_deltas = [ 1, 200, 3600, 10000, 86400 ]
+        
+        with mock.patch.object( HydrusTime, 'GetNow', return_value = fake_now ):
+            
+            time_started = HydrusTime.GetNowPrecise()
+            
+            for i in range( num_rounds ):
+                
+                naive_results = [ naive_tracker.GetUsage( HC.BANDWIDTH_TYPE_DATA, time_delta ) for time_delta in time_deltas ]
+                
+            
+            naive_time = HydrusTime.GetNowPrecise() - time_started
+            
+            time_started = HydrusTime.GetNowPrecise()
+            
+            for i in range( num_rounds ):
+                
+                ring_results = [ bandwidth_tracker.GetUsage( HC.BANDWIDTH_TYPE_DATA, time_delta ) for time_delta in time_deltas ]
+                
+            
+            ring_time = HydrusTime.GetNowPrecise() - time_started
+            
+        
+        self.assertEqual( naive_results, ring_results )
+        
+        if RUN_BENCHMARKS:
+            
+            HydrusData.Print( f'Bandwidth tracker, {num_rounds * len( time_deltas )} usage queries over {num_reports} reports: counter scan {HydrusTime.TimeDeltaToPrettyTimeDelta( naive_time )}, ring buffers {HydrusTime.TimeDeltaToPrettyTimeDelta( ring_time )}' )
+            
+        
+    
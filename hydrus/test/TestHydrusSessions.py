@@ -148,10 +148,25 @@ class TestSessions( unittest.TestCase ):
         
         new_obj_account_1 = HydrusNetwork.Account( account_key_1, account_type, created, expires )
         
-        TG.test_controller.SetRead( 'account', new_obj_account_1 )
+        new_obj_account_1.SetClean()
+        
+        # bandwidth used since the last dirty save is not in the db yet, so a refresh must keep it
+        
+        account.ReportRequestUsed()
+        
+        self.assertEqual( session_manager.GetDirtyAccounts(), { service_key : [ account ] } )
+        
+        TG.test_controller.SetRead( 'accounts', [ new_obj_account_1 ] )
         
         session_manager.RefreshAccounts( service_key, [ account_key_1 ] )
         
+        self.assertIs( new_obj_account_1.GetBandwidthTracker(), account.GetBandwidthTracker() )
+        self.assertTrue( new_obj_account_1.IsDirty() )
+        
+        self.assertEqual( session_manager.GetDirtyAccounts(), { service_key : [ new_obj_account_1 ] } )
+        
+        new_obj_account_1.SetClean()
+        
         read_account = session_manager.GetAccount( service_key, session_key_1 )
         
         self.assertIs( read_account, new_obj_account_1 )
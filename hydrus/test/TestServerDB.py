@@ -1,21 +1,30 @@
+import hashlib
+import os
 import random
 import time
 import typing
 import unittest
+from unittest import mock
 
 from hydrus.core import HydrusConstants as HC
 from hydrus.core import HydrusData
 from hydrus.core import HydrusExceptions
+from hydrus.core import HydrusNumbers
+from hydrus.core import HydrusSerialisable
 from hydrus.core import HydrusStaticDir
 from hydrus.core import HydrusTime
 from hydrus.core.networking import HydrusNetwork
 from hydrus.core.networking import HydrusNetworking
 
 from hydrus.server import ServerDB
+from hydrus.server import ServerFiles
 
 from hydrus.test import TestController
 from hydrus.test import TestGlobals as TG
 
+# the slow microbenchmarks only run when asked for
+RUN_BENCHMARKS = os.environ.get( 'HYDRUS_TEST_BENCHMARKS', '' ) != ''
+
 class TestServerDB( unittest.TestCase ):
     
     _db: typing.Any = None
@@ -451,6 +460,100 @@ class TestServerDB( unittest.TestCase ):
         
         self.assertEqual( message, set_message )
         
+        # the session manager's copy may be a moment behind a moderator, so a dirty save should only write its bandwidth
+        
+        session_account = self._read( 'account', self._tag_service_key, regular_account_key )
+        
+        self._write( 'modify_account_ban', self._tag_service_key, self._tag_service_account, regular_account_key, 'stale save test', None )
+        
+        session_account.ReportRequestUsed()
+        session_account.ReportRequestUsed()
+        
+        self._write( 'dirty_accounts', { self._tag_service_key : [ session_account ] } )
+        
+        self.assertFalse( session_account.IsDirty() )
+        
+        account = self._read( 'account', self._tag_service_key, regular_account_key )
+        
+        self.assertTrue( account.IsBanned() )
+        self.assertEqual( account.GetBandwidthTracker().GetUsage( HC.BANDWIDTH_TYPE_REQUESTS, None ), session_account.GetBandwidthTracker().GetUsage( HC.BANDWIDTH_TYPE_REQUESTS, None ) )
+        
+        self._write( 'modify_account_unban', self._tag_service_key, self._tag_service_account, regular_account_key )
+        
+    
+    def _test_bulk_mapping_update( self ):
+        
+        # a correctness-sized upload normally. set the env var to run the million-mapping version and see its timing
+        
+        if RUN_BENCHMARKS:
+            
+            ( num_tags, num_hashes_per_tag ) = ( 2000, 500 )
+            
+        else:
+            
+            ( num_tags, num_hashes_per_tag ) = ( 100, 10 )
+            
+        
+        num_hashes = num_hashes_per_tag * 40
+        num_mappings = num_tags * num_hashes_per_tag
+        
+        service_info = self._read( 'service_info', self._tag_service_key )
+        
+        expected_num_tags = service_info[ HC.SERVICE_INFO_NUM_TAGS ] + num_tags
+        expected_num_hashes = service_info[ HC.SERVICE_INFO_NUM_FILE_HASHES ] + num_hashes
+        expected_num_mappings = service_info[ HC.SERVICE_INFO_NUM_MAPPINGS ] + num_mappings
+        
+        # a big sync from a client that has been offline a while
+        
+        hashes = [ HydrusData.GenerateKey() for i in range( num_hashes ) ]
+        
+        client_to_server_update = HydrusNetwork.ClientToServerUpdate()
+        
+        for i in range( num_tags ):
+            
+            tag = f'bulk test tag {i}'
+            
+            # the first 40 tags cover every hash once, so we know exactly how many new hashes there are
+            
+            if i < 20:
+                
+                start = i * num_hashes_per_tag * 2
+                
+                tag_hashes = hashes[ start : start + num_hashes_per_tag ]
+                
+            elif i < 40:
+                
+                start = ( i - 20 ) * num_hashes_per_tag * 2 + num_hashes_per_tag
+                
+                tag_hashes = hashes[ start : start + num_hashes_per_tag ]
+                
+            else:
+                
+                tag_hashes = random.sample( hashes, num_hashes_per_tag )
+                
+            
+            content = HydrusNetwork.Content( HC.CONTENT_TYPE_MAPPINGS, ( tag, tag_hashes ) )
+            
+            client_to_server_update.AddContent( HC.CONTENT_UPDATE_PEND, content )
+            
+        
+        time_started = HydrusTime.GetNowPrecise()
+        
+        self._write( 'update', self._tag_service_key, self._tag_service_account, client_to_server_update, HydrusTime.GetNow() )
+        
+        time_took = HydrusTime.GetNowPrecise() - time_started
+        
+        if RUN_BENCHMARKS:
+            
+            HydrusData.Print( f'Client to server update with {HydrusNumbers.ToHumanInt( num_mappings )} mappings: {HydrusTime.TimeDeltaToPrettyTimeDelta( time_took )}' )
+            
+        
+        service_info = self._read( 'service_info', self._tag_service_key )
+        
+        self.assertEqual( service_info[ HC.SERVICE_INFO_NUM_TAGS ], expected_num_tags )
+        self.assertEqual( service_info[ HC.SERVICE_INFO_NUM_FILE_HASHES ], expected_num_hashes )
+        self.assertEqual( service_info[ HC.SERVICE_INFO_NUM_MAPPINGS ], expected_num_mappings )
+        
     
     def _test_content_creation_and_service_info_counts_files( self ):
         
@@ -614,6 +717,10 @@ class TestServerDB( unittest.TestCase ):
         
         do_num_test()
         
+        petitions_summary = self._read( 'petitions_summary', self._tag_service_key, self._tag_service_account, HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_STATUS_PETITIONED )
+        
+        self.assertEqual( { ( petition_header.account_key, petition_header.reason ) for petition_header in petitions_summary }, { ( self._tag_service_regular_account.GetAccountKey(), 'these are bad' ), ( self._tag_service_regular_account.GetAccountKey(), 'bad for a stupid reason' ) } )
+        
         # approve and deny some with admin
         
         client_to_server_update = HydrusNetwork.ClientToServerUpdate()
@@ -636,6 +743,40 @@ class TestServerDB( unittest.TestCase ):
         
         do_num_test()
         
+        # re-add deleted with regular, which should only get the new ones in
+        
+        tag_1_new_hashes = [ HydrusData.GenerateKey() for i in range( 5 ) ]
+        
+        client_to_server_update = HydrusNetwork.ClientToServerUpdate()
+        
+        content = HydrusNetwork.Content( HC.CONTENT_TYPE_MAPPINGS, ( tag_1, tag_1_deletee_hashes + tag_1_petition_hashes + tag_1_new_hashes ) )
+        client_to_server_update.AddContent( HC.CONTENT_UPDATE_PEND, content )
+        
+        self._write( 'update', self._tag_service_key, self._tag_service_regular_account, client_to_server_update, HydrusTime.GetNow() )
+        
+        expected_num_hashes += len( tag_1_new_hashes )
+        expected_num_mappings += len( tag_1_new_hashes )
+        
+        do_num_test()
+        
+        # re-add deleted with admin, which overwrites
+        
+        client_to_server_update = HydrusNetwork.ClientToServerUpdate()
+        
+        content = HydrusNetwork.Content( HC.CONTENT_TYPE_MAPPINGS, ( tag_1, tag_1_deletee_hashes + tag_1_new_hashes ) )
+        client_to_server_update.AddContent( HC.CONTENT_UPDATE_PEND, content )
+        
+        self._write( 'update', self._tag_service_key, self._tag_service_account, client_to_server_update, HydrusTime.GetNow() )
+        
+        expected_num_mappings += len( tag_1_deletee_hashes )
+        expected_num_deleted_mappings -= len( tag_1_deletee_hashes )
+        
+        do_num_test()
+        
+        petitions_summary = self._read( 'petitions_summary', self._tag_service_key, self._tag_service_account, HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_STATUS_PETITIONED )
+        
+        self.assertEqual( len( petitions_summary ), 0 )
+        
     
     def _test_content_creation_and_service_info_counts_tag_parents( self ):
         
@@ -1063,6 +1204,87 @@ class TestServerDB( unittest.TestCase ):
         self._admin_account = result
         
     
+    def _test_repository_update_creation( self ):
+        
+        begin = 0
+        end = HydrusTime.GetNow() + 100
+        
+        updates = self._read( 'immediate_update', self._tag_service_key, self._tag_service_account, begin, end )
+        
+        self.assertTrue( len( updates ) > 0 )
+        
+        update_file_writer = ServerFiles.UpdateFileWriter()
+        
+        self._write( 'create_update', self._tag_service_key, begin, end, update_file_writer )
+        
+        update_hashes = update_file_writer.WaitForUpdateHashes()
+        
+        self.assertEqual( len( update_hashes ), len( updates ) )
+        
+        for ( update, update_hash ) in zip( updates, update_hashes ):
+            
+            with open( ServerFiles.GetFilePath( update_hash ), 'rb' ) as f:
+                
+                update_bytes = f.read()
+                
+            
+            self.assertEqual( hashlib.sha256( update_bytes ).digest(), update_hash )
+            
+            written_update = HydrusSerialisable.CreateFromNetworkBytes( update_bytes )
+            
+            self.assertIs( type( written_update ), type( update ) )
+            self.assertEqual( written_update.GetNumRows(), update.GetNumRows() )
+            
+        
+        ( num_definition_rows, num_content_rows ) = update_file_writer.GetNumRows()
+        
+        self.assertEqual( num_definition_rows, sum( ( update.GetNumRows() for update in updates if isinstance( update, HydrusNetwork.DefinitionsUpdate ) ) ) )
+        self.assertEqual( num_content_rows, sum( ( update.GetNumRows() for update in updates if isinstance( update, HydrusNetwork.ContentUpdate ) ) ) )
+        
+        # the files are on disk, but nothing knows about them until they are registered
+        
+        self.assertTrue( self._read( 'is_an_orphan', update_hashes[0] ) )
+        
+        self._write( 'register_update', self._tag_service_key, update_hashes )
+        
+        for update_hash in update_hashes:
+            
+            self.assertFalse( self._read( 'is_an_orphan', update_hash ) )
+            
+        
+        # a .temp left by a crash mid-write is cleared on the next boot
+        
+        stale_temp_path = ServerFiles.GetExpectedFilePath( HydrusData.GenerateKey() ) + '.temp'
+        
+        with open( stale_temp_path, 'wb' ) as f:
+            
+            f.write( b'half an update' )
+            
+        
+        self.assertEqual( ServerFiles.DeleteStaleTempFiles(), 1 )
+        self.assertFalse( os.path.exists( stale_temp_path ) )
+        
+        # if a write job cannot be dispatched, its slot is handed back and nobody waits on it
+        
+        update_file_writer = ServerFiles.UpdateFileWriter()
+        
+        with mock.patch.object( TG.test_controller, 'CallToThread', side_effect = Exception( 'no threads today' ) ):
+            
+            for i in range( ServerFiles.UPDATE_FILE_WRITER_MAX_SIMULTANEOUS_JOBS + 1 ):
+                
+                with self.assertRaises( Exception ):
+                    
+                    update_file_writer.AddUpdate( updates[0] )
+                    
+                
+            
+        
+        with self.assertRaises( Exception ):
+            
+            update_file_writer.WaitForUpdateHashes()
+            
+        
+    
     def _test_service_creation( self ):
         
         self._tag_service_key = HydrusData.GenerateKey()
@@ -1111,6 +1333,10 @@ class TestServerDB( unittest.TestCase ):
         
         self._test_account_fetching_from_content()
         
+        self._test_repository_update_creation()
+        
         self._test_delete_all_content()
         
+        self._test_bulk_mapping_update()
+        
 